@@ -27,12 +27,18 @@
     @creation 20151007
 
 """
+import cPickle
 import exceptions
 import os
+import sys
+import threading
+import time
+import traceback
 from abc import ABCMeta, abstractmethod
 
 from SimEx.Parameters.AbstractCalculatorParameters import AbstractCalculatorParameters
-from SimEx.Utilities.EntityChecks import checkAndSetInstance
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.FileSet import FileSet
 
 
 class AbstractBaseCalculator(object):
@@ -41,6 +47,17 @@ class AbstractBaseCalculator(object):
     """
     __metaclass__ = ABCMeta
 
+    # Glob patterns selecting the input files in an input directory and the output files in an output directory, see FileSet.
+    _input_pattern = '*'
+    _output_pattern = '*'
+
+    # Dataset of the output files stacked by the output index, None if not supported.
+    _output_index_dataset = None
+
+    # Name of the container file replacing the output files in the 'container' output layout, None if not supported.
+    # It must match _output_pattern, so that the container is found in place of the output files.
+    _output_container_name = None
+
     @abstractmethod
     def __init__(self, parameters=None, input_path=None, output_path=None):
         """
@@ -63,6 +80,27 @@ class AbstractBaseCalculator(object):
 
         self.__input_path, self.__output_path = checkAndSetIO((input_path, output_path))
 
+        # Selection and parallel processing of input files.
+        self.__input_fileset = None
+        self.__executor = 'thread'
+        self.__number_of_workers = 1
+        self.__work_queue = None
+        self.__output_index = False
+        self.__output_layout = 'files'
+        self.__write_policy = None
+        self.__resources = {}
+
+        # Handling of failing work items.
+        self.__failure_policy = 'abort'
+        self.__max_retries = 0
+        self.__retry_backoff = 1.0
+        self.__quarantine = []
+
+        # In-memory hand-off.
+        self.__result = None
+        self.__input_calculator = None
+        self.__persistence = 'sync'
+
     @abstractmethod
     def backengine(self):
         """
@@ -96,6 +134,559 @@ class AbstractBaseCalculator(object):
     def saveH5(self):
         pass
 
+    def __getstate__(self):
+        """ Query for the state of copies, e.g. sent to worker processes: the in-memory hand-off stays with this calculator. """
+        state = self.__dict__.copy()
+        for name in ['result', 'input_calculator']:
+            state['_AbstractBaseCalculator__' + name] = None
+        return state
+
+    def _cacheIgnoredAttributes(self):
+        """
+        Query for the attributes that do not influence the result of the calculation, i.e. that are left out of the stage cache key.
+
+        @return : List of attribute names (as in __dict__, i.e. private attributes with the mangled name).
+        <br/><b>note</b> : Calculators holding settings that only affect how (not what) they calculate, or runtime state
+        such as data read or computed in a run, should extend this list.
+        """
+        return ['_AbstractBaseCalculator__input_path',
+                '_AbstractBaseCalculator__output_path',
+                '_AbstractBaseCalculator__executor',
+                '_AbstractBaseCalculator__number_of_workers',
+                '_AbstractBaseCalculator__work_queue',
+                '_AbstractBaseCalculator__max_retries',
+                '_AbstractBaseCalculator__retry_backoff',
+                '_AbstractBaseCalculator__resources',
+                '_AbstractBaseCalculator__persistence',
+                # Runtime state.
+                '_AbstractBaseCalculator__quarantine',
+                '_AbstractBaseCalculator__result',
+                '_AbstractBaseCalculator__input_calculator',
+                ]
+
+    #######################################################################
+    # Work items (per input file processing)
+    #######################################################################
+    def _supportsWorkItems(self):
+        """
+        Query whether this calculator can process its input file by file.
+
+        @return : True if _backengineWorkItem() is implemented, False otherwise.
+        <br/><b>note</b> : Calculators that return True can be run in pipelined mode, i.e. each input file is
+        processed as soon as it is provided by the upstream calculator.
+        """
+        return False
+
+    def _inputFiles(self):
+        """
+        Query for the list of input files to process.
+
+        @return : The input file if input_path is a file, the files selected by input_fileset if it is a directory.
+        """
+        if os.path.isdir(self.input_path):
+            return self.input_fileset.files()
+
+        return [self.input_path]
+
+    def _prepareOutputDirectory(self):
+        """ Create the output directory if not existing yet. Raises if output_path is a file. Starts a new quarantine list. """
+        self._resetQuarantine()
+        if os.path.isfile( self.output_path ):
+            raise IOError( "The given output path %s is a file but a directory is needed. Cowardly refusing to overwrite." % (self.output_path) )
+        if not os.path.isdir( self.output_path ):
+            os.mkdir( self.output_path )
+
+    def _backengineWorkItem(self, input_file, index):
+        """
+        Process a single input file and write the corresponding output into the output directory.
+
+        @param input_file : Path to the input file to process.
+        <br/><b>type</b> : string
+
+        @param index : Position of the input file in the sequence of all input files.
+        <br/><b>type</b> : int
+
+        @return : List of generated output files.
+        """
+        raise NotImplementedError( "%s does not support processing of single work items." % (self.__class__.__name__) )
+
+    def _backengineWorkItems(self, hooks=None):
+        """
+        Process all input files with _backengineWorkItem(), using number_of_workers threads or processes, or
+        number_of_workers worker processes of the work queue if work_queue is set.
+
+        @param hooks : Hooks skipping work items completed before and observing every processed work item, e.g. to journal and report them.
+        <br/><b>type</b> : WorkItemHooks
+        <br/><b>default</b> : None
+
+        @return : List of all generated output files.
+        <br/><b>note</b> : With the 'process' executor or a work queue, each work item runs on a copy of the calculator,
+        changes of the calculator's attributes made in _backengineWorkItem() are lost.
+        <br/><b>note</b> : The hooks are not called for work items run through a work queue, which keeps its own record of done items.
+        """
+        # Import here, so that importing calculators stays fast.
+        import multiprocessing
+        import multiprocessing.pool
+        from SimEx.Utilities.ResourceScheduler import defaultResourceScheduler
+
+        self._prepareOutputDirectory()
+
+        if self.__work_queue is not None:
+            from SimEx.PhotonExperimentSimulation.WorkQueue import WorkQueue
+            output_files = WorkQueue(self.__work_queue).run(self, self.__number_of_workers)
+            self._finishWorkItems()
+            return output_files
+
+        scheduler = defaultResourceScheduler()
+        # Results keyed by the index of the work item.
+        results = {}
+        work_items = []
+        for index, input_file in enumerate(self._inputFiles()):
+            completed_output = None
+            if hooks is not None:
+                completed_output = hooks.completedOutput(input_file)
+            if completed_output is not None:
+                results[index] = (completed_output, None, None)
+            else:
+                work_items.append((self, input_file, index, hooks is not None))
+
+        if self.__number_of_workers == 1 or len(work_items) < 2:
+            for work_item in work_items:
+                with scheduler.reserve(**self._workItemResources(work_item[1])):
+                    results[work_item[2]] = _runWorkItem(work_item)
+                if hooks is not None:
+                    hooks.workItemDone(work_item[1], work_item[2], *results[work_item[2]])
+        else:
+            number_of_workers = min(self.__number_of_workers, len(work_items))
+            if self.__executor == 'process':
+                pool = multiprocessing.Pool(number_of_workers, initializer=_initializeWorkerProcess, initargs=(self,))
+                # Work items and outcomes are passed pickled, see _tryPickledWorkItem().
+                function, encode = _tryPickledWorkItem, lambda work_item: cPickle.dumps(work_item, cPickle.HIGHEST_PROTOCOL)
+            else:
+                pool = multiprocessing.pool.ThreadPool(number_of_workers)
+                function, encode = _tryWorkItem, None
+
+            # Grant resources to a work item before it is submitted, at most one work item per worker waits for
+            # its grant. Within a reservation of the calling thread, the work items share that reservation.
+            scheduled = not scheduler.reserved()
+            workers = threading.BoundedSemaphore(number_of_workers)
+            hook_errors = []
+            # Outcomes keyed by the index of the work item, each the result and the error with its traceback.
+            outcomes = {}
+            def free(grant):
+                if grant is not None:
+                    scheduler.release(grant)
+                workers.release()
+            try:
+                pending = []
+                for work_item in work_items:
+                    workers.acquire()
+                    try:
+                        grant = scheduler.acquire(**self._workItemResources(work_item[1])) if scheduled else None
+                    except:
+                        workers.release()
+                        raise
+                    def done(outcome, grant=grant, work_item=work_item):
+                        # Hooks are called as work items finish, in the pool's result thread.
+                        try:
+                            if encode is not None:
+                                try:
+                                    outcome = cPickle.loads(outcome)
+                                except Exception:
+                                    outcome = (None, sys.exc_info()[1:])
+                            outcomes[work_item[2]] = outcome
+                            if hooks is not None and outcome[1] is None:
+                                hooks.workItemDone(work_item[1], work_item[2], *outcome[0])
+                        except Exception as error:
+                            hook_errors.append(error)
+                        finally:
+                            free(grant)
+                    try:
+                        argument = work_item if encode is None else encode(work_item)
+                        pending.append((work_item, grant, pool.apply_async(function, (argument,), callback=done)))
+                    except:
+                        free(grant)
+                        raise
+
+                # The pool calls back for every outcome of the work items. Should it fail a work item without
+                # calling back, its grant and worker are freed here.
+                for work_item, grant, p in pending:
+                    p.wait()
+                    if not p.successful():
+                        free(grant)
+                for work_item, grant, p in pending:
+                    p.get()
+                    result, error = outcomes[work_item[2]]
+                    if error is not None:
+                        _reraise(*error)
+                    results[work_item[2]] = result
+            finally:
+                pool.close()
+                pool.join()
+            if hook_errors != []:
+                raise hook_errors[0]
+
+        output_files = []
+        for outputs, failure, usage in [results[index] for index in sorted(results.keys())]:
+            output_files += outputs
+            if failure is not None:
+                self._quarantineWorkItem(failure)
+
+        self._finishWorkItems()
+
+        return output_files
+
+    def _initializeWorkerProcess(self):
+        """ Prepare a worker process of the 'process' executor before it runs work items, e.g. set environment variables
+        read by libraries when they are loaded. Nothing to be done by default. """
+        pass
+
+    def _processWorkItem(self, input_file, index):
+        """
+        Process a single input file with _backengineWorkItem(), retrying and quarantining it according to the failure policy.
+
+        @param input_file : Path to the input file to process.
+        <br/><b>type</b> : string
+
+        @param index : Position of the input file in the sequence of all input files.
+        <br/><b>type</b> : int
+
+        @return : List of generated output files, empty if the work item was quarantined.
+        """
+        output_files, failure = self._attemptWorkItem(input_file, index)
+        if failure is not None:
+            self._quarantineWorkItem(failure)
+
+        return output_files
+
+    def _attemptWorkItem(self, input_file, index):
+        """
+        Process a single input file, retrying failures max_retries times with exponentially growing pauses.
+
+        @return : Tuple of the list of generated output files and the failure record (None if successful).
+        <br/><b>note</b> : With the 'abort' failure policy, the last error is raised instead of returning a failure record.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._backengineWorkItem(input_file, index), None
+            except Exception as error:
+                if attempt <= self.__max_retries:
+                    time.sleep(self.__retry_backoff * 2**(attempt-1))
+                    continue
+                if self.__failure_policy == 'abort':
+                    raise
+                failure = {'item' : input_file,
+                           'index' : index,
+                           'attempts' : attempt,
+                           'error' : "%s: %s" % (error.__class__.__name__, error),
+                           'traceback' : traceback.format_exc(),
+                           }
+                return [], failure
+
+    def _resetQuarantine(self):
+        """ Start a new quarantine list for a new pass over the input. """
+        self.__quarantine = []
+
+    def _quarantineWorkItem(self, failure):
+        """ Record a work item that failed in all attempts, see _attemptWorkItem(). """
+        # Appending is atomic, work items of a thread pool may fail concurrently.
+        self.__quarantine.append(failure)
+        print "WARNING: %s quarantined %s after %d attempt(s): %s" % (self.__class__.__name__, failure['item'], failure['attempts'], failure['error'])
+
+    def _finishWorkItems(self):
+        """ Complete the output once all work items are processed: consolidate the output files into a container or write the output index if requested. """
+        if self.__quarantine != []:
+            print "WARNING: %d work item(s) of %s failed and were quarantined:\n%s" % (len(self.__quarantine), self.__class__.__name__, "\n".join([f['item'] for f in self.__quarantine]))
+
+        if self.__output_layout == 'container':
+            self.writeOutputContainer()
+        elif self.__output_index:
+            self.writeOutputIndex()
+
+    def writeOutputContainer(self):
+        """
+        Consolidate the output files into a single container file in the output directory and remove them.
+
+        @return : Path of the container file.
+        <br/><b>note</b> : The container holds one row per output file in extendable, chunked datasets, see OutputContainer.
+        Downstream calculators read containers and per-pulse files alike.
+        """
+        from SimEx.Utilities.OutputContainer import writeContainer
+
+        if self._output_container_name is None:
+            raise NotImplementedError( "%s does not support the container output layout." % (self.__class__.__name__) )
+        container_path = os.path.join( self.output_path, self._output_container_name )
+        files = [f for f in self.output_fileset.files() if os.path.abspath(f) != os.path.abspath(container_path)]
+        writeContainer( files, container_path, write_policy=self.write_policy, remove_files=True )
+
+        return container_path
+
+    def writeOutputIndex(self):
+        """
+        Write a virtual dataset index (index_vds.h5) into the output directory, stacking the data of all output files.
+
+        @return : Path of the index file.
+        """
+        from SimEx.Utilities.VirtualDatasetIndex import INDEX_FILE_NAME, writeVirtualDatasetIndex
+
+        if self._output_index_dataset is None:
+            raise NotImplementedError( "%s does not support an output index." % (self.__class__.__name__) )
+        index_path = os.path.join( self.output_path, INDEX_FILE_NAME )
+        writeVirtualDatasetIndex( self.output_fileset.files(), index_path, dataset=self._output_index_dataset )
+
+        return index_path
+
+    @property
+    def input_fileset(self):
+        """ Query for the selection of input files in the input directory. """
+        if self.__input_fileset is None:
+            return FileSet(self.input_path, pattern=self._input_pattern)
+        return self.__input_fileset.withPath(self.input_path)
+    @input_fileset.setter
+    def input_fileset(self, value):
+        """ Set the selection of input files (glob pattern, ordering, index range). If the FileSet has a path, it replaces input_path. """
+        value = checkAndSetInstance(FileSet, value, None)
+        if value is not None and value.path is not None:
+            self.input_path = value.path
+        self.__input_fileset = value
+
+    @property
+    def output_fileset(self):
+        """ Query for the files in the output directory (or the output file), ordered by their index. """
+        return FileSet(self.output_path, pattern=self._output_pattern, order='index')
+
+    def outputMetadataIndex(self):
+        """
+        Query for the metadata index of the output directory, e.g. to find output files by their parameters without opening them.
+
+        @return : The MetadataIndex, updated with all new and modified output files.
+        """
+        from SimEx.Utilities.MetadataIndex import MetadataIndex
+
+        if not os.path.isdir( self.output_path ):
+            raise IOError( "The output path %s is not a directory." % (self.output_path) )
+        index = MetadataIndex( self.output_path, pattern=self._output_pattern )
+        index.update()
+
+        return index
+
+    @property
+    def output_index(self):
+        """ Query whether a virtual dataset index of the output files is written. """
+        return self.__output_index
+    @output_index.setter
+    def output_index(self, value):
+        """ Set whether a virtual dataset index of the output files is written after all work items are processed. """
+        value = checkAndSetInstance(bool, value, False)
+        if value and self._output_index_dataset is None:
+            raise NotImplementedError( "%s does not support an output index." % (self.__class__.__name__) )
+        self.__output_index = value
+
+    @property
+    def output_layout(self):
+        """ Query for the layout of the output directory ('files' or 'container'). """
+        return self.__output_layout
+    @output_layout.setter
+    def output_layout(self, value):
+        """
+        Set the layout of the output directory: 'files' for one file per pulse, 'container' for a single file
+        holding all pulses, written once all work items are processed.
+        <br/><b>note</b> : Work items of a run journal refer to the per-pulse files and are run again after consolidation.
+        """
+        value = checkAndSetInstance(str, value, 'files')
+        if value not in ['files', 'container']:
+            raise ValueError("The output layout must be 'files' or 'container'.")
+        if value == 'container' and self._output_container_name is None:
+            raise NotImplementedError( "%s does not support the container output layout." % (self.__class__.__name__) )
+        self.__output_layout = value
+
+    @property
+    def failure_policy(self):
+        """ Query for the handling of work items failing in all attempts ('abort' or 'quarantine'). """
+        return self.__failure_policy
+    @failure_policy.setter
+    def failure_policy(self, value):
+        """ Set the handling of work items failing in all attempts: 'abort' raises the error and stops the calculator,
+        'quarantine' records the work item in the quarantine list and continues with the remaining work items. """
+        value = checkAndSetInstance(str, value, 'abort')
+        if value not in ['abort', 'quarantine']:
+            raise ValueError("The failure policy must be 'abort' or 'quarantine'.")
+        self.__failure_policy = value
+
+    @property
+    def max_retries(self):
+        """ Query for the number of retries of a failing work item. """
+        return self.__max_retries
+    @max_retries.setter
+    def max_retries(self, value):
+        """ Set the number of retries of a failing work item. """
+        value = checkAndSetInstance(int, value, 0)
+        if value < 0:
+            raise ValueError("The number of retries must not be negative.")
+        self.__max_retries = value
+
+    @property
+    def retry_backoff(self):
+        """ Query for the pause (in s) before the first retry. """
+        return self.__retry_backoff
+    @retry_backoff.setter
+    def retry_backoff(self, value):
+        """ Set the pause (in s) before the first retry, doubled for every further retry. """
+        value = checkAndSetInstance((int, float), value, 1.0)
+        if value < 0:
+            raise ValueError("The retry backoff must not be negative.")
+        self.__retry_backoff = value
+
+    @property
+    def quarantine(self):
+        """ Query for the work items quarantined in the last pass over the input, each a dict of item, index, attempts, error and traceback. """
+        return list(self.__quarantine)
+
+    @property
+    def resources(self):
+        """ Query for the resources needed by a work item (or the whole calculation if the calculator does not
+        support work items): a dict of cores, memory (estimated peak, in bytes) and mpi_ranks. """
+        return self._workItemResources()
+    @resources.setter
+    def resources(self, value):
+        """ Override the resources declared by the calculator, e.g. {'cores' : 8, 'memory' : 16*2**30}. """
+        value = checkAndSetInstance(dict, value, {})
+        for key, number in value.items():
+            if key not in ['cores', 'memory', 'mpi_ranks']:
+                raise ValueError("The resources must be given as cores, memory and mpi_ranks, got %s." % (key))
+            if not isinstance(number, (int, long)) or number < 0:
+                raise ValueError("The resource %s must be a non-negative integer." % (key))
+        self.__resources = dict(value)
+
+    def _workItemResources(self, input_file=None):
+        """ Query for the resources needed to process the given input file: the declared requirements updated by resources set by the user. """
+        resources = self._resourceRequirements(input_file)
+        resources.update(self.__resources)
+        return resources
+
+    def _resourceRequirements(self, input_file=None):
+        """
+        Query for the resources this calculator declares for a work item, see resources.
+
+        @param input_file : The input file of the work item, None for the whole input.
+        <br/><b>type</b> : string
+
+        @return : Dict of cores, memory (in bytes) and mpi_ranks.
+        <br/><b>note</b> : Calculators running multi-threaded or MPI parallel backengines, or holding large data in memory, should override this.
+        """
+        return {'cores' : 1, 'memory' : 0, 'mpi_ranks' : 0}
+
+    def _inputSize(self, input_file=None):
+        """ Query for the size (in bytes) of the given input file, or of input_path if it is a file. Returns 0 if the size is not known (yet). """
+        if input_file is None:
+            input_file = self.input_path
+        if input_file is None or not os.path.isfile(input_file):
+            return 0
+        return os.path.getsize(input_file)
+
+    @property
+    def executor(self):
+        """ Query for the kind of pool processing the work items ('thread' or 'process'). """
+        return self.__executor
+    @executor.setter
+    def executor(self, value):
+        """ Set the kind of pool processing the work items ('thread' or 'process'). """
+        value = checkAndSetInstance(str, value, 'thread')
+        if value not in ['thread', 'process']:
+            raise ValueError("The executor must be 'thread' or 'process'.")
+        self.__executor = value
+
+    @property
+    def work_queue(self):
+        """ Query for the job directory of the work queue processing the work items, None if they are processed by this process. """
+        return self.__work_queue
+    @work_queue.setter
+    def work_queue(self, value):
+        """ Set the job directory (on a filesystem shared by all workers) of a work queue to process the work items with,
+        see WorkQueue.run(). An existing job in the directory is resumed. None processes the work items in this process. """
+        self.__work_queue = checkAndSetInstance(str, value, None)
+
+    @property
+    def number_of_workers(self):
+        """ Query for the number of work items processed concurrently. """
+        return self.__number_of_workers
+    @number_of_workers.setter
+    def number_of_workers(self, value):
+        """ Set the number of work items processed concurrently. """
+        self.__number_of_workers = checkAndSetPositiveInteger(value, 1)
+
+    #######################################################################
+    # In-memory hand-off
+    #######################################################################
+    def publish(self, result):
+        """
+        Make the result of the calculation available to downstream calculators in the same process.
+
+        @param result : The result, e.g. a wavefront, a numpy array or a dict of data keyed by the provided data paths.
+        <br/><b>note</b> : The result is shared, not copied.
+        """
+        self.__result = result
+
+    @property
+    def result(self):
+        """ Query for the published result (None if nothing was published). """
+        return self.__result
+
+    @property
+    def input_calculator(self):
+        """ Query for the upstream calculator whose published result is consumed instead of reading input_path. """
+        return self.__input_calculator
+    @input_calculator.setter
+    def input_calculator(self, value):
+        """ Set the upstream calculator whose published result is consumed instead of reading input_path. """
+        self.__input_calculator = checkAndSetBaseCalculator(value, None)
+
+    def _inputResult(self):
+        """
+        Query for the result published by the input calculator.
+
+        @return : The published result, None if no input calculator is set or it has not published a result.
+        """
+        if self.__input_calculator is None:
+            return None
+        return self.__input_calculator.result
+
+    @property
+    def persistence(self):
+        """ Query for the persistence mode of the output ('sync' or 'none'). """
+        return self.__persistence
+    @persistence.setter
+    def persistence(self, value):
+        """ Set the persistence mode: 'sync' writes the output in persist(), 'none' skips writing, e.g. if the result is
+        only consumed in memory by a downstream calculator. """
+        value = checkAndSetInstance(str, value, 'sync')
+        if value not in ['sync', 'none']:
+            raise ValueError("The persistence mode must be one of 'sync' or 'none'.")
+        self.__persistence = value
+
+    def persist(self):
+        """ Save the output according to the persistence mode. """
+        if self.__persistence == 'none':
+            return
+        self.saveH5()
+
+    @property
+    def write_policy(self):
+        """ Query for the policy used to write hdf5 datasets: the policy set on this calculator, otherwise the one set for its class (see SimEx.Utilities.WritePolicy.setWritePolicy). """
+        from SimEx.Utilities.WritePolicy import writePolicy
+
+        if self.__write_policy is None:
+            return writePolicy(self.__class__.__name__)
+        return self.__write_policy
+    @write_policy.setter
+    def write_policy(self, value):
+        """ Set the policy used to write hdf5 datasets, None to use the policy set for the class. """
+        from SimEx.Utilities.WritePolicy import WritePolicy
+
+        self.__write_policy = checkAndSetInstance(WritePolicy, value, None)
+
     #######################################################################
     # Queries and setters
     #######################################################################
@@ -145,6 +736,105 @@ class AbstractBaseCalculator(object):
         """ Delete the output_path path(s). """
         del self.__output_path
 
+    # data
+    @property
+    def data(self):
+        """ Query for the output data: a read-only mapping of the provided data paths to lazily read datasets.
+        If the output is a directory, the datasets of all output files are stacked along the first axis, e.g.
+        data['/data/data'][347] reads the pattern of the 348th output file only. Provided data paths with placeholders
+        stand for all matching paths, e.g. data['/data/snp_0000001/ff'] for '/data/snp_<7 digit index>/ff'. """
+        from SimEx.Utilities.LazyData import LazyDataMapping
+
+        provided_data = self.providedData()
+        if provided_data is None:
+            provided_data = []
+        return LazyDataMapping(self.output_fileset.files(), provided_data)
+
+
+class WorkItemHooks(object):
+    """
+    Class representing hooks called by AbstractBaseCalculator._backengineWorkItems() in the calling process.
+    """
+
+    def completedOutput(self, input_file):
+        """
+        Query for the output files of a work item completed before, e.g. in an interrupted run.
+
+        @param input_file : The input file of the work item.
+        <br/><b>type</b> : string
+
+        @return : The list of output files, None to process the work item.
+        """
+        return None
+
+    def workItemDone(self, input_file, index, output_files, failure, usage):
+        """
+        Observe a processed work item.
+
+        @param input_file : The input file of the work item.
+        <br/><b>type</b> : string
+
+        @param index : Position of the input file in the sequence of all input files.
+        <br/><b>type</b> : int
+
+        @param output_files : The generated output files.
+        <br/><b>type</b> : list
+
+        @param failure : The failure record if the work item failed in all attempts, see quarantine, None otherwise.
+        <br/><b>type</b> : dict
+
+        @param usage : Resources used by the work item, measured in the worker, see RunReport.resourceUsageDifference().
+        <br/><b>type</b> : dict
+        """
+        pass
+
+
+def _initializeWorkerProcess(calculator):
+    """ Prepare a worker process of a process pool. Module level function so that process pools can pickle it. """
+    calculator._initializeWorkerProcess()
+
+def _runWorkItem(work_item):
+    """ Process a single work item, a tuple of calculator, input file, index and whether to measure the used resources.
+    Module level function so that process pools can pickle it. Returns the output files, the failure record and the used resources. """
+    calculator, input_file, index, measure = work_item
+    if not measure:
+        return calculator._attemptWorkItem(input_file, index) + (None,)
+
+    from SimEx.PhotonExperimentSimulation.RunReport import resourceUsage, resourceUsageDifference
+    start = resourceUsage()
+    output_files, failure = calculator._attemptWorkItem(input_file, index)
+    return output_files, failure, resourceUsageDifference(start, resourceUsage())
+
+def _tryWorkItem(work_item):
+    """ Process a single work item like _runWorkItem(), returning the raised error and its traceback instead of raising them,
+    so that a pool callback sees every outcome. """
+    try:
+        return _runWorkItem(work_item), None
+    except Exception:
+        return None, sys.exc_info()[1:]
+
+def _tryPickledWorkItem(pickled_work_item):
+    """ Process a pickled work item in a worker process like _tryWorkItem(). The outcome is returned pickled, so that a
+    result or error that cannot be pickled fails the work item rather than the pool. The traceback is returned formatted. """
+    try:
+        return cPickle.dumps((_runWorkItem(cPickle.loads(pickled_work_item)), None), cPickle.HIGHEST_PROTOCOL)
+    except Exception as error:
+        formatted_traceback = traceback.format_exc()
+    try:
+        return cPickle.dumps((None, (error, formatted_traceback)), cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        error = RuntimeError("%s: %s" % (error.__class__.__name__, error))
+        return cPickle.dumps((None, (error, formatted_traceback)), cPickle.HIGHEST_PROTOCOL)
+
+def _reraise(error, error_traceback):
+    """ Raise an error of a work item with the traceback of the worker, formatted if it comes from a worker process. """
+    if not isinstance(error_traceback, str):
+        raise error.__class__, error, error_traceback
+    try:
+        remote_error = error.__class__("%s\n\nTraceback of the worker process:\n%s" % (error, error_traceback))
+    except Exception:
+        remote_error = RuntimeError("%s: %s\n\nTraceback of the worker process:\n%s" % (error.__class__.__name__, error, error_traceback))
+    raise remote_error
 
 def checkAndSetIO(io):
     """ Check the passed io path/filenames and set appropriately. """
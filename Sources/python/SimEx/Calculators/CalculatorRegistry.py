@@ -0,0 +1,112 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the registry of calculators.
+
+    Calculators are listed by name and kind without importing their modules, since importing
+    a calculator may pull in its (slow or optional) backend packages.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import importlib
+from collections import OrderedDict
+
+# Kinds of calculators, named as the corresponding arguments of PhotonExperimentSimulation.
+CALCULATOR_KINDS = ['photon_source',
+                    'photon_propagator',
+                    'photon_interactor',
+                    'photon_diffractor',
+                    'photon_detector',
+                    'photon_analyzer',
+                    ]
+
+# Calculator name -> (module, kind)
+_REGISTRY = OrderedDict([
+        ('XFELPhotonSource',                ('SimEx.Calculators.XFELPhotonSource',                'photon_source')),
+        ('SASEPhotonSource',                ('SimEx.Calculators.SASEPhotonSource',                'photon_source')),
+        ('XFELPhotonPropagator',            ('SimEx.Calculators.XFELPhotonPropagator',            'photon_propagator')),
+        ('WavePropagator',                  ('SimEx.Calculators.WavePropagator',                  'photon_propagator')),
+        ('XMDYNDemoPhotonMatterInteractor', ('SimEx.Calculators.XMDYNDemoPhotonMatterInteractor', 'photon_interactor')),
+        ('SingFELPhotonDiffractor',         ('SimEx.Calculators.SingFELPhotonDiffractor',         'photon_diffractor')),
+        ('PlasmaXRTSCalculator',            ('SimEx.Calculators.PlasmaXRTSCalculator',            'photon_diffractor')),
+        ('PerfectPhotonDetector',           ('SimEx.Calculators.PerfectPhotonDetector',           'photon_detector')),
+        ('EMCOrientation',                  ('SimEx.Calculators.EMCOrientation',                  'photon_analyzer')),
+        ('DMPhasing',                       ('SimEx.Calculators.DMPhasing',                       'photon_analyzer')),
+        ('S2EReconstruction',               ('SimEx.Calculators.S2EReconstruction',               'photon_analyzer')),
+        ('OrientAndPhasePhotonAnalyzer',    ('SimEx.Calculators.OrientAndPhasePhotonAnalyzer',    'photon_analyzer')),
+        ])
+
+def registerCalculator(name, module, kind):
+    """
+    Add a calculator to the registry.
+
+    @param name : The class name of the calculator.
+    <br/><b>type</b> : string
+
+    @param module : The full name of the module defining the calculator.
+    <br/><b>type</b> : string
+
+    @param kind : The kind of calculator, one of CALCULATOR_KINDS.
+    <br/><b>type</b> : string
+    """
+    if kind not in CALCULATOR_KINDS:
+        raise ValueError("The calculator kind must be one of %s." % (', '.join(CALCULATOR_KINDS)))
+    _REGISTRY[name] = (module, kind)
+
+def calculatorNames(kind=None):
+    """
+    Query for the names of the registered calculators.
+
+    @param kind : Only list calculators of this kind.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : None (all calculators)
+
+    @return : List of calculator names.
+    """
+    return [name for name, (module, calculator_kind) in _REGISTRY.items() if kind is None or calculator_kind == kind]
+
+def calculatorKind(name):
+    """ Query for the kind of a registered calculator. """
+    return _registryEntry(name)[1]
+
+def calculatorModule(name):
+    """ Query for the full name of the module defining a registered calculator. """
+    return _registryEntry(name)[0]
+
+def calculatorClass(name):
+    """
+    Query for the class of a registered calculator. Imports the calculator's module.
+
+    @param name : The calculator name.
+    <br/><b>type</b> : string
+
+    @return : The calculator class.
+    """
+    return getattr(importlib.import_module(calculatorModule(name)), name)
+
+def _registryEntry(name):
+    """ Query for the registry entry of a calculator, raise if not registered. """
+    if name not in _REGISTRY:
+        raise KeyError("No calculator named %s is registered." % (name))
+    return _REGISTRY[name]
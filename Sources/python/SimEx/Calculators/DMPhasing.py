@@ -27,7 +27,6 @@
 
 """
 import os, shutil
-import subprocess
 import tempfile
 import numpy
 import glob
@@ -35,6 +34,7 @@ import h5py
 import re
 
 from AbstractPhotonAnalyzer import AbstractPhotonAnalyzer
+from SimEx.Utilities.ProcessSupervisor import defaultSupervisor
 
 class DMPhasing(AbstractPhotonAnalyzer):
     """
@@ -74,11 +74,6 @@ class DMPhasing(AbstractPhotonAnalyzer):
         """ Query for the data provided by the Analyzer. """
         return self.__provided_data
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
-
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
@@ -137,8 +132,6 @@ class DMPhasing(AbstractPhotonAnalyzer):
         else:
             number_of_shrink_cycles = 10
 
-        # Save current working directory.
-        cwd = os.path.abspath(os.curdir)
         try:
             run_instance_dir = tempfile.mkdtemp(prefix='dm_run_')
             out_dir          = tempfile.mkdtemp(prefix='dm_out_')
@@ -165,8 +158,7 @@ class DMPhasing(AbstractPhotonAnalyzer):
             #Start phasing
             #Store parameters into phase_out.h5.
             #Link executable from compiled version in srcDir to tmpDir
-            cwd = os.path.abspath(os.curdir)
-            os.chdir(run_instance_dir)
+            # object_recon runs in run_instance_dir, its files are addressed by absolute paths: the working directory is shared by all threads.
             input_options = [number_of_trials, number_of_iterations, averaging_start, leash, number_of_shrink_cycles]
 
             # Link executable
@@ -175,16 +167,19 @@ class DMPhasing(AbstractPhotonAnalyzer):
             cmd = ["object_recon"] + [str(o) for o in input_options]
 
             #print_to_log("Running phasing command: " + cmd)
-            process_handle = subprocess.Popen(cmd)
-            process_handle.wait()
+            backengine_log = os.path.join(run_instance_dir, "dm_backengine.log")
+            process = defaultSupervisor().run(cmd, cwd=run_instance_dir, stdout_path=backengine_log, stderr_path=backengine_log)
+            if process.returncode != 0:
+                raise RuntimeError("object_recon returned %d%s, see %s." % (process.returncode, {True : " (timed out)", False : ""}[process.timed_out], backengine_log))
 
             #Phasing completed. Write output to single h5
-            min_objects     = glob.glob("finish_min_object*.dat")
-            logFiles        = glob.glob("object*.log")
-            shrinkWrapFile  = "shrinkwrap.log"
+            min_objects     = glob.glob(os.path.join(run_instance_dir, "finish_min_object*.dat"))
+            logFiles        = glob.glob(os.path.join(run_instance_dir, "object*.log"))
+            shrinkWrapFile  = os.path.join(run_instance_dir, "shrinkwrap.log")
             #fin_object      = "finish_object.dat"
 
             #print_to_log("Done with reconstructions, now saving output from final shrink_cycle to h5 file")
+            write_policy = self.write_policy
             fp          = h5py.File(output_file, "w")
             g_data      = fp.create_group("data")
             g_params    = fp.create_group("params")
@@ -193,19 +188,19 @@ class DMPhasing(AbstractPhotonAnalyzer):
             g_hist_obj  = fp.create_group("/history/object")
             for n, mo in enumerate(logFiles):
                 err = parse_error_log(mo)
-                g_err.create_dataset("%0.4d"%(n+1), data=err, compression="gzip")
+                write_policy.createDataset(g_err, "%0.4d"%(n+1), err)
                 os.remove(mo)
 
             for n, ob_fn in enumerate(min_objects):
                 obj = extract_object(ob_fn)
-                g_hist_obj.create_dataset("%0.4d"%(n+1), data=obj, compression="gzip")
+                write_policy.createDataset(g_hist_obj, "%0.4d"%(n+1), obj, allow_downcast=True)
                 os.remove(ob_fn)
 
-            finish_object = extract_object("finish_object.dat")
-            g_data.create_dataset("electronDensity", data=finish_object, compression="gzip")
-            os.system("cp finish_object.dat start_object.dat")
+            finish_object = extract_object(os.path.join(run_instance_dir, "finish_object.dat"))
+            write_policy.createDataset(g_data, "electronDensity", finish_object)
+            shutil.copy(os.path.join(run_instance_dir, "finish_object.dat"), os.path.join(run_instance_dir, "start_object.dat"))
 
-            g_params.create_dataset("DM_support",           data=support, compression="gzip")
+            write_policy.createDataset(g_params, "DM_support", support)
             g_params.create_dataset("DM_numTrials",         data=number_of_trials)
             g_params.create_dataset("DM_numIterPerTrial",   data=number_of_iterations)
             g_params.create_dataset("DM_startAvePerIter",   data=averaging_start)
@@ -213,16 +208,14 @@ class DMPhasing(AbstractPhotonAnalyzer):
             g_params.create_dataset("DM_shrinkwrapCycles",  data=number_of_shrink_cycles)
 
             shrinkWrap = parse_shrinkwrap_log(shrinkWrapFile)
-            fp.create_dataset("/history/shrinkwrap", data=shrinkWrap, compression="gzip")
+            write_policy.createDataset(fp, "/history/shrinkwrap", shrinkWrap)
             fp.create_dataset("version", data=h5py.version.hdf5_version)
 
             fp.close()
 
-            shutil.copy( output_file, os.path.join( cwd, self.output_path ) )
-            os.chdir(cwd)
+            shutil.copy( output_file, self.output_path )
             return 0
         except:
-            os.chdir(cwd)
             return 1
 
 
@@ -22,14 +22,24 @@
 
 import numpy as N
 import h5py
+import itertools
 import os
 import time
 import sys
+import traceback
 
-import matplotlib
-matplotlib.use('Agg')
+from SimEx.Utilities.H5HandlePool import H5HandlePool
+from SimEx.Utilities.OutputContainer import countRows
+from SimEx.Utilities.VirtualDatasetIndex import readPatterns
+from SimEx.Utilities.WritePolicy import writePolicy
 
-import matplotlib.pyplot as plt
+def _pyplot():
+    """ Import matplotlib.pyplot with a non-interactive backend. Deferred until plotting, since importing matplotlib is slow. """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
 
 def print_to_log(msg, log_file=None):
     if not os.path.exists(log_file):
@@ -197,7 +207,8 @@ class EMCCaseGenerator(object):
         f = h5py.File(fn, 'r')
         self.detectorDist = (f["params/geom/detectorDist"].value)
         #We expect the detector to always be square of length 2*self.numPixToEdge+1
-        (r,c) = f["data/data"].shape
+        # Containers hold all patterns in one dataset, one row per pattern.
+        (r,c) = f["data/data"].shape[-2:]
         if (r == c and (r%2==1)):
             self.numPixToEdge = (r-1)/2
         else:
@@ -241,10 +252,27 @@ class EMCCaseGenerator(object):
         f.close()
         return
 
-    def writeSparsePhotonFile(self, fileList, outFN, outFNH5Avg):
+    def writeSparsePhotonFile(self, fileList, outFN, outFNH5Avg, write_policy=None):
         """
         Convert dense S2E file format to sparse EMC photons.dat format.
+        If the files are indexed by a virtual dataset (see SimEx.Utilities.VirtualDatasetIndex) or are containers
+        (see SimEx.Utilities.OutputContainer), patterns are read in batches.
+        The average pattern and mask are written according to write_policy (default: the default WritePolicy).
+        Patterns that cannot be read or converted are skipped and listed in the log.
+
+        @return : The failure records of the skipped patterns, see AbstractBaseCalculator.quarantine.
+        <br/><b>type</b> : list of dicts
         """
+        if write_policy is None:
+            write_policy = writePolicy()
+
+        # The files may be per-pattern files or containers of many patterns.
+        numPatterns = countRows(fileList)
+
+        # The first files are read twice (mean count and conversion), keep them open in between.
+        numFilesToAvgForMeanCount = min([200, numPatterns])
+        pool = H5HandlePool(max_open_files=max(1, min([200, len(fileList)])))
+
         # Log: destination output to file
         msg = "Writing diffr output to %s"%outFN
         print_to_log(msg, log_file=self.runLog)
@@ -268,33 +296,41 @@ class EMCCaseGenerator(object):
 
         # Compute mean photon count from the first 200 diffraction images
         # (or total number of images, whichever is smaller)
-        numFilesToAvgForMeanCount = min([200, len(fileList)])
+        # Unreadable patterns are skipped.
         meanPhoton = 0.
         totPhoton = 0.
-        for fn in fileList[:numFilesToAvgForMeanCount]:
-            f = h5py.File(fn, 'r')
-            meanPhoton += N.mean((f["data/data"].value).flatten())
-            totPhoton += N.sum((f["data/data"].value).flatten())
-            f.close()
-        meanPhoton /= 1.*numFilesToAvgForMeanCount
-        totPhoton /= 1.*numFilesToAvgForMeanCount
+        numAveraged = 0
+        patterns = readPatterns(fileList[:numFilesToAvgForMeanCount], pool=pool)
+        for v in itertools.islice(patterns, numFilesToAvgForMeanCount):
+            if v is None:
+                continue
+            meanPhoton += N.mean(v.flatten())
+            totPhoton += N.sum(v.flatten())
+            numAveraged += 1
+        patterns.close()
+        if numAveraged == 0:
+            raise IOError("None of the first %d diffraction patterns could be read." % (numFilesToAvgForMeanCount))
+        meanPhoton /= 1.*numAveraged
+        totPhoton /= 1.*numAveraged
 
         # Start stepping through diffraction images and writing them to sparse format
         msg = "Average intensities: %lf"%(totPhoton)
         print_to_log(msg, log_file=self.runLog)
         outf = open(outFN, "w")
-        outf.write("%d %lf \n"%(len(fileList), meanPhoton))
+        # The header holds the number of converted patterns, known only at the end. Reserve space for it.
+        header_length = 64
+        outf.write(" "*(header_length-1) + "\n")
         mask = flatMask.reshape(2*self.numPixToEdge+1, -1)
         avg = 0.*mask
 
         msg = "Converting individual data frames to sparse format %s"%("."*20)
         print_to_log(msg, log_file=self.runLog)
 
-        for n,fn in enumerate(fileList):
+        failedPatterns = []
+        for n,v in enumerate(readPatterns(fileList, pool=pool)):
             try:
-                f = h5py.File(fn, 'r')
-                v = f["data/data"].value
-                avg += v
+                if v is None:
+                    raise IOError("Pattern could not be read.")
                 temp = {"o":[], "m":[]}
 
                 for p,vv in zip(pos, v.flat):
@@ -313,29 +349,57 @@ class EMCCaseGenerator(object):
                 ssO = ' '.join([str(i) for i in temp["o"]])
                 strNumM = str(num_m)
                 ssM = ' '.join(["%d %d "%(i[0], i[1]) for i in temp["m"]])
-                outf.write(' '.join([strNumO, ssO, strNumM, ssM]) + "\n")
-                f.close()
-            except:
-                msg = "Failed to read file #%d %s." % (n, fn)
+                line = ' '.join([strNumO, ssO, strNumM, ssM]) + "\n"
+                newAvg = avg + v
+            except Exception as error:
+                # Skip the pattern, the remaining patterns are still converted. Nothing of it is written, so that
+                # the number of lines matches the number of converted patterns in the header.
+                item = fileList[n] if numPatterns == len(fileList) else "%s, pattern %d" % (os.path.dirname(fileList[0]), n)
+                failedPatterns.append({'item' : item,
+                                       'index' : n,
+                                       'attempts' : 1,
+                                       'error' : "%s: %s" % (error.__class__.__name__, error),
+                                       'traceback' : traceback.format_exc(),
+                                       })
+                msg = "Failed to convert pattern #%d: %s" % (n, error)
                 print_to_log(msg, log_file=self.runLog)
+            else:
+                outf.write(line)
+                avg = newAvg
 
             if n%10 == 0:
                 msg = "Translated %d patterns"%n
                 print_to_log(msg, log_file=self.runLog)
 
+        numConverted = numPatterns - len(failedPatterns)
+        if numConverted == 0:
+            outf.close()
+            pool.closeAll()
+            raise IOError("None of the %d diffraction patterns could be converted." % (numPatterns))
+        header = "%d %lf "%(numConverted, meanPhoton)
+        outf.seek(0)
+        outf.write(header.ljust(header_length-1))
         outf.close()
+        pool.closeAll()
+
+        if failedPatterns != []:
+            msg = "Skipped %d of %d patterns that could not be converted: %s" % (len(failedPatterns), numPatterns, ", ".join([str(f['index']) for f in failedPatterns]))
+            print_to_log(msg, log_file=self.runLog)
 
         # Write average photon and mask patterns to file
         outh5 = h5py.File(outFNH5Avg, 'w')
-        outh5.create_dataset("average", data=avg, compression="gzip", compression_opts=9)
-        outh5.create_dataset("mask", data=mask, compression="gzip", compression_opts=9)
+        write_policy.createDataset(outh5, "average", avg)
+        write_policy.createDataset(outh5, "mask", mask)
         outh5.close()
 
+        return failedPatterns
+
     def showDetector(self):
         """
         Shows detector pixels as points on scatter plot; could be slow for large detectors.
         """
         if self.detector is not None:
+            plt = _pyplot()
             fig = plt.figure()
             ax = fig.add_subplot(111, projection='3d')
             ax.scatter(self.detector[:,0], self.detector[:,1], self.detector[:,2], c='r', marker='s')
@@ -469,6 +533,7 @@ class EMCCaseGenerator(object):
         """
         Shows particle density as an array of sequential, equal-sized 2D sections.
         """
+        plt = _pyplot()
         subplotlen = int(N.ceil(N.sqrt(len(self.density))))
         fig = plt.figure(figsize=(9.5, 9.5))
         for i in range(len(self.density)):
@@ -486,6 +551,7 @@ class EMCCaseGenerator(object):
         if(plotSection<=0):
             plotSection += self.qmax
 
+        plt = _pyplot()
         fig = plt.figure(figsize=(13.9,9.5))
         ax = fig.add_subplot(111)
         ax.set_title("log(intensities) of section q=%d"%plotSection)
@@ -498,6 +564,7 @@ class EMCCaseGenerator(object):
         Shows Fourier intensities as an array of sequential, equal-sized 2D sections.
         Maximum intensities set to logarithm of maximum intensity in 3D Fourier volume.
         """
+        plt = _pyplot()
         subplotlen = int(N.ceil(N.sqrt(len(self.intensities))))
         maxLogIntens = N.log(self.intensities.max())
         minLogIntens = N.log(self.intensities.min())
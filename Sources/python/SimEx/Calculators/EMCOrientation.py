@@ -28,13 +28,15 @@
 
 """
 import os
-import subprocess
+import shutil
 import tempfile
 import numpy
 import h5py
 import time
 
 from SimEx.Calculators.AbstractPhotonAnalyzer import AbstractPhotonAnalyzer
+from SimEx.Utilities.H5HandlePool import defaultH5Pool
+from SimEx.Utilities.ProcessSupervisor import defaultSupervisor
 
 from EMCCaseGenerator import  EMCCaseGenerator, print_to_log
 
@@ -95,11 +97,6 @@ class EMCOrientation(AbstractPhotonAnalyzer):
         """ Query for the data provided by the Analyzer. """
         return self.__provided_data
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
-
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
@@ -176,8 +173,7 @@ class EMCOrientation(AbstractPhotonAnalyzer):
 
         outputLog           = os.path.join(run_instance_dir, "EMC_extended.log")
         if os.path.isdir(self.input_path):
-            photonFiles         = [ os.path.join(self.input_path, pf) for pf in os.listdir( self.input_path ) ]
-            photonFiles.sort()
+            photonFiles         = self._inputFiles()
             if debug:
                 photonFiles = photonFiles[:100]
 
@@ -214,7 +210,10 @@ class EMCOrientation(AbstractPhotonAnalyzer):
             gen.readGeomFromPhotonData(photonFiles[0])
             #gen.readGeomFromPhotonData(photonFiles)
             gen.writeDetectorToFile(filename=detectorFile)
-            gen.writeSparsePhotonFile(photonFiles, sparsePhotonFile, avgPatternFile)
+            # Patterns that cannot be converted are skipped, they are quarantined so that they show up in the run report.
+            self._resetQuarantine()
+            for failure in gen.writeSparsePhotonFile(photonFiles, sparsePhotonFile, avgPatternFile, self.write_policy):
+                self._quarantineWorkItem(failure)
             print_to_log(msg="Sparse photons file created. Deleting lock file now", log_file=outputLog)
             os.system("rm %s " % lockFile)
         else:
@@ -241,11 +240,13 @@ class EMCOrientation(AbstractPhotonAnalyzer):
         ###############################################################
         # Create dummy destination h5 for intermediate output from EMC
         ###############################################################
-        cwd = os.path.abspath(os.curdir)
-        os.chdir(run_instance_dir)
+        # EMC runs in run_instance_dir, its files are addressed by absolute paths: the working directory is shared by all threads.
         #Output file is kept in tmpOutDir,
         #a hard-linked version of this is kept in outDir
         outFile = self.output_path
+        write_policy = self.write_policy
+        # The output file is kept open across iterations.
+        h5_pool = defaultH5Pool()
         #outFileHardLink = os.path.join(output_path, "orient_out_" + op.timeStamp +".h5")
         offset_iter = 0
         if not (os.path.isfile(outFile)):
@@ -310,8 +311,12 @@ class EMCOrientation(AbstractPhotonAnalyzer):
                     start_time = time.clock()
 
                     command_sequence = ['EMC', '1']
-                    process_handle = subprocess.Popen(command_sequence)
-                    process_handle.wait()
+                    backengine_log = os.path.join(run_instance_dir, "EMC.log")
+                    process = defaultSupervisor().run(command_sequence, cwd=run_instance_dir, stdout_path=backengine_log, stderr_path=backengine_log)
+                    if process.returncode != 0:
+                        print_to_log("EMC returned %d%s, see %s."%(process.returncode, {True : " (timed out)", False : ""}[process.timed_out], backengine_log),
+                                log_file=outputLog)
+                        raise RuntimeError("EMC failed.")
                     time_taken = time.clock() - start_time
                     print_to_log("Took %lf s"%(time_taken),
                                 log_file=outputLog)
@@ -319,23 +324,23 @@ class EMCOrientation(AbstractPhotonAnalyzer):
                     # Read intermediate output of EMC.c and stuff them into a h5 file
                     # Delete these EMC.c-generated intermediate files afterwards,
                     # except finish_intensity.dat --> start_intensity.dat for next iteration.
-                    gen.intensities = (numpy.fromfile("finish_intensity.dat", sep=" ")).reshape(intensL, intensL, intensL)
+                    gen.intensities = (numpy.fromfile(os.path.join(run_instance_dir, "finish_intensity.dat"), sep=" ")).reshape(intensL, intensL, intensL)
 
-                    data_info = numpy.fromfile("mutual_info.dat", sep=" ")
-                    most_likely_orientations = numpy.fromfile("most_likely_orientations.dat", sep=" ")
+                    data_info = numpy.fromfile(os.path.join(run_instance_dir, "mutual_info.dat"), sep=" ")
+                    most_likely_orientations = numpy.fromfile(os.path.join(run_instance_dir, "most_likely_orientations.dat"), sep=" ")
 
-                    if(os.path.isfile("start_intensity.dat")):
-                        intens1 = numpy.fromfile("start_intensity.dat", sep=" ")
+                    if(os.path.isfile(os.path.join(run_instance_dir, "start_intensity.dat"))):
+                        intens1 = numpy.fromfile(os.path.join(run_instance_dir, "start_intensity.dat"), sep=" ")
                         diff = numpy.sqrt(numpy.mean(numpy.abs(gen.intensities.flatten()-intens1)**2))
                     else:
                         diff = 2.*min_error
 
-                    f = h5py.File(outFile, "a")
+                    f = h5_pool.acquire(outFile, "a")
                     gg = f["history/intensities"]
                     if detailed_output:
-                        gg.create_dataset("%04d"%(iter_num + offset_iter), data=gen.intensities, compression="gzip", compression_opts=9)
+                        write_policy.createDataset(gg, "%04d"%(iter_num + offset_iter), gen.intensities, allow_downcast=True)
                     try:
-                        f.create_dataset("data/data", data=gen.intensities, compression="gzip", compression_opts=9)
+                        write_policy.createDataset(f, "data/data", gen.intensities)
                     except:
                         temp = f["data/data"]
                         temp[...] = gen.intensities
@@ -346,9 +351,9 @@ class EMCOrientation(AbstractPhotonAnalyzer):
                                 log_file=outputLog)
 
                     gg = f["history/angle"]
-                    gg.create_dataset("%04d"%(iter_num + offset_iter), data=most_likely_orientations, compression="gzip", compression_opts=9)
+                    write_policy.createDataset(gg, "%04d"%(iter_num + offset_iter), most_likely_orientations)
                     try:
-                        f.create_dataset("data/angle", data=most_likely_orientations, compression="gzip", compression_opts=9)
+                        write_policy.createDataset(f, "data/angle", most_likely_orientations)
                     except:
                         temp = f["data/angle"]
                         temp[...] = most_likely_orientations
@@ -362,13 +367,13 @@ class EMCOrientation(AbstractPhotonAnalyzer):
                     gg = f["history/time"]
                     gg.create_dataset("%04d"%(iter_num + offset_iter), data=time_taken)
 
-                    f.close()
+                    h5_pool.release(outFile)
 
                     f = open(outputLog, "a")
                     f.write("%e\t %lf\n"%(diff, time_taken))
                     f.close()
 
-                    os.system("cp finish_intensity.dat start_intensity.dat")
+                    shutil.copy(os.path.join(run_instance_dir, "finish_intensity.dat"), os.path.join(run_instance_dir, "start_intensity.dat"))
 
                     print_to_log("Iteration number %d completed"%(iter_num),
                                 log_file=outputLog)
@@ -378,11 +383,11 @@ class EMCOrientation(AbstractPhotonAnalyzer):
 
             print_to_log("All EMC iterations completed", log_file=outputLog)
 
-            os.chdir(cwd)
+            h5_pool.close(outFile)
             return 0
 
         except:
-            os.chdir(cwd)
+            h5_pool.close(outFile)
             #raise
             return 1
 
@@ -63,11 +63,6 @@ class OrientAndPhasePhotonAnalyzer(AbstractPhotonAnalyzer):
         """ This method drives the backengine code."""
         pass
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
-
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
@@ -104,11 +104,6 @@ class PerfectPhotonDetector(AbstractPhotonDetector):
         # Simply link input to output and we're fine.
         os.symlink(self.input_path, self.output_path)
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
-
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
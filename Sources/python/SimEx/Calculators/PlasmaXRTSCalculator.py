@@ -30,9 +30,9 @@ import h5py
 import os
 import re
 import numpy
-import subprocess
 from SimEx.Calculators.AbstractPhotonDiffractor import AbstractPhotonDiffractor
 from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.ProcessSupervisor import defaultSupervisor
 
 from SimEx.Parameters.AbstractCalculatorParameters import AbstractCalculatorParameters
 
@@ -144,10 +144,20 @@ class PlasmaXRTSCalculator(AbstractPhotonDiffractor):
         # Setup command sequence and issue the system call.
         # Make sure to cd to correct directory where input deck is located.
         command_sequence = ['xrs']
-        process = subprocess.Popen( command_sequence, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.parameters._tmp_dir )
-
-        # Catch stdout and stderr, wait until process terminates.
-        out, err = process.communicate(input=None)
+        stdout_path = os.path.join( self.parameters._tmp_dir ,'xrts.log')
+        stderr_path = os.path.join( self.parameters._tmp_dir ,'xrts.err')
+        for log_path in [stdout_path, stderr_path]:
+            if os.path.isfile( log_path ):
+                os.remove( log_path )
+
+        # Stream stdout and stderr to files, wait until process terminates.
+        process = defaultSupervisor().run( command_sequence, cwd=self.parameters._tmp_dir, stdout_path=stdout_path, stderr_path=stderr_path )
+        with open( stdout_path, 'r' ) as stdout_handle:
+            out = stdout_handle.read()
+        with open( stderr_path, 'r' ) as stderr_handle:
+            err = stderr_handle.read()
+        if process.timed_out:
+            err += "Timed out after %f s." % (process.wall_time)
 
         # Error handling.
         if not err == "":
@@ -157,22 +167,20 @@ class PlasmaXRTSCalculator(AbstractPhotonDiffractor):
         if not os.path.isfile( path_to_data ):
             raise( IOError, "No data generated. Check input deck %s." % ( os.path.join( self.parameters._tmp_dir, 'input.dat' ) ) )
 
-        # Store output internally.
+        # Store output internally (also written to xrts.log in tmp_dir).
         self.__run_log = out
 
-        # Write to tmp_dir.
-        with open( os.path.join( self.parameters._tmp_dir ,'xrts.log'), 'w') as log_file_handle:
-                log_file_handle.write(out)
-
         # Store data internally.
         self.__run_data = numpy.loadtxt( path_to_data )
         # Cd back to where we came from.
         #os.chdir( pwd )
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+    def _cacheIgnoredAttributes(self):
+        """ Query for the attributes that do not influence the result: the data of the last run. """
+        return super(PlasmaXRTSCalculator, self)._cacheIgnoredAttributes() + ['_PlasmaXRTSCalculator__run_log',
+                                                                               '_PlasmaXRTSCalculator__run_data',
+                                                                               '_PlasmaXRTSCalculator__static_data',
+                                                                               ]
 
     def _readH5(self):
         """
@@ -225,16 +233,17 @@ class PlasmaXRTSCalculator(AbstractPhotonDiffractor):
         ### TODO
         #collfreq  = self.__run_data[:,4]
 
-        energy_shifts = h5.create_dataset("data/dynamic/energy_shifts", data=energies)
+        write_policy = self.write_policy
+        energy_shifts = write_policy.createDataset(h5, "data/dynamic/energy_shifts", energies)
         energy_shifts.attrs.create('unit', 'eV')
 
-        Skw_free = h5.create_dataset("data/dynamic/Skw_free", data=Skw_free)
+        Skw_free = write_policy.createDataset(h5, "data/dynamic/Skw_free", Skw_free)
         Skw_free.attrs.create('unit', 'eV**-1')
 
-        Skw_bound = h5.create_dataset("data/dynamic/Skw_bound", data=Skw_bound)
+        Skw_bound = write_policy.createDataset(h5, "data/dynamic/Skw_bound", Skw_bound)
         Skw_bound.attrs.create('unit', 'eV**-1')
 
-        Skw_total = h5.create_dataset("data/dynamic/Skw_total", data=Skw_total)
+        Skw_total = write_policy.createDataset(h5, "data/dynamic/Skw_total", Skw_total)
         Skw_total.attrs.create('unit', 'eV**-1')
 
         # Static data.
@@ -108,11 +108,6 @@ class S2EReconstruction(AbstractPhotonAnalyzer):
         """ Query for the data provided by the Analyzer. """
         return self.__provided_data
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
-
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
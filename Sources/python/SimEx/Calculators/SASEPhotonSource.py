@@ -0,0 +1,318 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the SASEPhotonSource class.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import numpy
+import os
+
+from SimEx.Calculators.AbstractPhotonSource import AbstractPhotonSource
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetNonNegativeInteger, checkAndSetPositiveFloat, checkAndSetPositiveInteger
+
+# Planck constant times speed of light (in eV m).
+_HC = 1.23984193e-6
+
+
+class SASEPhotonSource(AbstractPhotonSource):
+    """
+    Class representing a generator of synthetic SASE x-ray pulses: a Gaussian transverse profile and a Gaussian
+    temporal envelope filled with random spikes of the coherence time. The pulses are written in the layout of
+    FEL source files, one file per pulse, e.g. to test and benchmark downstream calculators without source data.
+    """
+
+    # Generated pulses in the output directory.
+    _output_pattern = 'FELsource_out_*.h5'
+
+    def __init__(self,  parameters=None, input_path=None, output_path=None):
+        """
+        Constructor for the SASE photon source.
+
+        @param parameters : Parameters of the generated pulses.
+        <br/><b>type</b> : dict
+        <br/><b>example</b> : parameters = {
+                     'number_of_pulses' : 10000,
+                     'nx'               : 21,
+                     'ny'               : 21,
+                     'nSlices'          : 550,
+                     'photon_energy'    : 4960.0,
+                     'pulse_energy'     : 1e-4,
+                     'pulse_duration'   : 2.0,
+                     'coherence_time'   : 0.2,
+                     'time_window'      : 9.15,
+                     'beam_size'        : 1e-4,
+                     'mesh_extent'      : 4.6e-4,
+                     'seed'             : 0,
+                     }
+
+        @param parameters['number_of_pulses'] : Number of pulses to generate.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        @param parameters['nx'] : Number of mesh points in x.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 21
+
+        @param parameters['ny'] : Number of mesh points in y.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 21
+
+        @param parameters['nSlices'] : Number of time slices.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 550
+
+        @param parameters['photon_energy'] : Photon energy (in eV).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 4960.0
+
+        @param parameters['pulse_energy'] : Mean pulse energy (in J), single pulses fluctuate around it.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 1e-4
+
+        @param parameters['pulse_duration'] : Rms duration of the power envelope (in fs).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 2.0
+
+        @param parameters['coherence_time'] : Coherence time, i.e. the width of a spike (in fs).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 0.2
+
+        @param parameters['time_window'] : Length of the time window covered by the slices (in fs).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 9.15
+
+        @param parameters['beam_size'] : Rms size of the intensity profile (in m).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 1e-4
+
+        @param parameters['mesh_extent'] : Half width of the mesh in x and y (in m).
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 4.6e-4
+
+        @param parameters['seed'] : Seed of the random spikes. Pulse i is generated from (seed, i), i.e. the same
+        seed generates the same pulses, also with several workers.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 0
+
+        @param input_path : Not used, the generator reads no input.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : os.devnull
+
+        @param output_path : Directory to write the pulses to (FELsource_out_<7 digit index>.h5), or a file if a single pulse is generated.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : 'source_out.h5'
+        """
+
+        # Initialize base class.
+        super(SASEPhotonSource, self).__init__(parameters, checkAndSetInstance(str, input_path, os.devnull), output_path)
+
+        # Check parameters.
+        # Check that only accepted parameters are present.
+        accepted_keys = ['number_of_pulses',
+                         'nx',
+                         'ny',
+                         'nSlices',
+                         'photon_energy',
+                         'pulse_energy',
+                         'pulse_duration',
+                         'coherence_time',
+                         'time_window',
+                         'beam_size',
+                         'mesh_extent',
+                         'seed']
+
+        for k in self.parameters.keys():
+            if k not in accepted_keys:
+                raise RuntimeError( "The parameter '%s' is not a valid parameter for the SASEPhotonSource. " % (k))
+
+        # Check each parameter individually and set defaults if not set.
+        self.parameters['number_of_pulses'] = checkAndSetPositiveInteger(self.parameters.get('number_of_pulses'), 1)
+        self.parameters['nx'] = checkAndSetPositiveInteger(self.parameters.get('nx'), 21)
+        self.parameters['ny'] = checkAndSetPositiveInteger(self.parameters.get('ny'), 21)
+        self.parameters['nSlices'] = checkAndSetPositiveInteger(self.parameters.get('nSlices'), 550)
+        self.parameters['photon_energy'] = checkAndSetPositiveFloat(self.parameters.get('photon_energy'), 4960.0)
+        self.parameters['pulse_energy'] = checkAndSetPositiveFloat(self.parameters.get('pulse_energy'), 1e-4)
+        self.parameters['pulse_duration'] = checkAndSetPositiveFloat(self.parameters.get('pulse_duration'), 2.0)
+        self.parameters['coherence_time'] = checkAndSetPositiveFloat(self.parameters.get('coherence_time'), 0.2)
+        self.parameters['time_window'] = checkAndSetPositiveFloat(self.parameters.get('time_window'), 9.15)
+        self.parameters['beam_size'] = checkAndSetPositiveFloat(self.parameters.get('beam_size'), 1e-4)
+        self.parameters['mesh_extent'] = checkAndSetPositiveFloat(self.parameters.get('mesh_extent'), 4.6e-4)
+        self.parameters['seed'] = checkAndSetNonNegativeInteger(self.parameters.get('seed'), 0)
+
+    def expectedData(self):
+        """ Query for the data expected in the input: none, the pulses are generated. """
+        return []
+
+    def backengine(self):
+        """ Generate the pulses, number_of_workers at a time. """
+        if self.parameters['number_of_pulses'] == 1 and not os.path.isdir(self.output_path) and self.output_path.endswith('.h5'):
+            self.__writePulse(0, self.output_path)
+            return 0
+
+        self._backengineWorkItems()
+
+        return 0
+
+    def _inputFiles(self):
+        """ Query for the work items: the pulses, named by their output files. """
+        return [os.path.join(self.output_path, 'FELsource_out_%07d.h5' % (index+1)) for index in range(self.parameters['number_of_pulses'])]
+
+    def _resourceRequirements(self, input_file=None):
+        """ Query for the resources of a pulse: the field in single and double precision. For the whole calculation, the pulses generated concurrently. """
+        p = self.parameters
+        memory = p['nx']*p['ny']*p['nSlices']*(8 + 16)
+        if input_file is None:
+            return {'cores' : self.number_of_workers, 'memory' : self.number_of_workers*memory, 'mpi_ranks' : 0}
+        return {'cores' : 1, 'memory' : memory, 'mpi_ranks' : 0}
+
+    def _backengineWorkItem(self, input_file, index):
+        """ Generate a single pulse. """
+        self.__writePulse(index, input_file)
+
+        return [input_file]
+
+    def __writePulse(self, index, path):
+        """ Generate the pulse of the given index and write it to path. """
+        p = self.parameters
+        field, power = saseField(numpy.random.RandomState([p['seed'], index]),
+                                 p['nx'], p['ny'], p['nSlices'],
+                                 p['pulse_energy'], p['pulse_duration'], p['coherence_time'], p['time_window'],
+                                 p['beam_size'], p['mesh_extent'])
+        times = numpy.linspace(-p['time_window']/2, p['time_window']/2, p['nSlices'])
+        wavelength = _HC / p['photon_energy']
+        policy = self.write_policy
+
+        # Write to a temporary file first, so that the output is never left incomplete.
+        tmp_path = path + '.tmp'
+        try:
+            with h5py.File(tmp_path, 'w') as h5:
+                E = numpy.empty(field.shape + (2,), dtype=numpy.float32)
+                E[..., 0] = field.real
+                E[..., 1] = field.imag
+                policy.createDataset(h5, '/data/arrEhor', E, allow_downcast=True)
+                policy.createDataset(h5, '/data/arrEver', numpy.zeros_like(E), allow_downcast=True)
+
+                h5['/params/Mesh/nSlices'] = numpy.int32(p['nSlices'])
+                h5['/params/Mesh/nx'] = numpy.int32(p['nx'])
+                h5['/params/Mesh/ny'] = numpy.int32(p['ny'])
+                h5['/params/Mesh/sliceMin'] = numpy.float32(-p['time_window']/2*1e-15)
+                h5['/params/Mesh/sliceMax'] = numpy.float32(p['time_window']/2*1e-15)
+                h5['/params/Mesh/xMin'] = numpy.float32(-p['mesh_extent'])
+                h5['/params/Mesh/xMax'] = numpy.float32(p['mesh_extent'])
+                h5['/params/Mesh/yMin'] = numpy.float32(-p['mesh_extent'])
+                h5['/params/Mesh/yMax'] = numpy.float32(p['mesh_extent'])
+                h5['/params/Mesh/zCoord'] = 0.0
+                # Radii of wavefront curvature as in FAST source files.
+                h5['/params/Rx'] = numpy.float32(5.0)
+                h5['/params/Ry'] = numpy.float32(5.0)
+                h5['/params/dRx'] = numpy.float32(0.125)
+                h5['/params/dRy'] = numpy.float32(0.125)
+                h5['/params/nval'] = numpy.int32(2)
+                h5['/params/photonEnergy'] = numpy.float32(p['photon_energy'])
+                h5['/params/wDomain'] = 'time'
+                h5['/params/wEFieldUnit'] = 'sqrt(W/mm^2)'
+                h5['/params/wFloatType'] = 'float'
+                h5['/params/wSpace'] = 'R-space'
+                h5['/params/xCentre'] = numpy.float32(0.0)
+                h5['/params/yCentre'] = numpy.float32(0.0)
+
+                parameters = ["%s = %s" % (k, p[k]) for k in sorted(p.keys())]
+                h5['/history/parent/info/data_description'] = numpy.array(["Synthetic SASE pulse %d generated by SimEx SASEPhotonSource: Gaussian transverse profile and Gaussian temporal envelope with random spikes." % (index+1), "gain_curve, nzc and spot_size are not simulated."] + parameters)
+                h5['/history/parent/info/package_version'] = 'SimEx SASEPhotonSource'
+                h5['/history/parent/misc/FAST2XY.DAT'] = numpy.array(parameters)
+
+                # Far field of the Gaussian profile: angle (rad), normalized intensity.
+                divergence = wavelength / (4*numpy.pi*p['beam_size'])
+                angles = numpy.linspace(0.0, 5*divergence, 200)
+                h5['/history/parent/misc/angular_distribution'] = numpy.array([angles, numpy.exp(-angles**2/(2*divergence**2))], dtype=numpy.float32).T
+                h5['/history/parent/misc/spot_size'] = numpy.array([[0.0, p['beam_size']]], dtype=numpy.float32)
+                h5['/history/parent/misc/gain_curve'] = numpy.zeros((1, 8), dtype=numpy.float32)
+                h5['/history/parent/misc/nzc'] = numpy.int32(0)
+                # Time (fs), power (W).
+                h5['/history/parent/misc/temporal_struct'] = numpy.array([times, power], dtype=numpy.float32).T
+
+                h5['/misc/electricField'] = 'horizontal'
+                h5['/misc/resizing'] = numpy.float32(1.0)
+                h5['/version'] = numpy.float32(0.1)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _readH5(self):
+        """ """
+        """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
+        pass # No input.
+
+    def saveH5(self):
+        """ """
+        """
+        Private method to save the object to a file.
+
+        @param output_path : The file where to save the object's data.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None
+        """
+        pass # No action required since output is written in backengine.
+
+
+def saseField(random_state, nx, ny, nSlices, pulse_energy, pulse_duration, coherence_time, time_window, beam_size, mesh_extent):
+    """
+    Generate the electric field of a SASE pulse.
+
+    The temporal structure is complex Gaussian noise, low pass filtered to the coherence time, under a Gaussian
+    power envelope, scaled such that pulse energies fluctuate around pulse_energy. The transverse profile is Gaussian
+    and normalized to unit integral of the intensity over the mesh.
+
+    @param random_state : Source of the random spikes.
+    <br/><b>type</b> : numpy.random.RandomState
+
+    @return : The field (in sqrt(W/mm^2)), shaped (ny, nx, nSlices), and the power (in W) of each slice.
+    <br/><b>note</b> : See SASEPhotonSource for the other parameters and their units.
+    """
+    # Temporal spikes (times in fs).
+    dt = time_window / max(nSlices - 1, 1)
+    times = numpy.linspace(-time_window/2, time_window/2, nSlices)
+    noise = (random_state.normal(size=nSlices) + 1j*random_state.normal(size=nSlices)) / numpy.sqrt(2)
+    spectral_filter = numpy.exp(-(numpy.pi*numpy.fft.fftfreq(nSlices, dt)*coherence_time)**2)
+    spikes = numpy.fft.ifft(numpy.fft.fft(noise) * spectral_filter) / numpy.sqrt(numpy.mean(spectral_filter**2))
+
+    envelope = numpy.exp(-times**2 / (4*pulse_duration**2))
+    peak_power = pulse_energy / (numpy.sum(envelope**2) * dt*1e-15)
+    amplitude = numpy.sqrt(peak_power) * envelope * spikes
+
+    # Transverse profile (positions in mm).
+    x = numpy.linspace(-mesh_extent, mesh_extent, nx) * 1e3
+    y = numpy.linspace(-mesh_extent, mesh_extent, ny) * 1e3
+    sigma = beam_size * 1e3
+    profile = numpy.exp(-(y[:, None]**2 + x[None, :]**2) / (4*sigma**2))
+    cell = (x[1] - x[0] if nx > 1 else 1.0) * (y[1] - y[0] if ny > 1 else 1.0)
+    profile /= numpy.sqrt(numpy.sum(profile**2) * cell)
+
+    field = (profile[:, :, None] * amplitude[None, None, :]).astype(numpy.complex64)
+
+    return field, numpy.abs(amplitude)**2
@@ -27,19 +27,28 @@
 
 """
 import os
+import re
+import shutil
 import inspect
 import subprocess
+import tempfile
 from SimEx.Calculators.AbstractPhotonDiffractor import AbstractPhotonDiffractor
 from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.ProcessSupervisor import defaultSupervisor, logTail
+from SimEx.Utilities.ResourceScheduler import defaultResourceScheduler
 
 
-import prepHDF5
 
 class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
     """
     Class representing a x-ray free electron laser photon propagator.
     """
 
+    # Diffraction patterns in the output directory, stacked by the output index or consolidated into a container.
+    _output_pattern = 'diffr_out*.h5'
+    _output_index_dataset = '/data/data'
+    _output_container_name = 'diffr_out.h5'
+
     def __init__(self,  parameters=None, input_path=None, output_path=None):
         """
         Constructor for the xfel photon propagator.
@@ -185,15 +194,98 @@ class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
             input_dir = os.path.dirname( self.input_path )
 
         # Link the  python utility so the backengine can find it.
-        ### Yes, this is messy.
+        preph5_target = linkPrepHDF5( input_dir )
+
+        if not os.path.isdir( self.output_path ):
+            os.mkdir( self.output_path )
+        output_dir = self.output_path
+
+        # Run the backengine command once the MPI processes fit onto the node.
+        command_sequence = self._backengineCommand( input_dir, output_dir )
+        with defaultResourceScheduler().reserve(**self.resources):
+            process = defaultSupervisor().run(command_sequence)
+
+        if os.path.islink(preph5_target):
+            os.remove(preph5_target)
+
+        if process.returncode == 0:
+            self._finishWorkItems()
+
+        # Return the return code from the backengine.
+        return process.returncode
+
+    def _supportsWorkItems(self):
+        """ Query whether this calculator can process its input file by file. """
+        return True
 
-        preph5_location = inspect.getsourcefile(prepHDF5)
-        preph5_target =  os.path.join( input_dir, 'prepHDF5.py')
-        # Link the prepHDF5 utility that gets called from singFEL code.
-        if not os.path.isfile( preph5_target ):
-            ln_preph5_command = 'ln -s %s %s' % ( preph5_location, preph5_target )
-            proc = subprocess.Popen(ln_preph5_command, shell=True)
-            proc.wait()
+    def _resourceRequirements(self, input_file=None):
+        """ Query for the resources of a work item: a core for each MPI process, each process holding the pmi data in memory. """
+        number_of_MPI_processes = self.parameters.get('number_of_MPI_processes', 2)
+        return {'cores' : number_of_MPI_processes, 'memory' : number_of_MPI_processes*self._inputSize(input_file), 'mpi_ranks' : number_of_MPI_processes}
+
+    def _backengineWorkItem(self, input_file, index):
+        """ Calculate the diffraction patterns from a single pmi file. """
+
+        # Get the pmi ID from the file name (pmi_out_<7 digit index>.h5).
+        match = re.search( r'pmi_out_(\d+)\.h5$', os.path.basename( input_file ) )
+        if match is not None:
+            pmi_id = int( match.group(1) )
+        else:
+            pmi_id = index + 1
+
+        pmi_start_ID = self.parameters['pmi_start_ID']
+        if pmi_id < pmi_start_ID or pmi_id > self.parameters['pmi_stop_ID']:
+            return []
+
+        # Run the backengine on a private input directory holding only this pmi file,
+        # so that concurrently processed work items do not interfere.
+        item_dir = tempfile.mkdtemp( prefix='diffr_item_' )
+        item_input_dir = os.path.join( item_dir, 'pmi' )
+        item_output_dir = os.path.join( item_dir, 'diffr' )
+        os.mkdir( item_input_dir )
+        os.mkdir( item_output_dir )
+        os.symlink( os.path.abspath( input_file ), os.path.join( item_input_dir, 'pmi_out_%07d.h5' % (pmi_id) ) )
+        linkPrepHDF5( item_input_dir )
+
+        try:
+            log_file = os.path.join( item_dir, 'singfel.log' )
+            process = defaultSupervisor().run( self._backengineCommand( item_input_dir, item_output_dir, pmi_id, pmi_id ), stdout_path=log_file, stderr_path=log_file )
+            if process.returncode != 0:
+                raise RuntimeError( "singFEL returned %d while processing %s%s. Output follows.\n%s" % (process.returncode, input_file, {True : " (timed out)", False : ""}[process.timed_out], logTail(log_file)) )
+
+            # Move patterns to the output directory, numbered by their position in a full run.
+            number_of_diffraction_patterns = self.parameters['number_of_diffraction_patterns']
+            pattern_files = sorted( [f for f in os.listdir( item_output_dir ) if f.startswith('diffr_out') and f.endswith('.h5')] )
+            output_files = []
+            for k, pattern_file in enumerate( pattern_files ):
+                output_file = os.path.join( self.output_path, 'diffr_out_%07d.h5' % ( (pmi_id - pmi_start_ID)*number_of_diffraction_patterns + k + 1 ) )
+                shutil.move( os.path.join( item_output_dir, pattern_file ), output_file )
+                output_files.append( output_file )
+        finally:
+            shutil.rmtree( item_dir )
+
+        return output_files
+
+    def _backengineCommand(self, input_dir, output_dir, pmi_start_ID=None, pmi_stop_ID=None):
+        """
+        Setup the command sequence to call the backengine.
+
+        @param input_dir : Directory holding the pmi files.
+        <br/><b>type</b> : string
+
+        @param output_dir : Directory where to write the diffraction patterns.
+        <br/><b>type</b> : string
+
+        @param pmi_start_ID : Index of the pmi file to start from.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : parameters['pmi_start_ID']
+
+        @param pmi_stop_ID : Index of the pmi file to stop at.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : parameters['pmi_stop_ID']
+
+        @return : The command sequence (list of strings).
+        """
 
         # If parameters are given, map them to command line arguments.
         if 'uniform_rotation' in self.parameters.keys():
@@ -214,15 +306,17 @@ class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
         if 'number_of_slices' in self.parameters.keys():
             number_of_slices = self.parameters['number_of_slices']
 
-        if 'pmi_start_ID' in self.parameters.keys():
-            pmi_start_ID = self.parameters['pmi_start_ID']
-        else:
-            pmi_start_ID = 0
+        if pmi_start_ID is None:
+            if 'pmi_start_ID' in self.parameters.keys():
+                pmi_start_ID = self.parameters['pmi_start_ID']
+            else:
+                pmi_start_ID = 0
 
-        if 'pmi_stop_ID' in self.parameters.keys():
-            pmi_stop_ID = self.parameters['pmi_stop_ID']
-        else:
-            pmi_stop_ID = 0
+        if pmi_stop_ID is None:
+            if 'pmi_stop_ID' in self.parameters.keys():
+                pmi_stop_ID = self.parameters['pmi_stop_ID']
+            else:
+                pmi_stop_ID = 0
 
         if 'number_of_diffraction_patterns' in self.parameters.keys():
             number_of_diffraction_patterns = self.parameters['number_of_diffraction_patterns']
@@ -244,14 +338,8 @@ class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
         else:
             raise RuntimeError("Beam geometry file must be given.")
 
-
-        if not os.path.isdir( self.output_path ):
-            os.mkdir( self.output_path )
-        output_dir = self.output_path
-
         config_file = '/dev/null'
 
-        # Run the backengine command.
         command_sequence = ['mpirun',
                             '-np',                str(number_of_MPI_processes) ,
                             'radiationDamageMPI',
@@ -268,20 +356,8 @@ class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
                             '--pmiEndID',         str(pmi_stop_ID),
                             '--numDP',            str(number_of_diffraction_patterns),
                             ]
-        proc = subprocess.Popen(command_sequence)
-        proc.wait()
-
 
-        if os.path.islink(preph5_target):
-            os.remove(preph5_target)
-
-        # Return the return code from the backengine.
-        return proc.returncode
-
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+        return command_sequence
 
     def _readH5(self):
         """ """
@@ -298,3 +374,25 @@ class SingFELPhotonDiffractor(AbstractPhotonDiffractor):
         <br/><b>default</b> : None
         """
         pass # No action required since output is written in backengine.
+
+def linkPrepHDF5(input_dir):
+    """
+    Link the prepHDF5 utility that gets called from singFEL code into the given directory.
+
+    @param input_dir : The directory where the backengine expects the utility.
+    <br/><b>type</b> : string
+
+    @return : The path of the link.
+    """
+    # Import here, the utility is needed only when running the backengine.
+    import prepHDF5
+
+    ### Yes, this is messy.
+    preph5_location = inspect.getsourcefile(prepHDF5)
+    preph5_target =  os.path.join( input_dir, 'prepHDF5.py')
+    if not os.path.isfile( preph5_target ):
+        ln_preph5_command = 'ln -s %s %s' % ( preph5_location, preph5_target )
+        proc = subprocess.Popen(ln_preph5_command, shell=True)
+        proc.wait()
+
+    return preph5_target
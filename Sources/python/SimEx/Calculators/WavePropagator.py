@@ -29,8 +29,6 @@
 """
 import os
 import h5py
-from wpg import Beamline, Wavefront
-from wpg.srwlib import srwl
 
 from SimEx.Calculators.AbstractPhotonPropagator import AbstractPhotonPropagator
 
@@ -54,6 +52,9 @@ class WavePropagator(AbstractPhotonPropagator):
         <br/><b>type</b>               : string
         """
 
+        # Import wpg here, so that importing this module stays fast.
+        from wpg import Beamline
+
         # Check if beamline was given.
         if isinstance(parameters, Beamline):
             parameters = {'beamline' : parameters}
@@ -71,6 +72,7 @@ class WavePropagator(AbstractPhotonPropagator):
 
     def backengine(self):
         """ This method drives the backengine code, in this case the WPG interface to SRW."""
+        from wpg.srwlib import srwl
 
         # Switch to frequency representation.
         srwl.SetRepresElecField(self.__wavefront._srwl_wf, 'f') # <---- switch to frequency domain
@@ -81,20 +83,30 @@ class WavePropagator(AbstractPhotonPropagator):
         # Switch back to time representation.
         srwl.SetRepresElecField(self.__wavefront._srwl_wf, 't')
 
+        # Make the propagated wavefront available to a downstream calculator.
+        self.publish(self.__wavefront)
+
         return 0
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+    def _cacheIgnoredAttributes(self):
+        """ Query for the attributes that do not influence the result: the wavefront is read from the input. """
+        return super(WavePropagator, self)._cacheIgnoredAttributes() + ['_WavePropagator__wavefront']
 
     def _readH5(self):
         """ """
         """ Private method for reading the hdf5 input and extracting the parameters and data relevant to initialize the object. """
-        # Check input.
-        try:
-            self.__h5 = h5py.File( self.input_path, 'r' )
-        except:
+        from wpg import Wavefront
+
+        # Take the wavefront from the upstream calculator if it was handed over in memory.
+        wavefront = self._inputResult()
+        if isinstance(wavefront, Wavefront):
+            # The wavefront is propagated in place, so the upstream calculator no longer provides it as its result.
+            self.input_calculator.publish(None)
+            self.__wavefront = wavefront
+            return
+
+        # Check input (without keeping the file open).
+        if not os.path.isfile( self.input_path ) or not h5py.is_hdf5( self.input_path ):
             raise IOError( 'The input_path argument (%s) is not a path to a valid hdf5 file.' % (self.input_path) )
 
         # Construct wpg wavefront based on input data.
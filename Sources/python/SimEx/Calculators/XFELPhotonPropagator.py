@@ -29,9 +29,8 @@
 """
 import os
 
-from prop import propagateSE
-
 from SimEx.Calculators.AbstractPhotonPropagator import AbstractPhotonPropagator
+from SimEx.Utilities.ResourceScheduler import threadLimits
 
 
 class XFELPhotonPropagator(AbstractPhotonPropagator):
@@ -56,42 +55,51 @@ class XFELPhotonPropagator(AbstractPhotonPropagator):
         # Initialize base class.
         super(XFELPhotonPropagator, self).__init__(parameters,input_path,output_path)
 
+        # Pulses are propagated in separate processes, set number_of_workers to propagate several at a time.
+        self.executor = 'process'
+
 
     def backengine(self):
         """ This method drives the backengine code, in this case the WPG interface to SRW."""
 
         # Check if input path is a directory.
-        if os.path.isdir(self.input_path):
-            input_files = [ os.path.join( self.input_path, input_file ) for \
-                            input_file in os.listdir( self.input_path ) ]
-            input_files.sort() # Assuming the filenames have some kind of ordering scheme.
-        else:
+        if not os.path.isdir(self.input_path):
+            from prop import propagateSE
             propagateSE.propagate(self.input_path, self.output_path)
             return 0
 
         # If we have more than one input file, we should also have more than one output file, i.e.
         # output_path should be a directory.
-        if os.path.isfile(self.output_path):
-            raise IOError("The given output path is a file but a directory is needed. Cowardly refusing to overwrite.")
-
-        # Check if output dir exists, create if not.
-        if not os.path.isdir(self.output_path):
-            os.mkdir(self.output_path)
-
-        # Loop over all input files and generate one run per source file.
-        for i,input_file in enumerate(input_files):
-            ### TODO: Transmit number of cpus.
-            output_file = os.path.join( self.output_path, 'prop_out_%07d.h5' % (i) )
-            propagateSE.propagate(input_file, output_file)
+        # Generate one run per source file.
+        self._backengineWorkItems()
 
         return 0
 
         ### TODO: Consider moving IO logic to the ABC.
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+    def _supportsWorkItems(self):
+        """ Query whether this calculator can process its input file by file. """
+        return True
+
+    def _resourceRequirements(self, input_file=None):
+        """ Query for the resources of a work item: one core (set resources, e.g. {'cores' : 4}, to run the FFTs of each pulse
+        on more threads), and memory for the wavefront and its resized copies held by SRW, estimated as four times the source file. """
+        return {'cores' : 1, 'memory' : 4*self._inputSize(input_file), 'mpi_ranks' : 0}
+
+    def _initializeWorkerProcess(self):
+        """ Limit the threads of SRW's FFTs to the cores granted to a work item. The limits are read when the backengine is
+        loaded, so they are set when the worker process starts. """
+        os.environ.update( threadLimits( self._workItemResources()['cores'] ) )
+
+    def _backengineWorkItem(self, input_file, index):
+        """ Propagate a single source file. """
+        # Import the backengine here, so that importing this module stays fast.
+        from prop import propagateSE
+
+        output_file = os.path.join( self.output_path, 'prop_out_%07d.h5' % (index) )
+        propagateSE.propagate(input_file, output_file)
+
+        return [output_file]
 
     def _readH5(self):
         """ """
@@ -28,12 +28,14 @@
 
 """
 import os
-import shutil
 from subprocess import Popen
 import numpy
 import h5py
 
 from SimEx.Calculators.AbstractPhotonSource import AbstractPhotonSource
+from SimEx.Utilities.EntityChecks import checkAndSetInstance
+from SimEx.Utilities.FileSet import FileSet
+from SimEx.Utilities.FileStaging import checkAndSetStagingMode, stageFile
 
 
 class XFELPhotonSource(AbstractPhotonSource):
@@ -41,6 +43,9 @@ class XFELPhotonSource(AbstractPhotonSource):
     Class representing a x-ray free electron laser photon source.
     """
 
+    # Source files in an input directory.
+    _input_pattern = '*FELsource_out*.h5'
+
     def __init__(self,  parameters=None, input_path=None, output_path=None):
         """
         Constructor for the xfel photon source.
@@ -58,27 +63,146 @@ class XFELPhotonSource(AbstractPhotonSource):
         # Initialize base class.
         super(XFELPhotonSource, self).__init__(parameters,input_path,output_path)
 
+        # Staging is bound by the file system, stage several files at once.
+        self.__staging_mode = None
+        self.__target_mesh = None
+        self.number_of_workers = 4
+
+    @property
+    def staging_mode(self):
+        """ Query for the way source files are staged into the output path, see FileStaging. """
+        return checkAndSetStagingMode(self.__staging_mode)
+    @staging_mode.setter
+    def staging_mode(self, value):
+        """ Set the way source files are staged into the output path: 'hardlink', 'reflink' (copy-on-write clone),
+        'symlink' or 'copy'. None selects the deployment wide mode, see FileStaging.setStagingMode(). """
+        if value is not None:
+            checkAndSetStagingMode(value)
+        self.__staging_mode = value
+
+    @property
+    def target_mesh(self):
+        """ Query for the mesh the source wavefronts are resampled to, None if they are staged unchanged. """
+        if self.__target_mesh is None:
+            return None
+        return dict(self.__target_mesh)
+    @target_mesh.setter
+    def target_mesh(self, value):
+        """ Set the mesh to resample the source wavefronts to: a dict of the number of points nx, ny and nSlices (keys
+        left out keep the source mesh), None to stage the source files unchanged. Resampling conserves the pulse energy,
+        see WavefrontResampling.resampleWavefront(). """
+        value = checkAndSetInstance(dict, value, None)
+        if value is not None:
+            for key, number in value.items():
+                if key not in ['nx', 'ny', 'nSlices']:
+                    raise ValueError("The target mesh must be given by nx, ny and nSlices, got %s." % (key))
+                if not isinstance(number, int) or number <= 0:
+                    raise ValueError("The number of mesh points %s must be a positive integer." % (key))
+        self.__target_mesh = value
+
+    def _cacheIgnoredAttributes(self):
+        """ Query for the attributes that do not influence the result: staged files have the same content in all staging modes. """
+        return super(XFELPhotonSource, self)._cacheIgnoredAttributes() + ['_XFELPhotonSource__staging_mode']
+
+    def pulseIndex(self):
+        """
+        Query for the metadata index of the source files in the input directory, e.g. to inspect the photon and pulse energies
+        before selecting pulses. Keys are e.g. '/params/photonEnergy', '/params/Mesh/nSlices' and 'pulse_energy', see MetadataIndex.
+
+        @return : The MetadataIndex, updated with all new and modified source files.
+        """
+        from SimEx.Utilities.MetadataIndex import MetadataIndex
+
+        if not os.path.isdir( self.input_path ):
+            raise IOError( "The input path %s is not a directory." % (self.input_path) )
+        index = MetadataIndex( self.input_path )
+        index.update()
+
+        return index
+
+    def selectPulses(self, photon_energy=None, pulse_energy=None, start=None, stop=None, step=None, sample=None, seed=None):
+        """
+        Select the pulses, i.e. the source files in the input directory, entering the simulation. Only the selected
+        pulses are staged into the output path and processed by downstream calculators.
+
+        @param photon_energy : Range (min, max) of the photon energy (in eV), a bound of None is open.
+        <br/><b>type</b> : tuple
+        <br/><b>default</b> : None (any photon energy)
+
+        @param pulse_energy : Range (min, max) of the pulse energy (in J), a bound of None is open.
+        <br/><b>type</b> : tuple
+        <br/><b>default</b> : None (any pulse energy)
+
+        @param start : Position of the first selected pulse in the list of pulses (ordered by file index) within the energy ranges.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (first pulse)
+
+        @param stop : Position after the last selected pulse.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (all pulses up to the last one)
+
+        @param step : Stride through the positions.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (every pulse)
+
+        @param sample : Number of pulses drawn at random from the selection.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (all pulses)
+
+        @param seed : Seed of the random sample.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (0)
+
+        @return : The selected source files.
+        <br/><b>example</b> : source.selectPulses(photon_energy=(4900.0, 5000.0), pulse_energy=(1e-4, None), sample=100, seed=1)
+        <br/><b>note</b> : Energies are read from a metadata index cached in the input directory, only new and modified files are scanned.
+        """
+        where = _rangeConditions('/params/photonEnergy', photon_energy) + _rangeConditions('pulse_energy', pulse_energy)
+        if where == []:
+            where = None
+        self.input_fileset = FileSet(pattern=self._input_pattern, order='index', start=start, stop=stop, where=where, step=step, sample=sample, seed=seed)
+
+        return self._inputFiles()
 
     def backengine(self):
-        # Copy input to output.
+        # Stage input to output.
         # Check if input_path is a directory.
         if os.path.isdir(self.input_path):
-            # Make directory target if not existing already.
-            if not os.path.isdir(self.output_path):
-                os.mkdir( self.output_path )
-            # Copy files.
-            files_to_copy = [os.path.join(self.input_path, ff) for ff in os.listdir(self.input_path) if 'FELsource_out' in ff and ff.split('.')[-1] == 'h5']
-            for f in files_to_copy:
-                shutil.copy( f, self.output_path )
-
-        # If input is a single file, just copy it to output.
-        else:
-            shutil.copy( self.input_path, self.output_path )
+            # Stage files.
+            self._backengineWorkItems()
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+        # If input is a single file, just stage it to output.
+        else:
+            output_file = self.output_path
+            if os.path.isdir(output_file):
+                output_file = os.path.join( output_file, os.path.basename(self.input_path) )
+            self.__stage( self.input_path, output_file )
+
+    def _supportsWorkItems(self):
+        """ Query whether this calculator can process its input file by file. """
+        return True
+
+    def _resourceRequirements(self, input_file=None):
+        """ Query for the resources of a work item: staging hardly uses the cpu, resampling holds the resampled fields
+        and a slab of source slices in double precision in memory (estimated as 512 MiB). """
+        if self.__target_mesh is None:
+            return {'cores' : 0, 'memory' : 0, 'mpi_ranks' : 0}
+        return {'cores' : 1, 'memory' : 512*1048576, 'mpi_ranks' : 0}
+
+    def _backengineWorkItem(self, input_file, index):
+        """ Stage (or resample) a single source file into the output directory. """
+        output_file = os.path.join( self.output_path, os.path.basename(input_file) )
+        self.__stage( input_file, output_file )
+
+        return [output_file]
+
+    def __stage(self, input_file, output_file):
+        """ Stage a source file, skipping files already staged, or write it resampled to the target mesh. """
+        if self.__target_mesh is None:
+            stageFile( input_file, output_file, self.staging_mode )
+        else:
+            from SimEx.Utilities.WavefrontResampling import resampleWavefront
+            resampleWavefront( input_file, output_file, write_policy=self.write_policy, **self.__target_mesh )
 
     def _readH5(self):
         """ """
@@ -99,5 +223,16 @@ class XFELPhotonSource(AbstractPhotonSource):
         pass
 
 
-
-
+def _rangeConditions(key, bounds):
+    """ Query for the metadata conditions selecting values of key within bounds (min, max). """
+    if bounds is None:
+        return []
+    bounds = checkAndSetInstance(tuple, bounds)
+    if len(bounds) != 2:
+        raise ValueError("The range of %s must be given as (min, max)." % (key))
+    conditions = []
+    if bounds[0] is not None:
+        conditions.append((key, '>=', bounds[0]))
+    if bounds[1] is not None:
+        conditions.append((key, '<=', bounds[1]))
+    return conditions
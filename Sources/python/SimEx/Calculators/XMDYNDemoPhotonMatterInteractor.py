@@ -30,10 +30,6 @@
 import os
 import subprocess
 
-
-from pmi_demo import PMIDemo
-import pmi_script
-
 from SimEx.Calculators.AbstractPhotonInteractor import AbstractPhotonInteractor
 
 
@@ -138,70 +134,64 @@ class XMDYNDemoPhotonMatterInteractor(AbstractPhotonInteractor):
     def backengine(self):
         """ This method drives the backengine code."""
         status = 0
-        input_files = []
-        if os.path.isfile(self.input_path):
-            input_files = [self.input_path]
+        if not os.path.exists(self.input_path):
+            raise IOError("Input file %s does not exist or cannot be read." % (self.input_path) )
 
-        elif os.path.isdir(self.input_path):
-            input_files = [ os.path.join( self.input_path, f) for f in os.listdir( self.input_path ) ]
-            input_files.sort()
+        # Generate formatted output files (i.e. attach history to output file) in the output directory.
+        self._backengineWorkItems()
+
+        return status
 
+    def _supportsWorkItems(self):
+        """ Query whether this calculator can process its input file by file. """
+        return True
+
+    def _backengineWorkItem(self, input_file, index):
+        """ Run the photon-matter interaction for a single propagated pulse. """
+        # Import the backengine here, so that importing this module stays fast.
+        from pmi_demo import PMIDemo
+        import pmi_script
+
+        tail = input_file.split( 'prop' )[-1]
+        output_file = os.path.join( self.output_path , 'pmi_out_%07d.h5' % (index+1) )
+        pmi_script.f_h5_out2in( input_file, output_file)
+
+        # Get the backengine calculator.
+        pmi_demo = PMIDemo()
+
+        # Transfer some parameters.
+        pmi_demo.g_s2e['prj'] = ''
+        pmi_demo.g_s2e['id'] = tail.split('_')[-1].split('.')[0]
+        pmi_demo.g_s2e['prop_out'] = input_file
+        pmi_demo.g_s2e['setup'] = dict()
+        pmi_demo.g_s2e['sys'] = dict()
+        pmi_demo.g_s2e['setup']['num_digits'] = 7
+
+        if 'number_of_steps' in self.parameters.keys():
+            pmi_demo.g_s2e['steps'] = self.parameters['number_of_steps']
         else:
-            raise IOError("Input file %s does not exist or cannot be read." % (self.input_path) )
+            pmi_demo.g_s2e['steps'] = 100
 
-        # Create output directory if not existing yet.
-        if not os.path.isdir( self.output_path ):
-            os.mkdir( self.output_path )
-        elif os.path.isfile( self.output_path ):
-            raise IOError( "Output file %s already exists, cowardly refusing to overwrite." % (self.output_path) )
-
-        # Generate formatted output files (i.e. attach history to output file).
-        for i,input_file in enumerate(input_files):
-            tail = input_file.split( 'prop' )[-1]
-            output_file = os.path.join( self.output_path , 'pmi_out_%07d.h5' % (i+1) )
-            pmi_script.f_h5_out2in( input_file, output_file)
-
-            # Get the backengine calculator.
-            pmi_demo = PMIDemo()
-
-            # Transfer some parameters.
-            pmi_demo.g_s2e['prj'] = ''
-            pmi_demo.g_s2e['id'] = tail.split('_')[-1].split('.')[0]
-            pmi_demo.g_s2e['prop_out'] = input_file
-            pmi_demo.g_s2e['setup'] = dict()
-            pmi_demo.g_s2e['sys'] = dict()
-            pmi_demo.g_s2e['setup']['num_digits'] = 7
-
-            if 'number_of_steps' in self.parameters.keys():
-                pmi_demo.g_s2e['steps'] = self.parameters['number_of_steps']
-            else:
-                pmi_demo.g_s2e['steps'] = 100
-
-            pmi_demo.g_s2e['maxZ'] = 100
-
-
-            pmi_demo.g_s2e['setup']['pmi_out'] = output_file
-            # Setup the database.
-            pmi_demo.f_dbase_setup()
-
-            # Go through the pmi workflow.
-            pmi_demo.f_init_random()
-            pmi_demo.f_save_info()
-            pmi_demo.f_load_pulse( pmi_demo.g_s2e['prop_out'] )
-            pmi_demo.f_load_sample(self.__sample_path)
-            pmi_demo.f_rotate_sample()
-            pmi_demo.f_system_setup()
-
-            # Perform the trajectories for this pulse and orientation.
-            for traj in range( self.parameters['number_of_trajectories'] ):
-                pmi_demo.f_time_evolution()
+        pmi_demo.g_s2e['maxZ'] = 100
 
-        return status
 
-    @property
-    def data(self):
-        """ Query for the field data. """
-        return self.__data
+        pmi_demo.g_s2e['setup']['pmi_out'] = output_file
+        # Setup the database.
+        pmi_demo.f_dbase_setup()
+
+        # Go through the pmi workflow.
+        pmi_demo.f_init_random()
+        pmi_demo.f_save_info()
+        pmi_demo.f_load_pulse( pmi_demo.g_s2e['prop_out'] )
+        pmi_demo.f_load_sample(self.__sample_path)
+        pmi_demo.f_rotate_sample()
+        pmi_demo.f_system_setup()
+
+        # Perform the trajectories for this pulse and orientation.
+        for traj in range( self.parameters['number_of_trajectories'] ):
+            pmi_demo.f_time_evolution()
+
+        return [output_file]
 
     def _readH5(self):
         """ """
@@ -0,0 +1,199 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the ParameterSweep class.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import copy
+import itertools
+import os
+from collections import OrderedDict
+
+from SimEx.Parameters.AbstractCalculatorParameters import AbstractCalculatorParameters
+from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+from SimEx.Utilities.EntityChecks import checkAndSetInstance
+
+class ParameterSweep(object):
+    """
+    Class representing a scan over parameter variants of the calculators in a simulation.
+    All combinations of variants form a prefix tree: calculators with identical parameters and identical
+    upstream calculators are run only once, their output feeds all downstream variants.
+    """
+
+    def __init__(self, simulation, variants, output_path):
+        """
+        Constructor for the ParameterSweep.
+
+        @param simulation : The simulation whose calculators serve as templates.
+        <br/><b>type</b> : PhotonExperimentSimulation
+
+        @param variants : Parameter variants per calculator. Each variant is a dict of parameters that replace the
+        calculator's parameters (for parameter objects the corresponding attributes are set).
+        <br/><b>type</b> : dict of lists of dicts, keyed by calculator name
+        <br/><b>example</b> : variants={'photon_diffractor' : [{'number_of_diffraction_patterns' : 2}, {'number_of_diffraction_patterns' : 10}]}
+
+        @param output_path : Directory holding the output of all calculators. The output of each calculator goes into a
+        subdirectory named after the calculator and its variant, nested below the directory of its upstream calculator.
+        <br/><b>type</b> : string
+        """
+        simulation = checkAndSetInstance(PhotonExperimentSimulation, simulation)
+        self.__order = simulation.workflow.linearOrder()
+        if self.__order is None:
+            raise RuntimeError("Parameter sweeps require a workflow without branches.")
+        self.__templates = simulation.workflow.calculators
+
+        variants = checkAndSetInstance(dict, variants)
+        for name, stage_variants in variants.items():
+            if name not in self.__templates:
+                raise KeyError("No calculator named %s in the simulation." % (name))
+            if not isinstance(stage_variants, list) or stage_variants == []:
+                raise TypeError("The variants of calculator %s must be given as a non-empty list of dicts." % (name))
+        self.__variants = variants
+
+        self.__output_path = os.path.abspath(checkAndSetInstance(str, output_path))
+        self.__simulation = None
+
+        self.__buildWorkflow()
+
+    @property
+    def points(self):
+        """ Query for all parameter points, each one a dict of variant indices keyed by calculator name. """
+        return [OrderedDict(zip(self.__order, indices)) for indices in self.__indices]
+
+    @property
+    def workflow(self):
+        """ Query for the workflow graph of all distinct calculators (the prefix tree). """
+        return self.__workflow
+
+    @property
+    def simulation(self):
+        """ Query for the simulation running the sweep, e.g. to set cache_dir, journal_path or report_path. """
+        return self.__simulation
+
+    def nodeName(self, point, name):
+        """
+        Query for the name of a calculator of a parameter point in the workflow graph.
+
+        @param point : Index of the parameter point.
+        <br/><b>type</b> : int
+
+        @param name : The calculator name.
+        <br/><b>type</b> : string
+
+        @return : The name of the node in the workflow graph, i.e. the path of its output directory relative to the sweep output.
+        """
+        return self.__nodeName(self.__indices[point], self.__order.index(name))
+
+    def calculator(self, point, name):
+        """
+        Query for a calculator of a parameter point.
+
+        @param point : Index of the parameter point.
+        <br/><b>type</b> : int
+
+        @param name : The calculator name.
+        <br/><b>type</b> : string
+
+        @return : The calculator, shared with all points that have the same upstream variants.
+        """
+        return self.__workflow.calculators[self.nodeName(point, name)]
+
+    def run(self, number_of_workers=1):
+        """
+        Run all distinct calculators, each one as soon as its upstream calculator has finished.
+
+        @param number_of_workers : Maximum number of calculators running concurrently.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+        """
+        for calculator in self.__workflow.calculators.values():
+            output_dir = os.path.dirname(calculator.output_path)
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+
+        self.__simulation.run(number_of_workers=number_of_workers)
+
+    def __nodeName(self, indices, position):
+        """ Name of the calculator at the given position in the chain for the given variant indices. """
+        return '/'.join(['%s_%d' % (n, i) for n,i in zip(self.__order[:position+1], indices)])
+
+    def __buildWorkflow(self):
+        """ Build the prefix tree of calculators for all combinations of variants. """
+        ranges = [range(len(self.__variants.get(name, [None]))) for name in self.__order]
+        self.__indices = list(itertools.product(*ranges))
+
+        self.__workflow = WorkflowGraph()
+        for indices in self.__indices:
+            upstream = None
+            for position, name in enumerate(self.__order):
+                node = self.__nodeName(indices, position)
+                if node not in self.__workflow.calculators:
+                    template = self.__templates[name]
+
+                    # The first calculator reads the original input, all others the output of their upstream calculator.
+                    input_path = template.input_path
+                    if upstream is not None:
+                        input_path = self.__workflow.calculators[upstream].output_path
+                    output_path = os.path.join(self.__output_path, node, os.path.basename(template.output_path))
+
+                    # Copy the template, so that settings beyond the constructor arguments (e.g. number_of_workers,
+                    # input_fileset, write_policy) are kept. Every calculator gets its own copy of the parameters, calculators
+                    # running concurrently must not share them. Published results are not copied, see AbstractBaseCalculator.__getstate__.
+                    calculator = copy.deepcopy(template)
+                    if name in self.__variants:
+                        calculator.parameters = applyVariant(calculator.parameters, self.__variants[name][indices[position]])
+                    calculator.input_path = input_path
+                    calculator.output_path = output_path
+                    self.__workflow.addCalculator(node, calculator, upstream)
+
+                upstream = node
+
+        self.__simulation = PhotonExperimentSimulation(workflow=self.__workflow)
+
+
+def applyVariant(parameters, variant):
+    """
+    Create a copy of calculator parameters with some parameters replaced.
+
+    @param parameters : The original parameters.
+    <br/><b>type</b> : dict or AbstractCalculatorParameters
+
+    @param variant : The parameters to replace.
+    <br/><b>type</b> : dict
+
+    @return : The new parameters.
+    """
+    variant = checkAndSetInstance(dict, variant)
+    if isinstance(parameters, AbstractCalculatorParameters):
+        parameters = copy.deepcopy(parameters)
+        for key, value in variant.items():
+            setattr(parameters, key, value)
+        return parameters
+
+    parameters = dict(parameters)
+    parameters.update(variant)
+
+    return parameters
@@ -25,7 +25,7 @@
     @creation : 20151005
 """
 
-
+import os
 
 from SimEx.Calculators.AbstractPhotonAnalyzer   import checkAndSetPhotonAnalyzer
 from SimEx.Calculators.AbstractPhotonDetector   import checkAndSetPhotonDetector
@@ -33,8 +33,19 @@ from SimEx.Calculators.AbstractPhotonDiffractor import checkAndSetPhotonDiffract
 from SimEx.Calculators.AbstractPhotonInteractor import checkAndSetPhotonInteractor
 from SimEx.Calculators.AbstractPhotonPropagator import checkAndSetPhotonPropagator
 from SimEx.Calculators.AbstractPhotonSource import checkAndSetPhotonSource
+from SimEx.Calculators.AbstractBaseCalculator import WorkItemHooks
+
+from SimEx.PhotonExperimentSimulation.RunJournal import RunJournal
+from SimEx.PhotonExperimentSimulation.RunReport import RunReport
+from SimEx.PhotonExperimentSimulation.StageCache import StageCache
+from SimEx.PhotonExperimentSimulation.StagePipeline import StagePipeline
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph, runCalculator, runPhase
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.ResourceScheduler import defaultResourceScheduler
+from SimEx.Utilities.SchemaValidator import defaultSchemaValidator
 
-from SimEx.Utilities.EntityChecks import checkAndSetInstance
+# Names of the calculators in the linear workflow, from upstream to downstream.
+_LINEAR_WORKFLOW = ['photon_source', 'photon_propagator', 'photon_interactor', 'photon_diffractor', 'photon_detector', 'photon_analyzer']
 
 class PhotonExperimentSimulation(object):
     """ The PhotonExperimentSimulation is the top level object for running photon experiment simulations. It hosts the modules (calculators) ."""
@@ -44,7 +55,8 @@ class PhotonExperimentSimulation(object):
                        photon_interactor=None,
                        photon_diffractor=None,
                        photon_detector=None,
-                       photon_analyzer=None):
+                       photon_analyzer=None,
+                       workflow=None):
         """
         !@brief  Constructor for the PhotonExperimentSimulation object.
 
@@ -65,6 +77,11 @@ class PhotonExperimentSimulation(object):
 
         @param photon_analyzer : The calculator for  photon signal analysis.
         <br/><b>type</b> : Child of AbstractPhotonAnalyzer
+
+        @param workflow : A graph of calculators to run instead of the linear chain source, propagator, interactor, diffractor, (detector,) analyzer.
+        <br/><b>type</b> : WorkflowGraph
+        <br/><b>default</b> : None
+        <br/><b>note</b> : If a workflow is given, none of the individual calculators may be given.
         """
         self.__photon_source = checkAndSetPhotonSource(photon_source)
         self.__photon_propagator = checkAndSetPhotonPropagator(photon_propagator)
@@ -73,21 +90,48 @@ class PhotonExperimentSimulation(object):
         self.__photon_detector = checkAndSetPhotonDetector(photon_detector)
         self.__photon_analyzer = checkAndSetPhotonAnalyzer(photon_analyzer)
 
-        self.__calculators = [
-                self.__photon_source,
-                self.__photon_propagator,
-                self.__photon_interactor,
-                self.__photon_diffractor,
-                self.__photon_analyzer,
+        calculators = [
+                ('photon_source', self.__photon_source),
+                ('photon_propagator', self.__photon_propagator),
+                ('photon_interactor', self.__photon_interactor),
+                ('photon_diffractor', self.__photon_diffractor),
+                ('photon_detector', self.__photon_detector),
+                ('photon_analyzer', self.__photon_analyzer),
                 ]
 
-
-        if self.__photon_detector is not None:
-            self.__calculators.insert(-1, self.__photon_detector )
-
-        if any([calc is None for calc in self.__calculators]):
+        if workflow is not None:
+            if any([calc is not None for name, calc in calculators]):
+                raise RuntimeError("Either a workflow or the individual calculators can be given, not both.")
+            self.__workflow = checkAndSetInstance(WorkflowGraph, workflow)
+            self.__linear_workflow = False
+            self.__cache = None
+            self.__journal = None
+            self.__report_path = None
+            self.__report = None
+            self.__item_mode = False
+            self.__schema_check = 'warn'
+            return
+
+        if any([calc is None for name, calc in calculators if name != 'photon_detector']):
             raise( TypeError, "No calculator can be None.")
 
+        # Setup the linear workflow.
+        self.__workflow = WorkflowGraph()
+        upstream = None
+        for name, calc in calculators:
+            if calc is None:
+                continue
+            self.__workflow.addCalculator(name, calc, upstream)
+            upstream = name
+        self.__linear_workflow = True
+
+        self.__cache = None
+        self.__journal = None
+        self.__report_path = None
+        self.__report = None
+        self.__item_mode = False
+        self.__schema_check = 'warn'
+
     #######################
     # Queries and setters #
     #######################
@@ -98,6 +142,7 @@ class PhotonExperimentSimulation(object):
     @photon_source.setter
     def photon_source(self, value):
         self.__photon_source = checkAndSetPhotonSource( value )
+        self.__updateWorkflow('photon_source', self.__photon_source)
 
     @property
     def photon_propagator(self):
@@ -106,6 +151,7 @@ class PhotonExperimentSimulation(object):
     @photon_propagator.setter
     def photon_propagator(self, value):
         self.__photon_propagator = checkAndSetPhotonPropagator( value )
+        self.__updateWorkflow('photon_propagator', self.__photon_propagator)
 
     @property
     def photon_interactor(self):
@@ -114,6 +160,7 @@ class PhotonExperimentSimulation(object):
     @photon_interactor.setter
     def photon_interactor(self, value):
         self.__photon_interactor = checkAndSetPhotonInteractor( value )
+        self.__updateWorkflow('photon_interactor', self.__photon_interactor)
 
     @property
     def photon_diffractor(self):
@@ -122,6 +169,7 @@ class PhotonExperimentSimulation(object):
     @photon_diffractor.setter
     def photon_diffractor(self, value):
         self.__photon_diffractor = checkAndSetPhotonDiffractor( value )
+        self.__updateWorkflow('photon_diffractor', self.__photon_diffractor)
 
     @property
     def photon_detector(self):
@@ -130,6 +178,7 @@ class PhotonExperimentSimulation(object):
     @photon_detector.setter
     def photon_detector(self, value):
         self.__photon_detector = checkAndSetPhotonDetector( value )
+        self.__updateWorkflow('photon_detector', self.__photon_detector)
 
     @property
     def photon_analyzer(self):
@@ -138,57 +187,348 @@ class PhotonExperimentSimulation(object):
     @photon_analyzer.setter
     def photon_analyzer(self, value):
         self.__photon_analyzer = checkAndSetPhotonAnalyzer( value )
+        self.__updateWorkflow('photon_analyzer', self.__photon_analyzer)
+
+    @property
+    def workflow(self):
+        """ Query for the graph of calculators run by this simulation. """
+        return self.__workflow
+
+    @property
+    def cache_dir(self):
+        """ Query for the directory of the stage result cache (None if caching is disabled). """
+        if self.__cache is None:
+            return None
+        return self.__cache.cache_dir
+    @cache_dir.setter
+    def cache_dir(self, value):
+        """ Set the directory of the stage result cache. Calculators whose class, parameters and input
+        are found in the cache are not run, their output is restored from the cache instead. """
+        value = checkAndSetInstance(str, value, None)
+        if value is None:
+            self.__cache = None
+        else:
+            self.__cache = StageCache(value)
+
+    @property
+    def journal_path(self):
+        """ Query for the path of the run journal (None if no journal is written). """
+        if self.__journal is None:
+            return None
+        return self.__journal.path
+    @journal_path.setter
+    def journal_path(self, value):
+        """ Set the path of the run journal. Completed calculators are recorded in the journal, so that an interrupted
+        run can be continued with resume(). In item mode and in pipelined runs, also completed single files are recorded. """
+        value = checkAndSetInstance(str, value, None)
+        if value is None:
+            self.__journal = None
+        else:
+            self.__journal = RunJournal(value)
+
+    @property
+    def report_path(self):
+        """ Query for the path of the json report on timing and resource usage (None if no report is written). """
+        return self.__report_path
+    @report_path.setter
+    def report_path(self, value):
+        """ Set the path of the json report on timing and resource usage. If set, the wall time, cpu time, peak memory
+        and io of every calculator's _readH5, backengine and saveH5 are recorded. In item mode and in pipelined runs, also
+        those of every single file processed by calculators reading a directory. """
+        value = checkAndSetInstance(str, value, None)
+        if value is not None:
+            value = os.path.abspath(value)
+        self.__report_path = value
+
+    @property
+    def report(self):
+        """ Query for the report of the last run (None if no report was recorded). """
+        return self.__report
+
+    @property
+    def item_mode(self):
+        """ Query whether calculators reading a directory are run file by file. """
+        return self.__item_mode
+    @item_mode.setter
+    def item_mode(self, value):
+        """ Set whether calculators that read a directory and support work items are run file by file instead of
+        calling their backengine, so that every completed file is recorded in journal and report and resume() continues
+        with the remaining files. Note that this changes how the backengine is run, e.g. one job per file. """
+        self.__item_mode = checkAndSetInstance(bool, value, False)
+
+    @property
+    def schema_check(self):
+        """ Query for the handling of input files lacking expected data ('strict', 'warn' or 'off'). """
+        return self.__schema_check
+    @schema_check.setter
+    def schema_check(self, value):
+        """ Set the handling of input files lacking data expected by their calculator: 'strict' raises before
+        the calculator runs, 'warn' prints the missing data (default), 'off' skips the check. Calculators without upstream
+        calculators are checked before the run starts, all others before they run. Only the hdf5 metadata of the
+        first and last input files is inspected, see SchemaValidator. """
+        value = checkAndSetInstance(str, value, 'warn')
+        if value not in ['strict', 'warn', 'off']:
+            raise ValueError("The schema check must be 'strict', 'warn' or 'off'.")
+        self.__schema_check = value
+
+    def __updateWorkflow(self, name, calculator):
+        """ Replace a calculator in the linear workflow, insert it between its neighbours if it was not given at construction, or remove it if set to None. """
+        if name in self.__workflow.calculators:
+            if calculator is None:
+                self.__workflow.removeCalculator(name)
+            else:
+                self.__workflow.setCalculator(name, calculator)
+            return
+        if calculator is None:
+            return
+        if not self.__linear_workflow:
+            raise RuntimeError("The workflow given at construction has no calculator named %s, please add it to the workflow." % (name))
+
+        position = _LINEAR_WORKFLOW.index(name)
+        present = self.__workflow.calculators
+        upstream = ([None] + [n for n in _LINEAR_WORKFLOW[:position] if n in present])[-1]
+        downstream = ([n for n in _LINEAR_WORKFLOW[position+1:] if n in present] + [None])[0]
+        self.__workflow.insertCalculator(name, calculator, upstream, downstream)
+
+    def run(self, pipelined=False, queue_size=4, number_of_workers=1):
+        """
+        Method to start the photon experiment simulation workflow.
+
+        @param pipelined : Whether to run all calculators concurrently, passing single files from one calculator to the next as soon as they are written.
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : False
+
+        @param queue_size : In pipelined mode, maximum number of files waiting between two calculators.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 4
+
+        @param number_of_workers : Maximum number of independent calculators running concurrently.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        <br/><b>note</b> : Pipelined runs cannot use the stage cache (cache_dir), since calculators start before their input is complete.
+        They run all calculators of the chain concurrently, number_of_workers must be 1.
+        """
+
+        if self.__journal is not None:
+            self.__journal.reset()
+
+        self.__run(pipelined, queue_size, number_of_workers)
+
+    def resume(self, pipelined=False, queue_size=4, number_of_workers=1):
+        """
+        Method to continue an interrupted run. Calculators and single files recorded as completed in the run
+        journal are skipped if their input and output files are unchanged since.
+
+        @param pipelined : Whether to run all calculators concurrently, see run().
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : False
+
+        @param queue_size : In pipelined mode, maximum number of files waiting between two calculators.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 4
+
+        @param number_of_workers : Maximum number of independent calculators running concurrently.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        <br/><b>note</b> : Requires the journal_path to be set to the journal of the interrupted run.
+        """
+        if self.__journal is None:
+            raise RuntimeError("Cannot resume without a run journal, please set the journal_path.")
 
-    def run(self):
-        """ Method to start the photon experiment simulation workflow. """
+        self.__run(pipelined, queue_size, number_of_workers)
 
+    def __run(self, pipelined, queue_size, number_of_workers):
+        """ Run the workflow. """
         if not self._checkInterfaceConsistency():
             raise RuntimeError(" Interfaces are not consistent, i.e. at least one module's expectations with respect to incoming data sets are not satisfied.")
 
-        print '\n'.join(["#"*80,  "# Starting SIMEX run.", "#"*80])
-        print '\n'.join(["#"*80,  "# Starting SIMEX photon source.", "#"*80])
-        self.__photon_source._readH5()
-        self.__photon_source.backengine()
-        self.__photon_source.saveH5()
-
-        print '\n'.join(["#"*80,  "# Starting SIMEX photon propagation.", "#"*80])
-        self.__photon_propagator._readH5()
-        self.__photon_propagator.backengine()
-        self.__photon_propagator.saveH5()
-
-        print '\n'.join(["#"*80,  "# Starting SIMEX photon-matter interaction.", "#"*80])
-        self.__photon_interactor._readH5()
-        self.__photon_interactor.backengine()
-        self.__photon_interactor.saveH5()
-
-        print '\n'.join(["#"*80,  "# Starting SIMEX photon diffraction.", "#"*80])
-        self.__photon_diffractor._readH5()
-        self.__photon_diffractor.backengine()
-        self.__photon_diffractor.saveH5()
-
-        if self.__photon_detector is not None:
-            print '\n'.join(["#"*80,  "# Starting SIMEX photon detection.", "#"*80])
-            self.__photon_detector._readH5()
-            self.__photon_detector.backengine()
-            self.__photon_detector.saveH5()
-
-        print '\n'.join(["#"*80,  "# Starting SIMEX photon signal analysis.", "#"*80])
-        self.__photon_analyzer._readH5()
-        self.__photon_analyzer.backengine()
-        self.__photon_analyzer.saveH5()
+        if pipelined:
+            # Cached outputs are keyed by the complete input, which pipelined calculators do not wait for.
+            if self.__cache is not None:
+                raise RuntimeError("Pipelined runs cannot use the stage cache, please unset the cache_dir or run without pipelining.")
+            if number_of_workers != 1:
+                raise ValueError("Pipelined runs run all calculators concurrently, number_of_workers must be 1.")
+
+        # Fail before anything runs if the initial input lacks expected data.
+        for name, calculator in self.__workflow.calculators.items():
+            if self.__workflow.upstream(name) == []:
+                self._checkInputSchema(name, calculator)
+
+        self.__report = None
+        if self.__report_path is not None:
+            self.__report = RunReport()
+
+        try:
+            if pipelined:
+                self._runPipelined(queue_size)
+                return
+
+            print '\n'.join(["#"*80,  "# Starting SIMEX run.", "#"*80])
+            self.__workflow.run(stage_runner=self._runStage, number_of_workers=number_of_workers)
+            print '\n'.join(["#"*80,  "# SIMEX  done.", "#"*80])
+
+        finally:
+            # Write the report also for failed runs.
+            if self.__report is not None:
+                self.__report.finish()
+                self.__report.write(self.__report_path)
+
+
+    def _runPipelined(self, queue_size):
+        """ Run all calculators concurrently, each one processing single files as soon as the upstream calculator provides them. """
+        order = self.__workflow.linearOrder()
+        if order is None:
+            raise RuntimeError("Pipelined mode requires a workflow without branches.")
+        calculators = [self.__workflow.calculators[name] for name in order]
+
+        # The input files of downstream calculators are written while the pipeline runs, the first one is checked.
+        checked = set(order[:1])
+        def runWorkItem(name, calculator, input_file, index):
+            if name not in checked:
+                checked.add(name)
+                self._checkInputSchema(name, calculator, [input_file])
+            return self._runWorkItem(name, calculator, input_file, index)
+
+        pipeline = StagePipeline(calculators,
+                                 queue_size=checkAndSetPositiveInteger(queue_size, 4),
+                                 names=order,
+                                 stage_runner=self._runStage,
+                                 item_runner=runWorkItem,
+                                 report=self.__report,
+                                 stage_done=self._completeItemStage,
+                                 )
+
+        print '\n'.join(["#"*80,  "# Starting SIMEX pipelined run.", "#"*80])
+        for calculator, item_mode in zip(calculators, pipeline.item_mode):
+            print "# %s: %s" % (calculator.__class__.__name__, {True : "per file", False : "waits for complete input"}[item_mode])
+
+        pipeline.run()
 
         print '\n'.join(["#"*80,  "# SIMEX  done.", "#"*80])
 
+    def _runStage(self, name, calculator):
+        """ Run a single calculator, skipping it if completed according to the journal and restoring its output from the cache if possible. """
+        journal = self.__journal
+        cache = self.__cache
+
+        # Input handed over in memory is not known to journal and cache, so the calculator has to run.
+        if calculator._inputResult() is not None:
+            cache = None
+        elif journal is not None and journal.isStageComplete(name, calculator):
+            print '\n'.join(["#"*80,  "# SIMEX %s already completed." % (name.replace('_', ' ')), "#"*80])
+            calculator.publish(None)
+            return
+
+        key = None
+        if cache is not None:
+            key = cache.key(calculator)
+            if cache.restore(key, calculator.output_path):
+                print '\n'.join(["#"*80,  "# SIMEX %s restored from cache." % (name.replace('_', ' ')), "#"*80])
+                calculator.publish(None)
+                if journal is not None:
+                    journal.completeStage(name, calculator)
+                return
+            cache.detach(calculator.output_path)
+
+        # Calculators without upstream calculators were checked before the run.
+        if calculator._inputResult() is None and self.__workflow.upstream(name) != []:
+            self._checkInputSchema(name, calculator)
+
+        # In item mode, calculators that process single files are run file by file so that each file is recorded.
+        report = self.__report
+        if self.__item_mode and calculator._supportsWorkItems() and os.path.isdir(calculator.input_path) and not os.path.isfile(calculator.output_path):
+            print '\n'.join(["#"*80,  "# Starting SIMEX %s." % (name.replace('_', ' ')), "#"*80])
+            runPhase(report, name, '_readH5', calculator._readH5)
+            hooks = _StageHooks(name, journal, report)
+            runPhase(report, name, 'backengine', lambda: calculator._backengineWorkItems(hooks))
+            runPhase(report, name, 'saveH5', calculator.persist)
+        elif calculator._supportsWorkItems():
+            # Resources are granted to the work items one by one.
+            runCalculator(name, calculator, report)
+        else:
+            with defaultResourceScheduler().reserve(**calculator.resources):
+                runCalculator(name, calculator, report)
+        if report is not None:
+            for failure in calculator.quarantine:
+                report.addFailure(name, failure)
+
+        # Output lacking quarantined work items is neither cached nor recorded as complete, resume() retries them.
+        if calculator.quarantine != []:
+            return
+
+        if key is not None:
+            cache.store(key, calculator.output_path)
+        if journal is not None:
+            journal.completeStage(name, calculator)
+
+    def _runWorkItem(self, name, calculator, input_file, index):
+        """ Process a single input file of a calculator unless completed according to the journal. Returns the list of output files. """
+        journal = self.__journal
+        if journal is not None:
+            output_files = journal.completedItem(name, input_file)
+            if output_files is not None:
+                return output_files
+
+        with defaultResourceScheduler().reserve(**calculator._workItemResources(input_file)):
+            output_files, failure = runPhase(self.__report, name, 'backengine', lambda: calculator._attemptWorkItem(input_file, index), item=input_file)
+        if failure is not None:
+            calculator._quarantineWorkItem(failure)
+            if self.__report is not None:
+                self.__report.addFailure(name, failure)
+            return output_files
+
+        if journal is not None:
+            journal.completeItem(name, input_file, output_files)
+
+        return output_files
+
+    def _completeItemStage(self, name, calculator):
+        """ Record a calculator that processed all its input files one by one as completed, unless files were quarantined. """
+        if self.__journal is not None and calculator.quarantine == []:
+            self.__journal.completeStage(name, calculator)
+
+    def _checkInputSchema(self, name, calculator, input_files=None):
+        """ Check that the input files of a calculator (by default the first and last ones) hold the data it expects, according to schema_check. """
+        if self.__schema_check == 'off':
+            return
+
+        missing = defaultSchemaValidator().validate(calculator, input_files)
+        if missing == {}:
+            return
+
+        msg = "Input of %s lacks expected data:\n%s" % (name, "\n".join(["%s: %s" % (path, ", ".join(data)) for path, data in sorted(missing.items())]))
+        if self.__schema_check == 'strict':
+            raise RuntimeError(msg)
+        print "WARNING: " + msg
 
     def _checkInterfaceConsistency(self):
         """
         Check that all calculators provide the data expected by the next downstream
         calculator.
         """
-        status = True
-        for i,calculator in enumerate(self.__calculators[:-1]):
-            provided_data_set = set(calculator.providedData())
-            expected_data_set = set(self.__calculators[i+1].expectedData())
-            if not expected_data_set.issubset( provided_data_set ):
-                raise RuntimeError( "Dataset expected by %s is not a subset of data provided by %s.\n Provided data are:\n%s.\n\n Expected data are:\n%s" % (self.__calculators[i+1], calculator, str(provided_data_set).replace(',', '\n'), str(expected_data_set).replace(',', '\n') ) )
-        return status
+        return self.__workflow.checkInterfaceConsistency()
+
+
+class _StageHooks(WorkItemHooks):
+    """ Hooks recording the work items of a calculator run in item mode in the journal and the report. """
+
+    def __init__(self, name, journal, report):
+        self.__name = name
+        self.__journal = journal
+        self.__report = report
+
+    def completedOutput(self, input_file):
+        """ Query for the output files of a work item completed according to the journal. """
+        if self.__journal is None:
+            return None
+        return self.__journal.completedItem(self.__name, input_file)
+
+    def workItemDone(self, input_file, index, output_files, failure, usage):
+        """ Record the resource usage of a work item, and the work item in the journal if it did not fail. """
+        if self.__report is not None:
+            usage['status'] = 'done' if failure is None else 'failed'
+            self.__report.addMeasurement(self.__name, 'backengine', usage, item=input_file)
+        if self.__journal is not None and failure is None:
+            self.__journal.completeItem(self.__name, input_file, output_files)
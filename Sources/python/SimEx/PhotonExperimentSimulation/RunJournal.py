@@ -0,0 +1,210 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the RunJournal class, a record of the work completed in a simulation run.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import json
+import os
+import threading
+
+from SimEx.PhotonExperimentSimulation.StageCache import walkFiles
+
+class RunJournal(object):
+    """
+    Class representing the journal of a simulation run. Completed calculators (stages) and completed
+    work items (single input files) are appended to a journal file together with the size and modification
+    time of their input and output files. A resumed run skips all work whose journal record is still valid.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor for the RunJournal.
+
+        @param path : Path of the journal file. Records from an existing file are loaded.
+        <br/><b>type</b> : string
+        """
+        self.__path = os.path.abspath(path)
+        self.__stages = {}
+        self.__items = {}
+        self.__lock = threading.Lock()
+
+        if os.path.isfile(self.__path):
+            self.__load()
+
+    @property
+    def path(self):
+        """ Query for the path of the journal file. """
+        return self.__path
+
+    def reset(self):
+        """ Discard all records, e.g. when starting a new run. """
+        with self.__lock:
+            self.__stages = {}
+            self.__items = {}
+            open(self.__path, 'w').close()
+
+    def isStageComplete(self, name, calculator):
+        """
+        Query whether a calculator has completed and its input and output are unchanged since.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param calculator : The calculator.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @return : True if the calculator does not need to run again, False otherwise.
+        """
+        record = self.__stages.get(name)
+        if record is None:
+            return False
+
+        return record['input'] == fileSignature(calculator.input_path) and validateFiles(record['output'])
+
+    def completeStage(self, name, calculator):
+        """
+        Record a completed calculator.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param calculator : The calculator.
+        <br/><b>type</b> : AbstractBaseCalculator
+        """
+        self.__append({'stage' : name,
+                       'input' : fileSignature(calculator.input_path),
+                       'output' : fileSignature(calculator.output_path),
+                       })
+
+    def completedItem(self, name, input_file):
+        """
+        Query for the output of a work item that has completed, if its input and output files are unchanged since.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param input_file : The input file of the work item.
+        <br/><b>type</b> : string
+
+        @return : The sorted list of output files, None if the work item has to run (again).
+        """
+        record = self.__items.get((name, os.path.abspath(input_file)))
+        if record is None:
+            return None
+        if record['input'] != fileSignature(input_file) or not validateFiles(record['output']):
+            return None
+
+        return sorted(record['output'].keys())
+
+    def completeItem(self, name, input_file, output_files):
+        """
+        Record a completed work item.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param input_file : The input file of the work item.
+        <br/><b>type</b> : string
+
+        @param output_files : The files written by the work item.
+        <br/><b>type</b> : list of strings
+        """
+        output = {}
+        for output_file in output_files:
+            output.update(fileSignature(output_file))
+
+        self.__append({'stage' : name,
+                       'item' : os.path.abspath(input_file),
+                       'input' : fileSignature(input_file),
+                       'output' : output,
+                       })
+
+    def __append(self, record):
+        """ Add a record and append it to the journal file. """
+        with self.__lock:
+            self.__add(record)
+            with open(self.__path, 'a') as journal_file:
+                journal_file.write(json.dumps(record) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def __add(self, record):
+        """ Add a record to the in-memory index. Later records supersede earlier ones. """
+        if 'item' in record:
+            self.__items[(record['stage'], record['item'])] = record
+        else:
+            self.__stages[record['stage']] = record
+
+    def __load(self):
+        """ Read all records from the journal file. """
+        with open(self.__path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Incomplete last line of an interrupted run.
+                    continue
+                self.__add(record)
+
+
+def fileSignature(path):
+    """
+    Query for the size and modification time of a file or of all files in a directory, except the index files.
+
+    @param path : The file or directory.
+    <br/><b>type</b> : string
+
+    @return : Dictionary of [size, modification time] lists keyed by the absolute file paths.
+    """
+    signature = {}
+    for file_path in walkFiles(os.path.abspath(path), skip_index_files=True):
+        stat = os.stat(file_path)
+        signature[file_path] = [stat.st_size, stat.st_mtime]
+
+    return signature
+
+def validateFiles(signature):
+    """
+    Check that recorded files are unchanged and, in case of hdf5 files, readable.
+
+    @param signature : Recorded file signature as returned by fileSignature().
+    <br/><b>type</b> : dict
+
+    @return : True if all files are valid, False otherwise.
+    """
+    if signature == {}:
+        return False
+    for file_path, size_and_mtime in signature.items():
+        if not os.path.isfile(file_path):
+            return False
+        stat = os.stat(file_path)
+        if [stat.st_size, stat.st_mtime] != size_and_mtime:
+            return False
+        if os.path.splitext(file_path)[1] == '.h5' and not h5py.is_hdf5(file_path):
+            return False
+
+    return True
@@ -0,0 +1,226 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the RunReport class, timing and resource usage of a simulation run.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class RunReport(object):
+    """
+    Class collecting wall time, cpu time, peak memory and io of every phase (_readH5, backengine, saveH5)
+    of every calculator in a simulation run, including single work items of calculators processing
+    a directory file by file.
+    <br/><b>note</b> : Cpu time and io are counted for the whole process including finished child processes (e.g. mpirun).
+    If calculators run concurrently, their figures include the work of the other calculators running at the same time.
+    Peak memory is the high-water mark of the resident set size up to the end of a phase.
+    """
+
+    def __init__(self):
+        """ Constructor for the RunReport. """
+        self.__stages = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__started = time.time()
+        self.__finished = None
+
+    @contextmanager
+    def measure(self, name, phase, item=None):
+        """
+        Context manager measuring the resource usage of the enclosed code.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param phase : The measured method, e.g. 'backengine'.
+        <br/><b>type</b> : string
+
+        @param item : The input file of a single work item.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (whole calculator)
+        """
+        start = resourceUsage()
+        status = 'failed'
+        try:
+            yield
+            status = 'done'
+        finally:
+            record = resourceUsageDifference(start, resourceUsage())
+            record['status'] = status
+            self.addMeasurement(name, phase, record, item)
+
+    def addMeasurement(self, name, phase, record, item=None):
+        """
+        Record a measurement taken elsewhere, e.g. by a work item in a worker process.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param phase : The measured method, e.g. 'backengine'.
+        <br/><b>type</b> : string
+
+        @param record : The used resources as returned by resourceUsageDifference(), and the status ('done' or 'failed').
+        <br/><b>type</b> : dict
+
+        @param item : The input file of a single work item.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (whole calculator)
+        """
+        record = OrderedDict(record)
+        with self.__lock:
+            stage = self.__stage(name)
+            if item is None:
+                stage['phases'][phase] = record
+            else:
+                record['item'] = os.path.basename(item)
+                record['phase'] = phase
+                stage['items'].append(record)
+
+    def addFailure(self, name, failure):
+        """
+        Record a work item that failed in all attempts and was quarantined.
+
+        @param name : The name of the calculator in the workflow.
+        <br/><b>type</b> : string
+
+        @param failure : The failure record of the work item, see AbstractBaseCalculator.quarantine.
+        <br/><b>type</b> : dict
+        """
+        with self.__lock:
+            stage = self.__stage(name)
+            stage['failures'].append(OrderedDict([('item', failure['item']),
+                                                  ('attempts', failure['attempts']),
+                                                  ('error', failure['error']),
+                                                  ]))
+
+    def finish(self):
+        """ Mark the end of the run. """
+        self.__finished = time.time()
+
+    def toDict(self):
+        """
+        Query for the report as a dictionary.
+
+        @return : Dictionary holding run information, the number of failed work items and, for each calculator, the measurements
+        of its phases and work items and its quarantined work items.
+        """
+        finished = self.__finished
+        if finished is None:
+            finished = time.time()
+
+        with self.__lock:
+            stages = json.loads(json.dumps(self.__stages))
+
+        return OrderedDict([
+                ('host', platform.node()),
+                ('platform', platform.platform()),
+                ('python_version', platform.python_version()),
+                ('number_of_cpus', multiprocessing.cpu_count()),
+                ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.__started))),
+                ('wall_time', finished - self.__started),
+                ('number_of_failed_items', sum([len(stage['failures']) for stage in stages.values()])),
+                ('stages', stages),
+                ])
+
+    def write(self, path):
+        """
+        Write the report to a json file.
+
+        @param path : The file to write.
+        <br/><b>type</b> : string
+        """
+        tmp_path = path + '.%d' % (os.getpid())
+        with open(tmp_path, 'w') as report_file:
+            json.dump(self.toDict(), report_file, indent=2)
+        os.rename(tmp_path, path)
+
+    def __stage(self, name):
+        """ Query for the records of a calculator, created if not existing yet. """
+        return self.__stages.setdefault(name, OrderedDict([('phases', OrderedDict()), ('items', []), ('failures', [])]))
+
+
+def resourceUsage():
+    """
+    Query for the resource usage of this process and its finished child processes.
+
+    @return : Dictionary of wall_time, cpu_time, cpu_time_children (in s), peak_rss (in bytes), read_bytes and write_bytes.
+    <br/><b>note</b> : Io counters are taken from /proc/self/io and are None where not available.
+    """
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is given in kilobytes on Linux, in bytes on Mac OS.
+    rss_unit = 1024
+    if sys.platform == 'darwin':
+        rss_unit = 1
+
+    usage = {'wall_time' : time.time(),
+             'cpu_time' : usage_self.ru_utime + usage_self.ru_stime + usage_children.ru_utime + usage_children.ru_stime,
+             'cpu_time_children' : usage_children.ru_utime + usage_children.ru_stime,
+             'peak_rss' : max(usage_self.ru_maxrss, usage_children.ru_maxrss) * rss_unit,
+             'read_bytes' : None,
+             'write_bytes' : None,
+             }
+
+    try:
+        with open('/proc/self/io', 'r') as io_file:
+            for line in io_file:
+                key, value = line.split(':')
+                if key in ['read_bytes', 'write_bytes']:
+                    usage[key] = int(value)
+    except (IOError, ValueError):
+        pass
+
+    return usage
+
+def resourceUsageDifference(start, end):
+    """
+    Calculate the resource usage between two snapshots taken by resourceUsage().
+
+    @param start : Usage at the start.
+    <br/><b>type</b> : dict
+
+    @param end : Usage at the end.
+    <br/><b>type</b> : dict
+
+    @return : Dictionary of used resources, peak_rss is the value at the end.
+    """
+    difference = OrderedDict()
+    for key in ['wall_time', 'cpu_time', 'cpu_time_children', 'read_bytes', 'write_bytes']:
+        if start[key] is None or end[key] is None:
+            difference[key] = None
+        else:
+            difference[key] = end[key] - start[key]
+    difference['peak_rss'] = end['peak_rss']
+
+    return difference
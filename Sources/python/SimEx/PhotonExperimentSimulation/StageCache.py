@@ -0,0 +1,334 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the StageCache class, an on-disk cache of calculator output.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import array
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from SimEx.Utilities.FileSet import indexFileNames
+
+class StageCache(object):
+    """
+    Class representing an on-disk cache of calculator output, keyed by a hash of the calculator's
+    class, its parameters and the content of its input files.
+    Cached output is restored by hard links, i.e. without copying data.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Constructor for the StageCache.
+
+        @param cache_dir : Directory holding the cache. Created if not existing.
+        <br/><b>type</b> : string
+        <br/><b>note</b> : The cache directory should be on the same filesystem as the output, otherwise cached files are copied instead of linked.
+        """
+        self.__cache_dir = os.path.abspath(cache_dir)
+        if not os.path.isdir(self.__cache_dir):
+            os.makedirs(self.__cache_dir)
+
+        # Digests of files already hashed, keyed by device, inode, size and modification time.
+        self.__digests_path = os.path.join(self.__cache_dir, 'digests.json')
+        self.__digests = {}
+        if os.path.isfile(self.__digests_path):
+            with open(self.__digests_path, 'r') as digests_file:
+                self.__digests = json.load(digests_file)
+        self.__digests_modified = False
+        self.__lock = threading.Lock()
+
+    @property
+    def cache_dir(self):
+        """ Query for the cache directory. """
+        return self.__cache_dir
+
+    def key(self, calculator):
+        """
+        Calculate the cache key of a calculator from its class, its attributes (except those declared by
+        _cacheIgnoredAttributes()), its write policy and the content of its input.
+
+        @param calculator : The calculator for which to calculate the key.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @return : The key (hex digest).
+        """
+        sha = hashlib.sha1()
+        sha.update(calculator.__class__.__module__ + '.' + calculator.__class__.__name__)
+        # Attributes that do not influence the result are declared by the calculator.
+        ignored_attributes = calculator._cacheIgnoredAttributes()
+        attributes = dict([(k, v) for k,v in stateAttributes(calculator).items() if k not in ignored_attributes])
+        sha.update(self.fingerprint(attributes))
+        # The write policy in effect, also if set for all calculators or for the stage, see WritePolicy.setWritePolicy().
+        sha.update(repr(calculator.write_policy))
+        sha.update(self.pathDigest(calculator.input_path))
+        self.__saveDigests()
+
+        return sha.hexdigest()
+
+    def restore(self, key, output_path):
+        """
+        Restore cached output.
+
+        @param key : The cache key.
+        <br/><b>type</b> : string
+
+        @param output_path : Where to restore the output.
+        <br/><b>type</b> : string
+
+        @return : True if the key was found and the output restored, False otherwise.
+        """
+        entry = self.__entryPath(key)
+        if not os.path.isfile(os.path.join(entry, 'complete')):
+            return False
+
+        removePath(output_path)
+        linkTree(os.path.join(entry, 'output'), output_path)
+
+        return True
+
+    def store(self, key, output_path):
+        """
+        Store output in the cache.
+
+        @param key : The cache key.
+        <br/><b>type</b> : string
+
+        @param output_path : The output to store.
+        <br/><b>type</b> : string
+        """
+        if not os.path.lexists(output_path):
+            return
+        entry = self.__entryPath(key)
+        if os.path.isdir(entry):
+            return
+
+        # Fill a temporary entry first, then move it in place, so that entries are always complete.
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not os.path.isdir(parent):
+                    raise
+        tmp_entry = tempfile.mkdtemp(prefix='.tmp_', dir=parent)
+        linkTree(output_path, os.path.join(tmp_entry, 'output'))
+        open(os.path.join(tmp_entry, 'complete'), 'w').close()
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Stored concurrently by another process.
+            shutil.rmtree(tmp_entry)
+
+    def detach(self, output_path):
+        """
+        Replace output files that are hard links into the cache by private copies, so that
+        calculators writing into existing output do not modify cached data.
+
+        @param output_path : The output to detach.
+        <br/><b>type</b> : string
+        """
+        for path in walkFiles(output_path):
+            if os.path.islink(path) or os.stat(path).st_nlink < 2:
+                continue
+            tmp_path = path + '.detach'
+            shutil.copy2(path, tmp_path)
+            os.rename(tmp_path, path)
+
+    def pathDigest(self, path):
+        """
+        Calculate the digest of a file's content or of all files in a directory, except the index files.
+
+        @param path : The file or directory.
+        <br/><b>type</b> : string
+
+        @return : The digest (hex string).
+        """
+        if path is None or not os.path.exists(path):
+            return 'missing'
+        if not os.path.isdir(path):
+            return self.__fileDigest(path)
+
+        sha = hashlib.sha1()
+        for file_path in walkFiles(path, skip_index_files=True):
+            sha.update(os.path.relpath(file_path, path))
+            sha.update(self.__fileDigest(file_path))
+
+        return sha.hexdigest()
+
+    def fingerprint(self, obj, _visited=None):
+        """
+        Calculate a string that identifies the value of an object, e.g. a parameters dict.
+        Strings naming existing files are represented by the file content.
+
+        @param obj : The object.
+
+        @return : The fingerprint (string).
+        """
+        if _visited is None:
+            _visited = set()
+
+        if obj is None or isinstance(obj, (bool, int, long, float, complex)):
+            return repr(obj)
+        if isinstance(obj, basestring):
+            if os.path.isfile(obj):
+                return 'file:' + self.__fileDigest(obj)
+            return repr(obj)
+        if isinstance(obj, numpy.ndarray):
+            return 'ndarray:%s:%s:%s' % (obj.dtype.str, obj.shape, hashlib.sha1(numpy.ascontiguousarray(obj).tostring()).hexdigest())
+        if isinstance(obj, numpy.generic):
+            return repr(obj.item())
+        if isinstance(obj, array.array):
+            return 'array:%s:%s' % (obj.typecode, hashlib.sha1(obj.tostring()).hexdigest())
+
+        # Guard against reference cycles.
+        if id(obj) in _visited:
+            return 'cycle'
+        _visited.add(id(obj))
+
+        if isinstance(obj, dict):
+            items = sorted([(self.fingerprint(k, _visited), self.fingerprint(v, _visited)) for k,v in obj.items()])
+            return '{' + ','.join(['%s:%s' % item for item in items]) + '}'
+        if isinstance(obj, (list, tuple)):
+            return '[' + ','.join([self.fingerprint(v, _visited) for v in obj]) + ']'
+        if isinstance(obj, (set, frozenset)):
+            return 'set(' + ','.join(sorted([self.fingerprint(v, _visited) for v in obj])) + ')'
+        if hasattr(obj, '__dict__'):
+            return obj.__class__.__name__ + self.fingerprint(stateAttributes(obj), _visited)
+
+        return repr(obj)
+
+    def __fileDigest(self, path):
+        """ Calculate the digest of a file's content, reusing digests of unchanged files. """
+        stat = os.stat(path)
+        memo_key = '%d:%d:%d:%r' % (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+        with self.__lock:
+            if memo_key in self.__digests:
+                return self.__digests[memo_key]
+
+        sha = hashlib.sha1()
+        with open(path, 'rb') as file_handle:
+            for block in iter(lambda: file_handle.read(1 << 20), ''):
+                sha.update(block)
+        digest = sha.hexdigest()
+
+        with self.__lock:
+            self.__digests[memo_key] = digest
+            self.__digests_modified = True
+
+        return digest
+
+    def __saveDigests(self):
+        """ Write the digests of hashed files to the cache directory. """
+        with self.__lock:
+            if not self.__digests_modified:
+                return
+            tmp_path = self.__digests_path + '.%d' % (os.getpid())
+            with open(tmp_path, 'w') as digests_file:
+                json.dump(self.__digests, digests_file)
+            os.rename(tmp_path, self.__digests_path)
+            self.__digests_modified = False
+
+    def __entryPath(self, key):
+        """ Query for the directory holding the cache entry of the given key. """
+        return os.path.join(self.__cache_dir, key[:2], key)
+
+
+def stateAttributes(obj):
+    """
+    Query for the attributes of an object that define its state. Attributes with a single leading
+    underscore hold runtime information (e.g. temporary directories, counters) and are skipped.
+
+    @param obj : The object.
+
+    @return : Dictionary of attribute names and values.
+    """
+    return dict([(k, v) for k,v in obj.__dict__.items() if not k.startswith('_') or '__' in k])
+
+def walkFiles(path, skip_index_files=False):
+    """
+    Query for all files under a path.
+
+    @param path : A file or directory.
+    <br/><b>type</b> : string
+
+    @param skip_index_files : Whether to leave out the index files kept in data directories (see FileSet.indexFileNames()),
+    which are (re)written when the data is queried.
+    <br/><b>type</b> : bool
+    <br/><b>default</b> : False
+
+    @return : Sorted list of file paths (the path itself if it is a file).
+    """
+    if not os.path.isdir(path):
+        if os.path.exists(path):
+            return [path]
+        return []
+
+    index_file_names = []
+    if skip_index_files:
+        index_file_names = indexFileNames()
+
+    files = []
+    for root, dirs, file_names in os.walk(path, followlinks=True):
+        # Also skip sidecars of the index files, e.g. the sqlite journal.
+        files += [os.path.join(root, f) for f in file_names if not any([f == n or f.startswith(n + '-') for n in index_file_names])]
+
+    return sorted(files)
+
+def linkTree(source, target):
+    """
+    Recreate a file or directory tree by hard links. Symbolic links are recreated as symbolic links,
+    files on other filesystems are copied.
+
+    @param source : The file or directory to link.
+    <br/><b>type</b> : string
+
+    @param target : The path of the new file or directory.
+    <br/><b>type</b> : string
+    """
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), target)
+    elif os.path.isdir(source):
+        os.mkdir(target)
+        for name in sorted(os.listdir(source)):
+            linkTree(os.path.join(source, name), os.path.join(target, name))
+    else:
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+def removePath(path):
+    """ Remove a file, symbolic link or directory tree if existing. """
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
@@ -0,0 +1,223 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the StagePipeline class for pipelined execution of a chain of calculators.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import os
+import sys
+import threading
+import Queue
+
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import runCalculator, runPhase
+
+# Marker put on a queue after the last work item.
+_END_OF_ITEMS = None
+
+class StagePipeline(object):
+    """
+    Class that runs a chain of calculators concurrently, one thread per calculator.
+    Calculators that support work items process each input file as soon as it was
+    written by the upstream calculator. Work items are passed between the stages through bounded queues,
+    each together with the index of the upstream work item, so that output files are numbered as in a
+    run calculator by calculator, also if upstream work items were quarantined.
+    """
+
+    def __init__(self, calculators, queue_size=4, names=None, stage_runner=None, item_runner=None, report=None, stage_done=None):
+        """
+        Constructor for the StagePipeline.
+
+        @param calculators : The calculators to run, ordered from upstream to downstream.
+        <br/><b>type</b> : list of AbstractBaseCalculator instances
+
+        @param queue_size : Maximum number of work items waiting between two stages.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 4
+
+        @param names : Names of the calculators.
+        <br/><b>type</b> : list of strings
+        <br/><b>default</b> : The calculators' class names.
+
+        @param stage_runner : Function called as stage_runner(name, calculator) to run a calculator that waits for its complete input.
+        <br/><b>type</b> : callable
+        <br/><b>default</b> : runCalculator
+
+        @param item_runner : Function called as item_runner(name, calculator, input_file, index) to process a single work item, returning the list of output files.
+        <br/><b>type</b> : callable
+        <br/><b>default</b> : runWorkItem
+
+        @param report : Report in which to record the resource usage of reading and saving in stages processing single work items.
+        <br/><b>type</b> : RunReport
+        <br/><b>default</b> : None
+
+        @param stage_done : Function called as stage_done(name, calculator) once a calculator processing single work items has processed and saved all of them.
+        <br/><b>type</b> : callable
+        <br/><b>default</b> : None
+        """
+        self.__calculators = calculators
+        if names is None:
+            names = [c.__class__.__name__ for c in calculators]
+        self.__names = names
+        if stage_runner is None:
+            stage_runner = runCalculator
+        self.__stage_runner = stage_runner
+        if item_runner is None:
+            item_runner = runWorkItem
+        self.__item_runner = item_runner
+        self.__report = report
+        self.__stage_done = stage_done
+        self.__queues = [Queue.Queue(maxsize=queue_size) for c in calculators[1:]]
+        self.__item_mode = determineItemMode(calculators)
+        self.__abort = threading.Event()
+        self.__errors = []
+
+    @property
+    def item_mode(self):
+        """ Query for the list of flags indicating which stages process single work items. """
+        return self.__item_mode
+
+    def run(self):
+        """ Run all stages and wait for them to finish. Raises the first error raised in any stage. """
+        threads = [threading.Thread(target=self.__runStage, args=(i,), name=c.__class__.__name__) for i,c in enumerate(self.__calculators)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Wait with timeout so that the main thread stays responsive to interrupts.
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.__abort.set()
+            raise
+
+        if self.__errors != []:
+            exc_info = self.__errors[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def __runStage(self, index):
+        """ Thread target running the calculator at the given position in the chain. """
+        calculator = self.__calculators[index]
+        inbox = None
+        outbox = None
+        if index > 0:
+            inbox = self.__queues[index-1]
+        if index < len(self.__queues):
+            outbox = self.__queues[index]
+
+        try:
+            if self.__item_mode[index]:
+                runPhase(self.__report, self.__names[index], '_readH5', calculator._readH5)
+                calculator._prepareOutputDirectory()
+                if inbox is None:
+                    work_items = enumerate(calculator._inputFiles())
+                else:
+                    work_items = self.__receive(inbox)
+                for i,input_file in work_items:
+                    for output_file in self.__item_runner(self.__names[index], calculator, input_file, i):
+                        self.__send(outbox, (i, output_file))
+                calculator._finishWorkItems()
+                runPhase(self.__report, self.__names[index], 'saveH5', calculator.persist)
+                if self.__stage_done is not None:
+                    self.__stage_done(self.__names[index], calculator)
+            else:
+                # Barrier: wait until all upstream work is done.
+                if inbox is not None:
+                    for work_item in self.__receive(inbox):
+                        pass
+                self.__stage_runner(self.__names[index], calculator)
+                if outbox is not None:
+                    if os.path.isdir(calculator.output_path):
+                        output_files = [os.path.join(calculator.output_path, f) for f in sorted(os.listdir(calculator.output_path))]
+                    else:
+                        output_files = [calculator.output_path]
+                    for i,output_file in enumerate(output_files):
+                        self.__send(outbox, (i, output_file))
+
+            self.__send(outbox, _END_OF_ITEMS)
+
+        except _PipelineAborted:
+            pass
+        except:
+            self.__errors.append(sys.exc_info())
+            self.__abort.set()
+
+    def __send(self, queue, item):
+        """ Put an item on the queue, blocking while the queue is full. """
+        if queue is None:
+            return
+        while True:
+            if self.__abort.is_set():
+                raise _PipelineAborted()
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def __receive(self, queue):
+        """ Generator yielding work items (tuples of index and file) from the queue until the end marker is received. """
+        while True:
+            if self.__abort.is_set():
+                raise _PipelineAborted()
+            try:
+                item = queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            if item is _END_OF_ITEMS:
+                return
+            yield item
+
+
+class _PipelineAborted(Exception):
+    """ Raised in a stage thread if another stage failed. """
+    pass
+
+
+def runWorkItem(name, calculator, input_file, index):
+    """ Process a single work item of a calculator (retried or quarantined according to its failure policy) and return the list of output files. """
+    return calculator._processWorkItem(input_file, index)
+
+def determineItemMode(calculators):
+    """
+    Determine which calculators in a chain can process single work items.
+
+    @param calculators : The calculators, ordered from upstream to downstream.
+    <br/><b>type</b> : list of AbstractBaseCalculator instances
+
+    @return : List of flags, True for calculators that process work items.
+    <br/><b>note</b> : The first calculator needs a directory as input. All following calculators
+    process work items only if their upstream calculator does so, i.e. once a calculator
+    has to wait for its complete input, all downstream calculators do so too.
+    """
+    item_mode = []
+    upstream_item_mode = len(calculators) > 0 and os.path.isdir(calculators[0].input_path)
+    for calculator in calculators:
+        mode = upstream_item_mode and calculator._supportsWorkItems() and not os.path.isfile(calculator.output_path)
+        item_mode.append(mode)
+        upstream_item_mode = mode
+
+    return item_mode
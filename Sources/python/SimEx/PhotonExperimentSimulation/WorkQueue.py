@@ -0,0 +1,391 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the WorkQueue class, a file based queue distributing work items across processes and hosts.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import cPickle
+import errno
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from SimEx.Calculators.AbstractBaseCalculator import checkAndSetBaseCalculator
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.ProcessSupervisor import defaultSupervisor
+
+# Subdirectories of the job directory holding the items in their different states.
+_STATES = ['pending', 'running', 'done', 'failed']
+
+class WorkQueue(object):
+    """
+    Class representing a queue of work items (single input files) of a calculator in a job directory on a
+    shared filesystem. Worker processes on any number of hosts claim items by atomically renaming them from
+    pending/ to a claim file in running/ named after the item and the worker (host, process and thread). A worker
+    touches its claims at regular intervals (heartbeat); claims whose heartbeat is older than the stale time are
+    put back to pending/ by any other worker. A worker records the outcome of an item in done/ or failed/ only
+    if it still holds the claim.
+    <br/><b>note</b> : The output of each item is written by the calculator into its output directory under the usual
+    name (e.g. prop_out_0000001.h5). An item reclaimed from a stalled worker may be processed twice, the second run
+    overwrites the output of the first one.
+    <br/><b>note</b> : Set AbstractBaseCalculator.work_queue to run the work items of a calculator through a queue.
+    """
+
+    def __init__(self, job_dir):
+        """
+        Constructor for the WorkQueue.
+
+        @param job_dir : The job directory, must be reachable by all workers under the same path.
+        <br/><b>type</b> : string
+        """
+        self.__job_dir = os.path.abspath(checkAndSetInstance(str, job_dir))
+
+    @property
+    def job_dir(self):
+        """ Query for the job directory. """
+        return self.__job_dir
+
+    def submit(self, calculator, heartbeat_interval=10.0, stale_after=60.0):
+        """
+        Create the job: store the calculator and queue one work item per input file.
+
+        @param calculator : The calculator, must support work items and be picklable.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @param heartbeat_interval : Time (in s) between two heartbeats of a worker.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 10.0
+
+        @param stale_after : Time (in s) without heartbeat after which an item is reclaimed.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 60.0
+        """
+        calculator = checkAndSetBaseCalculator(calculator)
+        if not calculator._supportsWorkItems():
+            raise TypeError("%s does not support processing of single work items." % (calculator.__class__.__name__))
+        if stale_after <= heartbeat_interval:
+            raise ValueError("The stale time must be larger than the heartbeat interval.")
+        if os.path.exists(self.__path('job.json')):
+            raise IOError("The job directory %s already holds a job." % (self.__job_dir))
+
+        for state in _STATES:
+            if not os.path.isdir(self.__path(state)):
+                os.makedirs(self.__path(state))
+        calculator._prepareOutputDirectory()
+
+        with open(self.__path('calculator.pkl'), 'wb') as calculator_file:
+            cPickle.dump(calculator, calculator_file, cPickle.HIGHEST_PROTOCOL)
+
+        input_files = calculator._inputFiles()
+        for index, input_file in enumerate(input_files):
+            writeJson(self.__path('pending', itemName(index)), {'input_file' : input_file, 'index' : index})
+
+        # Written last, workers start only once the job is complete.
+        writeJson(self.__path('job.json'), {'heartbeat_interval' : heartbeat_interval,
+                                            'stale_after' : stale_after,
+                                            'number_of_items' : len(input_files),
+                                            })
+
+    def status(self):
+        """
+        Query for the number of items in each state.
+
+        @return : Dictionary of item counts keyed by 'pending', 'running', 'done' and 'failed'.
+        """
+        return dict([(state, len(self.__items(state))) for state in _STATES])
+
+    def isFinished(self):
+        """ Query whether all items are done or failed. """
+        status = self.status()
+        return status['pending'] == 0 and status['running'] == 0 and status['done'] + status['failed'] == self.__job()['number_of_items']
+
+    def outputFiles(self):
+        """ Query for the sorted list of output files of all done items. """
+        output_files = []
+        for item in self.__items('done'):
+            output_files += readJson(self.__path('done', item))['output_files']
+
+        return sorted(output_files)
+
+    def failures(self):
+        """ Query for the failed items, a dictionary of error messages keyed by input file. """
+        failures = {}
+        for item in self.__items('failed'):
+            record = readJson(self.__path('failed', item))
+            failures[record['input_file']] = record['error']
+
+        return failures
+
+    def reclaim(self):
+        """
+        Put running items whose heartbeat is older than the stale time back to pending.
+
+        @return : Number of reclaimed items.
+        """
+        stale_after = self.__job()['stale_after']
+        reclaimed = 0
+        for claim in self.__items('running'):
+            claim_path = self.__path('running', claim)
+            reclaim_path = '%s.%s.reclaim' % (claim_path, workerName())
+            try:
+                if time.time() - os.stat(claim_path).st_mtime <= stale_after:
+                    continue
+                # Take the claim away first, its worker can then neither touch nor finalize it.
+                os.rename(claim_path, reclaim_path)
+            except OSError as error:
+                # Finished or reclaimed by another worker meanwhile.
+                if error.errno != errno.ENOENT:
+                    raise
+                continue
+
+            # rename() keeps the modification time: give the claim back if the heartbeat came between stat() and rename().
+            if time.time() - os.stat(reclaim_path).st_mtime > stale_after:
+                os.rename(reclaim_path, self.__path('pending', claimedItem(claim)))
+                reclaimed += 1
+            else:
+                os.rename(reclaim_path, claim_path)
+
+        return reclaimed
+
+    def claim(self):
+        """
+        Claim the next pending item for this worker (host, process and thread).
+
+        @return : The name of the claim file in running/, None if no item is pending.
+        """
+        for item in self.__items('pending'):
+            claim = '%s.%s.json' % (item[:-len('.json')], workerName())
+            try:
+                # rename() keeps the modification time, start the heartbeat before, so that the item is not stale when running.
+                os.utime(self.__path('pending', item), None)
+                os.rename(self.__path('pending', item), self.__path('running', claim))
+            except OSError as error:
+                # Claimed by another worker.
+                if error.errno != errno.ENOENT:
+                    raise
+                continue
+            return claim
+
+        return None
+
+    def runWorker(self, poll_interval=1.0):
+        """
+        Process items until the queue is finished.
+
+        @param poll_interval : Time (in s) to wait before checking again if no item is pending but others are still running.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 1.0
+
+        @return : Number of items processed by this worker, not counting items reclaimed from it while running.
+        """
+        job = self.__job()
+        with open(self.__path('calculator.pkl'), 'rb') as calculator_file:
+            calculator = cPickle.load(calculator_file)
+
+        processed = 0
+        while True:
+            self.reclaim()
+            claim = self.claim()
+            if claim is None:
+                if self.isFinished():
+                    return processed
+                time.sleep(poll_interval)
+                continue
+
+            if self.__runItem(calculator, claim, job['heartbeat_interval']):
+                processed += 1
+
+    def startWorkers(self, number_of_workers=1):
+        """
+        Launch worker processes on this host.
+
+        @param number_of_workers : Number of worker processes.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        @return : The launched processes, see ProcessSupervisor.submit().
+        <br/><b>note</b> : On other hosts, start workers with 'python -m SimEx.PhotonExperimentSimulation.WorkQueue <job_dir>'.
+        """
+        number_of_workers = checkAndSetPositiveInteger(number_of_workers, 1)
+
+        # Workers need to import the calculator's module.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p != ''])
+
+        command = [sys.executable, '-m', 'SimEx.PhotonExperimentSimulation.WorkQueue', self.__job_dir]
+        return [defaultSupervisor().submit(command,
+                                           env=env,
+                                           stdout_path=self.__path('worker_%d.log' % (i)),
+                                           stderr_path=self.__path('worker_%d.log' % (i)),
+                                           ) for i in range(number_of_workers)]
+
+    def run(self, calculator, number_of_workers=1, poll_interval=1.0):
+        """
+        Process the work items of a calculator through the queue: submit the job (or resume the job already in the
+        job directory), run worker processes on this host and wait until all items are done or failed. Workers
+        started on other hosts take part.
+
+        @param calculator : The calculator, must support work items and be picklable.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @param number_of_workers : Number of worker processes on this host.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        @param poll_interval : Time (in s) between two checks whether the queue is finished.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 1.0
+
+        @return : The sorted list of output files of all done items.
+        <br/><b>note</b> : Items failed in all attempts are quarantined by the calculator. With the 'abort' failure policy,
+        a RuntimeError is raised if any item failed.
+        """
+        calculator = checkAndSetBaseCalculator(calculator)
+        if not os.path.exists(self.__path('job.json')):
+            self.submit(calculator)
+
+        processes = self.startWorkers(number_of_workers)
+        for process in processes:
+            if process.wait() != 0:
+                raise RuntimeError("Worker of %s failed with exit code %s, see %s." % (self.__job_dir, process.returncode, process.stdout_path))
+
+        # Wait for items still run by workers on other hosts.
+        while not self.isFinished():
+            self.reclaim()
+            time.sleep(poll_interval)
+
+        errors = []
+        for item in self.__items('failed'):
+            record = readJson(self.__path('failed', item))
+            if 'failure' in record:
+                calculator._quarantineWorkItem(record['failure'])
+            else:
+                errors.append(record['error'])
+        if errors != []:
+            raise RuntimeError("%d work item(s) of %s failed:\n%s" % (len(errors), calculator.__class__.__name__, "\n".join(errors)))
+
+        return self.outputFiles()
+
+    def __runItem(self, calculator, claim, heartbeat_interval):
+        """ Process a claimed item while keeping its heartbeat alive, then record the outcome if the claim is still held.
+        Returns whether the outcome was recorded. """
+        claim_path = self.__path('running', claim)
+        record = readJson(claim_path)
+
+        stop = threading.Event()
+        def heartbeat():
+            while not stop.wait(heartbeat_interval):
+                try:
+                    os.utime(claim_path, None)
+                except OSError:
+                    # Reclaimed by another worker, or taken away for a moment while checking whether it is stale.
+                    pass
+        heartbeat_thread = threading.Thread(target=heartbeat, name='WorkQueue.heartbeat')
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+
+        state = 'done'
+        try:
+            record['output_files'], failure = calculator._attemptWorkItem(record['input_file'], record['index'])
+            if failure is not None:
+                state = 'failed'
+                record['error'] = failure['traceback']
+                record['attempts'] = failure['attempts']
+                record['failure'] = failure
+        except Exception:
+            state = 'failed'
+            record['error'] = traceback.format_exc()
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+
+        # Mark the claim as finishing, so that it is not stale while the outcome is written. Renaming fails if the
+        # item was reclaimed meanwhile: it is run by another worker, which records the outcome.
+        finishing_path = '%s.finishing.json' % (claim_path[:-len('.json')])
+        try:
+            os.utime(claim_path, None)
+            os.rename(claim_path, finishing_path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return False
+
+        record['host'] = socket.gethostname()
+        record['pid'] = os.getpid()
+        writeJson(self.__path(state, claimedItem(claim)), record)
+        os.remove(finishing_path)
+
+        return True
+
+    def __job(self):
+        """ Read the job description. """
+        if not os.path.isfile(self.__path('job.json')):
+            raise IOError("No job submitted to %s." % (self.__job_dir))
+        return readJson(self.__path('job.json'))
+
+    def __items(self, state):
+        """ Sorted item names in a state directory. """
+        return sorted([f for f in os.listdir(self.__path(state)) if f.endswith('.json')])
+
+    def __path(self, *names):
+        """ Path relative to the job directory. """
+        return os.path.join(self.__job_dir, *names)
+
+
+def itemName(index):
+    """ Name of the file representing the work item with the given index. """
+    return 'item_%07d.json' % (index)
+
+def workerName():
+    """ Name of the calling worker in claim files: host, process and thread. """
+    return '%s.%d.%d' % (socket.gethostname(), os.getpid(), threading.current_thread().ident)
+
+def claimedItem(claim):
+    """ Name of the work item of a claim file in running/. """
+    return claim.split('.')[0] + '.json'
+
+def writeJson(path, content):
+    """ Write a json file atomically. """
+    tmp_path = '%s.%s.%d.tmp' % (path, socket.gethostname(), os.getpid())
+    with open(tmp_path, 'w') as json_file:
+        json.dump(content, json_file)
+    os.rename(tmp_path, path)
+
+def readJson(path):
+    """ Read a json file. """
+    with open(path, 'r') as json_file:
+        return json.load(json_file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print "Usage: python -m SimEx.PhotonExperimentSimulation.WorkQueue <job_dir>"
+        sys.exit(2)
+    print "Processed %d items." % (WorkQueue(sys.argv[1]).runWorker())
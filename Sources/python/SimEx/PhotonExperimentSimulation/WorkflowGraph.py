@@ -0,0 +1,333 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the WorkflowGraph class, a directed acyclic graph of calculators.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import sys
+import threading
+import Queue
+from collections import OrderedDict
+
+from SimEx.Calculators.AbstractBaseCalculator import checkAndSetBaseCalculator
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+from SimEx.Utilities.SchemaValidator import missingDataPaths
+
+
+class WorkflowGraph(object):
+    """
+    Class representing a simulation workflow as a directed acyclic graph of calculators.
+    Each edge connects a calculator providing data to a calculator expecting these data.
+    Calculators that do not depend on each other can be run concurrently.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the WorkflowGraph.
+        """
+        self.__calculators = OrderedDict()
+        self.__upstream = {}
+
+    def addCalculator(self, name, calculator, upstream=None):
+        """
+        Add a calculator to the workflow.
+
+        @param name : Unique name of the calculator in this workflow.
+        <br/><b>type</b> : string
+
+        @param calculator : The calculator to add.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @param upstream : Name(s) of the calculator(s) providing the input data of this calculator.
+        <br/><b>type</b> : string or list of strings
+        <br/><b>default</b> : None (no upstream calculator)
+        """
+        name = checkAndSetInstance(str, name)
+        if name is None or name in self.__calculators:
+            raise ValueError("The calculator name must be a unique string, got %s." % (str(name)))
+        calculator = checkAndSetBaseCalculator(calculator)
+        if calculator is None:
+            raise TypeError("The calculator must be an AbstractBaseCalculator instance.")
+
+        self.__calculators[name] = calculator
+        self.__upstream[name] = []
+
+        if upstream is None:
+            upstream = []
+        if isinstance(upstream, str):
+            upstream = [upstream]
+        for upstream_name in upstream:
+            self.connect(upstream_name, name)
+
+    def setCalculator(self, name, calculator):
+        """ Replace the calculator of the given name, keeping its connections. """
+        if name not in self.__calculators:
+            raise KeyError("No calculator named %s in this workflow." % (name))
+        self.__calculators[name] = checkAndSetBaseCalculator(calculator)
+
+    def insertCalculator(self, name, calculator, upstream, downstream):
+        """
+        Add a calculator between two calculators, i.e. the downstream calculator takes its data from the new calculator instead of the upstream calculator.
+
+        @param name : Unique name of the calculator in this workflow.
+        <br/><b>type</b> : string
+
+        @param calculator : The calculator to insert.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @param upstream : Name of the calculator providing the input data of the new calculator (None if it has no upstream calculator).
+        <br/><b>type</b> : string
+
+        @param downstream : Name of the calculator expecting the data of the new calculator (None if it has no downstream calculator).
+        <br/><b>type</b> : string
+        """
+        if downstream is not None and downstream not in self.__calculators:
+            raise KeyError("No calculator named %s in this workflow." % (downstream))
+        self.addCalculator(name, calculator, upstream)
+        if downstream is None:
+            return
+        if upstream in self.__upstream[downstream]:
+            self.__upstream[downstream].remove(upstream)
+        self.connect(name, downstream)
+
+    def removeCalculator(self, name):
+        """ Remove the calculator of the given name, its downstream calculators take their data from its upstream calculators instead. """
+        if name not in self.__calculators:
+            raise KeyError("No calculator named %s in this workflow." % (name))
+        for downstream in self.downstream(name):
+            upstream = self.__upstream[downstream]
+            position = upstream.index(name)
+            upstream[position:position+1] = [n for n in self.__upstream[name] if n not in upstream]
+        del self.__calculators[name]
+        del self.__upstream[name]
+
+    def connect(self, upstream, downstream):
+        """
+        Connect two calculators.
+
+        @param upstream : Name of the calculator providing the data.
+        <br/><b>type</b> : string
+
+        @param downstream : Name of the calculator expecting the data.
+        <br/><b>type</b> : string
+        """
+        for name in (upstream, downstream):
+            if name not in self.__calculators:
+                raise KeyError("No calculator named %s in this workflow." % (name))
+        if upstream in self.__upstream[downstream]:
+            return
+        self.__upstream[downstream].append(upstream)
+
+        # Reject cycles right away.
+        try:
+            self.topologicalOrder()
+        except RuntimeError:
+            self.__upstream[downstream].remove(upstream)
+            raise
+
+    @property
+    def calculators(self):
+        """ Query for the calculators (dict of name : calculator, in insertion order). """
+        return self.__calculators
+
+    def upstream(self, name):
+        """ Query for the names of the calculators providing data to the named calculator. """
+        return list(self.__upstream[name])
+
+    def downstream(self, name):
+        """ Query for the names of the calculators expecting data from the named calculator. """
+        return [n for n in self.__calculators.keys() if name in self.__upstream[n]]
+
+    def topologicalOrder(self):
+        """
+        Query for the calculator names ordered such that every calculator comes after its upstream calculators.
+
+        @return : List of names.
+        @throw : RuntimeError if the graph contains a cycle.
+        """
+        order = []
+        done = set()
+        pending = list(self.__calculators.keys())
+        while pending != []:
+            ready = [name for name in pending if set(self.__upstream[name]).issubset(done)]
+            if ready == []:
+                raise RuntimeError("The workflow contains a cycle involving %s." % (', '.join(pending)))
+            for name in ready:
+                order.append(name)
+                done.add(name)
+                pending.remove(name)
+
+        return order
+
+    def linearOrder(self):
+        """
+        Query for the calculator names if the workflow is a simple chain.
+
+        @return : List of names from first to last calculator, None if the workflow branches.
+        """
+        order = self.topologicalOrder()
+        for i,name in enumerate(order):
+            expected_upstream = order[i-1:i]
+            if self.__upstream[name] != expected_upstream:
+                return None
+
+        return order
+
+    def checkInterfaceConsistency(self):
+        """
+        Check that every calculator's expected data are provided by its upstream calculators.
+
+        @return : True if all interfaces are consistent.
+        @throw : RuntimeError if a calculator expects data not provided by its upstream calculators.
+        """
+        for name, calculator in self.__calculators.items():
+            if self.__upstream[name] == []:
+                continue
+            provided_data_set = set()
+            for upstream_name in self.__upstream[name]:
+                provided_data_set.update(self.__calculators[upstream_name].providedData())
+            expected_data_set = set(calculator.expectedData())
+            # Placeholders such as '<7 digit index>' match any index.
+            if missingDataPaths( expected_data_set, provided_data_set ) != []:
+                upstream_calculators = ', '.join([str(self.__calculators[n]) for n in self.__upstream[name]])
+                raise RuntimeError( "Dataset expected by %s is not a subset of data provided by %s.\n Provided data are:\n%s.\n\n Expected data are:\n%s" % (calculator, upstream_calculators, str(provided_data_set).replace(',', '\n'), str(expected_data_set).replace(',', '\n') ) )
+
+        return True
+
+    def run(self, stage_runner=None, number_of_workers=1):
+        """
+        Run all calculators, each one as soon as all its upstream calculators have finished.
+
+        @param stage_runner : Function called as stage_runner(name, calculator) to run a calculator.
+        <br/><b>type</b> : callable
+        <br/><b>default</b> : runCalculator
+
+        @param number_of_workers : Maximum number of calculators running concurrently.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+        """
+        if stage_runner is None:
+            stage_runner = runCalculator
+        number_of_workers = checkAndSetPositiveInteger(number_of_workers, 1)
+
+        ready_queue = Queue.Queue()
+        done_queue = Queue.Queue()
+
+        def work():
+            while True:
+                name = ready_queue.get()
+                if name is None:
+                    return
+                try:
+                    stage_runner(name, self.__calculators[name])
+                    done_queue.put((name, None))
+                except:
+                    done_queue.put((name, sys.exc_info()))
+
+        workers = [threading.Thread(target=work) for i in range(number_of_workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        # Submit calculators in topological order as soon as their upstream calculators are done.
+        order = self.topologicalOrder()
+        done = set()
+        submitted = set()
+        running = 0
+        error = None
+        try:
+            while True:
+                if error is None:
+                    for name in order:
+                        if name not in submitted and set(self.__upstream[name]).issubset(done):
+                            submitted.add(name)
+                            running += 1
+                            ready_queue.put(name)
+                if running == 0:
+                    break
+
+                # Wait with timeout so that the main thread stays responsive to interrupts.
+                try:
+                    name, exc_info = done_queue.get(timeout=0.5)
+                except Queue.Empty:
+                    continue
+                running -= 1
+                if exc_info is None:
+                    done.add(name)
+                elif error is None:
+                    error = exc_info
+        finally:
+            for worker in workers:
+                ready_queue.put(None)
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+
+def runCalculator(name, calculator, report=None):
+    """
+    Run a calculator: read input, run the backengine and save the output.
+
+    @param name : The name of the calculator in the workflow.
+    <br/><b>type</b> : string
+
+    @param calculator : The calculator to run.
+    <br/><b>type</b> : AbstractBaseCalculator
+
+    @param report : Report in which to record the resource usage of each step.
+    <br/><b>type</b> : RunReport
+    <br/><b>default</b> : None
+    """
+    print '\n'.join(["#"*80,  "# Starting SIMEX %s." % (name.replace('_', ' ')), "#"*80])
+    runPhase(report, name, '_readH5', calculator._readH5)
+    runPhase(report, name, 'backengine', calculator.backengine)
+    runPhase(report, name, 'saveH5', calculator.persist)
+
+def runPhase(report, name, phase, method, item=None):
+    """
+    Call a method of a calculator, recording its resource usage if a report is given.
+
+    @param report : The report (None if nothing is recorded).
+    <br/><b>type</b> : RunReport
+
+    @param name : The name of the calculator in the workflow.
+    <br/><b>type</b> : string
+
+    @param phase : The name under which the call is recorded.
+    <br/><b>type</b> : string
+
+    @param method : The method to call (without arguments).
+    <br/><b>type</b> : callable
+
+    @param item : The input file if the call processes a single work item.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : None
+
+    @return : The return value of the method.
+    """
+    if report is None:
+        return method()
+    with report.measure(name, phase, item):
+        return method()
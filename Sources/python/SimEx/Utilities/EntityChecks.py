@@ -112,3 +112,24 @@ def checkAndSetNonNegativeInteger(var=None, default=None):
     if var < 0:
             raise exceptions.TypeError("The parameter must be a non-negative integer.")
     return var
+
+def checkAndSetPositiveFloat(var=None, default=None):
+    """
+    Utility to check if the passed value is a positive number.
+
+    @param var : The object to check.
+    @param default : The default to use if no var is given.
+    @return : The checked object or default, as float.
+    @throw : TypeError if check fails.
+    """
+
+    if var is None:
+        if not (isinstance( default, (int, float)) and default > 0):
+            raise exceptions.TypeError("The default must be a positive number.")
+        return float(default)
+
+    if not isinstance(var, (int, float)):
+            raise exceptions.TypeError("The parameter must be a number.")
+    if var <= 0:
+            raise exceptions.TypeError("The parameter must be a positive number.")
+    return float(var)
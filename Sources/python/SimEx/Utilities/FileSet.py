@@ -0,0 +1,236 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the FileSet class, a selection of files in a directory.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import fnmatch
+import os
+import random
+import re
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+
+# Supported orderings of the files in a FileSet.
+FILESET_ORDERS = ['name', 'index', 'mtime']
+
+class FileSet(object):
+    """
+    Class representing an ordered selection of files: a single file or the files in a directory
+    matching a glob pattern, sorted by name, by the index in their name or by modification time,
+    optionally restricted to files whose metadata fulfill conditions, to a range of positions (with a stride)
+    and to a random sample.
+    <br/><b>note</b> : Index files (see VirtualDatasetIndex and MetadataIndex) are never selected.
+    """
+
+    def __init__(self, path=None, pattern='*', order='name', start=None, stop=None, where=None, step=None, sample=None, seed=None):
+        """
+        Constructor for the FileSet.
+
+        @param path : A file or a directory.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (to be set later, e.g. to the input path of a calculator)
+
+        @param pattern : Glob pattern the file names have to match.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : '*'
+
+        @param order : Ordering of the files, one of 'name', 'index' (the last number in the file name, e.g. pmi_out_0000012.h5) or 'mtime'.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : 'name'
+
+        @param start : Position of the first selected file in the ordered list.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (first file)
+
+        @param stop : Position after the last selected file in the ordered list.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (all files up to the last one)
+
+        @param where : Conditions (key, operator, value) on the metadata of the files, evaluated with the MetadataIndex of the directory (updated before each query).
+        <br/><b>type</b> : list of tuples
+        <br/><b>default</b> : None (no conditions)
+        <br/><b>example</b> : where=[('total_counts', '>', 1e4)]
+
+        @param step : Stride through the range of positions.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (every file)
+
+        @param sample : Number of files drawn at random from the selection, kept in order.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (all files)
+
+        @param seed : Seed of the random sample, the same seed draws the same files.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : None (0)
+        """
+        self.path = path
+        self.__pattern = checkAndSetInstance(str, pattern, '*')
+        self.__order = checkAndSetInstance(str, order, 'name')
+        if self.__order not in FILESET_ORDERS:
+            raise ValueError("The order must be one of %s." % (", ".join(FILESET_ORDERS)))
+        self.__start = checkAndSetInstance(int, start, None)
+        self.__stop = checkAndSetInstance(int, stop, None)
+        self.__where = checkAndSetInstance(list, where, None)
+        self.__step = None if step is None else checkAndSetPositiveInteger(step)
+        self.__sample = checkAndSetInstance(int, sample, None)
+        if self.__sample is not None and self.__sample < 0:
+            raise ValueError("The sample size must not be negative.")
+        self.__seed = checkAndSetInstance(int, seed, None)
+
+    @property
+    def path(self):
+        """ Query for the file or directory. """
+        return self.__path
+    @path.setter
+    def path(self, value):
+        """ Set the file or directory. """
+        value = checkAndSetInstance(str, value, None)
+        if value is not None:
+            value = os.path.abspath(value)
+        self.__path = value
+
+    @property
+    def pattern(self):
+        """ Query for the glob pattern. """
+        return self.__pattern
+
+    @property
+    def order(self):
+        """ Query for the ordering of the files. """
+        return self.__order
+
+    @property
+    def start(self):
+        """ Query for the position of the first selected file. """
+        return self.__start
+
+    @property
+    def stop(self):
+        """ Query for the position after the last selected file. """
+        return self.__stop
+
+    @property
+    def where(self):
+        """ Query for the conditions on the metadata of the files. """
+        return self.__where
+
+    @property
+    def step(self):
+        """ Query for the stride through the range of positions. """
+        return self.__step
+
+    @property
+    def sample(self):
+        """ Query for the number of files drawn at random. """
+        return self.__sample
+
+    @property
+    def seed(self):
+        """ Query for the seed of the random sample. """
+        return self.__seed
+
+    def withPath(self, path):
+        """
+        Query for a FileSet with the same selection applied to another path.
+
+        @param path : A file or a directory.
+        <br/><b>type</b> : string
+
+        @return : The new FileSet.
+        """
+        return FileSet(path, self.__pattern, self.__order, self.__start, self.__stop, self.__where, self.__step, self.__sample, self.__seed)
+
+    def files(self):
+        """
+        Query for the selected files.
+
+        @return : The ordered list of absolute file paths. The path itself if it is a file, an empty list if it does not exist.
+        """
+        if self.__path is None:
+            raise IOError("No path set for the file set.")
+        if os.path.isfile(self.__path):
+            return [self.__path]
+        if not os.path.isdir(self.__path):
+            return []
+
+        index_file_names = indexFileNames()
+        names = [f for f in os.listdir(self.__path) if fnmatch.fnmatch(f, self.__pattern) and f not in index_file_names]
+        files = [os.path.join(self.__path, f) for f in names if os.path.isfile(os.path.join(self.__path, f))]
+
+        if self.__where is not None:
+            from SimEx.Utilities.MetadataIndex import MetadataIndex
+            index = MetadataIndex(self.__path)
+            index.update()
+            selected = set(index.select(self.__where))
+            files = [f for f in files if f in selected]
+
+        if self.__order == 'index':
+            files.sort(key=lambda f: (fileIndex(f), os.path.basename(f)))
+        elif self.__order == 'mtime':
+            files.sort(key=lambda f: (os.path.getmtime(f), os.path.basename(f)))
+        else:
+            files.sort()
+
+        files = files[self.__start:self.__stop:self.__step]
+        if self.__sample is not None and self.__sample < len(files):
+            drawn = random.Random(self.__seed or 0).sample(range(len(files)), self.__sample)
+            files = [files[i] for i in sorted(drawn)]
+
+        return files
+
+    def __iter__(self):
+        """ Iterate over the selected files. """
+        return iter(self.files())
+
+    def __len__(self):
+        """ Number of selected files. """
+        return len(self.files())
+
+    def __repr__(self):
+        return "FileSet(%r, pattern=%r, order=%r, start=%r, stop=%r, where=%r, step=%r, sample=%r, seed=%r)" % (self.__path, self.__pattern, self.__order, self.__start, self.__stop, self.__where, self.__step, self.__sample, self.__seed)
+
+
+def indexFileNames():
+    """ Query for the names of the index files kept in data directories (see VirtualDatasetIndex and MetadataIndex), never selected by a FileSet. """
+    # Import here, so that importing FileSet does not load sqlite3 and h5py.
+    from SimEx.Utilities.MetadataIndex import METADATA_INDEX_FILE_NAME
+    from SimEx.Utilities.VirtualDatasetIndex import INDEX_FILE_NAME
+    return [INDEX_FILE_NAME, METADATA_INDEX_FILE_NAME]
+
+def fileIndex(path):
+    """
+    Query for the index in a file name, i.e. the last number in it.
+
+    @param path : The file path.
+    <br/><b>type</b> : string
+
+    @return : The index, -1 if the file name (without extension) holds no number.
+    """
+    numbers = re.findall(r'\d+', os.path.splitext(os.path.basename(path))[0])
+    if numbers == []:
+        return -1
+    return int(numbers[-1])
@@ -0,0 +1,201 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds utilities to stage files into a directory without copying their data where possible.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance
+
+# Supported staging modes, in the order they are tried as fallbacks.
+STAGING_MODES = ['hardlink', 'reflink', 'symlink', 'copy']
+
+# Linux ioctl cloning a file (copy-on-write), see ioctl_ficlone(2).
+_FICLONE = 0x40049409
+
+# Deployment wide staging mode, initialized from the environment.
+_staging_mode = os.environ.get('SIMEX_STAGING_MODE', 'reflink')
+_staging_lock = threading.Lock()
+
+# Checksums of files keyed by (path, size, mtime).
+_checksums = {}
+
+def stagingMode():
+    """
+    Query for the deployment wide staging mode.
+
+    @return : The staging mode, initially taken from the environment variable SIMEX_STAGING_MODE ('reflink' if not set).
+    """
+    with _staging_lock:
+        return _staging_mode
+
+def setStagingMode(mode):
+    """
+    Set the deployment wide staging mode.
+
+    @param mode : The staging mode, one of 'hardlink', 'reflink', 'symlink' and 'copy'.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : 'reflink'
+    """
+    global _staging_mode
+    mode = checkAndSetStagingMode(mode)
+    with _staging_lock:
+        _staging_mode = mode
+
+def checkAndSetStagingMode(mode=None):
+    """
+    Utility to check the passed staging mode.
+
+    @param mode : The staging mode to check.
+    @return : The checked mode or the deployment wide mode if none is given.
+    @throw : ValueError if the mode is not supported.
+    """
+    mode = checkAndSetInstance(str, mode, stagingMode())
+    if mode not in STAGING_MODES:
+        raise ValueError("The staging mode must be one of %s, got %s." % (", ".join(STAGING_MODES), mode))
+    return mode
+
+def stageFile(source, target, mode=None):
+    """
+    Make a file available under a target path. Hardlinks share the data of the source, reflinks share it until
+    either file is modified (copy-on-write), symlinks refer to the source. If the requested mode is not supported
+    (e.g. links across file systems), the file is cloned or, as a last resort, copied.
+
+    @param source : The file to stage.
+    <br/><b>type</b> : string
+
+    @param target : The path to stage the file to, replaced if existing.
+    <br/><b>type</b> : string
+
+    @param mode : The staging mode, one of 'hardlink', 'reflink', 'symlink' and 'copy'.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : None (the deployment wide mode, see stagingMode())
+
+    @return : The way the file was staged, one of the staging modes or 'skipped' if the target already holds the data of the source.
+    """
+    mode = checkAndSetStagingMode(mode)
+    if isStaged(source, target, mode):
+        return 'skipped'
+
+    # Stage to a temporary file and rename it, so that the target is never left incomplete.
+    target_dir = os.path.dirname(os.path.abspath(target))
+    handle, tmp_path = tempfile.mkstemp(prefix='.staging_', dir=target_dir)
+    os.close(handle)
+    os.remove(tmp_path)
+    try:
+        for fallback in _fallbacks(mode):
+            try:
+                _stage(source, tmp_path, fallback)
+            except (OSError, IOError) as error:
+                if fallback == 'copy' or error.errno not in _UNSUPPORTED_ERRORS:
+                    raise
+                _remove(tmp_path)
+                continue
+            os.rename(tmp_path, target)
+            return fallback
+    finally:
+        _remove(tmp_path)
+
+def isStaged(source, target, mode='copy'):
+    """
+    Query whether the target already holds the data of the source.
+
+    @param source : The file to stage.
+    <br/><b>type</b> : string
+
+    @param target : The staged file.
+    <br/><b>type</b> : string
+
+    @param mode : The staging mode. Symlinks are only taken as staged in 'symlink' mode, since the target should not depend on the source otherwise.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : 'copy'
+
+    @return : True if the target is the source (hardlink or symlink) or an identical copy, False otherwise.
+    """
+    if not os.path.lexists(target):
+        return False
+    if os.path.islink(target):
+        return mode == 'symlink' and os.path.exists(target) and os.path.samefile(source, target)
+    if os.path.samefile(source, target):
+        return True
+    if os.path.getsize(source) != os.path.getsize(target):
+        return False
+    return fileChecksum(source) == fileChecksum(target)
+
+def fileChecksum(path):
+    """
+    Query for the checksum of a file. Checksums are cached as long as size and modification time of the file do not change.
+
+    @param path : The file.
+    <br/><b>type</b> : string
+
+    @return : The md5 checksum (hex digest).
+    """
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime)
+    checksum = _checksums.get(key)
+    if checksum is None:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as stream:
+            for block in iter(lambda: stream.read(1048576), b''):
+                md5.update(block)
+        checksum = md5.hexdigest()
+        _checksums[key] = checksum
+    return checksum
+
+
+# Errors indicating that a staging mode is not supported for the given files.
+_UNSUPPORTED_ERRORS = [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTTY, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS, errno.EACCES]
+
+def _fallbacks(mode):
+    """ Query for the staging modes to try, the requested one first. Links fall back to cloning and copying, they never fall back to symlinks. """
+    return [mode] + [m for m in ['reflink', 'copy'] if m != mode]
+
+def _stage(source, target, mode):
+    """ Stage a file with the given mode. """
+    if mode == 'hardlink':
+        os.link(source, target)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(source), target)
+    elif mode == 'reflink':
+        with open(source, 'rb') as src:
+            with open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        shutil.copymode(source, target)
+    else:
+        shutil.copy2(source, target)
+
+def _remove(path):
+    """ Remove a file if existing. """
+    if os.path.lexists(path):
+        os.remove(path)
@@ -0,0 +1,242 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the H5HandlePool class, a pool of open hdf5 files shared within a process.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from SimEx.Utilities.EntityChecks import checkAndSetPositiveInteger
+
+# Modes that allow writing.
+_WRITE_MODES = ['r+', 'a', 'w']
+
+class H5HandlePool(object):
+    """
+    Class representing a pool of open hdf5 files. Files are reference counted while in use and kept open
+    afterwards, so that opening the same file again costs no open/close (and no metadata round trips on
+    network filesystems). Unused files are closed in least recently used order once more than
+    max_open_files are open.
+    <br/><b>note</b> : Files kept open by the pool cannot be truncated (mode 'w') by code outside the pool,
+    in this or (with hdf5 file locking) another process. Close files with close() once done with them.
+    """
+
+    def __init__(self, max_open_files=128):
+        """
+        Constructor for the H5HandlePool.
+
+        @param max_open_files : Maximum number of files kept open when unused.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 128
+        """
+        self.max_open_files = max_open_files
+        self.__handles = OrderedDict()
+        self.__lock = threading.RLock()
+        self.__pid = os.getpid()
+        self.__statistics = {'hits' : 0, 'misses' : 0, 'evictions' : 0}
+
+    @property
+    def max_open_files(self):
+        """ Query for the maximum number of files kept open when unused. """
+        return self.__max_open_files
+    @max_open_files.setter
+    def max_open_files(self, value):
+        """ Set the maximum number of files kept open when unused. """
+        self.__max_open_files = checkAndSetPositiveInteger(value, 128)
+
+    @property
+    def statistics(self):
+        """ Query for the number of hits (file already open), misses (file opened) and evictions (file closed to make room). """
+        with self.__lock:
+            return dict(self.__statistics)
+
+    def acquire(self, path, mode='r'):
+        """
+        Open a file or reuse the open file, and mark it as in use.
+
+        @param path : The hdf5 file.
+        <br/><b>type</b> : string
+
+        @param mode : The h5py mode, 'r', 'r+', 'a' or 'w' (truncate, only if the file is not in use).
+        <br/><b>type</b> : string
+        <br/><b>default</b> : 'r'
+
+        @return : The open h5py.File. Call release() when done with it.
+        """
+        path = os.path.abspath(path)
+        with self.__lock:
+            self.__checkProcess()
+            handle = self.__handles.get(path)
+
+            if handle is not None and not handle.isValid(mode):
+                if handle.references > 0:
+                    raise IOError("%s is in use in mode '%s' and cannot be reopened in mode '%s'." % (path, handle.mode, mode))
+                self.__close(path)
+                handle = None
+
+            if handle is None:
+                self.__statistics['misses'] += 1
+                handle = _Handle(path, mode)
+                self.__handles[path] = handle
+            else:
+                self.__statistics['hits'] += 1
+                # Most recently used files go to the end.
+                del self.__handles[path]
+                self.__handles[path] = handle
+
+            handle.references += 1
+            self.__evict()
+
+            return handle.h5
+
+    def release(self, path):
+        """
+        Mark a file as no longer in use by the caller. Written data is flushed, the file stays open.
+
+        @param path : The hdf5 file.
+        <br/><b>type</b> : string
+        """
+        path = os.path.abspath(path)
+        with self.__lock:
+            handle = self.__handles.get(path)
+            if handle is None or handle.references == 0:
+                return
+            handle.references -= 1
+            if handle.mode in _WRITE_MODES:
+                handle.h5.flush()
+                handle.updateSignature()
+            self.__evict()
+
+    @contextmanager
+    def file(self, path, mode='r'):
+        """
+        Context manager for acquire() and release().
+
+        @example : with defaultH5Pool().file(path) as h5: data = h5['data/data'][()]
+        """
+        h5 = self.acquire(path, mode)
+        try:
+            yield h5
+        finally:
+            self.release(path)
+
+    def close(self, path):
+        """
+        Close a file, even if in use.
+
+        @param path : The hdf5 file.
+        <br/><b>type</b> : string
+        """
+        with self.__lock:
+            self.__close(os.path.abspath(path))
+
+    def closeAll(self):
+        """ Close all files. """
+        with self.__lock:
+            for path in self.__handles.keys():
+                self.__close(path)
+
+    def __close(self, path):
+        """ Close a file and remove it from the pool. """
+        handle = self.__handles.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def __evict(self):
+        """ Close unused files, least recently used first, until at most max_open_files are open. """
+        excess = len(self.__handles) - self.__max_open_files
+        for path in self.__handles.keys():
+            if excess <= 0:
+                break
+            if self.__handles[path].references == 0:
+                self.__close(path)
+                self.__statistics['evictions'] += 1
+                excess -= 1
+
+    def __checkProcess(self):
+        """ Forget handles inherited from the parent process, they must not be used in a forked child. """
+        if self.__pid != os.getpid():
+            self.__handles = OrderedDict()
+            self.__pid = os.getpid()
+
+
+class _Handle(object):
+    """ An open file of the pool. """
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.h5 = h5py.File(path, mode)
+        # A truncated file is then open for reading and writing.
+        self.mode = {'w' : 'r+'}.get(mode, mode)
+        self.references = 0
+        self.updateSignature()
+
+    def updateSignature(self):
+        """ Record the file's identity to detect replacement or modification by others. """
+        stat = os.stat(self.path)
+        self.signature = (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def isValid(self, mode):
+        """ Query whether the open file can serve a request in the given mode. """
+        if mode == 'w':
+            return False
+        if mode in _WRITE_MODES and self.mode not in _WRITE_MODES:
+            return False
+        if self.references > 0:
+            return True
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_size, stat.st_mtime) == self.signature
+
+    def close(self):
+        try:
+            self.h5.close()
+        except Exception:
+            # Already closed, e.g. by the caller.
+            pass
+
+
+# Pool shared by all calculators of this process.
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def defaultH5Pool():
+    """
+    Query for the hdf5 handle pool shared by all calculators.
+
+    @return : The shared H5HandlePool.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = H5HandlePool()
+        return _default_pool
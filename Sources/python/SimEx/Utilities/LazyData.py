@@ -0,0 +1,206 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module holding read-only lazy views on data in hdf5 files.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import collections
+import h5py
+import numpy
+
+from SimEx.Utilities.SchemaValidator import compileDataPath, defaultSchemaValidator, isDataPathPattern
+
+class LazyDataMapping(collections.Mapping):
+    """
+    Class representing a read-only mapping of data paths to lazily read data in one or several hdf5 files.
+    Datasets are returned as LazyDataset objects that read only the requested slices, groups as LazyDataMapping objects.
+    Data paths with placeholders, e.g. '/data/snp_<7 digit index>/ff', stand for all matching paths in the first file.
+    """
+
+    def __init__(self, files, keys):
+        """
+        Constructor for the LazyDataMapping.
+
+        @param files : The hdf5 files. The data of several files is stacked along a new first axis.
+        <br/><b>type</b> : list of strings
+
+        @param keys : The data paths, e.g. the provided data of a calculator, possibly with placeholders, see SchemaValidator.compileDataPath().
+        <br/><b>type</b> : list of strings
+        """
+        self.__files = list(files)
+        self.__keys = [normalizePath(k) for k in keys]
+        self.__patterns = [compileDataPath(k) for k in self.__keys if isDataPathPattern(k)]
+        self.__expanded_keys = None
+
+    @property
+    def files(self):
+        """ Query for the hdf5 files. """
+        return self.__files
+
+    def __getitem__(self, key):
+        """ Query for the data under a path. """
+        key = normalizePath(key)
+        if key not in self.__keys and not any([pattern.match(key) for pattern in self.__patterns]):
+            raise KeyError(key)
+        if self.__files == []:
+            raise IOError("No output files to read %s from." % (key))
+
+        with h5py.File(self.__files[0], 'r') as h5:
+            if key not in h5:
+                raise KeyError("%s holds no %s." % (self.__files[0], key))
+            obj = h5[key]
+            if isinstance(obj, h5py.Group):
+                return LazyDataMapping(self.__files, [key + '/' + k for k in sorted(obj.keys())])
+
+        return LazyDataset(self.__files, key)
+
+    def __iter__(self):
+        return iter(self.__expandedKeys())
+
+    def __len__(self):
+        return len(self.__expandedKeys())
+
+    def __expandedKeys(self):
+        """ The data paths with placeholders replaced by the matching paths in the first file. """
+        if self.__patterns == [] or self.__files == []:
+            return self.__keys
+
+        if self.__expanded_keys is None:
+            data_paths = sorted(defaultSchemaValidator().dataPaths(self.__files[0]))
+            expanded_keys = []
+            for key in self.__keys:
+                if isDataPathPattern(key):
+                    pattern = compileDataPath(key)
+                    expanded_keys += [path for path in data_paths if pattern.match(path) and path not in expanded_keys]
+                elif key not in expanded_keys:
+                    expanded_keys.append(key)
+            self.__expanded_keys = expanded_keys
+
+        return self.__expanded_keys
+
+    def __repr__(self):
+        return "LazyDataMapping(%d files, keys=%r)" % (len(self.__files), self.__keys)
+
+
+class LazyDataset(object):
+    """
+    Class representing a read-only dataset in one hdf5 file or stacked from several hdf5 files.
+    Indexing reads only the requested part: e.g. volume[10] reads one slice of a volume, patterns[347] reads one file.
+    """
+
+    def __init__(self, files, path):
+        """
+        Constructor for the LazyDataset.
+
+        @param files : The hdf5 files.
+        <br/><b>type</b> : list of strings
+
+        @param path : The dataset path.
+        <br/><b>type</b> : string
+        """
+        self.__files = list(files)
+        self.__path = path
+        with h5py.File(self.__files[0], 'r') as h5:
+            self.__file_shape = h5[path].shape
+            self.__dtype = h5[path].dtype
+
+    @property
+    def shape(self):
+        """ Query for the shape, (number of files,) + shape of the dataset in each file if stacked from several files. """
+        if len(self.__files) == 1:
+            return self.__file_shape
+        return (len(self.__files),) + self.__file_shape
+
+    @property
+    def dtype(self):
+        """ Query for the data type. """
+        return self.__dtype
+
+    @property
+    def path(self):
+        """ Query for the dataset path. """
+        return self.__path
+
+    def __len__(self):
+        if self.shape == ():
+            raise TypeError("len() of a scalar dataset.")
+        return self.shape[0]
+
+    def __getitem__(self, selection):
+        """ Read a part of the dataset. """
+        if len(self.__files) == 1:
+            return self.__read(self.__files[0], selection)
+
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+        file_selection, selection = selection[0], selection[1:]
+        if selection == ():
+            selection = Ellipsis
+
+        if isinstance(file_selection, (int, long, numpy.integer)):
+            return self.__read(self.__files[file_selection], selection)
+
+        if isinstance(file_selection, slice):
+            files = self.__files[file_selection]
+        else:
+            files = [self.__files[i] for i in numpy.arange(len(self.__files))[file_selection]]
+        return numpy.array([self.__read(f, selection) for f in files])
+
+    def __array__(self, dtype=None):
+        """ Read the complete dataset, e.g. for numpy.asarray(). """
+        data = self[...] if len(self.__files) == 1 else self[:]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def memmap(self):
+        """
+        Query for a read-only memory map of the dataset in a single file.
+
+        @return : numpy.memmap of the dataset.
+        @throw : ValueError if the dataset is stacked, chunked or compressed and can therefore not be memory mapped.
+        """
+        if len(self.__files) != 1:
+            raise ValueError("Datasets stacked from several files cannot be memory mapped.")
+        with h5py.File(self.__files[0], 'r') as h5:
+            dataset = h5[self.__path]
+            offset = dataset.id.get_offset()
+            if dataset.chunks is not None or offset is None:
+                raise ValueError("%s in %s is not stored contiguously." % (self.__path, self.__files[0]))
+        return numpy.memmap(self.__files[0], dtype=self.__dtype, mode='r', offset=offset, shape=self.__file_shape)
+
+    def __read(self, path, selection):
+        """ Read a selection of the dataset from one file. """
+        with h5py.File(path, 'r') as h5:
+            return h5[self.__path][selection]
+
+    def __repr__(self):
+        return "LazyDataset(%r, shape=%r, dtype=%r)" % (self.__path, self.shape, self.__dtype)
+
+
+def normalizePath(path):
+    """ Query for a data path with a leading slash and without trailing slash. """
+    return '/' + path.strip('/')
@@ -0,0 +1,249 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the MetadataIndex class, a sqlite index of scalar metadata of hdf5 files.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import fnmatch
+import h5py
+import numpy
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance
+
+# Name of the index file written into an indexed directory.
+METADATA_INDEX_FILE_NAME = 'metadata_index.sqlite'
+
+# Version of the extracted metadata, indices of older versions are rebuilt.
+_INDEX_VERSION = 2
+
+# Comparison operators supported in queries.
+_OPERATORS = {'<' : '<', '<=' : '<=', '>' : '>', '>=' : '>=', '=' : '=', '==' : '=', '!=' : '!='}
+
+class MetadataIndex(object):
+    """
+    Class representing a sqlite index of the scalar metadata of the hdf5 files in a directory:
+    all scalar numbers under /params (e.g. /params/beam/photons) and /history/parent/misc, the number of snp_* groups
+    under /data (key 'number_of_snapshots'), the sum of /data/data (key 'total_counts') and the energy of a FEL pulse
+    (key 'pulse_energy').
+    The index is updated incrementally, only new and modified files are read.
+    """
+
+    def __init__(self, directory, index_path=None, pattern='*.h5'):
+        """
+        Constructor for the MetadataIndex.
+
+        @param directory : The directory holding the hdf5 files.
+        <br/><b>type</b> : string
+
+        @param index_path : The sqlite file.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : metadata_index.sqlite in the directory.
+
+        @param pattern : Glob pattern of the indexed files.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : '*.h5'
+        """
+        self.__directory = os.path.abspath(checkAndSetInstance(str, directory))
+        index_path = checkAndSetInstance(str, index_path, os.path.join(self.__directory, METADATA_INDEX_FILE_NAME))
+        self.__index_path = os.path.abspath(index_path)
+        self.__pattern = checkAndSetInstance(str, pattern, '*.h5')
+        self.__lock = threading.Lock()
+
+        with self.__connect() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] < _INDEX_VERSION:
+                connection.execute("DROP TABLE IF EXISTS files")
+                connection.execute("DROP TABLE IF EXISTS metadata")
+                connection.execute("PRAGMA user_version = %d" % (_INDEX_VERSION))
+            connection.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, key TEXT, value REAL, PRIMARY KEY (name, key))")
+            connection.execute("CREATE INDEX IF NOT EXISTS metadata_key_value ON metadata (key, value)")
+
+    @property
+    def directory(self):
+        """ Query for the indexed directory. """
+        return self.__directory
+
+    @property
+    def index_path(self):
+        """ Query for the sqlite file. """
+        return self.__index_path
+
+    def update(self):
+        """
+        Bring the index up to date: read new and modified files, drop removed files.
+
+        @return : Number of files (re-)read.
+        """
+        with self.__lock:
+            names = sorted([f for f in os.listdir(self.__directory) if fnmatch.fnmatch(f, self.__pattern)])
+            current = {}
+            for name in names:
+                path = os.path.join(self.__directory, name)
+                if os.path.isfile(path):
+                    stat = os.stat(path)
+                    current[name] = (stat.st_size, stat.st_mtime)
+
+            with self.__connect() as connection:
+                indexed = dict([(row[0], (row[1], row[2])) for row in connection.execute("SELECT name, size, mtime FROM files")])
+
+                removed = [name for name in indexed if name not in current]
+                modified = sorted([name for name in current if indexed.get(name) != current[name]])
+
+                for name in removed + modified:
+                    connection.execute("DELETE FROM files WHERE name = ?", (name,))
+                    connection.execute("DELETE FROM metadata WHERE name = ?", (name,))
+                for name in modified:
+                    metadata = extractMetadata(os.path.join(self.__directory, name))
+                    connection.executemany("INSERT INTO metadata (name, key, value) VALUES (?, ?, ?)", [(name, k, v) for k,v in metadata.items()])
+                    connection.execute("INSERT INTO files (name, size, mtime) VALUES (?, ?, ?)", (name,) + current[name])
+
+        return len(modified)
+
+    def files(self):
+        """ Query for the sorted list of indexed files (absolute paths). """
+        with self.__connect() as connection:
+            return [os.path.join(self.__directory, str(row[0])) for row in connection.execute("SELECT name FROM files ORDER BY name")]
+
+    def keys(self):
+        """ Query for the sorted list of all metadata keys. """
+        with self.__connect() as connection:
+            return [str(row[0]) for row in connection.execute("SELECT DISTINCT key FROM metadata ORDER BY key")]
+
+    def metadata(self, path):
+        """
+        Query for the metadata of a file.
+
+        @param path : The file (absolute or relative to the directory).
+        <br/><b>type</b> : string
+
+        @return : Dictionary of values keyed by metadata key, empty if the file is not indexed.
+        """
+        with self.__connect() as connection:
+            return dict([(str(key), value) for key, value in connection.execute("SELECT key, value FROM metadata WHERE name = ?", (os.path.basename(path),))])
+
+    def value(self, path, key):
+        """
+        Query for a metadata value of a file.
+
+        @param path : The file (absolute or relative to the directory).
+        <br/><b>type</b> : string
+
+        @param key : The metadata key, e.g. '/params/beam/photonEnergy'.
+        <br/><b>type</b> : string
+
+        @return : The value, None if not indexed.
+        """
+        return self.metadata(path).get(key)
+
+    def select(self, conditions):
+        """
+        Query for the files whose metadata fulfill all conditions.
+
+        @param conditions : Conditions (key, operator, value), operator one of '<', '<=', '>', '>=', '==', '!='.
+        <br/><b>type</b> : list of tuples
+        <br/><b>example</b> : select([('total_counts', '>', 1e4)])
+
+        @return : The sorted list of matching files (absolute paths).
+        """
+        query = "SELECT name FROM files"
+        arguments = []
+        clauses = []
+        for key, operator, value in conditions:
+            if operator not in _OPERATORS:
+                raise ValueError("Unsupported operator %s, use one of %s." % (operator, ", ".join(sorted(_OPERATORS.keys()))))
+            clauses.append("name IN (SELECT name FROM metadata WHERE key = ? AND value %s ?)" % (_OPERATORS[operator]))
+            arguments += [key, value]
+        if clauses != []:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY name"
+
+        with self.__connect() as connection:
+            return [os.path.join(self.__directory, str(row[0])) for row in connection.execute(query, arguments)]
+
+    def __connect(self):
+        """ Open a connection, closed when leaving the with block; changes are committed on success. """
+        connection = sqlite3.connect(self.__index_path, timeout=60.0)
+        return _Transaction(connection)
+
+
+class _Transaction(object):
+    """ Context manager committing (or rolling back) and closing a sqlite connection. """
+    def __init__(self, connection):
+        self.__connection = connection
+    def __enter__(self):
+        return self.__connection
+    def __exit__(self, exc_type, exc_value, traceback):
+        with closing(self.__connection):
+            if exc_type is None:
+                self.__connection.commit()
+            else:
+                self.__connection.rollback()
+        return False
+
+
+def extractMetadata(path):
+    """
+    Read the scalar metadata of an hdf5 file.
+
+    @param path : The hdf5 file.
+    <br/><b>type</b> : string
+
+    @return : Dictionary of values keyed by metadata key: the paths of scalar numbers under /params and /history/parent/misc,
+    'number_of_snapshots' (number of snp_* groups under /data), 'total_counts' (sum of /data/data) and 'pulse_energy'
+    (in J, the power of /history/parent/misc/temporal_struct integrated over time), where present.
+    An unreadable file has no metadata.
+    """
+    metadata = {}
+    try:
+        with h5py.File(path, 'r') as h5:
+            if 'params' in h5:
+                def collect(name, obj):
+                    if isinstance(obj, h5py.Dataset) and obj.shape == () and obj.dtype.kind in 'biuf':
+                        metadata['/params/' + name] = float(obj[()])
+                h5['params'].visititems(collect)
+            if 'data' in h5 and isinstance(h5['data'], h5py.Group):
+                snapshots = [k for k in h5['data'].keys() if k.startswith('snp_')]
+                if snapshots != []:
+                    metadata['number_of_snapshots'] = len(snapshots)
+                if 'data' in h5['data'] and isinstance(h5['data/data'], h5py.Dataset) and h5['data/data'].dtype.kind in 'biuf':
+                    metadata['total_counts'] = float(numpy.sum(h5['data/data'][()]))
+            if 'history/parent/misc' in h5 and isinstance(h5['history/parent/misc'], h5py.Group):
+                misc = h5['history/parent/misc']
+                for name, obj in misc.items():
+                    if isinstance(obj, h5py.Dataset) and obj.shape == () and obj.dtype.kind in 'biuf':
+                        metadata['/history/parent/misc/' + name] = float(obj[()])
+                # Power (W) over time (fs) of the FEL pulse.
+                if 'temporal_struct' in misc and len(misc['temporal_struct'].shape) == 2 and misc['temporal_struct'].shape[1] == 2:
+                    temporal_struct = misc['temporal_struct'][()]
+                    metadata['pulse_energy'] = float(numpy.trapz(temporal_struct[:,1], temporal_struct[:,0]))*1e-15
+    except IOError:
+        return {}
+
+    return metadata
@@ -0,0 +1,270 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the ContainerWriter class and functions to consolidate per-pulse files into a single hdf5 container.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import numpy
+import os
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance
+from SimEx.Utilities.WritePolicy import WritePolicy, writePolicy
+
+# Root attribute holding the number of rows (pulses or patterns) of a container.
+CONTAINER_ROWS_ATTRIBUTE = 'container_rows'
+
+# Attribute marking the datasets of a container that hold one row per pulse.
+CONTAINER_STACKED_ATTRIBUTE = 'container_stacked'
+
+class ContainerWriter(object):
+    """
+    Class writing the content of many per-pulse hdf5 files into one container file.
+    Datasets that differ between pulses are stored as extendable, chunked datasets with one row per pulse
+    under their original path, e.g. /data/data of shape (number of pulses, ny, nx). Datasets identical for
+    all pulses, e.g. the detector geometry, are stored once, unchanged. The source file names go to /container/files.
+    """
+
+    def __init__(self, path, write_policy=None, expected_rows=1):
+        """
+        Constructor for the ContainerWriter.
+
+        @param path : The container file to write (truncated).
+        <br/><b>type</b> : string
+
+        @param write_policy : The policy for the stacked datasets.
+        <br/><b>type</b> : WritePolicy
+        <br/><b>default</b> : The default WritePolicy.
+
+        @param expected_rows : Expected number of pulses, used to size the chunks.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+        """
+        self.__write_policy = checkAndSetInstance(WritePolicy, write_policy, writePolicy())
+        self.__expected_rows = checkAndSetInstance(int, expected_rows, 1)
+        self.__h5 = h5py.File(path, 'w')
+        self.__rows = 0
+        self.__files = []
+        self.__first = None
+        self.__stacked = {}
+
+    @property
+    def rows(self):
+        """ Query for the number of appended pulses. """
+        return self.__rows
+
+    def append(self, path):
+        """
+        Append the content of a per-pulse file as a new row.
+
+        @param path : The per-pulse file.
+        <br/><b>type</b> : string
+
+        @throw : ValueError if the file does not hold the same datasets (with the same shapes and types) as the first file.
+        """
+        values = {}
+        def collect(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                values['/' + name] = _rowValue(obj[()])
+        with h5py.File(path, 'r') as h5:
+            h5.visititems(collect)
+
+        if self.__first is None:
+            self.__first = values
+        elif sorted(values.keys()) != sorted(self.__first.keys()):
+            raise ValueError("%s does not hold the same datasets as the first file." % (path))
+
+        for name, value in values.items():
+            if name not in self.__stacked:
+                if _equal(value, self.__first[name]):
+                    continue
+                self.__stack(name)
+            self.__appendRow(path, name, value)
+
+        self.__rows += 1
+        self.__files.append(os.path.basename(path))
+
+    def close(self):
+        """ Write the datasets identical for all pulses and the list of source files, and close the container. """
+        if self.__first is not None:
+            for name, value in self.__first.items():
+                if name not in self.__stacked:
+                    self.__h5.create_dataset(name, data=value, dtype=_h5Type(value))
+        self.__h5.create_dataset('/container/files', data=numpy.array(self.__files, dtype=object), dtype=h5py.special_dtype(vlen=str))
+        self.__h5.attrs[CONTAINER_ROWS_ATTRIBUTE] = self.__rows
+        self.__h5.close()
+
+    def __stack(self, name):
+        """ Turn a dataset identical for all previous pulses into a stacked dataset. """
+        first = self.__first[name]
+        dataset = self.__write_policy.createExtendableDataset(self.__h5, name, first.shape, _h5Type(first), max(self.__expected_rows, self.__rows+1))
+        dataset.attrs[CONTAINER_STACKED_ATTRIBUTE] = 1
+        if self.__rows > 0:
+            dataset.resize(self.__rows, axis=0)
+            dataset[:] = numpy.array([first]*self.__rows)
+        self.__stacked[name] = dataset
+
+    def __appendRow(self, path, name, value):
+        """ Append a row to a stacked dataset. """
+        dataset = self.__stacked[name]
+        first = self.__first[name]
+        if value.shape != first.shape or value.dtype.kind != first.dtype.kind or (value.dtype.kind != 'O' and value.dtype != first.dtype):
+            raise ValueError("%s holds %s with shape %s and type %s, expected shape %s and type %s." % (path, name, value.shape, value.dtype, first.shape, first.dtype))
+        dataset.resize(self.__rows+1, axis=0)
+        dataset[self.__rows] = value
+
+
+def writeContainer(files, container_path, write_policy=None, remove_files=False):
+    """
+    Consolidate per-pulse files into a single container file.
+
+    @param files : The per-pulse files, in row order.
+    <br/><b>type</b> : list of strings
+
+    @param container_path : The container file to write.
+    <br/><b>type</b> : string
+
+    @param write_policy : The policy for the stacked datasets.
+    <br/><b>type</b> : WritePolicy
+    <br/><b>default</b> : The default WritePolicy.
+
+    @param remove_files : Whether to remove the per-pulse files once the container is complete.
+    <br/><b>type</b> : bool
+    <br/><b>default</b> : False
+
+    @return : The number of rows.
+    """
+    if len(files) == 0:
+        raise ValueError("No files to consolidate.")
+
+    # Write to a temporary file first, so that readers never see an incomplete container.
+    container_path = os.path.abspath(container_path)
+    tmp_path = container_path + '.%d.tmp' % (os.getpid())
+    writer = ContainerWriter(tmp_path, write_policy, len(files))
+    try:
+        for path in files:
+            writer.append(path)
+    except:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.rename(tmp_path, container_path)
+
+    if remove_files:
+        for path in files:
+            if os.path.abspath(path) != container_path:
+                os.remove(path)
+
+    return writer.rows
+
+def containerRows(h5):
+    """
+    Query for the number of rows of a container.
+
+    @param h5 : The open hdf5 file.
+    <br/><b>type</b> : h5py.File
+
+    @return : The number of rows, None if the file is not a container.
+    """
+    rows = h5.attrs.get(CONTAINER_ROWS_ATTRIBUTE)
+    if rows is None:
+        return None
+    return int(rows)
+
+def iterateRows(h5, dataset, batch_size=100):
+    """
+    Iterate over the rows of a dataset in a container, reading batch_size rows at once.
+
+    @param h5 : The open container.
+    <br/><b>type</b> : h5py.File
+
+    @param dataset : The dataset to read.
+    <br/><b>type</b> : string
+
+    @param batch_size : Number of rows read at once.
+    <br/><b>type</b> : int
+    <br/><b>default</b> : 100
+
+    @return : Generator yielding the data of each row. Datasets identical for all pulses yield the same data for every row.
+    """
+    rows = containerRows(h5)
+    data = h5[dataset]
+    if not data.attrs.get(CONTAINER_STACKED_ATTRIBUTE, 0):
+        value = data[()]
+        for i in range(rows):
+            yield value
+        return
+
+    for start in range(0, rows, batch_size):
+        for value in data[start:min(start+batch_size, rows)]:
+            yield value
+
+def countRows(files):
+    """
+    Query for the number of pulses in files of either layout, i.e. the number of per-pulse files or the total number of rows of containers.
+
+    @param files : Per-pulse files or containers.
+    <br/><b>type</b> : list of strings
+
+    @return : The number of pulses.
+    <br/><b>note</b> : Only the first file is opened for per-pulse files.
+    """
+    if len(files) == 0:
+        return 0
+    try:
+        with h5py.File(files[0], 'r') as h5:
+            if containerRows(h5) is None:
+                return len(files)
+    except IOError:
+        return len(files)
+
+    number_of_rows = 0
+    for path in files:
+        with h5py.File(path, 'r') as h5:
+            rows = containerRows(h5)
+        number_of_rows += 1 if rows is None else rows
+
+    return number_of_rows
+
+def _rowValue(value):
+    """ Convert a value read from hdf5 into an array, strings into object arrays (variable length strings). """
+    value = numpy.asarray(value)
+    if value.dtype.kind in 'SUO':
+        value = numpy.asarray(value, dtype=object)
+    return value
+
+def _h5Type(value):
+    """ Query for the hdf5 type of a row value. """
+    if value.dtype.kind == 'O':
+        return h5py.special_dtype(vlen=str)
+    return value.dtype
+
+def _equal(value, reference):
+    """ Query whether two row values are identical. """
+    if value.shape != reference.shape or value.dtype != reference.dtype:
+        return False
+    return bool(numpy.all(value == reference))
@@ -0,0 +1,364 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Module that holds the ProcessSupervisor class, which runs external backengine processes.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import collections
+import os
+import subprocess
+import threading
+import time
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+
+class ProcessSupervisor(object):
+    """
+    Class that launches external processes under a limit on the number of concurrently running processes.
+    Output of the processes is written directly to log files, timeouts are enforced and exit codes collected.
+    A single monitor thread watches all processes, so any number of threads can submit and wait for processes.
+    """
+
+    def __init__(self, max_processes=None, timeout=None, poll_interval=0.05):
+        """
+        Constructor for the ProcessSupervisor.
+
+        @param max_processes : Maximum number of processes running at the same time.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : Number of cpus.
+
+        @param timeout : Default timeout (in s) for processes submitted without a timeout.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : None (no timeout)
+
+        @param poll_interval : Time (in s) between two checks of the running processes.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : 0.05
+        """
+        self.max_processes = max_processes
+        self.timeout = timeout
+        self.__poll_interval = poll_interval
+
+        self.__pending = collections.deque()
+        self.__running = []
+        self.__condition = threading.Condition()
+        self.__monitor = None
+
+    @property
+    def max_processes(self):
+        """ Query for the maximum number of concurrently running processes. """
+        return self.__max_processes
+    @max_processes.setter
+    def max_processes(self, value):
+        """ Set the maximum number of concurrently running processes. """
+        # Import here, so that importing this module stays fast.
+        import multiprocessing
+        self.__max_processes = checkAndSetPositiveInteger(value, multiprocessing.cpu_count())
+
+    @property
+    def timeout(self):
+        """ Query for the default timeout. """
+        return self.__timeout
+    @timeout.setter
+    def timeout(self, value):
+        """ Set the default timeout (in s), None for no timeout. """
+        self.__timeout = checkAndSetInstance((int, float), value, None)
+
+    def submit(self, command, cwd=None, env=None, stdout_path=None, stderr_path=None, timeout=None):
+        """
+        Queue a process for launch.
+
+        @param command : The command sequence.
+        <br/><b>type</b> : list of strings
+
+        @param cwd : Working directory of the process.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (current directory)
+
+        @param env : Environment of the process.
+        <br/><b>type</b> : dict
+        <br/><b>default</b> : None (environment of this process)
+
+        @param stdout_path : Log file for the standard output (appended to).
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (standard output of this process)
+
+        @param stderr_path : Log file for the standard error (appended to). May be identical to stdout_path.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : None (standard error of this process)
+
+        @param timeout : Time (in s) after which the process is terminated.
+        <br/><b>type</b> : float
+        <br/><b>default</b> : The supervisor's default timeout.
+
+        @return : The supervised process.
+        """
+        if timeout is None:
+            timeout = self.__timeout
+        process = SupervisedProcess(command, cwd, env, stdout_path, stderr_path, timeout)
+
+        with self.__condition:
+            self.__pending.append(process)
+            if self.__monitor is None or not self.__monitor.is_alive():
+                self.__monitor = threading.Thread(target=self.__monitorProcesses, name='ProcessSupervisor')
+                self.__monitor.daemon = True
+                self.__monitor.start()
+            self.__condition.notify_all()
+
+        return process
+
+    def run(self, command, **kwargs):
+        """
+        Launch a process and wait for it to finish. Takes the same arguments as submit().
+
+        @return : The finished process.
+        """
+        process = self.submit(command, **kwargs)
+        process.wait()
+
+        return process
+
+    def wait(self, processes):
+        """
+        Wait for processes to finish.
+
+        @param processes : The processes returned by submit().
+        <br/><b>type</b> : list of SupervisedProcess
+
+        @return : List of exit codes.
+        """
+        return [process.wait() for process in processes]
+
+    def terminateAll(self):
+        """ Cancel all pending processes and terminate all running processes. """
+        with self.__condition:
+            while len(self.__pending) > 0:
+                self.__pending.popleft()._cancel()
+            for process in self.__running:
+                process._terminate()
+
+    def __monitorProcesses(self):
+        """ Monitor thread target: launch pending processes and watch running ones. """
+        while True:
+            with self.__condition:
+                # Reap finished processes.
+                for process in self.__running[:]:
+                    if process._poll():
+                        self.__running.remove(process)
+
+                # Launch pending processes.
+                while len(self.__pending) > 0 and len(self.__running) < self.__max_processes:
+                    process = self.__pending.popleft()
+                    if process._launch():
+                        self.__running.append(process)
+
+                if len(self.__running) == 0 and len(self.__pending) == 0:
+                    self.__monitor = None
+                    return
+
+            time.sleep(self.__poll_interval)
+
+
+class SupervisedProcess(object):
+    """
+    Class representing a process launched by a ProcessSupervisor.
+    """
+
+    # Time (in s) between terminating a timed out process and killing it.
+    KILL_DELAY = 5.0
+
+    def __init__(self, command, cwd, env, stdout_path, stderr_path, timeout):
+        """ Constructor for the SupervisedProcess, use ProcessSupervisor.submit() instead. """
+        self.__command = checkAndSetInstance(list, command)
+        self.__cwd = cwd
+        self.__env = env
+        self.__stdout_path = stdout_path
+        self.__stderr_path = stderr_path
+        self.__timeout = timeout
+
+        self.__popen = None
+        self.__returncode = None
+        self.__error = None
+        self.__timed_out = False
+        self.__start_time = None
+        self.__end_time = None
+        self.__terminate_time = None
+        self.__done = threading.Event()
+
+    @property
+    def command(self):
+        """ Query for the command sequence. """
+        return self.__command
+
+    @property
+    def pid(self):
+        """ Query for the process id (None if not launched yet). """
+        if self.__popen is None:
+            return None
+        return self.__popen.pid
+
+    @property
+    def returncode(self):
+        """ Query for the exit code (None while running, negative if killed by a signal). """
+        return self.__returncode
+
+    @property
+    def timed_out(self):
+        """ Query whether the process was terminated because it exceeded its timeout. """
+        return self.__timed_out
+
+    @property
+    def wall_time(self):
+        """ Query for the run time (in s) of the finished process. """
+        if self.__start_time is None or self.__end_time is None:
+            return None
+        return self.__end_time - self.__start_time
+
+    @property
+    def stdout_path(self):
+        """ Query for the standard output log file. """
+        return self.__stdout_path
+
+    @property
+    def stderr_path(self):
+        """ Query for the standard error log file. """
+        return self.__stderr_path
+
+    def done(self):
+        """ Query whether the process has finished. """
+        return self.__done.is_set()
+
+    def wait(self):
+        """
+        Wait for the process to finish.
+
+        @return : The exit code.
+        @throw : OSError if the process could not be launched.
+        """
+        # Wait with timeout so that the waiting thread stays responsive to interrupts.
+        while not self.__done.wait(0.5):
+            pass
+        if self.__error is not None:
+            raise self.__error
+
+        return self.__returncode
+
+    def _launch(self):
+        """ Start the process. Returns False if it could not be started. """
+        stdout = stderr = None
+        try:
+            if self.__stdout_path is not None:
+                stdout = open(self.__stdout_path, 'a')
+            if self.__stderr_path is not None:
+                if self.__stderr_path == self.__stdout_path:
+                    stderr = subprocess.STDOUT
+                else:
+                    stderr = open(self.__stderr_path, 'a')
+            self.__start_time = time.time()
+            self.__popen = subprocess.Popen(self.__command, cwd=self.__cwd, env=self.__env, stdout=stdout, stderr=stderr, close_fds=True)
+        except (OSError, IOError) as error:
+            self.__error = error
+            self.__finish()
+            return False
+        finally:
+            # The child holds its own copies of the file descriptors.
+            for handle in [stdout, stderr]:
+                if isinstance(handle, file):
+                    handle.close()
+
+        return True
+
+    def _poll(self):
+        """ Check the process, enforce the timeout. Returns True if the process has finished. """
+        returncode = self.__popen.poll()
+        if returncode is not None:
+            self.__returncode = returncode
+            self.__finish()
+            return True
+
+        now = time.time()
+        if self.__timeout is not None and not self.__timed_out and now - self.__start_time > self.__timeout:
+            self.__timed_out = True
+            self._terminate()
+        elif self.__terminate_time is not None and now - self.__terminate_time > self.KILL_DELAY:
+            self.__popen.kill()
+
+        return False
+
+    def _terminate(self):
+        """ Ask the process to terminate. """
+        if self.__terminate_time is None:
+            self.__terminate_time = time.time()
+            try:
+                self.__popen.terminate()
+            except OSError:
+                # Already finished.
+                pass
+
+    def _cancel(self):
+        """ Mark a process that was never launched as finished. """
+        self.__error = OSError("Process %s was cancelled before launch." % (' '.join(self.__command)))
+        self.__finish()
+
+    def __finish(self):
+        """ Record the end time and wake up waiting threads. """
+        self.__end_time = time.time()
+        self.__done.set()
+
+
+# Supervisor shared by all calculators of this process.
+_default_supervisor = None
+_default_supervisor_lock = threading.Lock()
+
+def defaultSupervisor():
+    """
+    Query for the process supervisor shared by all calculators.
+
+    @return : The shared ProcessSupervisor.
+    <br/><b>note</b> : Set e.g. defaultSupervisor().max_processes or defaultSupervisor().timeout to control all backengine processes.
+    """
+    global _default_supervisor
+    with _default_supervisor_lock:
+        if _default_supervisor is None:
+            _default_supervisor = ProcessSupervisor()
+        return _default_supervisor
+
+def logTail(path, number_of_lines=20):
+    """
+    Query for the last lines of a log file, e.g. to report the cause of a failed process.
+
+    @param path : The log file.
+    <br/><b>type</b> : string
+
+    @param number_of_lines : Number of lines to return.
+    <br/><b>type</b> : int
+    <br/><b>default</b> : 20
+
+    @return : The last lines of the log file, empty if the file does not exist.
+    """
+    if not os.path.isfile(path):
+        return ""
+    with open(path, 'r') as log_file:
+        return "".join(collections.deque(log_file, number_of_lines))
@@ -0,0 +1,230 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the ResourceScheduler class, which shares the cores and memory of a node between concurrently running work.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import collections
+import os
+import threading
+from contextlib import contextmanager
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+
+# Environment variables limiting the threads of OpenMP and of FFT and linear algebra libraries.
+THREAD_LIMIT_VARIABLES = ['OMP_NUM_THREADS',
+                          'MKL_NUM_THREADS',
+                          'OPENBLAS_NUM_THREADS',
+                          'NUMEXPR_NUM_THREADS',
+                          'VECLIB_MAXIMUM_THREADS',
+                          ]
+
+class ResourceScheduler(object):
+    """
+    Class granting cores and memory of the node to work items and calculators. Requests are granted in
+    the order they are made, as soon as enough cores and memory are free, so that concurrently running
+    stages and workflows do not oversubscribe the node. Requests larger than the node are reduced to the
+    node's capacity, i.e. they run alone.
+    """
+
+    def __init__(self, cores=None, memory=None):
+        """
+        Constructor for the ResourceScheduler.
+
+        @param cores : Number of cores to share.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : Number of cpus.
+
+        @param memory : Memory (in bytes) to share.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : Physical memory of the node.
+        """
+        self.__condition = threading.Condition()
+        self.__waiting = collections.deque()
+        self.__used_cores = 0
+        self.__used_memory = 0
+        self.__local = threading.local()
+        self.cores = cores
+        self.memory = memory
+
+    @property
+    def cores(self):
+        """ Query for the number of shared cores. """
+        return self.__cores
+    @cores.setter
+    def cores(self, value):
+        """ Set the number of shared cores. """
+        with self.__condition:
+            # Import here, so that importing this module stays fast.
+            import multiprocessing
+            self.__cores = checkAndSetPositiveInteger(value, multiprocessing.cpu_count())
+            self.__condition.notify_all()
+
+    @property
+    def memory(self):
+        """ Query for the shared memory (in bytes). """
+        return self.__memory
+    @memory.setter
+    def memory(self, value):
+        """ Set the shared memory (in bytes). """
+        with self.__condition:
+            self.__memory = checkAndSetPositiveInteger(value, physicalMemory())
+            self.__condition.notify_all()
+
+    @property
+    def available_cores(self):
+        """ Query for the number of cores not granted. """
+        with self.__condition:
+            return self.__cores - self.__used_cores
+
+    @property
+    def available_memory(self):
+        """ Query for the memory (in bytes) not granted. """
+        with self.__condition:
+            return self.__memory - self.__used_memory
+
+    def acquire(self, cores=1, memory=0, mpi_ranks=0):
+        """
+        Wait until the requested resources are free and grant them.
+
+        @param cores : Number of cores, 0 for work hardly using the cpu (e.g. staging files).
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        @param memory : Estimated peak memory (in bytes).
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 0
+
+        @param mpi_ranks : Number of MPI ranks, each one occupying a core.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 0
+
+        @return : The grant, to be passed to release().
+        """
+        request = object()
+        with self.__condition:
+            grant = (min(max(cores, mpi_ranks, 0), self.__cores), min(max(memory, 0), self.__memory))
+            self.__waiting.append(request)
+            try:
+                while self.__waiting[0] is not request or not self.__fits(grant):
+                    self.__condition.wait(0.5)
+                    grant = (min(grant[0], self.__cores), min(grant[1], self.__memory))
+            finally:
+                self.__waiting.remove(request)
+                # The next request in line may fit as well.
+                self.__condition.notify_all()
+            self.__used_cores += grant[0]
+            self.__used_memory += grant[1]
+
+        return grant
+
+    def release(self, grant):
+        """
+        Return granted resources.
+
+        @param grant : The grant returned by acquire().
+        <br/><b>type</b> : tuple
+        """
+        with self.__condition:
+            self.__used_cores -= grant[0]
+            self.__used_memory -= grant[1]
+            self.__condition.notify_all()
+
+    @contextmanager
+    def reserve(self, cores=1, memory=0, mpi_ranks=0):
+        """
+        Context manager holding resources while the enclosed code runs. Takes the same arguments as acquire().
+        Reservations nested in the same thread are granted by the outer reservation.
+
+        @example : with defaultResourceScheduler().reserve(**calculator.resources): calculator.backengine()
+        """
+        if self.reserved():
+            self.__local.depth += 1
+            try:
+                yield
+            finally:
+                self.__local.depth -= 1
+            return
+
+        grant = self.acquire(cores, memory, mpi_ranks)
+        self.__local.depth = 1
+        try:
+            yield
+        finally:
+            self.__local.depth = 0
+            self.release(grant)
+
+    def reserved(self):
+        """ Query whether the calling thread holds a reservation, see reserve(). """
+        return getattr(self.__local, 'depth', 0) > 0
+
+    def __fits(self, grant):
+        """ Query whether a grant fits into the free resources. """
+        return self.__used_cores + grant[0] <= self.__cores and self.__used_memory + grant[1] <= self.__memory
+
+
+def physicalMemory():
+    """
+    Query for the physical memory of the node.
+
+    @return : The memory (in bytes).
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        # Not available on this platform, do not limit by memory.
+        return 2**62
+
+def threadLimits(cores):
+    """
+    Query for the environment limiting OpenMP, FFT and linear algebra libraries to a number of threads.
+
+    @param cores : The number of threads.
+    <br/><b>type</b> : int
+
+    @return : Dictionary of environment variables.
+    <br/><b>note</b> : The libraries read the variables when they are loaded, i.e. the environment has to be set before.
+    """
+    cores = checkAndSetPositiveInteger(cores)
+    return dict([(variable, str(cores)) for variable in THREAD_LIMIT_VARIABLES])
+
+
+# Scheduler shared by all calculators of this process.
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def defaultResourceScheduler():
+    """
+    Query for the resource scheduler shared by all calculators and simulations.
+
+    @return : The shared ResourceScheduler.
+    <br/><b>note</b> : Set e.g. defaultResourceScheduler().cores to the cores available to simulations on this node.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = ResourceScheduler()
+        return _default_scheduler
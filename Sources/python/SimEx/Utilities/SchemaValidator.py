@@ -0,0 +1,239 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the SchemaValidator class, which checks input files against the data expected by a calculator.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import os
+import re
+import threading
+
+from SimEx.Utilities.EntityChecks import checkAndSetPositiveInteger
+
+# Placeholders in data paths, e.g. '/data/snp_<7 digit index>/ff'.
+_PLACEHOLDER = re.compile(r'<(\d+) digit index>')
+
+# Compiled data paths.
+_compiled_paths = {}
+_compiled_paths_lock = threading.Lock()
+
+class SchemaValidator(object):
+    """
+    Class checking that input files hold the data expected by a calculator. Only the hdf5 metadata (the names
+    of groups and datasets) is walked, no data is read. The names found in a file are cached together with the
+    file's size and modification time, so repeated checks of unchanged files cost a stat() only.
+    """
+
+    def __init__(self, max_files=2):
+        """
+        Constructor for the SchemaValidator.
+
+        @param max_files : Maximum number of files checked per input directory (the first and the last ones).
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 2
+        """
+        self.max_files = max_files
+        self.__cache = {}
+        self.__lock = threading.Lock()
+        self.__statistics = {'hits' : 0, 'misses' : 0}
+
+    @property
+    def max_files(self):
+        """ Query for the maximum number of files checked per input directory. """
+        return self.__max_files
+    @max_files.setter
+    def max_files(self, value):
+        """ Set the maximum number of files checked per input directory. """
+        self.__max_files = checkAndSetPositiveInteger(value, 2)
+
+    @property
+    def statistics(self):
+        """ Query for the number of hits (names taken from the cache) and misses (metadata walked). """
+        with self.__lock:
+            return dict(self.__statistics)
+
+    def dataPaths(self, path):
+        """
+        Query for the names of all groups and datasets in an hdf5 file.
+
+        @param path : The hdf5 file.
+        <br/><b>type</b> : string
+
+        @return : Set of data paths with leading slash, e.g. '/params/Mesh/xMin'.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime)
+        with self.__lock:
+            cached = self.__cache.get(path)
+            if cached is not None and cached[0] == signature:
+                self.__statistics['hits'] += 1
+                return cached[1]
+
+        names = []
+        with h5py.File(path, 'r') as h5:
+            h5.visit(names.append)
+        names = frozenset(['/' + str(name) for name in names])
+
+        with self.__lock:
+            self.__statistics['misses'] += 1
+            self.__cache[path] = (signature, names)
+
+        return names
+
+    def missingData(self, files, expected_data):
+        """
+        Query for the expected data missing in files.
+
+        @param files : The hdf5 files.
+        <br/><b>type</b> : list of strings
+
+        @param expected_data : The expected data paths, possibly with placeholders such as '<7 digit index>'.
+        <br/><b>type</b> : list of strings
+
+        @return : Dictionary of the sorted missing data paths keyed by file, holding only files with missing data.
+        @throw : IOError if a file is not a readable hdf5 file.
+        """
+        missing = {}
+        for path in files:
+            missing_paths = missingDataPaths(expected_data, self.dataPaths(path))
+            if missing_paths != []:
+                missing[path] = missing_paths
+
+        return missing
+
+    def validate(self, calculator, files=None):
+        """
+        Check the input files of a calculator against its expected data.
+
+        @param calculator : The calculator.
+        <br/><b>type</b> : AbstractBaseCalculator
+
+        @param files : The input files to check.
+        <br/><b>type</b> : list of strings
+        <br/><b>default</b> : The first and last input files, up to max_files.
+
+        @return : Dictionary of the missing data paths keyed by input file, empty if the input is complete or does not exist yet.
+        """
+        if files is None:
+            input_path = calculator.input_path
+            if input_path is None or not os.path.exists(input_path):
+                return {}
+            if os.path.isdir(input_path):
+                files = calculator._inputFiles()
+                if len(files) > self.__max_files:
+                    files = files[:self.__max_files-1] + files[-1:]
+            else:
+                files = [input_path]
+        # Input files that are not hdf5, e.g. pdb files, are not checked.
+        files = [f for f in files if h5py.is_hdf5(f)]
+
+        return self.missingData(files, calculator.expectedData())
+
+    def clear(self):
+        """ Forget all cached names. """
+        with self.__lock:
+            self.__cache = {}
+
+
+def compileDataPath(path):
+    """
+    Compile a data path with placeholders into a regular expression.
+
+    @param path : The data path, e.g. '/data/snp_<7 digit index>/ff'.
+    <br/><b>type</b> : string
+
+    @return : The compiled regular expression matching the complete data path, e.g. '/data/snp_0000001/ff'.
+    """
+    with _compiled_paths_lock:
+        compiled = _compiled_paths.get(path)
+        if compiled is None:
+            parts = _PLACEHOLDER.split('/' + path.strip('/'))
+            # Parts alternate between literal text and placeholder widths.
+            expression = ''.join([re.escape(part) if i % 2 == 0 else r'\d{%s}' % (part) for i, part in enumerate(parts)])
+            compiled = re.compile(expression + '$')
+            _compiled_paths[path] = compiled
+
+        return compiled
+
+def isDataPathPattern(path):
+    """
+    Query whether a data path holds placeholders, see compileDataPath().
+
+    @param path : The data path.
+    <br/><b>type</b> : string
+
+    @return : True if the path holds placeholders such as '<7 digit index>'.
+    """
+    return _PLACEHOLDER.search(path) is not None
+
+def missingDataPaths(expected_data, provided_data):
+    """
+    Query for expected data paths not matched by any provided data path. Placeholders on either side match indices.
+
+    @param expected_data : The expected data paths.
+    <br/><b>type</b> : list of strings
+
+    @param provided_data : The provided data paths, e.g. the names found in a file.
+    <br/><b>type</b> : iterable of strings
+
+    @return : The sorted list of expected data paths without a match.
+    """
+    provided_data = set(['/' + p.strip('/') for p in provided_data])
+    provided_patterns = [p for p in provided_data if _PLACEHOLDER.search(p)]
+
+    missing = []
+    for expected in set(expected_data):
+        normalized = '/' + expected.strip('/')
+        if normalized in provided_data:
+            continue
+        if _PLACEHOLDER.search(normalized):
+            pattern = compileDataPath(normalized)
+            if any([pattern.match(p) for p in provided_data]):
+                continue
+        if any([compileDataPath(p).match(normalized) for p in provided_patterns]):
+            continue
+        missing.append(expected)
+
+    return sorted(missing)
+
+
+# Validator shared by all simulations of this process.
+_default_validator = None
+_default_validator_lock = threading.Lock()
+
+def defaultSchemaValidator():
+    """
+    Query for the schema validator shared by all simulations, so that unchanged files are walked only once.
+
+    @return : The shared SchemaValidator.
+    """
+    global _default_validator
+    with _default_validator_lock:
+        if _default_validator is None:
+            _default_validator = SchemaValidator()
+        return _default_validator
@@ -0,0 +1,206 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module holding utilities to index per-pulse hdf5 files with a virtual dataset and to read them in batches.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import numpy
+import os
+
+from SimEx.Utilities.OutputContainer import containerRows, iterateRows
+
+# Name of the index file written into a directory of per-pulse files.
+INDEX_FILE_NAME = 'index_vds.h5'
+
+def writeVirtualDatasetIndex(files, index_path, dataset='/data/data', parameters_group='/params'):
+    """
+    Write an hdf5 file that stacks a dataset of many files into one virtual dataset, without copying the data.
+
+    @param files : The per-pulse files, in stacking order.
+    <br/><b>type</b> : list of strings
+
+    @param index_path : The index file to write. The files are referenced relative to its directory.
+    <br/><b>type</b> : string
+
+    @param dataset : The dataset to stack, all files must hold it with the same shape and type.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : '/data/data'
+
+    @param parameters_group : Group whose scalar numeric datasets are collected into per-pulse tables (copied, not virtual).
+    <br/><b>type</b> : string
+    <br/><b>default</b> : '/params'
+
+    @return : The number of indexed files.
+    <br/><b>note</b> : The index holds the virtual dataset under the same path, e.g. /data/data of shape (N, ny, nx),
+    the tables under parameters_group, e.g. /params/beam/photonEnergy of shape (N,), and the file names under /files.
+    """
+    if len(files) == 0:
+        raise ValueError("No files to index.")
+
+    index_path = os.path.abspath(index_path)
+    index_dir = os.path.dirname(index_path)
+
+    # Shape, type and parameter datasets from the first file.
+    with h5py.File(files[0], 'r') as h5:
+        if dataset not in h5:
+            raise KeyError("%s holds no dataset %s." % (files[0], dataset))
+        shape = h5[dataset].shape
+        dtype = h5[dataset].dtype
+        parameter_names = []
+        if parameters_group in h5:
+            def collect(name, obj):
+                if isinstance(obj, h5py.Dataset) and obj.shape == () and obj.dtype.kind in 'biuf':
+                    parameter_names.append(parameters_group.rstrip('/') + '/' + name)
+            h5[parameters_group].visititems(collect)
+
+    layout = h5py.VirtualLayout(shape=(len(files),)+shape, dtype=dtype)
+    parameters = dict([(name, numpy.zeros(len(files))) for name in parameter_names])
+    for i, path in enumerate(files):
+        with h5py.File(path, 'r') as h5:
+            if dataset not in h5 or h5[dataset].shape != shape or h5[dataset].dtype != dtype:
+                raise ValueError("%s does not hold %s with shape %s and type %s." % (path, dataset, shape, dtype))
+            for name in parameter_names:
+                parameters[name][i] = h5[name][()] if name in h5 else numpy.nan
+        layout[i] = h5py.VirtualSource(os.path.relpath(os.path.abspath(path), index_dir), dataset, shape=shape)
+
+    # Write to a temporary file first, so that readers never see an incomplete index.
+    tmp_path = index_path + '.%d.tmp' % (os.getpid())
+    with h5py.File(tmp_path, 'w') as h5:
+        h5.create_virtual_dataset(dataset, layout)
+        for name, table in parameters.items():
+            h5[name] = table
+        h5['files'] = numpy.array([os.path.relpath(os.path.abspath(path), index_dir) for path in files], dtype=h5py.special_dtype(vlen=str))
+        h5['file_sizes'] = numpy.array([os.path.getsize(path) for path in files], dtype='i8')
+        h5.attrs['dataset'] = dataset
+    os.rename(tmp_path, index_path)
+
+    return len(files)
+
+def findVirtualDatasetIndex(files, dataset='/data/data'):
+    """
+    Query for a valid index of files, i.e. an index file in the directory of the first file that stacks
+    the dataset of these files as a contiguous run, in this order, with unchanged file sizes.
+
+    @param files : The per-pulse files.
+    <br/><b>type</b> : list of strings
+
+    @param dataset : The stacked dataset.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : '/data/data'
+
+    @return : Tuple of the index file path and the position of the first file in the index, None if there is no valid index.
+    """
+    if len(files) == 0:
+        return None
+    index_dir = os.path.dirname(os.path.abspath(files[0]))
+    index_path = os.path.join(index_dir, INDEX_FILE_NAME)
+    if not os.path.isfile(index_path):
+        return None
+
+    try:
+        with h5py.File(index_path, 'r') as h5:
+            if h5.attrs['dataset'] != dataset:
+                return None
+            indexed_files = [os.path.normpath(os.path.join(index_dir, f)) for f in h5['files'][()]]
+            indexed_sizes = list(h5['file_sizes'][()])
+    except (IOError, KeyError):
+        return None
+
+    files = [os.path.abspath(f) for f in files]
+    if files[0] not in indexed_files:
+        return None
+    start = indexed_files.index(files[0])
+    if indexed_files[start:start+len(files)] != files:
+        return None
+    for path, size in zip(files, indexed_sizes[start:start+len(files)]):
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return None
+
+    return index_path, start
+
+def readPatterns(files, dataset='/data/data', batch_size=100, pool=None):
+    """
+    Iterate over a dataset of many files. If the files are indexed by a valid virtual dataset index,
+    the data is read in batches of contiguous slices of the virtual dataset, otherwise file by file.
+    Containers (see OutputContainer) yield one item per row, read in batches.
+
+    @param files : The per-pulse files or containers.
+    <br/><b>type</b> : list of strings
+
+    @param dataset : The dataset to read.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : '/data/data'
+
+    @param batch_size : Number of files (or rows) read at once from an index (or a container).
+    <br/><b>type</b> : int
+    <br/><b>default</b> : 100
+
+    @param pool : Pool of open files used when reading file by file, so that files read repeatedly are opened only once.
+    <br/><b>type</b> : H5HandlePool
+    <br/><b>default</b> : None (open and close each file)
+
+    @return : Generator yielding the data of each file (or row), None for files that cannot be read.
+    """
+    index = findVirtualDatasetIndex(files, dataset)
+    if index is not None:
+        index_path, offset = index
+        with h5py.File(index_path, 'r') as h5:
+            stack = h5[dataset]
+            for start in range(offset, offset+len(files), batch_size):
+                batch = stack[start:min(start+batch_size, offset+len(files))]
+                for data in batch:
+                    yield data
+        return
+
+    for path in files:
+        try:
+            h5 = h5py.File(path, 'r') if pool is None else pool.acquire(path, 'r')
+        except IOError:
+            yield None
+            continue
+
+        try:
+            rows = containerRows(h5)
+            if rows is not None:
+                if dataset in h5:
+                    for data in iterateRows(h5, dataset, batch_size):
+                        yield data
+                else:
+                    for i in range(rows):
+                        yield None
+                continue
+
+            try:
+                data = h5[dataset][()]
+            except KeyError:
+                data = None
+            yield data
+        finally:
+            if pool is None:
+                h5.close()
+            else:
+                pool.release(path)
@@ -0,0 +1,172 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds utilities to resample wavefronts in WPG format onto a coarser mesh.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import numpy
+import os
+
+from SimEx.Utilities.EntityChecks import checkAndSetPositiveInteger
+from SimEx.Utilities.WritePolicy import writePolicy
+
+# Electric field datasets, shaped (ny, nx, nSlices, 2) with real and imaginary part in the last axis.
+WAVEFRONT_FIELDS = ['/data/arrEhor', '/data/arrEver']
+
+# Size (in bytes) of the slab of source slices processed at once.
+_SLAB_BYTES = 64*1048576
+
+def resampleWavefront(input_path, output_path, nx=None, ny=None, nSlices=None, write_policy=None):
+    """
+    Write a copy of a wavefront file with the electric fields rebinned onto a coarser mesh.
+
+    Each new mesh cell collects a block of source cells. Its intensity is the summed intensity of the block divided
+    by the ratio of cell sizes, its phase is the phase of the summed field, so that the pulse energy
+    (intensity integrated over the mesh) is conserved. The mesh extent /params/Mesh/*Min, *Max is adjusted to the
+    centres of the new cells, all other data are copied.
+
+    @param input_path : The wavefront file to resample.
+    <br/><b>type</b> : string
+
+    @param output_path : The file to write.
+    <br/><b>type</b> : string
+
+    @param nx : Number of mesh points in x.
+    <br/><b>type</b> : int
+    <br/><b>default</b> : None (keep)
+
+    @param ny : Number of mesh points in y.
+    <br/><b>type</b> : int
+    <br/><b>default</b> : None (keep)
+
+    @param nSlices : Number of time slices.
+    <br/><b>type</b> : int
+    <br/><b>default</b> : None (keep)
+
+    @param write_policy : Policy to write the resampled fields with.
+    <br/><b>type</b> : WritePolicy
+    <br/><b>default</b> : None (the default policy)
+
+    @return : The new mesh as dict of nx, ny and nSlices.
+    <br/><b>note</b> : A mesh can only be made coarser. Requests for more points than the source mesh has keep the source mesh.
+    """
+    if os.path.abspath(input_path) == os.path.abspath(output_path):
+        raise IOError("Cannot resample %s in place." % (input_path))
+    if write_policy is None:
+        write_policy = writePolicy()
+
+    with h5py.File(input_path, 'r') as source:
+        mesh = source['params/Mesh']
+        shape = (int(mesh['ny'][()]), int(mesh['nx'][()]), int(mesh['nSlices'][()]))
+        target = (min(checkAndSetPositiveInteger(ny, shape[0]), shape[0]),
+                  min(checkAndSetPositiveInteger(nx, shape[1]), shape[1]),
+                  min(checkAndSetPositiveInteger(nSlices, shape[2]), shape[2]))
+
+        fields = [f for f in WAVEFRONT_FIELDS if f in source]
+        for field in fields:
+            if source[field].shape != shape + (2,):
+                raise IOError("%s in %s has shape %s, expected %s from /params/Mesh." % (field, input_path, source[field].shape, shape + (2,)))
+
+        # Write to a temporary file first, so that the output is never left incomplete.
+        tmp_path = output_path + '.tmp'
+        try:
+            with h5py.File(tmp_path, 'w') as destination:
+                for name in source.keys():
+                    if name != 'data':
+                        source.copy(name, destination)
+                data = destination.require_group('data')
+                for name, obj in source['data'].items():
+                    if '/data/' + name not in fields:
+                        source.copy(obj, data)
+                for field in fields:
+                    write_policy.createDataset(data, field.split('/')[-1], rebinField(source[field], target), allow_downcast=True)
+                    for key, value in source[field].attrs.items():
+                        destination[field].attrs[key] = value
+
+                _resampleMesh(destination['params/Mesh'], shape, target)
+            os.rename(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return {'ny' : target[0], 'nx' : target[1], 'nSlices' : target[2]}
+
+def rebinField(field, target):
+    """
+    Rebin an electric field onto a coarser mesh, conserving its energy (see resampleWavefront()).
+
+    @param field : The field, shaped (ny, nx, nSlices, 2) with real and imaginary part in the last axis. Read slab by slab if a dataset.
+    <br/><b>type</b> : numpy.ndarray or h5py.Dataset
+
+    @param target : The new number of points (ny, nx, nSlices), each not larger than in the field.
+    <br/><b>type</b> : tuple
+
+    @return : The rebinned field, shaped target + (2,).
+    """
+    shape = field.shape[:3]
+    starts = [(numpy.arange(n) * N) // n for N, n in zip(shape, target)]
+    # Ratio of the new to the old cell size.
+    scale = float(numpy.prod(shape)) / numpy.prod(target)
+
+    # Read whole blocks of slices, about _SLAB_BYTES at a time.
+    slice_bytes = shape[0] * shape[1] * 2 * field.dtype.itemsize
+    slices_per_slab = max(1, _SLAB_BYTES // max(slice_bytes, 1))
+    slice_edges = list(starts[2]) + [shape[2]]
+
+    rebinned = numpy.empty(target + (2,), dtype=field.dtype)
+    first = 0
+    while first < target[2]:
+        last = first + 1
+        while last < target[2] and slice_edges[last+1] - slice_edges[first] <= slices_per_slab:
+            last += 1
+        slab = field[:, :, slice_edges[first]:slice_edges[last], :]
+        E = slab[..., 0].astype(numpy.float64) + 1j*slab[..., 1]
+
+        intensity = numpy.abs(E)**2
+        for axis, block_starts in enumerate(starts[:2] + [starts[2][first:last] - slice_edges[first]]):
+            intensity = numpy.add.reduceat(intensity, block_starts, axis=axis)
+            E = numpy.add.reduceat(E, block_starts, axis=axis)
+
+        E = numpy.sqrt(intensity / scale) * numpy.exp(1j*numpy.angle(E))
+        rebinned[:, :, first:last, 0] = E.real
+        rebinned[:, :, first:last, 1] = E.imag
+        first = last
+
+    return rebinned
+
+def _resampleMesh(mesh, shape, target):
+    """ Update the mesh parameters to the rebinned field: the new cells cover the same extent as the old ones. """
+    for key, n, N in [('nSlices', target[2], shape[2]), ('nx', target[1], shape[1]), ('ny', target[0], shape[0])]:
+        mesh[key][()] = n
+    for prefix, n, N in [('slice', target[2], shape[2]), ('x', target[1], shape[1]), ('y', target[0], shape[0])]:
+        if n == N or N < 2:
+            continue
+        low, high = mesh[prefix + 'Min'][()], mesh[prefix + 'Max'][()]
+        step = (high - low) / (N - 1)
+        new_step = step * N / n
+        mesh[prefix + 'Min'][()] = low - step/2 + new_step/2
+        mesh[prefix + 'Max'][()] = high + step/2 - new_step/2
@@ -0,0 +1,287 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Module that holds the WritePolicy class, the settings used to write hdf5 datasets.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import numpy
+import threading
+
+from SimEx.Utilities.EntityChecks import checkAndSetInstance, checkAndSetPositiveInteger
+
+# Supported compression codecs.
+WRITE_POLICY_CODECS = ['none', 'lzf', 'gzip']
+
+class WritePolicy(object):
+    """
+    Class representing the settings for writing hdf5 datasets: compression codec, shuffle filter,
+    chunk shape and down-casting of double precision data to single precision.
+    Datasets smaller than min_bytes, scalars and strings are always written contiguously without filters.
+    """
+
+    def __init__(self, codec='gzip', level=4, shuffle=True, chunk_bytes=1048576, min_bytes=4096, downcast=False):
+        """
+        Constructor for the WritePolicy.
+
+        @param codec : The compression codec, one of 'none', 'lzf' and 'gzip'.
+        <br/><b>type</b> : string
+        <br/><b>default</b> : 'gzip'
+
+        @param level : The gzip compression level (0-9).
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 4
+
+        @param shuffle : Whether to apply the shuffle filter before compression.
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : True
+
+        @param chunk_bytes : Target size of a chunk (in bytes).
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1048576 (1 MiB)
+
+        @param min_bytes : Datasets smaller than this (in bytes) are written without chunking and filters.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 4096
+
+        @param downcast : Whether to write double precision data as single precision where the writer allows it.
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : False
+        """
+        self.__codec = checkAndSetInstance(str, codec, 'gzip')
+        if self.__codec not in WRITE_POLICY_CODECS:
+            raise ValueError("The codec must be one of %s." % (", ".join(WRITE_POLICY_CODECS)))
+        self.__level = checkAndSetInstance(int, level, 4)
+        if self.__level < 0 or self.__level > 9:
+            raise ValueError("The gzip level must be between 0 and 9.")
+        self.__shuffle = checkAndSetInstance(bool, shuffle, True)
+        self.__chunk_bytes = checkAndSetPositiveInteger(chunk_bytes, 1048576)
+        self.__min_bytes = checkAndSetInstance(int, min_bytes, 4096)
+        self.__downcast = checkAndSetInstance(bool, downcast, False)
+
+    @property
+    def codec(self):
+        """ Query for the compression codec. """
+        return self.__codec
+
+    @property
+    def level(self):
+        """ Query for the gzip compression level. """
+        return self.__level
+
+    @property
+    def shuffle(self):
+        """ Query whether the shuffle filter is applied. """
+        return self.__shuffle
+
+    @property
+    def chunk_bytes(self):
+        """ Query for the target size of a chunk. """
+        return self.__chunk_bytes
+
+    @property
+    def min_bytes(self):
+        """ Query for the size below which datasets are written without filters. """
+        return self.__min_bytes
+
+    @property
+    def downcast(self):
+        """ Query whether double precision data is written as single precision where allowed. """
+        return self.__downcast
+
+    def datasetOptions(self, data, allow_downcast=False):
+        """
+        Query for the data to write and the keyword arguments for h5py's create_dataset().
+
+        @param data : The data to write.
+        <br/><b>type</b> : numpy.ndarray or anything convertible to it
+
+        @param allow_downcast : Whether the writer allows single precision for this dataset.
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : False
+
+        @return : Tuple of the (possibly converted) data and a dictionary of keyword arguments.
+        """
+        data = numpy.asarray(data)
+        if allow_downcast and self.__downcast:
+            if data.dtype == numpy.float64:
+                data = data.astype(numpy.float32)
+            elif data.dtype == numpy.complex128:
+                data = data.astype(numpy.complex64)
+
+        if data.shape == () or data.dtype.kind not in 'biufc' or data.nbytes < self.__min_bytes:
+            return data, {}
+
+        options = self.__filterOptions()
+        if options != {}:
+            options['chunks'] = chunkShape(data.shape, data.dtype.itemsize, self.__chunk_bytes)
+
+        return data, options
+
+    def createDataset(self, group, name, data, allow_downcast=False):
+        """
+        Write a dataset according to this policy.
+
+        @param group : The file or group to write to.
+        <br/><b>type</b> : h5py.Group
+
+        @param name : The name of the dataset.
+        <br/><b>type</b> : string
+
+        @param data : The data to write.
+        <br/><b>type</b> : numpy.ndarray or anything convertible to it
+
+        @param allow_downcast : Whether the writer allows single precision for this dataset.
+        <br/><b>type</b> : bool
+        <br/><b>default</b> : False
+
+        @return : The created dataset.
+        """
+        data, options = self.datasetOptions(data, allow_downcast)
+
+        return group.create_dataset(name, data=data, **options)
+
+    def createExtendableDataset(self, group, name, row_shape, dtype, expected_rows=1):
+        """
+        Create an empty dataset that grows along its first axis, one row at a time, e.g. one row per pulse.
+
+        @param group : The file or group to write to.
+        <br/><b>type</b> : h5py.Group
+
+        @param name : The name of the dataset.
+        <br/><b>type</b> : string
+
+        @param row_shape : The shape of a row.
+        <br/><b>type</b> : tuple of ints
+
+        @param dtype : The data type.
+        <br/><b>type</b> : numpy.dtype or h5py special type
+
+        @param expected_rows : Expected number of rows, used to size the chunks.
+        <br/><b>type</b> : int
+        <br/><b>default</b> : 1
+
+        @return : The created dataset of shape (0,)+row_shape. Rows are appended with dataset.resize().
+        <br/><b>note</b> : Extendable datasets are always chunked. Chunks hold whole rows, filters are applied to numeric data only.
+        """
+        row_shape = tuple(row_shape)
+        dtype = numpy.dtype(dtype)
+        itemsize = dtype.itemsize if dtype.kind != 'O' else 8
+        expected_rows = max(1, expected_rows)
+        row_bytes = int(numpy.prod(row_shape)) * itemsize
+        if row_bytes <= self.__chunk_bytes:
+            # Whole rows per chunk, so that reading a row touches a single chunk.
+            chunks = (max(1, min(expected_rows, self.__chunk_bytes // max(1, row_bytes))),) + tuple(max(1, n) for n in row_shape)
+        else:
+            chunks = (1,) + chunkShape(row_shape, itemsize, self.__chunk_bytes)
+
+        options = {}
+        if dtype.kind in 'biufc' and expected_rows * numpy.prod(row_shape) * itemsize >= self.__min_bytes:
+            options = self.__filterOptions()
+
+        return group.create_dataset(name, shape=(0,)+row_shape, maxshape=(None,)+row_shape, dtype=dtype, chunks=chunks, **options)
+
+    def __filterOptions(self):
+        """ Keyword arguments for h5py's create_dataset() selecting the compression and shuffle filters. """
+        options = {}
+        if self.__codec == 'gzip':
+            options['compression'] = 'gzip'
+            options['compression_opts'] = self.__level
+        elif self.__codec == 'lzf':
+            options['compression'] = 'lzf'
+        if self.__codec != 'none' and self.__shuffle:
+            options['shuffle'] = True
+
+        return options
+
+    def __repr__(self):
+        return "WritePolicy(codec=%r, level=%r, shuffle=%r, chunk_bytes=%r, min_bytes=%r, downcast=%r)" % (self.__codec, self.__level, self.__shuffle, self.__chunk_bytes, self.__min_bytes, self.__downcast)
+
+
+def chunkShape(shape, itemsize, chunk_bytes):
+    """
+    Query for a chunk shape of roughly the given size, obtained by halving the largest dimension until the chunk fits.
+
+    @param shape : The dataset shape.
+    <br/><b>type</b> : tuple of ints
+
+    @param itemsize : Size of one element (in bytes).
+    <br/><b>type</b> : int
+
+    @param chunk_bytes : Target size of a chunk (in bytes).
+    <br/><b>type</b> : int
+
+    @return : The chunk shape.
+    """
+    chunk = [max(1, n) for n in shape]
+    while numpy.prod(chunk) * itemsize > chunk_bytes and max(chunk) > 1:
+        i = chunk.index(max(chunk))
+        chunk[i] = (chunk[i] + 1) // 2
+
+    return tuple(chunk)
+
+
+# Default policy and policies of single stages (keyed by calculator class name).
+_default_policy = WritePolicy()
+_stage_policies = {}
+_policies_lock = threading.Lock()
+
+def writePolicy(stage=None):
+    """
+    Query for the write policy of a stage.
+
+    @param stage : The stage, i.e. the calculator class name, e.g. 'EMCOrientation'.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : None (default policy)
+
+    @return : The policy set for the stage, the default policy if none is set.
+    """
+    with _policies_lock:
+        return _stage_policies.get(stage, _default_policy)
+
+def setWritePolicy(policy, stage=None):
+    """
+    Set the write policy of a stage or the default policy.
+
+    @param policy : The policy, None to remove the policy of a stage (or to restore the default policy).
+    <br/><b>type</b> : WritePolicy
+
+    @param stage : The stage, i.e. the calculator class name, e.g. 'EMCOrientation'.
+    <br/><b>type</b> : string
+    <br/><b>default</b> : None (set the default policy)
+
+    @example : setWritePolicy(WritePolicy(codec='lzf', downcast=True), 'EMCOrientation')
+    """
+    global _default_policy
+    policy = checkAndSetInstance(WritePolicy, policy, None)
+    with _policies_lock:
+        if stage is None:
+            if policy is None:
+                policy = WritePolicy()
+            _default_policy = policy
+        elif policy is None:
+            _stage_policies.pop(stage, None)
+        else:
+            _stage_policies[stage] = policy
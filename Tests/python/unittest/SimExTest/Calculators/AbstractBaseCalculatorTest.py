@@ -28,8 +28,15 @@
 """
 import paths
 import unittest
+import cPickle
 import exceptions
+import h5py
 import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
 
 
 # Import the class to test.
@@ -37,6 +44,10 @@ from SimEx.Calculators.AbstractBaseCalculator import AbstractBaseCalculator
 from SimEx.Calculators.AbstractBaseCalculator import checkAndSetIO
 from SimEx.Calculators.AbstractBaseCalculator import checkAndSetParameters
 from SimEx.Parameters.AbstractCalculatorParameters import AbstractCalculatorParameters
+from SimEx.Utilities.FileSet import FileSet
+from SimEx.Utilities.ResourceScheduler import defaultResourceScheduler
+from SimEx.Utilities.VirtualDatasetIndex import readPatterns
+from SimEx.Utilities.WritePolicy import WritePolicy, setWritePolicy, writePolicy
 
 # Test parameter class.
 class DerivedParameters(AbstractCalculatorParameters):
@@ -60,6 +71,65 @@ class DerivedCalculator(AbstractBaseCalculator):
     def expectedData(self):
         return ['/data/dat1', '/data/dat2']
 
+# Calculator that records calls to saveH5.
+class SavingCalculator(DerivedCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(SavingCalculator, self).__init__(parameters, input_path, output_path)
+        self.saved = []
+    def saveH5(self):
+        self.saved.append(self.result)
+
+# Calculator that writes the pid of the process handling each work item.
+class WorkItemCalculator(DerivedCalculator):
+    def _supportsWorkItems(self):
+        return True
+    def _backengineWorkItem(self, input_file, index):
+        time.sleep(0.1)
+        output_file = os.path.join(self.output_path, 'out_%07d.txt' % (index))
+        with open(output_file, 'w') as output:
+            output.write('%s %d' % (os.path.basename(input_file), os.getpid()))
+        return [output_file]
+
+# Calculator failing for input files named bad_*, and in the first attempt of every work item if flaky.
+class FailingCalculator(WorkItemCalculator):
+    def _backengineWorkItem(self, input_file, index):
+        if os.path.basename(input_file).startswith('bad'):
+            raise IOError("Corrupt input %s." % (input_file))
+        marker = os.path.join(self.output_path, 'attempted_%07d' % (index))
+        if self.parameters.get('flaky', False) and not os.path.exists(marker):
+            open(marker, 'w').close()
+            raise RuntimeError("Transient failure.")
+        return super(FailingCalculator, self)._backengineWorkItem(input_file, index)
+
+# Calculator providing data indexed by snapshot, like XMDYNDemoPhotonMatterInteractor.
+class IndexedCalculator(DerivedCalculator):
+    def backengine(self):
+        with h5py.File(self.output_path, 'w') as h5:
+            for snapshot in range(1, 4):
+                h5['data/snp_%07d/ff' % (snapshot)] = [snapshot, snapshot]
+            h5['params/info'] = 1
+    def providedData(self):
+        return ['/data/snp_<7 digit index>/ff', '/params/info']
+
+# Calculator returning output that cannot be pickled.
+class UnpicklableCalculator(WorkItemCalculator):
+    def _backengineWorkItem(self, input_file, index):
+        return [lambda: input_file]
+
+# Calculator writing one pattern per work item, indexed by a virtual dataset.
+class PatternCalculator(WorkItemCalculator):
+    _output_pattern = 'diffr_out_*.h5'
+    _output_index_dataset = '/data/data'
+    _output_container_name = 'diffr_out_container.h5'
+    def _backengineWorkItem(self, input_file, index):
+        output_file = os.path.join(self.output_path, 'diffr_out_%07d.h5' % (index+1))
+        with h5py.File(output_file, 'w') as h5:
+            h5['data/data'] = [[index, index], [index, index]]
+            h5['params/geom/detectorDist'] = 0.2
+        return [output_file]
+    def providedData(self):
+        return ['/data/data']
+
 
 class AbstractBaseCalculatorTest(unittest.TestCase):
     """
@@ -176,6 +246,331 @@ class AbstractBaseCalculatorTest(unittest.TestCase):
         parameters = DerivedParameters(a=1, b=2, c=3)
         self.assertEqual( parameters, checkAndSetParameters( parameters ) )
 
+    def testPublish(self):
+        """ Test the in-memory hand-off of results between calculators. """
+        upstream = DerivedCalculator(input_path=__file__, output_path='out.h5')
+        downstream = DerivedCalculator(input_path='out.h5', output_path='out2.h5')
+
+        self.assertIsNone(upstream.result)
+        self.assertIsNone(downstream.input_calculator)
+        self.assertIsNone(downstream._inputResult())
+
+        downstream.input_calculator = upstream
+        self.assertIs(downstream.input_calculator, upstream)
+        self.assertIsNone(downstream._inputResult())
+
+        result = {'/data/dat1' : [1,2,3]}
+        upstream.publish(result)
+        self.assertIs(upstream.result, result)
+        self.assertIs(downstream._inputResult(), result)
+
+        self.assertRaises(TypeError, setattr, downstream, 'input_calculator', 'upstream')
+
+    def testPersistence(self):
+        """ Test the persistence modes. """
+        calculator = SavingCalculator(parameters=None, input_path=__file__, output_path='out.h5')
+        self.assertEqual(calculator.persistence, 'sync')
+        self.assertRaises(ValueError, setattr, calculator, 'persistence', 'later')
+
+        calculator.publish(1)
+        calculator.persist()
+        self.assertEqual(calculator.saved, [1])
+
+        calculator.persistence = 'none'
+        calculator.persist()
+        self.assertEqual(calculator.saved, [1])
+        self.assertRaises(ValueError, setattr, calculator, 'persistence', 'async')
+
+    def testInputFileset(self):
+        """ Test the selection of input files. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for i in [3, 1, 12, 2]:
+                open(os.path.join(tmp_dir, 'in_%d.h5' % (i)), 'w').close()
+            open(os.path.join(tmp_dir, 'README'), 'w').close()
+
+            calculator = WorkItemCalculator(input_path=tmp_dir, output_path='out')
+            self.assertEqual(len(calculator._inputFiles()), 5)
+
+            calculator.input_fileset = FileSet(pattern='in_*.h5', order='index', start=1, stop=3)
+            self.assertEqual([os.path.basename(f) for f in calculator._inputFiles()], ['in_2.h5', 'in_3.h5'])
+            self.assertEqual(calculator.input_path, tmp_dir)
+
+            # A file set with a path replaces the input path.
+            calculator.input_fileset = FileSet(os.path.join(tmp_dir, 'in_1.h5'))
+            self.assertEqual(calculator.input_path, os.path.join(tmp_dir, 'in_1.h5'))
+            self.assertEqual(calculator._inputFiles(), [os.path.join(tmp_dir, 'in_1.h5')])
+
+            self.assertRaises(TypeError, setattr, calculator, 'input_fileset', '*.h5')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testBackengineWorkItems(self):
+        """ Test processing work items with thread and process pools. """
+        tmp_dir = tempfile.mkdtemp()
+        # Let all work items run concurrently also on small nodes.
+        scheduler = defaultResourceScheduler()
+        cores = scheduler.cores
+        scheduler.cores = 4
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for i in range(4):
+                open(os.path.join(input_dir, 'in_%d.h5' % (i)), 'w').close()
+
+            calculator = WorkItemCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out'))
+            self.assertEqual(calculator.executor, 'thread')
+            self.assertEqual(calculator.number_of_workers, 1)
+            self.assertRaises(ValueError, setattr, calculator, 'executor', 'cluster')
+            self.assertRaises(TypeError, setattr, calculator, 'number_of_workers', 0)
+
+            expected = [os.path.join(tmp_dir, 'out', 'out_%07d.txt' % (i)) for i in range(4)]
+            for executor in ['thread', 'process']:
+                calculator.executor = executor
+                calculator.number_of_workers = 4
+                start = time.time()
+                self.assertEqual(calculator._backengineWorkItems(), expected)
+                self.assertLess(time.time() - start, 0.35)
+
+                contents = [open(f).read().split() for f in expected]
+                self.assertEqual([c[0] for c in contents], ['in_%d.h5' % (i) for i in range(4)])
+                pids = set([int(c[1]) for c in contents])
+                if executor == 'thread':
+                    self.assertEqual(pids, set([os.getpid()]))
+                else:
+                    self.assertNotIn(os.getpid(), pids)
+        finally:
+            scheduler.cores = cores
+            shutil.rmtree(tmp_dir)
+
+    def testIndexedData(self):
+        """ Test that the output data of a calculator providing data paths with placeholders can be read. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            calculator = IndexedCalculator(input_path=tmp_dir, output_path=os.path.join(tmp_dir, 'pmi_out.h5'))
+            calculator.backengine()
+
+            data = calculator.data
+            self.assertEqual(list(data['/data/snp_0000002/ff'][:]), [2, 2])
+            self.assertIn('/data/snp_0000003/ff', data)
+            self.assertEqual(data.keys(), ['/data/snp_0000001/ff', '/data/snp_0000002/ff', '/data/snp_0000003/ff', '/params/info'])
+
+            self.assertNotIn('/data/snp_0000004/ff', data)
+            self.assertRaises(KeyError, data.__getitem__, '/data/snp_1/ff')
+            self.assertRaises(KeyError, data.__getitem__, '/data/snp_0000001/Z')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testWorkerErrors(self):
+        """ Test that errors of work items in pools are raised with the worker's traceback and free the workers and resources. """
+        tmp_dir = tempfile.mkdtemp()
+        scheduler = defaultResourceScheduler()
+        cores = scheduler.cores
+        scheduler.cores = 4
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for i in range(4):
+                open(os.path.join(input_dir, 'in_%d.h5' % (i)), 'w').close()
+            open(os.path.join(input_dir, 'bad_0.h5'), 'w').close()
+
+            for executor in ['thread', 'process']:
+                calculator = FailingCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out_'+executor))
+                calculator.executor = executor
+                calculator.number_of_workers = 2
+                try:
+                    calculator._backengineWorkItems()
+                    self.fail("The corrupt input did not raise.")
+                except IOError as error:
+                    if executor == 'thread':
+                        stack = traceback.extract_tb(sys.exc_info()[2])
+                        self.assertEqual(stack[-1][2], '_backengineWorkItem')
+                    else:
+                        self.assertIn('Traceback of the worker process', str(error))
+                        self.assertIn('_backengineWorkItem', str(error))
+                self.assertEqual(scheduler.available_cores, 4)
+
+            # A result that cannot be passed back from a worker process fails the work item.
+            calculator = UnpicklableCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out_unpicklable'))
+            calculator.executor = 'process'
+            calculator.number_of_workers = 2
+            self.assertRaises(cPickle.PicklingError, calculator._backengineWorkItems)
+            self.assertEqual(scheduler.available_cores, 4)
+        finally:
+            scheduler.cores = cores
+            shutil.rmtree(tmp_dir)
+
+    def testOutputIndex(self):
+        """ Test writing the virtual dataset index of the output files. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for i in range(12):
+                open(os.path.join(input_dir, 'in_%d.h5' % (i)), 'w').close()
+
+            # Not supported by default.
+            calculator = WorkItemCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out'))
+            self.assertFalse(calculator.output_index)
+            self.assertRaises(NotImplementedError, setattr, calculator, 'output_index', True)
+
+            calculator = PatternCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'diffr'))
+            calculator.output_index = True
+            calculator._backengineWorkItems()
+
+            with h5py.File(os.path.join(tmp_dir, 'diffr', 'index_vds.h5'), 'r') as h5:
+                self.assertEqual(list(h5['data/data'][:, 0, 0]), range(12))
+
+            # The index is not an output file.
+            self.assertEqual(len(calculator.output_fileset), 12)
+
+            # Lazy access to the output data.
+            self.assertEqual(calculator.data.keys(), ['/data/data'])
+            self.assertEqual(calculator.data['/data/data'].shape, (12, 2, 2))
+            self.assertEqual(calculator.data['/data/data'][7, 1, 1], 7)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testOutputContainer(self):
+        """ Test consolidating the output files into a container. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for i in range(12):
+                open(os.path.join(input_dir, 'in_%d.h5' % (i)), 'w').close()
+
+            # Not supported by default.
+            calculator = WorkItemCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out'))
+            self.assertEqual(calculator.output_layout, 'files')
+            self.assertRaises(NotImplementedError, setattr, calculator, 'output_layout', 'container')
+
+            calculator = PatternCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'diffr'))
+            self.assertRaises(ValueError, setattr, calculator, 'output_layout', 'single')
+            calculator.output_layout = 'container'
+            calculator.output_index = True
+            calculator.number_of_workers = 3
+            calculator._backengineWorkItems()
+
+            # The container replaces the output files, no index is needed.
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp_dir, 'diffr'))), ['diffr_out_container.h5'])
+            self.assertEqual(calculator.output_fileset.files(), [os.path.join(tmp_dir, 'diffr', 'diffr_out_container.h5')])
+
+            with h5py.File(os.path.join(tmp_dir, 'diffr', 'diffr_out_container.h5'), 'r') as h5:
+                self.assertEqual(h5['data/data'].shape, (12, 2, 2))
+                self.assertEqual(h5['data/data'].maxshape, (None, 2, 2))
+                self.assertEqual(list(h5['data/data'][:, 0, 0]), range(12))
+                self.assertEqual(h5['params/geom/detectorDist'][()], 0.2)
+
+            # Lazy access to the output data.
+            self.assertEqual(calculator.data['/data/data'].shape, (12, 2, 2))
+            self.assertEqual(calculator.data['/data/data'][7, 1, 1], 7)
+
+            # Downstream readers.
+            self.assertEqual([p[0, 0] for p in readPatterns(calculator.output_fileset.files())], range(12))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testFailurePolicy(self):
+        """ Test retrying and quarantining failing work items. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for name in ['bad_0.h5', 'in_1.h5', 'in_2.h5', 'in_3.h5']:
+                open(os.path.join(input_dir, name), 'w').close()
+
+            calculator = FailingCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out'))
+            self.assertEqual(calculator.failure_policy, 'abort')
+            self.assertEqual(calculator.max_retries, 0)
+            self.assertEqual(calculator.retry_backoff, 1.0)
+            self.assertRaises(ValueError, setattr, calculator, 'failure_policy', 'ignore')
+            self.assertRaises(ValueError, setattr, calculator, 'max_retries', -1)
+            self.assertRaises(ValueError, setattr, calculator, 'retry_backoff', -1.0)
+            self.assertRaises(TypeError, setattr, calculator, 'max_retries', 'twice')
+
+            # A single bad file stops the calculator.
+            self.assertRaises(IOError, calculator._backengineWorkItems)
+
+            # The remaining files are processed.
+            calculator.failure_policy = 'quarantine'
+            calculator.number_of_workers = 2
+            self.assertEqual(len(calculator._backengineWorkItems()), 3)
+            self.assertEqual([f['item'] for f in calculator.quarantine], [os.path.join(input_dir, 'bad_0.h5')])
+            self.assertEqual(calculator.quarantine[0]['attempts'], 1)
+            self.assertTrue(calculator.quarantine[0]['error'].startswith('IOError'))
+
+            # Transient failures are retried, also in worker processes.
+            calculator = FailingCalculator(parameters={'flaky' : True}, input_path=input_dir, output_path=os.path.join(tmp_dir, 'flaky'))
+            calculator.failure_policy = 'quarantine'
+            calculator.max_retries = 2
+            calculator.retry_backoff = 0.05
+            calculator.executor = 'process'
+            calculator.number_of_workers = 2
+            start = time.time()
+            self.assertEqual(len(calculator._backengineWorkItems()), 3)
+            self.assertGreaterEqual(time.time() - start, 0.15)
+            self.assertEqual(len(calculator.quarantine), 1)
+            self.assertEqual(calculator.quarantine[0]['attempts'], 3)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testResources(self):
+        """ Test that work items are run as their declared resources fit onto the node. """
+        tmp_dir = tempfile.mkdtemp()
+        scheduler = defaultResourceScheduler()
+        cores = scheduler.cores
+        try:
+            input_dir = os.path.join(tmp_dir, 'in')
+            os.mkdir(input_dir)
+            for i in range(4):
+                open(os.path.join(input_dir, 'in_%d.h5' % (i)), 'w').close()
+
+            calculator = WorkItemCalculator(input_path=input_dir, output_path=os.path.join(tmp_dir, 'out'))
+            self.assertEqual(calculator.resources, {'cores' : 1, 'memory' : 0, 'mpi_ranks' : 0})
+            calculator.resources = {'cores' : 2, 'mpi_ranks' : 2}
+            self.assertEqual(calculator.resources, {'cores' : 2, 'memory' : 0, 'mpi_ranks' : 2})
+            self.assertRaises(ValueError, setattr, calculator, 'resources', {'gpus' : 1})
+            self.assertRaises(ValueError, setattr, calculator, 'resources', {'cores' : -1})
+            self.assertRaises(TypeError, setattr, calculator, 'resources', 2)
+
+            # Only one work item fits onto two cores at a time.
+            scheduler.cores = 2
+            calculator.number_of_workers = 4
+            start = time.time()
+            self.assertEqual(len(calculator._backengineWorkItems()), 4)
+            self.assertGreaterEqual(time.time() - start, 0.4)
+            self.assertEqual(scheduler.available_cores, 2)
+
+            # All work items fit.
+            scheduler.cores = 8
+            start = time.time()
+            self.assertEqual(len(calculator._backengineWorkItems()), 4)
+            self.assertLess(time.time() - start, 0.4)
+            self.assertEqual(scheduler.available_cores, 8)
+        finally:
+            scheduler.cores = cores
+            shutil.rmtree(tmp_dir)
+
+    def testWritePolicy(self):
+        """ Test that calculators use their own, their class' or the default write policy. """
+        calculator = DerivedCalculator(input_path=__file__, output_path='out.h5')
+        self.assertIs(calculator.write_policy, writePolicy())
+
+        class_policy = WritePolicy(codec='lzf')
+        setWritePolicy(class_policy, 'DerivedCalculator')
+        try:
+            self.assertIs(calculator.write_policy, class_policy)
+            own_policy = WritePolicy(codec='none')
+            calculator.write_policy = own_policy
+            self.assertIs(calculator.write_policy, own_policy)
+            calculator.write_policy = None
+            self.assertIs(calculator.write_policy, class_policy)
+        finally:
+            setWritePolicy(None, 'DerivedCalculator')
+
+        self.assertRaises(TypeError, setattr, calculator, 'write_policy', 'gzip')
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,75 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the CalculatorRegistry.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import os
+import subprocess
+import sys
+import paths
+import unittest
+
+from SimEx.Calculators import CalculatorRegistry
+from SimEx.Calculators.CalculatorRegistry import calculatorNames, calculatorKind, calculatorModule, calculatorClass, registerCalculator
+from SimEx.Calculators.PerfectPhotonDetector import PerfectPhotonDetector
+
+class CalculatorRegistryTest(unittest.TestCase):
+    """
+    Test class for the CalculatorRegistry module.
+    """
+
+    def testQueries(self):
+        """ Test listing registered calculators. """
+        self.assertIn('SingFELPhotonDiffractor', calculatorNames())
+        self.assertEqual(calculatorNames('photon_source'), ['XFELPhotonSource', 'SASEPhotonSource'])
+        self.assertIn('PlasmaXRTSCalculator', calculatorNames('photon_diffractor'))
+        self.assertEqual(calculatorKind('WavePropagator'), 'photon_propagator')
+        self.assertEqual(calculatorModule('DMPhasing'), 'SimEx.Calculators.DMPhasing')
+        self.assertIs(calculatorClass('PerfectPhotonDetector'), PerfectPhotonDetector)
+
+        self.assertRaises(KeyError, calculatorKind, 'NoSuchCalculator')
+
+    def testRegisterCalculator(self):
+        """ Test adding a calculator to the registry. """
+        registerCalculator('TestDetector', 'SimEx.Calculators.PerfectPhotonDetector', 'photon_detector')
+        try:
+            self.assertIn('TestDetector', calculatorNames('photon_detector'))
+            self.assertRaises(ValueError, registerCalculator, 'TestDetector', 'SimEx.Calculators.PerfectPhotonDetector', 'detector')
+        finally:
+            del CalculatorRegistry._REGISTRY['TestDetector']
+
+    def testLazyBackendImports(self):
+        """ Test that importing the calculators does not import their backends, nor the index and pool modules. """
+        script = '; '.join(['import sys'] +
+                           ['import %s' % (calculatorModule(name)) for name in calculatorNames()] +
+                           ["print ' '.join([m for m in ['wpg', 'prop', 'pmi_demo', 'pmi_script', 'prepHDF5', 'matplotlib', 'sqlite3', 'multiprocessing'] if m in sys.modules])"])
+        output = subprocess.check_output([sys.executable, '-c', script], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+        self.assertEqual(output.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,8 +30,10 @@ from AbstractPhotonPropagatorTest import AbstractPhotonPropagatorTest
 from AbstractPhotonInteractorTest import AbstractPhotonInteractorTest
 from AbstractPhotonDiffractorTest import AbstractPhotonDiffractorTest
 from AbstractPhotonDetectorTest import AbstractPhotonDetectorTest
+from CalculatorRegistryTest import CalculatorRegistryTest
 
 from XFELPhotonSourceTest import XFELPhotonSourceTest
+from SASEPhotonSourceTest import SASEPhotonSourceTest
 from XFELPhotonPropagatorTest import XFELPhotonPropagatorTest
 from WavePropagatorTest import WavePropagatorTest
 from SingFELPhotonDiffractorTest import SingFELPhotonDiffractorTest
@@ -46,7 +48,9 @@ def suite():
              unittest.makeSuite(AbstractPhotonInteractorTest,  'test'),
              unittest.makeSuite(AbstractPhotonDiffractorTest,  'test'),
              #unittest.makeSuite(AbstractPhotonDetectorTest,    'test'),
+             unittest.makeSuite(CalculatorRegistryTest,        'test'),
              unittest.makeSuite(XFELPhotonSourceTest,          'test'),
+             unittest.makeSuite(SASEPhotonSourceTest,          'test'),
              unittest.makeSuite(XFELPhotonPropagatorTest,      'test'),
              unittest.makeSuite(WavePropagatorTest,            'test'),
              unittest.makeSuite(SingFELPhotonDiffractorTest,   'test'),
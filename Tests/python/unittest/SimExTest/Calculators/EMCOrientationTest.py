@@ -27,8 +27,12 @@
     @creation 20151109
 
 """
+import h5py
+import numpy
 import os
+import shutil
 import subprocess
+import tempfile
 
 import paths
 import unittest
@@ -36,6 +40,7 @@ import unittest
 
 # Import the class to test.
 from SimEx.Calculators.EMCOrientation import EMCOrientation
+from SimEx.Calculators.EMCCaseGenerator import EMCCaseGenerator
 from TestUtilities import TestUtilities
 
 class EMCOrientationTest(unittest.TestCase):
@@ -88,6 +93,38 @@ class EMCOrientationTest(unittest.TestCase):
 
         self.assertEqual(status, 0)
 
+    def testSparsePhotonFileSkipsCorruptPatterns(self):
+        """ Test that patterns failing to convert are left out of the sparse photon file and reported. """
+        tmp_dir = tempfile.mkdtemp(prefix='emc_test_')
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        # An unreadable file and a pattern of the wrong shape.
+        unreadable = os.path.join(tmp_dir, 'diffr_out_0000002.h5')
+        with open(unreadable, 'w') as f:
+            f.write('corrupt')
+        misshaped = os.path.join(tmp_dir, 'diffr_out_0000003.h5')
+        shutil.copy(self.input_h5, misshaped)
+        with h5py.File(misshaped, 'a') as h5:
+            shape = h5['data/data'].shape
+            del h5['data/data']
+            h5['data/data'] = numpy.ones((shape[0]-1, shape[1]-1))
+
+        generator = EMCCaseGenerator(os.path.join(tmp_dir, 'EMC_extended.log'))
+        generator.readGeomFromPhotonData(self.input_h5)
+        sparse_photon_file = os.path.join(tmp_dir, 'photons.dat')
+        failures = generator.writeSparsePhotonFile([self.input_h5, unreadable, misshaped, self.input_h5],
+                                                   sparse_photon_file,
+                                                   os.path.join(tmp_dir, 'avg_photon.h5'))
+
+        self.assertEqual([f['item'] for f in failures], [unreadable, misshaped])
+        self.assertEqual([f['index'] for f in failures], [1, 2])
+
+        # The header announces the number of patterns written.
+        with open(sparse_photon_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(int(lines[0].split()[0]), 2)
+        self.assertEqual(len(lines), 1+2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,129 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the SASEPhotonSource.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import paths
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import h5py
+
+# Import the class to test.
+from SimEx.Calculators.SASEPhotonSource import SASEPhotonSource, saseField
+from SimEx.Utilities.MetadataIndex import extractMetadata
+
+class SASEPhotonSourceTest(unittest.TestCase):
+    """
+    Test class for the SASEPhotonSource class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testConstruction(self):
+        """ Testing the default construction of the class. """
+        source = SASEPhotonSource(output_path=os.path.join(self.__tmp_dir, 'source_out.h5'))
+        self.assertEqual(source.input_path, os.devnull)
+        self.assertEqual(source.parameters['number_of_pulses'], 1)
+        self.assertEqual(source.parameters['nSlices'], 550)
+        self.assertEqual(source.expectedData(), [])
+
+        self.assertRaises(RuntimeError, SASEPhotonSource, parameters={'number_of_spikes' : 3}, output_path=self.__tmp_dir)
+        self.assertRaises(TypeError, SASEPhotonSource, parameters={'pulse_energy' : -1.0}, output_path=self.__tmp_dir)
+        self.assertRaises(TypeError, SASEPhotonSource, parameters={'nx' : 2.5}, output_path=self.__tmp_dir)
+
+    def testLayout(self):
+        """ Test that a pulse provides all data of a photon source. """
+        output_path = os.path.join(self.__tmp_dir, 'source_out.h5')
+        source = SASEPhotonSource(parameters={'nx' : 11, 'ny' : 9, 'nSlices' : 100}, output_path=output_path)
+        source.backengine()
+
+        with h5py.File(output_path, 'r') as h5:
+            for path in source.providedData():
+                self.assertIn(path, h5)
+            self.assertEqual(h5['data/arrEhor'].shape, (9, 11, 100, 2))
+            self.assertEqual(h5['data/arrEhor'].dtype, numpy.float32)
+            self.assertEqual(h5['params/Mesh/nSlices'][()], 100)
+            self.assertEqual(h5['params/photonEnergy'][()], 4960.)
+
+            # The power of the temporal structure is the intensity integrated over the mesh.
+            E = h5['data/arrEhor'][()].astype(numpy.float64)
+            intensity = numpy.sum(E[..., 0]**2 + E[..., 1]**2, axis=(0, 1))
+            cell = (h5['params/Mesh/xMax'][()] - h5['params/Mesh/xMin'][()]) / 10 * (h5['params/Mesh/yMax'][()] - h5['params/Mesh/yMin'][()]) / 8 * 1e6
+            power = h5['history/parent/misc/temporal_struct'][:, 1]
+            self.assertTrue(numpy.allclose(intensity*cell, power, rtol=1e-4))
+
+        self.assertGreater(extractMetadata(output_path)['pulse_energy'], 0.0)
+
+    def testReproducibility(self):
+        """ Test that the same seed generates the same pulses, with any number of workers. """
+        parameters = {'number_of_pulses' : 4, 'nx' : 5, 'ny' : 5, 'nSlices' : 64, 'seed' : 3}
+        serial = SASEPhotonSource(parameters=dict(parameters), output_path=os.path.join(self.__tmp_dir, 'serial'))
+        serial.number_of_workers = 1
+        serial.backengine()
+        parallel = SASEPhotonSource(parameters=dict(parameters), output_path=os.path.join(self.__tmp_dir, 'parallel'))
+        parallel.executor = 'process'
+        parallel.number_of_workers = 2
+        parallel.backengine()
+
+        names = sorted(os.listdir(serial.output_path))
+        self.assertEqual(names, ['FELsource_out_%07d.h5' % (i+1) for i in range(4)])
+        self.assertEqual(sorted(os.listdir(parallel.output_path)), names)
+        self.assertTrue(numpy.array_equal(serial.data['/data/arrEhor'][:], parallel.data['/data/arrEhor'][:]))
+
+        # Pulses differ from each other and from those of another seed.
+        fields = serial.data['/data/arrEhor'][:]
+        self.assertFalse(numpy.array_equal(fields[0], fields[1]))
+        parameters['seed'] = 4
+        other = SASEPhotonSource(parameters=parameters, output_path=os.path.join(self.__tmp_dir, 'other'))
+        other.backengine()
+        self.assertFalse(numpy.array_equal(other.data['/data/arrEhor'][0], fields[0]))
+
+    def testStatistics(self):
+        """ Test that pulse energies fluctuate around the mean pulse energy. """
+        random_state = numpy.random.RandomState(0)
+        dt = 9.15 / 549 * 1e-15
+        energies = numpy.array([numpy.sum(saseField(random_state, 3, 3, 550, 1e-4, 2.0, 0.2, 9.15, 1e-4, 4.6e-4)[1]) * dt for i in range(400)])
+        self.assertAlmostEqual(numpy.mean(energies) / 1e-4, 1.0, 1)
+
+        # About pulse_duration/coherence_time modes.
+        relative_fluctuation = numpy.std(energies) / numpy.mean(energies)
+        self.assertGreater(relative_fluctuation, 0.05)
+        self.assertLess(relative_fluctuation, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
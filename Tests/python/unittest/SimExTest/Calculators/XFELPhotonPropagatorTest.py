@@ -29,6 +29,10 @@
 """
 import os, shutil
 import paths
+import sys
+import tempfile
+import time
+import types
 import unittest
 
 import numpy
@@ -36,8 +40,17 @@ import h5py
 
 # Import the class to test.
 from SimEx.Calculators.XFELPhotonPropagator import XFELPhotonPropagator
+from SimEx.Utilities.FileSet import fileIndex
+from SimEx.Utilities.ResourceScheduler import defaultResourceScheduler
 from TestUtilities import TestUtilities
 
+def fakePropagate(input_file, output_file):
+    """ Stand-in for the backengine, finishing the first pulses last. Records the input file and the thread limit of the worker process. """
+    time.sleep(0.1 * (3 - fileIndex(input_file)))
+    with h5py.File(output_file, 'w') as h5:
+        h5['input_file'] = os.path.basename(input_file)
+        h5['omp_num_threads'] = os.environ.get('OMP_NUM_THREADS', '')
+
 class XFELPhotonPropagatorTest(unittest.TestCase):
     """
     Test class for the XFELPhotonPropagator class.
@@ -75,6 +88,47 @@ class XFELPhotonPropagatorTest(unittest.TestCase):
 
         self.assertIsInstance(xfel_propagator, XFELPhotonPropagator)
 
+    def testParallelPropagation(self):
+        """ Test that pulses are propagated in worker processes, each limited to the cores granted to a pulse. """
+        scheduler = defaultResourceScheduler()
+        cores = scheduler.cores
+        tmp_dir = tempfile.mkdtemp()
+        input_dir = os.path.join(tmp_dir, 'FELsource_out')
+        os.mkdir(input_dir)
+        for i in range(4):
+            shutil.copy(self.input_h5, os.path.join(input_dir, 'FELsource_out_%07d.h5' % (i)))
+
+        # Propagate with a stand-in for the backengine, loaded by the worker processes.
+        prop = types.ModuleType('prop')
+        prop.propagateSE = types.ModuleType('prop.propagateSE')
+        prop.propagateSE.propagate = fakePropagate
+        sys.modules['prop'] = prop
+        sys.modules['prop.propagateSE'] = prop.propagateSE
+        try:
+            scheduler.cores = 48
+            xfel_propagator = XFELPhotonPropagator( parameters=None, input_path=input_dir, output_path=os.path.join(tmp_dir, 'prop') )
+            self.assertEqual(xfel_propagator.executor, 'process')
+
+            # A pulse needs one core, independent of the number of workers.
+            self.assertEqual(xfel_propagator.resources['cores'], 1)
+            xfel_propagator.number_of_workers = 4
+            self.assertEqual(xfel_propagator.resources['cores'], 1)
+            xfel_propagator.resources = {'cores' : 2}
+
+            # Output files are named by the position of the pulse, also if the pulses finish in reverse order.
+            output_files = xfel_propagator._backengineWorkItems()
+            self.assertEqual(output_files, [os.path.join(tmp_dir, 'prop', 'prop_out_%07d.h5' % (i)) for i in range(4)])
+            for i, output_file in enumerate(output_files):
+                with h5py.File(output_file, 'r') as h5:
+                    self.assertEqual(h5['input_file'][()], 'FELsource_out_%07d.h5' % (i))
+                    # The FFT threads of a worker are limited to the cores of a pulse.
+                    self.assertEqual(h5['omp_num_threads'][()], '2')
+        finally:
+            del sys.modules['prop']
+            del sys.modules['prop.propagateSE']
+            scheduler.cores = cores
+            shutil.rmtree(tmp_dir)
+
     @unittest.skip("Skipped")
     def testConstructionNumberOfFiles(self):
         """ Test that input and output are setup correctly depending on the number and type of input files given."""
@@ -28,6 +28,9 @@
 
 """
 import paths
+import os
+import shutil
+import tempfile
 import unittest
 
 import numpy
@@ -65,6 +68,90 @@ class XFELPhotonSourceTest(unittest.TestCase):
 
         self.assertIsInstance(xfel_source, XFELPhotonSource)
 
+    def testStaging(self):
+        """ Test staging source files into the output directory. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'FELsource')
+            os.mkdir(input_dir)
+            for i in range(3):
+                shutil.copy(self.input_h5, os.path.join(input_dir, 'FELsource_out_%07d.h5' % (i+1)))
+
+            xfel_source = XFELPhotonSource(parameters=None, input_path=input_dir, output_path=os.path.join(tmp_dir, 'source'))
+            self.assertRaises(ValueError, setattr, xfel_source, 'staging_mode', 'teleport')
+            xfel_source.staging_mode = 'hardlink'
+            self.assertEqual(xfel_source.staging_mode, 'hardlink')
+            xfel_source.backengine()
+
+            output_files = sorted(os.listdir(xfel_source.output_path))
+            self.assertEqual(output_files, sorted(os.listdir(input_dir)))
+            for f in output_files:
+                self.assertEqual(os.stat(os.path.join(input_dir, f)).st_ino, os.stat(os.path.join(xfel_source.output_path, f)).st_ino)
+
+            # Staged files are kept in a second run.
+            mtimes = [os.stat(os.path.join(xfel_source.output_path, f)).st_mtime for f in output_files]
+            xfel_source.staging_mode = 'copy'
+            xfel_source.backengine()
+            self.assertEqual([os.stat(os.path.join(xfel_source.output_path, f)).st_mtime for f in output_files], mtimes)
+            self.assertEqual(xfel_source.data['/data/arrEhor'].shape[0], 3)
+        finally:
+            shutil.rmtree(tmp_dir)
+    def testSelectPulses(self):
+        """ Test selecting pulses by photon energy, pulse energy and position. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'FELsource')
+            os.mkdir(input_dir)
+            for i in range(6):
+                path = os.path.join(input_dir, 'FELsource_out_%07d.h5' % (i+1))
+                shutil.copy(self.input_h5, path)
+                with h5py.File(path, 'a') as h5:
+                    h5['params/photonEnergy'][()] = 4900. + 20*i
+                    h5['history/parent/misc/temporal_struct'][:,1] *= (i+1)
+
+            xfel_source = XFELPhotonSource(parameters=None, input_path=input_dir, output_path=os.path.join(tmp_dir, 'source'))
+            index = xfel_source.pulseIndex()
+            pulse_energy = index.value(os.path.join(input_dir, 'FELsource_out_0000001.h5'), 'pulse_energy')
+            self.assertAlmostEqual(pulse_energy, 1.68e-4, 5)
+
+            names = lambda files: [os.path.basename(f) for f in files]
+            self.assertEqual(names(xfel_source.selectPulses(photon_energy=(4930., 4970.))), ['FELsource_out_0000003.h5', 'FELsource_out_0000004.h5'])
+            self.assertEqual(names(xfel_source.selectPulses(pulse_energy=(3.5*pulse_energy, None))), ['FELsource_out_0000004.h5', 'FELsource_out_0000005.h5', 'FELsource_out_0000006.h5'])
+            self.assertEqual(names(xfel_source.selectPulses(photon_energy=(None, 4970.), start=1, step=2)), ['FELsource_out_0000002.h5', 'FELsource_out_0000004.h5'])
+            self.assertEqual(len(xfel_source.selectPulses(sample=2, seed=3)), 2)
+            self.assertRaises(ValueError, xfel_source.selectPulses, photon_energy=(4900.,))
+
+            # Only the selected pulses are staged.
+            selected = xfel_source.selectPulses(photon_energy=(4930., 4970.))
+            xfel_source.backengine()
+            self.assertEqual(sorted(os.listdir(xfel_source.output_path)), names(selected))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def testTargetMesh(self):
+        """ Test resampling the source wavefronts to a coarser mesh. """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = os.path.join(tmp_dir, 'FELsource')
+            os.mkdir(input_dir)
+            for i in range(2):
+                shutil.copy(self.input_h5, os.path.join(input_dir, 'FELsource_out_%07d.h5' % (i+1)))
+
+            xfel_source = XFELPhotonSource(parameters=None, input_path=input_dir, output_path=os.path.join(tmp_dir, 'source'))
+            self.assertIsNone(xfel_source.target_mesh)
+            self.assertRaises(ValueError, setattr, xfel_source, 'target_mesh', {'nz' : 3})
+            self.assertRaises(ValueError, setattr, xfel_source, 'target_mesh', {'nx' : 0})
+            xfel_source.target_mesh = {'nx' : 7, 'ny' : 7, 'nSlices' : 110}
+            self.assertEqual(xfel_source.resources['cores'], 1)
+            xfel_source.backengine()
+
+            self.assertEqual(xfel_source.data['/data/arrEhor'].shape, (2, 7, 7, 110, 2))
+            with h5py.File(os.path.join(xfel_source.output_path, 'FELsource_out_0000002.h5'), 'r') as h5:
+                self.assertEqual(h5['params/Mesh/nSlices'][()], 110)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,168 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the ParameterSweep.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import os
+import shutil
+import tempfile
+import paths
+import unittest
+
+from SimEx.Parameters.AbstractCalculatorParameters import AbstractCalculatorParameters
+from SimEx.PhotonExperimentSimulation.ParameterSweep import ParameterSweep
+from SimEx.PhotonExperimentSimulation.ParameterSweep import applyVariant
+from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+
+from StagePipelineTest import ItemCalculator, BarrierCalculator
+
+# Parameter class with a single attribute.
+class ScaleParameters(AbstractCalculatorParameters):
+    def __init__(self, scale=1.0):
+        self.scale = scale
+
+# Calculator with a setting only given to the constructor.
+class SampleCalculator(BarrierCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None, sample_path=None):
+        super(SampleCalculator, self).__init__(parameters, input_path, output_path)
+        self.sample_path = sample_path
+
+
+class ParameterSweepTest(unittest.TestCase):
+    """
+    Test class for the ParameterSweep class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='parameter_sweep_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(2):
+            with open(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as f:
+                f.write(str(i))
+
+        workflow = WorkflowGraph()
+        workflow.addCalculator('source', ItemCalculator(None, self.__input_dir, 'source_out'))
+        workflow.addCalculator('diffractor', ItemCalculator({'delay' : 0.0}, 'source_out', 'diffr_out'), 'source')
+        workflow.addCalculator('analyzer', BarrierCalculator(None, 'diffr_out', 'analysis.txt'), 'diffractor')
+        self.__simulation = PhotonExperimentSimulation(workflow=workflow)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def testConstruction(self):
+        """ Test that the prefix tree contains each distinct calculator once. """
+        variants = {'diffractor' : [{'delay' : 0.0}, {'delay' : 0.01}],
+                    'analyzer' : [{'a' : 1}, {'a' : 2}, {'a' : 3}],
+                   }
+        sweep = ParameterSweep(self.__simulation, variants, self.path('sweep'))
+
+        self.assertEqual(len(sweep.points), 6)
+        self.assertEqual(sweep.points[5], {'source' : 0, 'diffractor' : 1, 'analyzer' : 2})
+        self.assertEqual(len(sweep.workflow.calculators), 1 + 2 + 6)
+
+        self.assertEqual(sweep.nodeName(5, 'analyzer'), 'source_0/diffractor_1/analyzer_2')
+        self.assertIs(sweep.calculator(0, 'source'), sweep.calculator(5, 'source'))
+        self.assertIs(sweep.calculator(3, 'diffractor'), sweep.calculator(5, 'diffractor'))
+        self.assertEqual(sweep.calculator(5, 'diffractor').parameters, {'delay' : 0.01})
+        self.assertEqual(sweep.calculator(5, 'analyzer').input_path, sweep.calculator(5, 'diffractor').output_path)
+        self.assertEqual(sweep.calculator(5, 'analyzer').output_path, self.path('sweep/source_0/diffractor_1/analyzer_2/analysis.txt'))
+
+    def testTemplateSettings(self):
+        """ Test that the calculators keep the settings of their templates. """
+        analyzer = SampleCalculator(None, 'diffr_out', 'analysis.txt', sample_path='sample.pdb')
+        analyzer.number_of_workers = 8
+        analyzer.failure_policy = 'quarantine'
+        analyzer.publish([1, 2, 3])
+        self.__simulation.workflow.setCalculator('analyzer', analyzer)
+
+        sweep = ParameterSweep(self.__simulation, {'analyzer' : [{'a' : 1}, {'a' : 2}]}, self.path('sweep'))
+
+        for point in range(2):
+            calculator = sweep.calculator(point, 'analyzer')
+            self.assertIsInstance(calculator, SampleCalculator)
+            self.assertIsNot(calculator, analyzer)
+            self.assertEqual(calculator.sample_path, 'sample.pdb')
+            self.assertEqual(calculator.number_of_workers, 8)
+            self.assertEqual(calculator.failure_policy, 'quarantine')
+            self.assertEqual(calculator.parameters, {'a' : point+1})
+            self.assertIsNone(calculator.result)
+        self.assertEqual(analyzer.parameters, {})
+        self.assertEqual(analyzer.output_path, os.path.abspath('analysis.txt'))
+
+    def testSharedParameters(self):
+        """ Test that calculators without variants do not share their parameters. """
+        analyzer = BarrierCalculator(ScaleParameters(), 'diffr_out', 'analysis.txt')
+        self.__simulation.workflow.setCalculator('analyzer', analyzer)
+
+        sweep = ParameterSweep(self.__simulation, {'diffractor' : [{'delay' : 0.0}, {'delay' : 0.01}]}, self.path('sweep'))
+
+        self.assertIsNot(sweep.calculator(0, 'analyzer'), sweep.calculator(1, 'analyzer'))
+        self.assertIsNot(sweep.calculator(0, 'analyzer').parameters, sweep.calculator(1, 'analyzer').parameters)
+        self.assertIsNot(sweep.calculator(0, 'analyzer').parameters, analyzer.parameters)
+
+        sweep.calculator(0, 'analyzer').parameters.scale = 2.0
+        self.assertEqual(sweep.calculator(1, 'analyzer').parameters.scale, 1.0)
+        self.assertEqual(analyzer.parameters.scale, 1.0)
+
+    def testConstructionExceptions(self):
+        """ Test that invalid variants raise. """
+        self.assertRaises(KeyError, ParameterSweep, self.__simulation, {'detector' : [{}]}, self.path('sweep'))
+        self.assertRaises(TypeError, ParameterSweep, self.__simulation, {'analyzer' : []}, self.path('sweep'))
+        self.assertRaises(TypeError, ParameterSweep, self.__simulation, {'analyzer' : {'a' : 1}}, self.path('sweep'))
+
+    def testApplyVariant(self):
+        """ Test that variants replace parameters in copies. """
+        parameters = {'a' : 1, 'b' : 2}
+        self.assertEqual(applyVariant(parameters, {'b' : 3}), {'a' : 1, 'b' : 3})
+        self.assertEqual(parameters, {'a' : 1, 'b' : 2})
+
+        parameters = ScaleParameters()
+        variant = applyVariant(parameters, {'scale' : 2.0})
+        self.assertEqual(variant.scale, 2.0)
+        self.assertEqual(parameters.scale, 1.0)
+
+    def testRun(self):
+        """ Test that shared upstream calculators run once and feed all variants. """
+        variants = {'analyzer' : [{'a' : 1}, {'a' : 2}, {'a' : 3}]}
+        sweep = ParameterSweep(self.__simulation, variants, self.path('sweep'))
+        sweep.run(number_of_workers=3)
+
+        self.assertEqual(len(sweep.calculator(0, 'source').log), 2)
+        self.assertEqual(len(sweep.calculator(0, 'diffractor').log), 2)
+        for point in range(3):
+            analysis = sweep.calculator(point, 'analyzer').output_path
+            self.assertEqual(open(analysis).read(), '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
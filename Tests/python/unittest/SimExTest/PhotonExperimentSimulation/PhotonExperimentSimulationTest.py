@@ -36,6 +36,7 @@ from SimEx.Calculators.PerfectPhotonDetector import PerfectPhotonDetector
 from SimEx.Calculators.S2EReconstruction import S2EReconstruction
 
 from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
 
 class PhotonExperimentSimulationTest( unittest.TestCase):
     """ Test class for the PhotonExperimentSimulation class. """
@@ -139,6 +140,52 @@ class PhotonExperimentSimulationTest( unittest.TestCase):
         self.assertIs( pxs.photon_detector, photon_detector )
         self.assertIs( pxs.photon_analyzer, photon_analyzer )
 
+    def testSetDetector(self):
+        """ Test that a detector set after construction is inserted into the workflow. """
+        source_input = TestUtilities.generateTestFilePath('FELsource_out.h5')
+        pmi_input = TestUtilities.generateTestFilePath('prop_out.h5')
+        diffr_input =  TestUtilities.generateTestFilePath('pmi_out.h5')
+        photon_source = XFELPhotonSource(parameters=None, input_path=source_input, output_path='FELsource_out.h5')
+        photon_propagator = XFELPhotonPropagator(parameters=None, input_path='FELsource_out.h5', output_path='prop_out.h5')
+        photon_interactor = XMDYNDemoPhotonMatterInteractor(parameters=None, input_path=pmi_input, output_path='pmi_out.h5')
+        diffraction_parameters={ 'uniform_rotation': True,
+                     'calculate_Compton' : False,
+                     'slice_interval' : 100,
+                     'number_of_slices' : 2,
+                     'pmi_start_ID' : 1,
+                     'pmi_stop_ID'  : 1,
+                     'number_of_diffraction_patterns' : 2,
+                     'beam_parameter_file' : TestUtilities.generateTestFilePath('s2e.beam'),
+                     'beam_geometry_file' : TestUtilities.generateTestFilePath('s2e.geom'),
+                   }
+        photon_diffractor = SingFELPhotonDiffractor(parameters=diffraction_parameters, input_path=diffr_input, output_path='diffr_out.h5')
+        photon_analyzer = S2EReconstruction(parameters=None, input_path='detector_out.h5', output_path='analyzer_out.h5')
+
+        pxs = PhotonExperimentSimulation(photon_source=photon_source,
+                                         photon_propagator=photon_propagator,
+                                         photon_interactor=photon_interactor,
+                                         photon_diffractor=photon_diffractor,
+                                         photon_detector=None,
+                                         photon_analyzer=photon_analyzer,
+                                         )
+        self.assertNotIn( 'photon_detector', pxs.workflow.calculators )
+
+        photon_detector = PerfectPhotonDetector(parameters = None, input_path='diffr_out.h5', output_path='detector_out.h5')
+        pxs.photon_detector = photon_detector
+        self.assertIs( pxs.workflow.calculators['photon_detector'], photon_detector )
+        self.assertEqual( pxs.workflow.upstream('photon_detector'), ['photon_diffractor'] )
+        self.assertEqual( pxs.workflow.upstream('photon_analyzer'), ['photon_detector'] )
+
+        pxs.photon_detector = None
+        self.assertNotIn( 'photon_detector', pxs.workflow.calculators )
+        self.assertEqual( pxs.workflow.upstream('photon_analyzer'), ['photon_diffractor'] )
+
+        # A workflow given at construction is not extended.
+        workflow = WorkflowGraph()
+        workflow.addCalculator('photon_source', photon_source)
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        self.assertRaises( RuntimeError, setattr, pxs, 'photon_detector', photon_detector )
+
     def testConstructionExceptions(self):
         """ Test that the appropriate exceptions are thrown if the object is constructed incorrectly. """
         # Setup a minimal experiment simulation.
@@ -259,6 +306,24 @@ class PhotonExperimentSimulationTest( unittest.TestCase):
                                                                   photon_analyzer=photon_diffractor,
                          )
 
+    def testConstructionWithWorkflow(self):
+        """ Test the construction from a workflow graph. """
+        source_input = TestUtilities.generateTestFilePath('FELsource_out.h5')
+        photon_source = XFELPhotonSource(parameters=None, input_path=source_input, output_path='FELsource_out.h5')
+        photon_propagator = XFELPhotonPropagator(parameters=None, input_path='FELsource_out.h5', output_path='prop_out.h5')
+
+        workflow = WorkflowGraph()
+        workflow.addCalculator('photon_source', photon_source)
+        workflow.addCalculator('photon_propagator', photon_propagator, upstream='photon_source')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+
+        self.assertIs( pxs.workflow, workflow )
+        self.assertTrue( pxs._checkInterfaceConsistency() )
+
+        # Giving both a workflow and calculators is an error.
+        self.assertRaises( RuntimeError, PhotonExperimentSimulation, photon_source=photon_source, workflow=workflow )
+
     def testCheckInterfaceConsistency(self):
         """ Test if the check for interface consistency works correctly. """
 
@@ -301,6 +366,27 @@ class PhotonExperimentSimulationTest( unittest.TestCase):
 
 
 
+    def testSchemaCheck(self):
+        """ Test checking the input files against the expected data before the run. """
+        source_input = TestUtilities.generateTestFilePath('FELsource_out.h5')
+        photon_source = XFELPhotonSource(parameters=None, input_path=source_input, output_path='FELsource_out.h5')
+        workflow = WorkflowGraph()
+        workflow.addCalculator('photon_source', photon_source)
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+
+        # The test file lacks some of the expected parameters.
+        self.assertEqual( pxs.schema_check, 'warn' )
+        pxs._checkInputSchema('photon_source', photon_source)
+
+        pxs.schema_check = 'strict'
+        self.assertRaises( RuntimeError, pxs._checkInputSchema, 'photon_source', photon_source )
+        self.assertRaises( RuntimeError, pxs.run )
+
+        pxs.schema_check = 'off'
+        pxs._checkInputSchema('photon_source', photon_source)
+
+        self.assertRaises( ValueError, setattr, pxs, 'schema_check', 'sometimes' )
+
     def testSimS2EWorkflowTwoDiffractionPatterns(self):
         """ Testing that a workflow akin to the simS2E example workflow works. """
 
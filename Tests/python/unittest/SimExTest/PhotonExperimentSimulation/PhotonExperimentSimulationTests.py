@@ -24,12 +24,26 @@ import paths
 import unittest
 
 # Import classes to test.
+from ParameterSweepTest import ParameterSweepTest
 from PhotonExperimentSimulationTest import PhotonExperimentSimulationTest
+from RunJournalTest import RunJournalTest
+from RunReportTest import RunReportTest
+from StageCacheTest import StageCacheTest
+from StagePipelineTest import StagePipelineTest
+from WorkflowGraphTest import WorkflowGraphTest
+from WorkQueueTest import WorkQueueTest
 
 # Setup the suite.
 def suite():
     suites = (
+             unittest.makeSuite(ParameterSweepTest,                'test'),
              unittest.makeSuite(PhotonExperimentSimulationTest,    'test'),
+             unittest.makeSuite(RunJournalTest,                    'test'),
+             unittest.makeSuite(RunReportTest,                     'test'),
+             unittest.makeSuite(StageCacheTest,                    'test'),
+             unittest.makeSuite(StagePipelineTest,                 'test'),
+             unittest.makeSuite(WorkflowGraphTest,                 'test'),
+             unittest.makeSuite(WorkQueueTest,                     'test'),
              )
 
     return unittest.TestSuite(suites)
@@ -0,0 +1,221 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the RunJournal.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import os
+import shutil
+import tempfile
+import paths
+import unittest
+
+from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.RunJournal import RunJournal
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+from SimEx.Utilities.FileSet import FileSet
+
+from StagePipelineTest import ItemCalculator
+
+# Calculator that writes one hdf5 file per input file and counts its work items.
+class H5ItemCalculator(ItemCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(H5ItemCalculator, self).__init__(parameters, input_path, output_path)
+        del self.log
+        self._count = 0
+    def _backengineWorkItem(self, input_file, index):
+        if self.parameters.get('fail_at', -1) == index:
+            raise RuntimeError("Failing at item %d." % (index))
+        self._count += 1
+        output_file = os.path.join(self.output_path, 'out_%07d.h5' % (index))
+        with h5py.File(output_file, 'w') as h5:
+            h5['data'] = index
+        return [output_file]
+
+
+class RunJournalTest(unittest.TestCase):
+    """
+    Test class for the RunJournal class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='run_journal_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(4):
+            with h5py.File(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as h5:
+                h5['data'] = i
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def testConstruction(self):
+        """ Test the default constructor. """
+        journal = RunJournal(self.path('journal'))
+
+        self.assertIsInstance(journal, RunJournal)
+        self.assertEqual(journal.path, self.path('journal'))
+
+    def testItems(self):
+        """ Test that completed work items are recorded and validated. """
+        calculator = H5ItemCalculator(None, self.__input_dir, self.path('a'))
+        calculator._prepareOutputDirectory()
+        input_file = os.path.join(self.__input_dir, 'in_0000000.h5')
+
+        journal = RunJournal(self.path('journal'))
+        self.assertIsNone(journal.completedItem('a', input_file))
+        output_files = calculator._backengineWorkItem(input_file, 0)
+        journal.completeItem('a', input_file, output_files)
+        self.assertEqual(journal.completedItem('a', input_file), output_files)
+
+        # Records are read back from the journal file, an incomplete last line is ignored.
+        with open(self.path('journal'), 'a') as journal_file:
+            journal_file.write('{"stage" : "a", "item"')
+        journal = RunJournal(self.path('journal'))
+        self.assertEqual(journal.completedItem('a', input_file), output_files)
+
+        # A truncated output file invalidates the record.
+        with open(output_files[0], 'r+') as output_file:
+            output_file.truncate(10)
+        self.assertIsNone(journal.completedItem('a', input_file))
+
+        # Reset discards all records.
+        journal.completeItem('a', input_file, calculator._backengineWorkItem(input_file, 0))
+        journal.reset()
+        self.assertIsNone(journal.completedItem('a', input_file))
+        self.assertIsNone(RunJournal(self.path('journal')).completedItem('a', input_file))
+
+    def testStages(self):
+        """ Test that completed calculators are recorded and invalidated by changed input. """
+        calculator = H5ItemCalculator(None, self.__input_dir, self.path('a'))
+        calculator.backengine()
+
+        journal = RunJournal(self.path('journal'))
+        self.assertFalse(journal.isStageComplete('a', calculator))
+        journal.completeStage('a', calculator)
+        self.assertTrue(journal.isStageComplete('a', calculator))
+
+        # Index files written into the input directory by queries do not invalidate the stage.
+        FileSet(self.__input_dir, pattern='in_*.h5', where=[('data', '>=', 1)]).files()
+        self.assertTrue(journal.isStageComplete('a', calculator))
+
+        with h5py.File(os.path.join(self.__input_dir, 'in_0000004.h5'), 'w') as h5:
+            h5['data'] = 4
+        self.assertFalse(journal.isStageComplete('a', calculator))
+
+    def testResume(self):
+        """ Test that a resumed simulation only processes the files not completed before the interruption. """
+        workflow = WorkflowGraph()
+        first = H5ItemCalculator(None, self.__input_dir, self.path('a'))
+        second = H5ItemCalculator({'fail_at' : 2}, self.path('a'), self.path('b'))
+        workflow.addCalculator('first', first)
+        workflow.addCalculator('second', second, 'first')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        self.assertRaises(RuntimeError, pxs.resume)
+        pxs.journal_path = self.path('journal')
+        self.assertEqual(pxs.journal_path, self.path('journal'))
+        self.assertFalse(pxs.item_mode)
+        pxs.item_mode = True
+
+        self.assertRaises(RuntimeError, pxs.run)
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 2)
+
+        second.parameters = {}
+        pxs.resume()
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 4)
+        self.assertEqual(sorted(os.listdir(self.path('b'))), ['out_%07d.h5' % (i) for i in range(4)])
+
+        # Nothing left to do.
+        pxs.resume()
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 4)
+
+        # A new run starts over.
+        pxs.run()
+        self.assertEqual(first._count, 8)
+        self.assertEqual(second._count, 8)
+
+    def testResumePipelined(self):
+        """ Test that pipelined runs record completed files and calculators and check the input of downstream calculators. """
+        workflow = WorkflowGraph()
+        first = H5ItemCalculator(None, self.__input_dir, self.path('a'))
+        second = H5ItemCalculator({'fail_at' : 2}, self.path('a'), self.path('b'))
+        workflow.addCalculator('first', first)
+        workflow.addCalculator('second', second, 'first')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        pxs.journal_path = self.path('journal')
+        self.assertRaises(ValueError, pxs.run, pipelined=True, number_of_workers=2)
+
+        self.assertRaises(RuntimeError, pxs.run, pipelined=True, queue_size=1)
+        self.assertEqual(second._count, 2)
+        self.assertFalse(RunJournal(self.path('journal')).isStageComplete('second', second))
+
+        second.parameters = {}
+        pxs.resume(pipelined=True)
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 4)
+        self.assertTrue(RunJournal(self.path('journal')).isStageComplete('first', first))
+        self.assertTrue(RunJournal(self.path('journal')).isStageComplete('second', second))
+
+        # The output of the first calculator lacks data expected by the second one.
+        second.expectedData = lambda: ['/data', '/params/missing']
+        pxs.schema_check = 'strict'
+        self.assertRaises(RuntimeError, pxs.run, pipelined=True)
+        self.assertEqual(second._count, 4)
+
+    def testResumeStages(self):
+        """ Test that without item mode, calculators run their backengine and are recorded as a whole. """
+        workflow = WorkflowGraph()
+        first = H5ItemCalculator(None, self.__input_dir, self.path('a'))
+        second = H5ItemCalculator({'fail_at' : 2}, self.path('a'), self.path('b'))
+        workflow.addCalculator('first', first)
+        workflow.addCalculator('second', second, 'first')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        pxs.journal_path = self.path('journal')
+
+        self.assertRaises(RuntimeError, pxs.run)
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 2)
+
+        # The interrupted calculator starts over.
+        second.parameters = {}
+        pxs.resume()
+        self.assertEqual(first._count, 4)
+        self.assertEqual(second._count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the RunReport.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import paths
+import unittest
+
+from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.RunReport import RunReport
+from SimEx.PhotonExperimentSimulation.RunReport import resourceUsage
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+
+from StagePipelineTest import ItemCalculator, BarrierCalculator
+
+
+class RunReportTest(unittest.TestCase):
+    """
+    Test class for the RunReport class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='run_report_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(3):
+            with open(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as f:
+                f.write(str(i))
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def testResourceUsage(self):
+        """ Test the resource usage snapshot. """
+        usage = resourceUsage()
+
+        for key in ['wall_time', 'cpu_time', 'cpu_time_children', 'peak_rss', 'read_bytes', 'write_bytes']:
+            self.assertIn(key, usage)
+        self.assertGreater(usage['peak_rss'], 0)
+
+    def testMeasure(self):
+        """ Test that phases and work items are recorded. """
+        report = RunReport()
+
+        with report.measure('stage', 'backengine'):
+            time.sleep(0.1)
+            # Cpu time of finished child processes is included.
+            subprocess.check_call([sys.executable, '-c', 'sum(range(3000000))'])
+
+        with report.measure('stage', 'backengine', item=os.path.join(self.__input_dir, 'in_0000000.h5')):
+            pass
+
+        def fail():
+            with report.measure('stage', 'saveH5'):
+                raise IOError("Cannot write.")
+        self.assertRaises(IOError, fail)
+
+        stage = report.toDict()['stages']['stage']
+        self.assertGreaterEqual(stage['phases']['backengine']['wall_time'], 0.1)
+        self.assertGreater(stage['phases']['backengine']['cpu_time_children'], 0.0)
+        self.assertEqual(stage['phases']['backengine']['status'], 'done')
+        self.assertEqual(stage['phases']['saveH5']['status'], 'failed')
+        self.assertEqual(len(stage['items']), 1)
+        self.assertEqual(stage['items'][0]['item'], 'in_0000000.h5')
+
+    def testSimulationReport(self):
+        """ Test that a simulation writes a json report with per file figures. """
+        workflow = WorkflowGraph()
+        workflow.addCalculator('items', ItemCalculator(None, self.__input_dir, self.path('a')))
+        workflow.addCalculator('barrier', BarrierCalculator(None, self.path('a'), self.path('summary.txt')), 'items')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        self.assertIsNone(pxs.report_path)
+        pxs.run()
+        self.assertIsNone(pxs.report)
+
+        pxs.report_path = self.path('report.json')
+        pxs.run()
+
+        # Without item mode, the backengine processes all files.
+        self.assertEqual(pxs.report.toDict()['stages']['items']['items'], [])
+        self.assertIn('backengine', pxs.report.toDict()['stages']['items']['phases'])
+
+        pxs.item_mode = True
+        pxs.run()
+
+        with open(self.path('report.json'), 'r') as report_file:
+            report = json.load(report_file)
+
+        self.assertEqual(sorted(report['stages'].keys()), ['barrier', 'items'])
+        self.assertEqual([item['item'] for item in report['stages']['items']['items']], ['in_%07d.h5' % (i) for i in range(3)])
+        self.assertEqual(sorted(report['stages']['items']['phases'].keys()), ['_readH5', 'backengine', 'saveH5'])
+        self.assertEqual(sorted(report['stages']['barrier']['phases'].keys()), ['_readH5', 'backengine', 'saveH5'])
+        self.assertEqual(report['stages']['barrier']['items'], [])
+        self.assertEqual(pxs.report.toDict()['stages'], report['stages'])
+
+        # Work items run in the calculator's process pool are measured in the worker processes.
+        items = workflow.calculators['items']
+        items.executor = 'process'
+        items.number_of_workers = 2
+        pxs.run()
+
+        records = pxs.report.toDict()['stages']['items']['items']
+        self.assertEqual(sorted([record['item'] for record in records]), ['in_%07d.h5' % (i) for i in range(3)])
+        self.assertEqual([record['status'] for record in records], ['done']*3)
+        self.assertEqual(sorted(os.listdir(self.path('a'))), ['out_%07d.h5' % (i) for i in range(3)])
+
+    def testQuarantine(self):
+        """ Test that failing work items are quarantined and summarized in the report. """
+        items = ItemCalculator({'fail_at' : 1}, self.__input_dir, self.path('a'))
+        items.failure_policy = 'quarantine'
+        barrier = BarrierCalculator(None, self.path('a'), self.path('summary.txt'))
+        workflow = WorkflowGraph()
+        workflow.addCalculator('items', items)
+        workflow.addCalculator('barrier', barrier, 'items')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        pxs.report_path = self.path('report.json')
+        pxs.journal_path = self.path('journal.jsonl')
+        pxs.item_mode = True
+        pxs.run()
+
+        # The downstream calculator runs on the remaining files.
+        self.assertEqual(sorted(os.listdir(self.path('a'))), ['out_0000000.h5', 'out_0000002.h5'])
+        self.assertTrue(os.path.isfile(self.path('summary.txt')))
+
+        report = pxs.report.toDict()
+        self.assertEqual(report['number_of_failed_items'], 1)
+        failure = report['stages']['items']['failures'][0]
+        self.assertEqual(failure['item'], os.path.join(self.__input_dir, 'in_0000001.h5'))
+        self.assertEqual(failure['attempts'], 1)
+        self.assertIn('Failing at item 1', failure['error'])
+        self.assertEqual(report['stages']['barrier']['failures'], [])
+
+        # The stage is not recorded as complete, resuming retries the quarantined file.
+        items.parameters = {}
+        pxs.resume()
+        self.assertEqual(items.quarantine, [])
+        self.assertEqual(sorted(os.listdir(self.path('a'))), ['out_%07d.h5' % (i) for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
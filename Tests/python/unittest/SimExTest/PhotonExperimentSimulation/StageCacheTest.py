@@ -0,0 +1,214 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the StageCache.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import os
+import shutil
+import tempfile
+import paths
+import unittest
+
+from SimEx.PhotonExperimentSimulation.PhotonExperimentSimulation import PhotonExperimentSimulation
+from SimEx.PhotonExperimentSimulation.StageCache import StageCache
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+from SimEx.Utilities.FileSet import FileSet
+from SimEx.Utilities.MetadataIndex import METADATA_INDEX_FILE_NAME
+from SimEx.Utilities.WritePolicy import WritePolicy, setWritePolicy
+
+from StagePipelineTest import ItemCalculator
+
+# Calculator that counts its work items. The counter is runtime state and does not enter the cache key.
+class CountingCalculator(ItemCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(CountingCalculator, self).__init__(parameters, input_path, output_path)
+        del self.log
+        self._count = 0
+    def _backengineWorkItem(self, input_file, index):
+        self._count += 1
+        output_file = os.path.join(self.output_path, 'out_%07d.h5' % (index))
+        shutil.copy(input_file, output_file)
+        return [output_file]
+
+# Calculator with a setting that does not influence its result.
+class VerboseCalculator(ItemCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(VerboseCalculator, self).__init__(parameters, input_path, output_path)
+        self.__verbose = False
+    def setVerbose(self, value):
+        self.__verbose = value
+    def _cacheIgnoredAttributes(self):
+        return super(VerboseCalculator, self)._cacheIgnoredAttributes() + ['_VerboseCalculator__verbose']
+
+
+class StageCacheTest(unittest.TestCase):
+    """
+    Test class for the StageCache class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='stage_cache_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(3):
+            with open(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as f:
+                f.write(str(i))
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def testConstruction(self):
+        """ Test the default constructor. """
+        cache = StageCache(self.path('cache'))
+
+        self.assertIsInstance(cache, StageCache)
+        self.assertTrue(os.path.isdir(self.path('cache')))
+        self.assertEqual(cache.cache_dir, self.path('cache'))
+
+    def testKey(self):
+        """ Test that the key depends on parameters and input content but not on the output path. """
+        cache = StageCache(self.path('cache'))
+
+        key = cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('a')))
+
+        # Same calculation with another output path.
+        self.assertEqual(cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('b'))), key)
+
+        # Changed parameters.
+        self.assertNotEqual(cache.key(ItemCalculator({'delay' : 0.1}, self.__input_dir, self.path('a'))), key)
+
+        # Settings declared by the calculator as not influencing the result and runtime state are ignored.
+        calculator = VerboseCalculator({'delay' : 0.0}, self.__input_dir, self.path('a'))
+        calculator.failure_policy = 'quarantine'
+        verbose_key = cache.key(calculator)
+        calculator.setVerbose(True)
+        calculator._prepareOutputDirectory()
+        calculator._processWorkItem(None, 0)
+        self.assertEqual(len(calculator.quarantine), 1)
+        self.assertEqual(cache.key(calculator), verbose_key)
+
+        # Changed write policy, also if set for all calculators or for the stage.
+        for stage in [None, 'ItemCalculator']:
+            setWritePolicy(WritePolicy(codec='lzf'), stage)
+            try:
+                self.assertNotEqual(cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('a'))), key)
+            finally:
+                setWritePolicy(None, stage)
+        self.assertEqual(cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('a'))), key)
+
+        # Index files written into the input directory by queries are not input.
+        FileSet(self.__input_dir, pattern='in_*.h5', where=[('data', '>=', 1)]).files()
+        self.assertTrue(os.path.isfile(os.path.join(self.__input_dir, METADATA_INDEX_FILE_NAME)))
+        self.assertEqual(cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('a'))), key)
+
+        # Changed input content.
+        with open(os.path.join(self.__input_dir, 'in_0000001.h5'), 'w') as f:
+            f.write('changed')
+        self.assertNotEqual(cache.key(ItemCalculator({'delay' : 0.0}, self.__input_dir, self.path('a'))), key)
+
+        # File digests are remembered across instances.
+        self.assertTrue(os.path.isfile(os.path.join(self.path('cache'), 'digests.json')))
+
+    def testStoreRestore(self):
+        """ Test that stored output is restored by hard links. """
+        cache = StageCache(self.path('cache'))
+        calculator = ItemCalculator(None, self.__input_dir, self.path('a'))
+        key = cache.key(calculator)
+
+        self.assertFalse(cache.restore(key, calculator.output_path))
+
+        calculator.backengine()
+        cache.store(key, calculator.output_path)
+
+        restored_path = self.path('restored')
+        self.assertTrue(cache.restore(key, restored_path))
+        self.assertEqual(sorted(os.listdir(restored_path)), sorted(os.listdir(calculator.output_path)))
+
+        original = os.path.join(calculator.output_path, 'out_0000002.h5')
+        restored = os.path.join(restored_path, 'out_0000002.h5')
+        self.assertEqual(os.stat(original).st_ino, os.stat(restored).st_ino)
+        self.assertEqual(open(restored).read(), '2')
+
+    def testDetach(self):
+        """ Test that detached output no longer shares data with the cache. """
+        cache = StageCache(self.path('cache'))
+        calculator = ItemCalculator(None, self.__input_dir, self.path('a'))
+        key = cache.key(calculator)
+        calculator.backengine()
+        cache.store(key, calculator.output_path)
+
+        cache.detach(calculator.output_path)
+
+        output_file = os.path.join(calculator.output_path, 'out_0000000.h5')
+        self.assertEqual(os.stat(output_file).st_nlink, 1)
+        with open(output_file, 'w') as f:
+            f.write('overwritten')
+
+        cache.restore(key, self.path('restored'))
+        self.assertEqual(open(os.path.join(self.path('restored'), 'out_0000000.h5')).read(), '0')
+
+    def testSimulationRun(self):
+        """ Test that a simulation with a cache directory skips calculations found in the cache. """
+        workflow = WorkflowGraph()
+        first = CountingCalculator(None, self.__input_dir, self.path('a'))
+        second = CountingCalculator(None, self.path('a'), self.path('b'))
+        workflow.addCalculator('first', first)
+        workflow.addCalculator('second', second, 'first')
+
+        pxs = PhotonExperimentSimulation(workflow=workflow)
+        self.assertIsNone(pxs.cache_dir)
+        pxs.cache_dir = self.path('cache')
+        self.assertEqual(pxs.cache_dir, self.path('cache'))
+
+        pxs.run()
+        self.assertEqual(first._count, 3)
+        self.assertEqual(second._count, 3)
+
+        # Second run: everything is restored.
+        shutil.rmtree(self.path('b'))
+        pxs.run()
+        self.assertEqual(first._count, 3)
+        self.assertEqual(second._count, 3)
+        self.assertEqual(sorted(os.listdir(self.path('b'))), ['out_%07d.h5' % (i) for i in range(3)])
+
+        # Changed parameters of the second stage: only this one is rerun.
+        second.parameters = {'delay' : 0.01}
+        pxs.run()
+        self.assertEqual(first._count, 3)
+        self.assertEqual(second._count, 6)
+
+        # Pipelined calculators start before their input is complete, their output cannot be cached.
+        self.assertRaises(RuntimeError, pxs.run, pipelined=True)
+        self.assertEqual(second._count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the StagePipeline.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import os
+import shutil
+import tempfile
+import time
+import paths
+import unittest
+
+from SimEx.Calculators.AbstractBaseCalculator import AbstractBaseCalculator
+from SimEx.PhotonExperimentSimulation.StagePipeline import StagePipeline
+from SimEx.PhotonExperimentSimulation.StagePipeline import determineItemMode
+
+# Calculator that copies its input files one by one.
+class ItemCalculator(AbstractBaseCalculator):
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(ItemCalculator, self).__init__(parameters, input_path, output_path)
+        self.log = []
+    def backengine(self):
+        self._prepareOutputDirectory()
+        for i,f in enumerate(self._inputFiles()):
+            self._backengineWorkItem(f, i)
+    def _supportsWorkItems(self):
+        return True
+    def _backengineWorkItem(self, input_file, index):
+        if self.parameters.get('fail_at', -1) == index:
+            raise RuntimeError("Failing at item %d." % (index))
+        time.sleep(self.parameters.get('delay', 0.0))
+        output_file = os.path.join(self.output_path, 'out_%07d.h5' % (index))
+        shutil.copy(input_file, output_file)
+        self.log.append((index, time.time()))
+        return [output_file]
+    def _readH5(self):
+        pass
+    def saveH5(self):
+        pass
+    def providedData(self):
+        return []
+    def expectedData(self):
+        return []
+
+# Calculator that needs its complete input.
+class BarrierCalculator(ItemCalculator):
+    def _supportsWorkItems(self):
+        return False
+    def backengine(self):
+        self.number_of_input_files = len(self._inputFiles())
+        with open(self.output_path, 'w') as output:
+            output.write(str(self.number_of_input_files))
+
+
+class StagePipelineTest(unittest.TestCase):
+    """
+    Test class for the StagePipeline class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='pipeline_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(4):
+            with open(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as f:
+                f.write(str(i))
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def testItemMode(self):
+        """ Test that calculators after a barrier wait for their complete input. """
+        calculators = [ItemCalculator(None, self.__input_dir, self.path('a')),
+                       BarrierCalculator(None, self.path('a'), self.path('b')),
+                       ItemCalculator(None, self.path('b'), self.path('c')),
+                      ]
+        self.assertEqual(determineItemMode(calculators), [True, False, False])
+
+        # Single input file: nothing to pipeline.
+        calculators[0].input_path = os.path.join(self.__input_dir, 'in_0000000.h5')
+        self.assertEqual(determineItemMode(calculators), [False, False, False])
+
+    def testRun(self):
+        """ Test that all files pass through the pipeline in order. """
+        first = ItemCalculator({'delay' : 0.05}, self.__input_dir, self.path('a'))
+        second = ItemCalculator({'delay' : 0.05}, self.path('a'), self.path('b'))
+        barrier = BarrierCalculator(None, self.path('b'), self.path('summary.txt'))
+
+        StagePipeline([first, second, barrier], queue_size=1).run()
+
+        self.assertEqual(sorted(os.listdir(self.path('b'))), ['out_%07d.h5' % (i) for i in range(4)])
+        self.assertEqual(open(os.path.join(self.path('b'), 'out_0000003.h5')).read(), '3')
+        self.assertEqual(barrier.number_of_input_files, 4)
+
+        # Downstream processing started before upstream finished.
+        self.assertLess(second.log[0][1], first.log[-1][1])
+
+    def testError(self):
+        """ Test that an error in one stage is raised and stops the pipeline. """
+        first = ItemCalculator(None, self.__input_dir, self.path('a'))
+        second = ItemCalculator({'fail_at' : 1}, self.path('a'), self.path('b'))
+
+        self.assertRaises(RuntimeError, StagePipeline([first, second], queue_size=1).run)
+
+    def testQuarantinedItem(self):
+        """ Test that output files keep the index of their upstream work item if an upstream work item is quarantined. """
+        first = ItemCalculator({'fail_at' : 1}, self.__input_dir, self.path('a'))
+        first.failure_policy = 'quarantine'
+        second = ItemCalculator(None, self.path('a'), self.path('b'))
+
+        StagePipeline([first, second], queue_size=1).run()
+
+        self.assertEqual(len(first.quarantine), 1)
+        self.assertEqual(sorted(os.listdir(self.path('b'))), ['out_%07d.h5' % (i) for i in [0, 2, 3]])
+        self.assertEqual(open(os.path.join(self.path('b'), 'out_0000002.h5')).read(), '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+
+""" Test module for the WorkQueue.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import h5py
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import paths
+import unittest
+
+from SimEx.PhotonExperimentSimulation.WorkQueue import WorkQueue
+
+from RunJournalTest import H5ItemCalculator
+from StagePipelineTest import BarrierCalculator, ItemCalculator
+from SimExTest.Calculators.AbstractBaseCalculatorTest import FailingCalculator, PatternCalculator
+
+
+class WorkQueueTest(unittest.TestCase):
+    """
+    Test class for the WorkQueue class.
+    """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp(prefix='work_queue_test_')
+        self.__input_dir = os.path.join(self.__tmp_dir, 'in')
+        os.mkdir(self.__input_dir)
+        for i in range(5):
+            with h5py.File(os.path.join(self.__input_dir, 'in_%07d.h5' % (i)), 'w') as h5:
+                h5['data'] = i
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.__tmp_dir, name)
+
+    def calculator(self, parameters=None):
+        return H5ItemCalculator(parameters=parameters, input_path=self.__input_dir, output_path=self.path('out'))
+
+    def testSubmit(self):
+        """ Test that submitting queues one item per input file. """
+        queue = WorkQueue(self.path('job'))
+        self.assertEqual(queue.job_dir, self.path('job'))
+
+        queue.submit(self.calculator())
+        self.assertEqual(queue.status(), {'pending' : 5, 'running' : 0, 'done' : 0, 'failed' : 0})
+        self.assertFalse(queue.isFinished())
+        self.assertTrue(os.path.isdir(self.path('out')))
+
+        # A job directory holds only one job.
+        self.assertRaises(IOError, queue.submit, self.calculator())
+
+        # Calculators must support work items.
+        self.assertRaises(TypeError, WorkQueue(self.path('job2')).submit, BarrierCalculator(input_path=self.__input_dir, output_path=self.path('out')))
+        self.assertRaises(TypeError, WorkQueue(self.path('job2')).submit, object())
+
+    def testRunWorkersInThreads(self):
+        """ Test that concurrent workers process every item exactly once. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(self.calculator())
+
+        processed = []
+        def worker():
+            processed.append(WorkQueue(self.path('job')).runWorker(poll_interval=0.01))
+        threads = [threading.Thread(target=worker) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(processed), 5)
+        self.assertTrue(queue.isFinished())
+        self.assertEqual(queue.status()['done'], 5)
+        self.assertEqual(queue.outputFiles(), [os.path.join(self.path('out'), 'out_%07d.h5' % (i)) for i in range(5)])
+
+    def testFailure(self):
+        """ Test that a failing item is recorded and does not stop the worker. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(self.calculator({'fail_at' : 2}))
+
+        self.assertEqual(queue.runWorker(poll_interval=0.01), 5)
+        self.assertEqual(queue.status(), {'pending' : 0, 'running' : 0, 'done' : 4, 'failed' : 1})
+        failures = queue.failures()
+        self.assertEqual(failures.keys(), [os.path.join(self.__input_dir, 'in_0000002.h5')])
+        self.assertIn("Failing at item 2.", failures.values()[0])
+
+    def testReclaim(self):
+        """ Test that items of a stalled worker are reclaimed. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(self.calculator(), heartbeat_interval=0.05, stale_after=0.2)
+
+        # A worker claims an item and dies.
+        claim = queue.claim()
+        self.assertTrue(claim.startswith('item_0000000.%s.%d.' % (socket.gethostname(), os.getpid())))
+        self.assertEqual(queue.status()['running'], 1)
+        self.assertEqual(queue.reclaim(), 0)
+
+        time.sleep(0.3)
+        self.assertEqual(queue.reclaim(), 1)
+        self.assertEqual(queue.status()['pending'], 5)
+
+        # The item is processed by the next worker.
+        queue.claim()
+        time.sleep(0.3)
+        self.assertEqual(queue.runWorker(poll_interval=0.01), 5)
+        self.assertEqual(queue.status()['done'], 5)
+
+    def testStaleWorker(self):
+        """ Test that a worker whose item was reclaimed does not record the outcome nor touch the new owner's claim. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(ItemCalculator({'delay' : 0.3}, self.__input_dir, self.path('out')), heartbeat_interval=0.05, stale_after=0.2)
+
+        # The first worker stalls on the first item, which is reclaimed and claimed by another worker meanwhile.
+        claims = []
+        stalled = threading.Event()
+        def claimer():
+            stalled.wait()
+            time.sleep(0.3)
+            queue.reclaim()
+            claims.append(queue.claim())
+        thread = threading.Thread(target=claimer)
+        thread.start()
+        try:
+            calculator = ItemCalculator({'delay' : 0.3}, self.__input_dir, self.path('out'))
+            def stall(input_file, index):
+                stalled.set()
+                time.sleep(0.6)
+                return [], None
+            calculator._attemptWorkItem = stall
+            first_claim = queue.claim()
+            self.assertFalse(queue._WorkQueue__runItem(calculator, first_claim, 10.0))
+        finally:
+            thread.join()
+
+        # The new owner's claim is untouched, the item is not recorded.
+        self.assertNotEqual(claims[0], first_claim)
+        self.assertEqual(os.listdir(self.path(os.path.join('job', 'running'))), [claims[0]])
+        self.assertEqual(queue.status(), {'pending' : 4, 'running' : 1, 'done' : 0, 'failed' : 0})
+        self.assertFalse(queue.isFinished())
+
+    def testHeartbeat(self):
+        """ Test that a long running item is not reclaimed while its worker is alive. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(ItemCalculator({'delay' : 0.3}, self.__input_dir, self.path('out')), heartbeat_interval=0.02, stale_after=0.1)
+
+        stop = threading.Event()
+        reclaimed = []
+        def reclaimer():
+            while not stop.is_set():
+                reclaimed.append(queue.reclaim())
+                time.sleep(0.01)
+        thread = threading.Thread(target=reclaimer)
+        thread.start()
+        try:
+            self.assertEqual(queue.runWorker(poll_interval=0.01), 5)
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertEqual(sum(reclaimed), 0)
+
+    def testStartWorkers(self):
+        """ Test running the queue with worker processes. """
+        queue = WorkQueue(self.path('job'))
+        queue.submit(self.calculator())
+
+        processes = queue.startWorkers(2)
+        self.assertEqual([process.wait() for process in processes], [0, 0])
+        self.assertEqual(queue.status()['done'], 5)
+        for i in range(5):
+            with h5py.File(os.path.join(self.path('out'), 'out_%07d.h5' % (i)), 'r') as h5:
+                self.assertEqual(h5['data'].value, i)
+
+    def testRunCalculator(self):
+        """ Test running the work items of a calculator through a work queue. """
+        calculator = PatternCalculator(input_path=self.__input_dir, output_path=self.path('out'))
+        calculator.output_index = True
+        calculator.work_queue = self.path('job')
+        calculator.number_of_workers = 2
+        self.assertEqual(calculator.work_queue, self.path('job'))
+
+        output_files = calculator._backengineWorkItems()
+        self.assertEqual(output_files, [os.path.join(self.path('out'), 'diffr_out_%07d.h5' % (i+1)) for i in range(5)])
+        self.assertEqual(WorkQueue(self.path('job')).status()['done'], 5)
+
+        # The output is completed once all work items are done.
+        self.assertTrue(os.path.isfile(os.path.join(self.path('out'), 'index_vds.h5')))
+
+        # Failed work items are quarantined.
+        os.rename(os.path.join(self.__input_dir, 'in_0000003.h5'), os.path.join(self.__input_dir, 'bad_0000003.h5'))
+        calculator = FailingCalculator(input_path=self.__input_dir, output_path=self.path('out2'))
+        calculator.failure_policy = 'quarantine'
+        calculator.work_queue = self.path('job2')
+        self.assertEqual(len(calculator._backengineWorkItems()), 4)
+        self.assertEqual([failure['item'] for failure in calculator.quarantine], [os.path.join(self.__input_dir, 'bad_0000003.h5')])
+
+        # With the 'abort' failure policy, failed work items raise.
+        calculator.failure_policy = 'abort'
+        calculator.work_queue = self.path('job3')
+        self.assertRaises(RuntimeError, calculator._backengineWorkItems)
+
+
+if __name__ == '__main__':
+    unittest.main()
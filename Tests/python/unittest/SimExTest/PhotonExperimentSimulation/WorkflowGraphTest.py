@@ -0,0 +1,152 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2016 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                        #
+##########################################################################
+
+""" Test module for the WorkflowGraph.
+
+    @author : CFG
+    @institution : XFEL
+    @creation 20161018
+
+"""
+import time
+import paths
+import unittest
+
+from SimEx.Calculators.AbstractBaseCalculator import AbstractBaseCalculator
+from SimEx.PhotonExperimentSimulation.WorkflowGraph import WorkflowGraph
+
+# Calculator that sleeps in its backengine.
+class SleepingCalculator(AbstractBaseCalculator):
+    def __init__(self, parameters=None, provided=None, expected=None):
+        super(SleepingCalculator, self).__init__(parameters, __file__, 'out.h5')
+        self.__provided = provided or []
+        self.__expected = expected or []
+        self.started = None
+    def backengine(self):
+        self.started = time.time()
+        if self.parameters.get('fail', False):
+            raise RuntimeError("Failure requested.")
+        time.sleep(self.parameters.get('delay', 0.0))
+    def _readH5(self):
+        pass
+    def saveH5(self):
+        pass
+    def providedData(self):
+        return self.__provided
+    def expectedData(self):
+        return self.__expected
+
+
+class WorkflowGraphTest(unittest.TestCase):
+    """
+    Test class for the WorkflowGraph class.
+    """
+
+    def buildBranchedWorkflow(self, delay=0.0):
+        """ Source feeding two independent branches. """
+        workflow = WorkflowGraph()
+        workflow.addCalculator('source', SleepingCalculator(provided=['/data/a', '/data/b']))
+        workflow.addCalculator('left', SleepingCalculator({'delay' : delay}, provided=['/data/c'], expected=['/data/a']), upstream='source')
+        workflow.addCalculator('right', SleepingCalculator({'delay' : delay}, expected=['/data/b']), upstream='source')
+        workflow.addCalculator('analysis', SleepingCalculator(expected=['/data/c']), upstream='left')
+        return workflow
+
+    def testConstruction(self):
+        """ Test adding and connecting calculators. """
+        workflow = self.buildBranchedWorkflow()
+
+        self.assertEqual(workflow.topologicalOrder(), ['source', 'left', 'right', 'analysis'])
+        self.assertEqual(workflow.upstream('analysis'), ['left'])
+        self.assertEqual(workflow.downstream('source'), ['left', 'right'])
+        self.assertIsNone(workflow.linearOrder())
+
+        # Names must be unique.
+        self.assertRaises(ValueError, workflow.addCalculator, 'left', SleepingCalculator())
+        # Unknown upstream.
+        self.assertRaises(KeyError, workflow.addCalculator, 'new', SleepingCalculator(), 'unknown')
+        # Cycles are rejected.
+        self.assertRaises(RuntimeError, workflow.connect, 'analysis', 'source')
+        self.assertEqual(workflow.upstream('source'), [])
+
+    def testLinearOrder(self):
+        """ Test that a chain is recognized. """
+        workflow = WorkflowGraph()
+        workflow.addCalculator('a', SleepingCalculator())
+        workflow.addCalculator('b', SleepingCalculator(), upstream='a')
+        workflow.addCalculator('c', SleepingCalculator(), upstream='b')
+
+        self.assertEqual(workflow.linearOrder(), ['a', 'b', 'c'])
+
+    def testInsertAndRemove(self):
+        """ Test inserting a calculator into a chain and removing it again. """
+        workflow = WorkflowGraph()
+        workflow.addCalculator('a', SleepingCalculator())
+        workflow.addCalculator('c', SleepingCalculator(), upstream='a')
+
+        workflow.insertCalculator('b', SleepingCalculator(), 'a', 'c')
+        self.assertEqual(workflow.linearOrder(), ['a', 'b', 'c'])
+        workflow.insertCalculator('d', SleepingCalculator(), 'c', None)
+        self.assertEqual(workflow.linearOrder(), ['a', 'b', 'c', 'd'])
+        self.assertRaises(KeyError, workflow.insertCalculator, 'e', SleepingCalculator(), 'a', 'unknown')
+
+        workflow.removeCalculator('b')
+        self.assertEqual(workflow.linearOrder(), ['a', 'c', 'd'])
+        self.assertRaises(KeyError, workflow.removeCalculator, 'b')
+
+    def testCheckInterfaceConsistency(self):
+        """ Test that every edge is checked against provided and expected data. """
+        workflow = self.buildBranchedWorkflow()
+        self.assertTrue(workflow.checkInterfaceConsistency())
+
+        workflow.addCalculator('broken', SleepingCalculator(expected=['/data/z']), upstream='right')
+        self.assertRaises(RuntimeError, workflow.checkInterfaceConsistency)
+
+        # Placeholders match any index.
+        workflow = WorkflowGraph()
+        workflow.addCalculator('pmi', SleepingCalculator(provided=['/data/snp_0000001/ff']))
+        workflow.addCalculator('diffr', SleepingCalculator(expected=['/data/snp_<7 digit index>/ff']), upstream='pmi')
+        self.assertTrue(workflow.checkInterfaceConsistency())
+        workflow.addCalculator('broken', SleepingCalculator(expected=['/data/snp_<7 digit index>/xyz']), upstream='pmi')
+        self.assertRaises(RuntimeError, workflow.checkInterfaceConsistency)
+
+    def testRunConcurrently(self):
+        """ Test that independent branches run concurrently. """
+        workflow = self.buildBranchedWorkflow(delay=0.5)
+
+        start = time.time()
+        workflow.run(number_of_workers=2)
+        self.assertLess(time.time() - start, 0.9)
+
+        calculators = workflow.calculators
+        self.assertGreaterEqual(calculators['analysis'].started, calculators['left'].started + 0.5)
+
+    def testRunError(self):
+        """ Test that a failing calculator stops the workflow. """
+        workflow = WorkflowGraph()
+        workflow.addCalculator('a', SleepingCalculator({'fail' : True}))
+        workflow.addCalculator('b', SleepingCalculator(), upstream='a')
+
+        self.assertRaises(RuntimeError, workflow.run)
+        self.assertIsNone(workflow.calculators['b'].started)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,7 @@ import unittest
 from SimEx.Utilities.EntityChecks import checkAndSetInstance
 from SimEx.Utilities.EntityChecks import checkAndSetPositiveInteger
 from SimEx.Utilities.EntityChecks import checkAndSetNonNegativeInteger
+from SimEx.Utilities.EntityChecks import checkAndSetPositiveFloat
 
 class EntityChecksTest(unittest.TestCase):
     """ Test class for the EntityChecks class. """
@@ -133,6 +134,22 @@ class EntityChecksTest(unittest.TestCase):
         # Check exception if parameter < 0.
         self.assertRaises( TypeError, checkAndSetNonNegativeInteger, -1)
 
+    def testCheckAndSetPositiveFloat(self):
+        """ Test the check method for positive numbers. """
+
+        # Check with correct parameter.
+        self.assertEqual( 1.5, checkAndSetPositiveFloat(1.5) )
+        self.assertIsInstance( checkAndSetPositiveFloat(2), float )
+
+        # Check default.
+        self.assertEqual( 1.0, checkAndSetPositiveFloat(None, 1) )
+
+        # Check exception if parameter not a number.
+        self.assertRaises( TypeError, checkAndSetPositiveFloat, "not a number")
+
+        # Check exception if parameter <= 0.
+        self.assertRaises( TypeError, checkAndSetPositiveFloat, 0.0)
+
 
 
 
@@ -0,0 +1,121 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the FileSet.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from SimEx.Utilities.FileSet import FileSet, fileIndex
+
+class FileSetTest(unittest.TestCase):
+    """ Test class for the FileSet class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        for name in ['pmi_out_0000010.h5', 'pmi_out_0000002.h5', 'pmi_out_0000001.h5', 'pmi.log']:
+            open(os.path.join(self.__tmp_dir, name), 'w').close()
+        os.mkdir(os.path.join(self.__tmp_dir, 'pmi_out_subdir.h5'))
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def names(self, fileset):
+        return [os.path.basename(f) for f in fileset]
+
+    def testDefaults(self):
+        """ Test that all files are selected, sorted by name. """
+        fileset = FileSet(self.__tmp_dir)
+        self.assertEqual(fileset.path, self.__tmp_dir)
+        self.assertEqual(fileset.pattern, '*')
+        self.assertEqual(fileset.order, 'name')
+        self.assertEqual(self.names(fileset), ['pmi.log', 'pmi_out_0000001.h5', 'pmi_out_0000002.h5', 'pmi_out_0000010.h5'])
+        self.assertEqual(len(fileset), 4)
+
+    def testPatternAndRange(self):
+        """ Test selection by glob pattern and position range. """
+        fileset = FileSet(self.__tmp_dir, pattern='pmi_out_*.h5', start=1)
+        self.assertEqual(self.names(fileset), ['pmi_out_0000002.h5', 'pmi_out_0000010.h5'])
+
+        fileset = FileSet(self.__tmp_dir, pattern='pmi_out_*.h5', start=0, stop=2)
+        self.assertEqual(self.names(fileset), ['pmi_out_0000001.h5', 'pmi_out_0000002.h5'])
+
+    def testStepAndSample(self):
+        """ Test selection by stride and random sample. """
+        for i in range(10):
+            open(os.path.join(self.__tmp_dir, 'FELsource_out_%07d.h5' % (i+1)), 'w').close()
+        fileset = FileSet(self.__tmp_dir, pattern='FELsource_out_*', order='index', start=1, step=3)
+        self.assertEqual(fileset.step, 3)
+        self.assertEqual([fileIndex(f) for f in fileset], [2, 5, 8])
+        self.assertRaises(TypeError, FileSet, self.__tmp_dir, step=0)
+
+        # The same seed draws the same files, in order.
+        sample = FileSet(self.__tmp_dir, pattern='FELsource_out_*', order='index', sample=4, seed=7).files()
+        self.assertEqual(len(sample), 4)
+        self.assertEqual(sample, sorted(sample))
+        self.assertEqual(FileSet(self.__tmp_dir, pattern='FELsource_out_*', order='index', sample=4, seed=7).files(), sample)
+        self.assertEqual(len(FileSet(self.__tmp_dir, pattern='FELsource_out_*', sample=20).files()), 10)
+        self.assertRaises(ValueError, FileSet, self.__tmp_dir, sample=-1)
+
+        # The selection is kept when applied to another path.
+        self.assertEqual(FileSet(pattern='FELsource_out_*', order='index', sample=4, seed=7).withPath(self.__tmp_dir).files(), sample)
+
+    def testOrder(self):
+        """ Test ordering by index and by modification time. """
+        for name in ['in_10.h5', 'in_9.h5']:
+            open(os.path.join(self.__tmp_dir, name), 'w').close()
+        self.assertEqual(self.names(FileSet(self.__tmp_dir, pattern='in_*', order='index')), ['in_9.h5', 'in_10.h5'])
+        self.assertEqual(self.names(FileSet(self.__tmp_dir, pattern='in_*', order='name')), ['in_10.h5', 'in_9.h5'])
+
+        now = time.time()
+        os.utime(os.path.join(self.__tmp_dir, 'in_9.h5'), (now, now + 10))
+        self.assertEqual(self.names(FileSet(self.__tmp_dir, pattern='in_*', order='mtime')), ['in_10.h5', 'in_9.h5'])
+
+        self.assertRaises(ValueError, FileSet, self.__tmp_dir, order='size')
+        self.assertEqual(fileIndex('/a/b/pmi_out_0000012.h5'), 12)
+        self.assertEqual(fileIndex('README'), -1)
+
+    def testFileAndMissingPath(self):
+        """ Test a single file and a missing path. """
+        path = os.path.join(self.__tmp_dir, 'pmi.log')
+        self.assertEqual(FileSet(path, pattern='*.h5').files(), [path])
+        self.assertEqual(FileSet(os.path.join(self.__tmp_dir, 'missing')).files(), [])
+        self.assertRaises(IOError, FileSet().files)
+
+    def testWithPath(self):
+        """ Test applying a selection to another path. """
+        fileset = FileSet(pattern='pmi_out_*', order='index', stop=1)
+        self.assertIsNone(fileset.path)
+        self.assertEqual(self.names(fileset.withPath(self.__tmp_dir)), ['pmi_out_0000001.h5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the FileStaging utilities.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import os
+import shutil
+import tempfile
+import unittest
+
+from SimEx.Utilities.FileStaging import fileChecksum, isStaged, setStagingMode, stageFile, stagingMode
+
+class FileStagingTest(unittest.TestCase):
+    """ Test class for the FileStaging utilities. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__source = os.path.join(self.__tmp_dir, 'FELsource_out_0000001.h5')
+        with open(self.__source, 'wb') as stream:
+            stream.write(os.urandom(4096))
+        self.__target = os.path.join(self.__tmp_dir, 'staged.h5')
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testModes(self):
+        """ Test staging with every mode. """
+        source, target = self.__source, self.__target
+
+        self.assertEqual(stageFile(source, target, 'hardlink'), 'hardlink')
+        self.assertEqual(os.stat(source).st_ino, os.stat(target).st_ino)
+        os.remove(target)
+
+        self.assertEqual(stageFile(source, target, 'symlink'), 'symlink')
+        self.assertTrue(os.path.islink(target))
+        os.remove(target)
+
+        # Cloning is not supported by every file system, the file is copied then.
+        self.assertIn(stageFile(source, target, 'reflink'), ['reflink', 'copy'])
+        self.assertFalse(os.path.islink(target))
+        self.assertNotEqual(os.stat(source).st_ino, os.stat(target).st_ino)
+        self.assertEqual(fileChecksum(source), fileChecksum(target))
+        os.remove(target)
+
+        self.assertEqual(stageFile(source, target, 'copy'), 'copy')
+        self.assertEqual(open(source, 'rb').read(), open(target, 'rb').read())
+
+        self.assertRaises(ValueError, stageFile, source, target, 'teleport')
+
+        # No temporary files are left behind.
+        self.assertEqual(sorted(os.listdir(self.__tmp_dir)), ['FELsource_out_0000001.h5', 'staged.h5'])
+
+    def testSkipping(self):
+        """ Test that files already staged are skipped and changed files are staged again. """
+        source, target = self.__source, self.__target
+
+        self.assertEqual(stageFile(source, target, 'copy'), 'copy')
+        self.assertTrue(isStaged(source, target))
+        self.assertEqual(stageFile(source, target, 'copy'), 'skipped')
+        self.assertEqual(stageFile(source, target, 'hardlink'), 'skipped')
+
+        # A symlink is replaced unless symlinks are requested.
+        os.remove(target)
+        stageFile(source, target, 'symlink')
+        self.assertEqual(stageFile(source, target, 'symlink'), 'skipped')
+        self.assertEqual(stageFile(source, target, 'copy'), 'copy')
+        self.assertFalse(os.path.islink(target))
+
+        # A modified target is replaced.
+        with open(target, 'r+b') as stream:
+            stream.write(b'changed')
+        self.assertFalse(isStaged(source, target))
+        self.assertEqual(stageFile(source, target, 'copy'), 'copy')
+        self.assertEqual(fileChecksum(source), fileChecksum(target))
+
+    def testStagingMode(self):
+        """ Test setting the deployment wide staging mode. """
+        mode = stagingMode()
+        try:
+            setStagingMode('hardlink')
+            self.assertEqual(stagingMode(), 'hardlink')
+            self.assertEqual(stageFile(self.__source, self.__target), 'hardlink')
+            self.assertRaises(ValueError, setStagingMode, 'teleport')
+        finally:
+            setStagingMode(mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the H5HandlePool.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from SimEx.Utilities.H5HandlePool import H5HandlePool, defaultH5Pool
+
+class H5HandlePoolTest(unittest.TestCase):
+    """ Test class for the H5HandlePool class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__files = []
+        for i in range(3):
+            path = os.path.join(self.__tmp_dir, 'pattern_%07d.h5' % (i+1))
+            with h5py.File(path, 'w') as h5:
+                h5.create_dataset('data/data', data=numpy.ones((4,4))*i)
+            self.__files.append(path)
+        self.__pool = H5HandlePool(max_open_files=2)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        self.__pool.closeAll()
+        shutil.rmtree(self.__tmp_dir)
+
+    def testDefaultConstruction(self):
+        """ Testing the default construction. """
+        pool = H5HandlePool()
+        self.assertEqual(pool.max_open_files, 128)
+        self.assertEqual(pool.statistics, {'hits' : 0, 'misses' : 0, 'evictions' : 0})
+        self.assertRaises(TypeError, H5HandlePool, 'many')
+
+    def testReuse(self):
+        """ Test that a released file is reused when acquired again. """
+        pool = self.__pool
+        with pool.file(self.__files[1]) as h5:
+            self.assertEqual(h5['data/data'][0,0], 1.0)
+            first = h5.id.id
+        with pool.file(self.__files[1]) as h5:
+            self.assertEqual(h5['data/data'][0,0], 1.0)
+            self.assertEqual(h5.id.id, first)
+        self.assertEqual(pool.statistics, {'hits' : 1, 'misses' : 1, 'evictions' : 0})
+
+    def testEviction(self):
+        """ Test that the least recently used file is closed when too many files are open. """
+        pool = self.__pool
+        h5s = []
+        for path in self.__files:
+            with pool.file(path) as h5:
+                h5s.append(h5)
+        self.assertEqual(pool.statistics['evictions'], 1)
+        self.assertFalse(h5s[0].id.valid)
+        self.assertTrue(h5s[1].id.valid)
+        self.assertTrue(h5s[2].id.valid)
+
+    def testNoEvictionInUse(self):
+        """ Test that files in use are not closed. """
+        pool = self.__pool
+        h5s = [pool.acquire(path) for path in self.__files]
+        self.assertTrue(all([h5.id.valid for h5 in h5s]))
+
+        pool.release(self.__files[0])
+        self.assertFalse(h5s[0].id.valid)
+        self.assertEqual(pool.statistics['evictions'], 1)
+
+    def testModeUpgrade(self):
+        """ Test that a file open for reading is reopened for writing. """
+        pool = self.__pool
+        path = self.__files[0]
+        with pool.file(path, 'r'):
+            pass
+        with pool.file(path, 'a') as h5:
+            h5.create_dataset('extra', data=numpy.arange(3))
+        # A file open for writing serves reads.
+        with pool.file(path, 'r') as h5:
+            self.assertEqual(list(h5['extra'][()]), [0,1,2])
+        self.assertEqual(pool.statistics, {'hits' : 1, 'misses' : 2, 'evictions' : 0})
+
+    def testTruncateInUse(self):
+        """ Test that a file in use cannot be truncated or reopened in an incompatible mode. """
+        pool = self.__pool
+        path = self.__files[0]
+        pool.acquire(path, 'r')
+        self.assertRaises(IOError, pool.acquire, path, 'w')
+        self.assertRaises(IOError, pool.acquire, path, 'a')
+        pool.release(path)
+
+        h5 = pool.acquire(path, 'w')
+        self.assertEqual(h5.keys(), [])
+        pool.release(path)
+
+    def testExternalModification(self):
+        """ Test that a file modified outside the pool is reopened. """
+        pool = self.__pool
+        path = self.__files[0]
+        with pool.file(path) as h5:
+            h5s = h5
+        pool.close(path)
+        self.assertFalse(h5s.id.valid)
+
+        with pool.file(path):
+            pass
+        # Replace the file while it is not in use.
+        os.remove(path)
+        time.sleep(0.01)
+        with h5py.File(path, 'w') as h5:
+            h5.create_dataset('data/data', data=numpy.ones((8,8))*5)
+        with pool.file(path) as h5:
+            self.assertEqual(h5['data/data'].shape, (8,8))
+        self.assertEqual(pool.statistics['hits'], 0)
+
+    def testCloseAll(self):
+        """ Test closing all files. """
+        pool = self.__pool
+        h5s = [pool.acquire(path) for path in self.__files]
+        pool.closeAll()
+        self.assertFalse(any([h5.id.valid for h5 in h5s]))
+        # Releasing a closed file is harmless.
+        pool.release(self.__files[0])
+
+    def testDefaultPool(self):
+        """ Test the pool shared by all calculators. """
+        self.assertIs(defaultH5Pool(), defaultH5Pool())
+        self.assertIsInstance(defaultH5Pool(), H5HandlePool)
+
+
+if __name__ == '__main__':
+    unittest.main()
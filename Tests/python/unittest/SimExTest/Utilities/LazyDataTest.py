@@ -0,0 +1,122 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the lazy data views.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from SimEx.Utilities.LazyData import LazyDataMapping, LazyDataset
+
+class LazyDataTest(unittest.TestCase):
+    """ Test class for the LazyDataMapping and LazyDataset classes. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__volume = numpy.arange(5*6*7, dtype='float64').reshape(5, 6, 7)
+        self.__volume_file = os.path.join(self.__tmp_dir, 'orient_out.h5')
+        with h5py.File(self.__volume_file, 'w') as h5:
+            h5['data/data'] = self.__volume
+            h5.create_dataset('data/compressed', data=self.__volume, compression='gzip')
+            h5['params/info/energy'] = 4.96
+
+        self.__pattern_files = []
+        for i in range(4):
+            path = os.path.join(self.__tmp_dir, 'diffr_out_%07d.h5' % (i+1))
+            with h5py.File(path, 'w') as h5:
+                h5['data/data'] = numpy.full((3, 3), i)
+            self.__pattern_files.append(path)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testSingleFile(self):
+        """ Test reading parts of a dataset in a single file. """
+        data = LazyDataMapping([self.__volume_file], ['/data/data', 'params/info', '/data/missing'])
+        self.assertEqual(sorted(data.keys()), ['/data/data', '/data/missing', '/params/info'])
+        self.assertEqual(len(data), 3)
+
+        volume = data['data/data']
+        self.assertIsInstance(volume, LazyDataset)
+        self.assertEqual(volume.shape, (5, 6, 7))
+        self.assertEqual(volume.dtype, numpy.float64)
+        numpy.testing.assert_array_equal(volume[2], self.__volume[2])
+        numpy.testing.assert_array_equal(volume[1:3, 0, ::2], self.__volume[1:3, 0, ::2])
+        numpy.testing.assert_array_equal(numpy.asarray(volume), self.__volume)
+
+        # Groups are mappings.
+        self.assertEqual(data['/params/info']['/params/info/energy'][()], 4.96)
+
+        self.assertRaises(KeyError, data.__getitem__, '/data/missing')
+        self.assertRaises(KeyError, data.__getitem__, '/data/other')
+        self.assertFalse(hasattr(data, '__setitem__'))
+
+    def testMemmap(self):
+        """ Test memory mapping of contiguous datasets. """
+        volume = LazyDataset([self.__volume_file], '/data/data').memmap()
+        numpy.testing.assert_array_equal(volume[3], self.__volume[3])
+        self.assertRaises(ValueError, LazyDataset([self.__volume_file], '/data/compressed').memmap)
+        self.assertRaises(ValueError, LazyDataset(self.__pattern_files, '/data/data').memmap)
+
+    def testStackedFiles(self):
+        """ Test reading datasets stacked from several files. """
+        patterns = LazyDataMapping(self.__pattern_files, ['/data/data'])['/data/data']
+        self.assertEqual(patterns.shape, (4, 3, 3))
+        self.assertEqual(len(patterns), 4)
+        self.assertEqual(patterns[2][0, 0], 2)
+        self.assertEqual(patterns[3, 1, 1], 3)
+        self.assertEqual(list(patterns[1:3, 0, 0]), [1, 2])
+        self.assertEqual(list(patterns[[0, 3], 2, 2]), [0, 3])
+        self.assertEqual(numpy.asarray(patterns).shape, (4, 3, 3))
+
+    def testPlaceholders(self):
+        """ Test that data paths with placeholders stand for the matching paths. """
+        snapshot_file = os.path.join(self.__tmp_dir, 'pmi_out_0000001.h5')
+        with h5py.File(snapshot_file, 'w') as h5:
+            for snapshot in range(1, 3):
+                h5['data/snp_%07d/ff' % (snapshot)] = numpy.full((2,), snapshot)
+                h5['data/snp_%07d/Z' % (snapshot)] = numpy.full((2,), snapshot)
+
+        data = LazyDataMapping([snapshot_file], ['/data/snp_<7 digit index>/ff'])
+        self.assertEqual(list(data.keys()), ['/data/snp_0000001/ff', '/data/snp_0000002/ff'])
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data['/data/snp_0000002/ff'][1], 2)
+        self.assertRaises(KeyError, data.__getitem__, '/data/snp_0000002/Z')
+        self.assertRaises(KeyError, data.__getitem__, '/data/snp_0000003/ff')
+
+    def testNoFiles(self):
+        """ Test that reading without files raises. """
+        self.assertRaises(IOError, LazyDataMapping([], ['/data/data']).__getitem__, '/data/data')
+
+
+if __name__ == '__main__':
+    unittest.main()
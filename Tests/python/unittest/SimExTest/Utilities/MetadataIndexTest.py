@@ -0,0 +1,140 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the MetadataIndex.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from SimEx.Utilities.MetadataIndex import MetadataIndex, extractMetadata
+from SimEx.Utilities.FileSet import FileSet
+
+class MetadataIndexTest(unittest.TestCase):
+    """ Test class for the MetadataIndex class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        for i in range(4):
+            self.writePattern(i)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def writePattern(self, i, counts=None):
+        path = os.path.join(self.__tmp_dir, 'diffr_out_%07d.h5' % (i+1))
+        if counts is None:
+            counts = 10**i
+        with h5py.File(path, 'w') as h5:
+            data = numpy.zeros((10, 10))
+            data[0, 0] = counts
+            h5['data/data'] = data
+            h5['params/beam/photonEnergy'] = 4000. + i
+            h5['params/geom/detectorDist'] = 0.2
+            h5['params/info'] = 'singfel'
+        return path
+
+    def testExtractMetadata(self):
+        """ Test reading the metadata of a file. """
+        path = os.path.join(self.__tmp_dir, 'pmi_out_0000001.h5')
+        with h5py.File(path, 'w') as h5:
+            h5['data/snp_0000001/T'] = 1.0
+            h5['data/snp_0000002/T'] = 1.0
+            h5['params/xparams'] = [1, 2]
+        self.assertEqual(extractMetadata(path), {'number_of_snapshots' : 2})
+
+        self.assertEqual(extractMetadata(os.path.join(self.__tmp_dir, 'diffr_out_0000003.h5')),
+                         {'/params/beam/photonEnergy' : 4002., '/params/geom/detectorDist' : 0.2, 'total_counts' : 100.})
+
+    def testPulseMetadata(self):
+        """ Test reading the metadata of a FEL pulse. """
+        path = os.path.join(self.__tmp_dir, 'FELsource_out_0000001.h5')
+        with h5py.File(path, 'w') as h5:
+            h5['params/photonEnergy'] = 4960.
+            h5['params/Mesh/nSlices'] = 550
+            h5['history/parent/misc/nzc'] = 20
+            h5['history/parent/misc/gain_curve'] = numpy.zeros((50, 8))
+            # 1 GW over 10 fs.
+            h5['history/parent/misc/temporal_struct'] = numpy.array([[0., 1e9], [10., 1e9]])
+
+        metadata = extractMetadata(path)
+        self.assertEqual(metadata['/params/photonEnergy'], 4960.)
+        self.assertEqual(metadata['/params/Mesh/nSlices'], 550)
+        self.assertEqual(metadata['/history/parent/misc/nzc'], 20)
+        self.assertNotIn('/history/parent/misc/gain_curve', metadata)
+        self.assertAlmostEqual(metadata['pulse_energy'], 1e-5)
+
+    def testIncrementalUpdate(self):
+        """ Test that only new and modified files are read. """
+        index = MetadataIndex(self.__tmp_dir)
+        self.assertEqual(index.index_path, os.path.join(self.__tmp_dir, 'metadata_index.sqlite'))
+        self.assertEqual(index.update(), 4)
+        self.assertEqual(index.update(), 0)
+        self.assertEqual(len(index.files()), 4)
+
+        # New file.
+        self.writePattern(4)
+        self.assertEqual(MetadataIndex(self.__tmp_dir).update(), 1)
+
+        # Modified and removed files.
+        time.sleep(0.01)
+        path = self.writePattern(0, counts=5e4)
+        os.remove(os.path.join(self.__tmp_dir, 'diffr_out_0000002.h5'))
+        self.assertEqual(index.update(), 1)
+        self.assertEqual(index.value(path, 'total_counts'), 5e4)
+        self.assertEqual(len(index.files()), 4)
+        self.assertEqual(index.metadata('diffr_out_0000002.h5'), {})
+
+    def testSelect(self):
+        """ Test selecting files by their metadata. """
+        index = MetadataIndex(self.__tmp_dir)
+        index.update()
+
+        self.assertEqual(index.keys(), ['/params/beam/photonEnergy', '/params/geom/detectorDist', 'total_counts'])
+        self.assertEqual([os.path.basename(f) for f in index.select([('total_counts', '>=', 100)])], ['diffr_out_0000003.h5', 'diffr_out_0000004.h5'])
+        self.assertEqual([os.path.basename(f) for f in index.select([('total_counts', '>=', 10), ('/params/beam/photonEnergy', '<', 4003)])], ['diffr_out_0000002.h5', 'diffr_out_0000003.h5'])
+        self.assertEqual(index.select([('no_such_key', '>', 0)]), [])
+        self.assertEqual(len(index.select([])), 4)
+        self.assertEqual(index.value('diffr_out_0000004.h5', '/params/beam/photonEnergy'), 4003.)
+        self.assertRaises(ValueError, index.select, [('total_counts', 'like', 1)])
+
+    def testFileSetWhere(self):
+        """ Test selecting files of a FileSet by their metadata. """
+        fileset = FileSet(self.__tmp_dir, where=[('total_counts', '>', 5)], start=1)
+        self.assertEqual([os.path.basename(f) for f in fileset], ['diffr_out_0000003.h5', 'diffr_out_0000004.h5'])
+
+        # The index file itself is never selected.
+        self.assertEqual(len(FileSet(self.__tmp_dir)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
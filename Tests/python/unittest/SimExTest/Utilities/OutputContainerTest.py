@@ -0,0 +1,135 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the OutputContainer.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from SimEx.Utilities.OutputContainer import ContainerWriter, containerRows, countRows, iterateRows, writeContainer
+from SimEx.Utilities.VirtualDatasetIndex import readPatterns
+from SimEx.Utilities.WritePolicy import WritePolicy
+
+class OutputContainerTest(unittest.TestCase):
+    """ Test class for the OutputContainer module. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__files = []
+        for i in range(5):
+            path = os.path.join(self.__tmp_dir, 'diffr_out_%07d.h5' % (i+1))
+            with h5py.File(path, 'w') as h5:
+                h5['data/data'] = numpy.ones((3,3)) * i
+                h5['data/angle'] = numpy.array([i, 0., 0., 1.])
+                h5['params/geom/detectorDist'] = 0.13
+                h5['params/geom/mask'] = numpy.ones((3,3))
+                h5['history/parent/detail'] = 'pmi_out_%07d.h5' % (i+1)
+                h5['info/package_version'] = 'SingFEL v0.1.0'
+            self.__files.append(path)
+        self.__container = os.path.join(self.__tmp_dir, 'diffr_out.h5')
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testWriteContainer(self):
+        """ Test consolidating per-pulse files. """
+        self.assertEqual(writeContainer(self.__files, self.__container), 5)
+
+        with h5py.File(self.__container, 'r') as h5:
+            self.assertEqual(containerRows(h5), 5)
+            # Per-pulse data, one row per pulse.
+            self.assertEqual(h5['data/data'].shape, (5,3,3))
+            self.assertEqual(h5['data/data'].maxshape, (None,3,3))
+            self.assertIsNotNone(h5['data/data'].chunks)
+            self.assertEqual(list(h5['data/data'][:,1,1]), [0.,1.,2.,3.,4.])
+            self.assertEqual(h5['data/angle'].shape, (5,4))
+            self.assertEqual(list(h5['history/parent/detail'][()]), ['pmi_out_%07d.h5' % (i+1) for i in range(5)])
+            # Data identical for all pulses is stored once.
+            self.assertEqual(h5['params/geom/detectorDist'][()], 0.13)
+            self.assertEqual(h5['params/geom/mask'].shape, (3,3))
+            self.assertEqual(h5['info/package_version'][()], 'SingFEL v0.1.0')
+            self.assertEqual(list(h5['container/files'][()]), [os.path.basename(f) for f in self.__files])
+
+        # The source files are kept by default.
+        self.assertTrue(all([os.path.isfile(f) for f in self.__files]))
+
+    def testRemoveFiles(self):
+        """ Test removing the per-pulse files after consolidation. """
+        writeContainer(self.__files, self.__container, remove_files=True)
+        self.assertEqual(os.listdir(self.__tmp_dir), ['diffr_out.h5'])
+
+    def testCompression(self):
+        """ Test that the stacked datasets are written according to the write policy. """
+        writeContainer(self.__files, self.__container, write_policy=WritePolicy(codec='gzip', min_bytes=0))
+        with h5py.File(self.__container, 'r') as h5:
+            self.assertEqual(h5['data/data'].compression, 'gzip')
+            self.assertEqual(h5['data/data'].chunks, (5,3,3))
+
+    def testMismatch(self):
+        """ Test that files with different datasets cannot be consolidated. """
+        with h5py.File(self.__files[3], 'a') as h5:
+            del h5['data/data']
+            h5['data/data'] = numpy.ones((4,4))
+        self.assertRaises(ValueError, writeContainer, self.__files, self.__container, None, True)
+        # Nothing is written or removed.
+        self.assertFalse(os.path.exists(self.__container))
+        self.assertEqual(len(os.listdir(self.__tmp_dir)), 5)
+
+        with h5py.File(self.__files[3], 'a') as h5:
+            del h5['data/angle']
+        self.assertRaises(ValueError, writeContainer, self.__files, self.__container)
+
+    def testContainerWriter(self):
+        """ Test appending to a container file by file. """
+        writer = ContainerWriter(self.__container)
+        for path in self.__files[:2]:
+            writer.append(path)
+        self.assertEqual(writer.rows, 2)
+        writer.close()
+
+        with h5py.File(self.__container, 'r') as h5:
+            self.assertEqual(list(iterateRows(h5, 'data/angle', batch_size=1))[1][0], 1.)
+            self.assertEqual(len(list(iterateRows(h5, 'params/geom/detectorDist'))), 2)
+
+    def testReadEitherLayout(self):
+        """ Test that readers handle per-pulse files and containers alike. """
+        self.assertEqual(countRows(self.__files), 5)
+        per_pulse = [p[0,0] for p in readPatterns(self.__files)]
+
+        writeContainer(self.__files, self.__container, remove_files=True)
+        self.assertEqual(countRows([self.__container]), 5)
+        self.assertEqual([p[0,0] for p in readPatterns([self.__container], batch_size=2)], per_pulse)
+        self.assertEqual(countRows([]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the ProcessSupervisor.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from SimEx.Utilities.ProcessSupervisor import ProcessSupervisor, SupervisedProcess, defaultSupervisor, logTail
+
+class ProcessSupervisorTest(unittest.TestCase):
+    """ Test class for the ProcessSupervisor class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testRunWritesLogs(self):
+        """ Test that output is written to the log files and the exit code is collected. """
+        supervisor = ProcessSupervisor(max_processes=2)
+        stdout_path = os.path.join(self.__tmp_dir, 'out.log')
+        stderr_path = os.path.join(self.__tmp_dir, 'err.log')
+
+        command = [sys.executable, '-c', 'import sys; sys.stdout.write("out"); sys.stderr.write("err"); sys.exit(3)']
+        process = supervisor.run(command, stdout_path=stdout_path, stderr_path=stderr_path)
+
+        self.assertEqual(process.returncode, 3)
+        self.assertFalse(process.timed_out)
+        self.assertTrue(process.done())
+        self.assertGreater(process.wall_time, 0.0)
+        self.assertEqual(open(stdout_path).read(), "out")
+        self.assertEqual(open(stderr_path).read(), "err")
+
+        # Combined log.
+        log_path = os.path.join(self.__tmp_dir, 'combined.log')
+        supervisor.run(command, stdout_path=log_path, stderr_path=log_path, cwd=self.__tmp_dir)
+        self.assertEqual(sorted(open(log_path).read()), sorted("outerr"))
+        self.assertEqual(logTail(log_path, 1), open(log_path).read())
+        self.assertEqual(logTail(os.path.join(self.__tmp_dir, 'missing.log')), "")
+
+    def testConcurrencyLimit(self):
+        """ Test that no more than max_processes processes run at the same time. """
+        supervisor = ProcessSupervisor(max_processes=2, poll_interval=0.01)
+        self.assertEqual(supervisor.max_processes, 2)
+
+        command = [sys.executable, '-c', 'import time; print time.time(); time.sleep(0.3); print time.time()']
+        log_paths = [os.path.join(self.__tmp_dir, '%d.log' % (i)) for i in range(4)]
+        processes = [supervisor.submit(command, stdout_path=log_path) for log_path in log_paths]
+        self.assertEqual(supervisor.wait(processes), [0, 0, 0, 0])
+
+        intervals = [[float(t) for t in open(log_path).read().split()] for log_path in log_paths]
+        for start, end in intervals:
+            running = len([1 for s, e in intervals if s < (start+end)/2. < e])
+            self.assertLessEqual(running, 2)
+
+    def testTimeout(self):
+        """ Test that a process exceeding its timeout is terminated. """
+        supervisor = ProcessSupervisor(timeout=0.2, poll_interval=0.01)
+
+        start = time.time()
+        process = supervisor.run([sys.executable, '-c', 'import time; time.sleep(30)'])
+
+        self.assertLess(time.time() - start, 10.0)
+        self.assertTrue(process.timed_out)
+        self.assertNotEqual(process.returncode, 0)
+
+    def testLaunchError(self):
+        """ Test that a process that cannot be launched raises when waited for. """
+        supervisor = ProcessSupervisor()
+        process = supervisor.submit([os.path.join(self.__tmp_dir, 'no_such_executable')])
+
+        self.assertRaises(OSError, process.wait)
+        self.assertIsNone(process.returncode)
+
+        # The supervisor keeps working.
+        self.assertEqual(supervisor.run([sys.executable, '-c', 'pass']).returncode, 0)
+
+    def testWaitFromThreads(self):
+        """ Test that processes can be submitted and waited for from several threads. """
+        supervisor = ProcessSupervisor(max_processes=1, poll_interval=0.01)
+        returncodes = []
+
+        def target(code):
+            returncodes.append(supervisor.run([sys.executable, '-c', 'import sys; sys.exit(%d)' % (code)]).returncode)
+
+        threads = [threading.Thread(target=target, args=(code,)) for code in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(returncodes), [0, 1, 2])
+
+    def testDefaultSupervisor(self):
+        """ Test that the default supervisor is shared. """
+        self.assertIsInstance(defaultSupervisor(), ProcessSupervisor)
+        self.assertIs(defaultSupervisor(), defaultSupervisor())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the ResourceScheduler.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import threading
+import time
+import unittest
+
+from SimEx.Utilities.ResourceScheduler import ResourceScheduler, defaultResourceScheduler, threadLimits
+
+class ResourceSchedulerTest(unittest.TestCase):
+    """ Test class for the ResourceScheduler class. """
+
+    def testDefaultConstruction(self):
+        """ Testing the default construction. """
+        scheduler = ResourceScheduler()
+        self.assertGreater(scheduler.cores, 0)
+        self.assertGreater(scheduler.memory, 0)
+        self.assertEqual(scheduler.available_cores, scheduler.cores)
+        self.assertRaises(TypeError, ResourceScheduler, 'many')
+        self.assertIs(defaultResourceScheduler(), defaultResourceScheduler())
+
+    def testAcquireRelease(self):
+        """ Test that granted resources are accounted until released. """
+        scheduler = ResourceScheduler(cores=4, memory=1000)
+        grant = scheduler.acquire(cores=1, memory=400, mpi_ranks=3)
+        self.assertEqual(scheduler.available_cores, 1)
+        self.assertEqual(scheduler.available_memory, 600)
+        scheduler.release(grant)
+        self.assertEqual(scheduler.available_cores, 4)
+        self.assertEqual(scheduler.available_memory, 1000)
+
+        # Requests exceeding the node are reduced to its capacity.
+        grant = scheduler.acquire(cores=16, memory=5000)
+        self.assertEqual(scheduler.available_cores, 0)
+        self.assertEqual(scheduler.available_memory, 0)
+        scheduler.release(grant)
+
+    def testPacking(self):
+        """ Test that concurrent reservations never exceed the cores and memory. """
+        scheduler = ResourceScheduler(cores=3, memory=100)
+        lock = threading.Lock()
+        usage = {'cores' : 0, 'memory' : 0, 'max_cores' : 0, 'max_memory' : 0}
+
+        def work(cores, memory):
+            with scheduler.reserve(cores=cores, memory=memory):
+                with lock:
+                    usage['cores'] += cores
+                    usage['memory'] += memory
+                    usage['max_cores'] = max(usage['cores'], usage['max_cores'])
+                    usage['max_memory'] = max(usage['memory'], usage['max_memory'])
+                time.sleep(0.05)
+                with lock:
+                    usage['cores'] -= cores
+                    usage['memory'] -= memory
+
+        threads = [threading.Thread(target=work, args=request) for request in [(1, 60), (1, 30), (2, 10), (1, 50), (1, 10)]*2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(usage['max_cores'], 3)
+        self.assertLessEqual(usage['max_memory'], 100)
+        self.assertGreater(usage['max_cores'], 1)
+        self.assertEqual(scheduler.available_cores, 3)
+        self.assertEqual(scheduler.available_memory, 100)
+
+    def testNestedReservation(self):
+        """ Test that reservations nested in the same thread are granted by the outer reservation. """
+        scheduler = ResourceScheduler(cores=2, memory=100)
+        self.assertFalse(scheduler.reserved())
+        with scheduler.reserve(cores=2):
+            self.assertTrue(scheduler.reserved())
+            with scheduler.reserve(cores=2):
+                self.assertEqual(scheduler.available_cores, 0)
+            self.assertTrue(scheduler.reserved())
+        self.assertFalse(scheduler.reserved())
+        self.assertEqual(scheduler.available_cores, 2)
+
+    def testThreadLimits(self):
+        """ Test the environment limiting the threads of numerical libraries. """
+        limits = threadLimits(4)
+        self.assertEqual(limits['OMP_NUM_THREADS'], '4')
+        self.assertEqual(set(limits.values()), set(['4']))
+        self.assertRaises(TypeError, threadLimits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the SchemaValidator.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from SimEx.Calculators.AbstractBaseCalculator import AbstractBaseCalculator
+from SimEx.Utilities.SchemaValidator import SchemaValidator, compileDataPath, defaultSchemaValidator, missingDataPaths
+
+# Calculator expecting pmi data.
+class ExpectingCalculator(AbstractBaseCalculator):
+    _input_pattern = 'pmi_out_*.h5'
+    def __init__(self, parameters=None, input_path=None, output_path=None):
+        super(ExpectingCalculator, self).__init__(parameters, input_path, output_path)
+    def backengine(self):
+        pass
+    def _readH5(self):
+        pass
+    def saveH5(self):
+        pass
+    def providedData(self):
+        return []
+    def expectedData(self):
+        return ['/data/snp_<7 digit index>/ff', '/data/snp_<7 digit index>/xyz', '/params/Mesh/xMin']
+
+
+class SchemaValidatorTest(unittest.TestCase):
+    """ Test class for the SchemaValidator class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__files = []
+        for i in range(4):
+            path = os.path.join(self.__tmp_dir, 'pmi_out_%07d.h5' % (i+1))
+            with h5py.File(path, 'w') as h5:
+                h5['data/snp_0000001/ff'] = numpy.zeros(10)
+                h5['data/snp_0000002/ff'] = numpy.zeros(10)
+                h5['data/snp_0000001/xyz'] = numpy.zeros((10, 3))
+                h5['params/Mesh/xMin'] = 0.0
+            self.__files.append(path)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testCompileDataPath(self):
+        """ Test compiling placeholders into patterns. """
+        pattern = compileDataPath('/data/snp_<7 digit index>/ff')
+        self.assertTrue(pattern.match('/data/snp_0000001/ff'))
+        self.assertFalse(pattern.match('/data/snp_001/ff'))
+        self.assertFalse(pattern.match('/data/snp_0000001/ff/extra'))
+        self.assertTrue(compileDataPath('params/Mesh/xMin').match('/params/Mesh/xMin'))
+        # Regular expression characters are literal.
+        self.assertFalse(compileDataPath('/misc/FAST2XY.DAT').match('/misc/FAST2XYaDAT'))
+
+    def testMissingDataPaths(self):
+        """ Test matching expected against provided data paths. """
+        self.assertEqual(missingDataPaths(['/data/snp_<7 digit index>/ff', '/params/xMin'], ['/data/snp_0000003/ff', '/params/Mesh/xMin']), ['/params/xMin'])
+        # Placeholders on the providing side.
+        self.assertEqual(missingDataPaths(['/data/snp_0000003/ff'], ['/data/snp_<7 digit index>/ff']), [])
+        self.assertEqual(missingDataPaths(['data/data/'], ['/data/data']), [])
+
+    def testValidate(self):
+        """ Test checking the input files of a calculator. """
+        validator = SchemaValidator()
+        calculator = ExpectingCalculator(input_path=self.__tmp_dir, output_path='out')
+        self.assertEqual(validator.validate(calculator), {})
+        # First and last file only.
+        self.assertEqual(validator.statistics, {'hits' : 0, 'misses' : 2})
+
+        with h5py.File(self.__files[-1], 'a') as h5:
+            del h5['params/Mesh/xMin']
+            h5['params/xMin'] = 0.0
+        self.assertEqual(validator.validate(calculator), {self.__files[-1] : ['/params/Mesh/xMin']})
+
+        # Single input file.
+        calculator.input_path = self.__files[-1]
+        self.assertEqual(validator.validate(calculator).keys(), [self.__files[-1]])
+
+        # Input not written yet or not hdf5.
+        calculator.input_path = os.path.join(self.__tmp_dir, 'missing')
+        self.assertEqual(validator.validate(calculator), {})
+        calculator.input_path = __file__
+        self.assertEqual(validator.validate(calculator), {})
+
+    def testCache(self):
+        """ Test that unchanged files are not walked again. """
+        validator = SchemaValidator(max_files=10)
+        validator.missingData(self.__files, ['/params/Mesh/xMin'])
+        validator.missingData(self.__files, ['/params/Mesh/xMin'])
+        self.assertEqual(validator.statistics, {'hits' : 4, 'misses' : 4})
+
+        # Modified files are walked again.
+        time.sleep(0.01)
+        with h5py.File(self.__files[0], 'a') as h5:
+            h5['params/new'] = 1
+        self.assertIn('/params/new', validator.dataPaths(self.__files[0]))
+        self.assertEqual(validator.statistics['misses'], 5)
+
+        validator.clear()
+        validator.dataPaths(self.__files[1])
+        self.assertEqual(validator.statistics['misses'], 6)
+
+    def testDefaultValidator(self):
+        """ Test the validator shared by all simulations. """
+        self.assertIs(defaultSchemaValidator(), defaultSchemaValidator())
+        self.assertRaises(TypeError, SchemaValidator, 'all')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,11 +25,35 @@ import unittest
 
 # Import classes to test.
 from EntityChecksTest import EntityChecksTest
+from FileSetTest import FileSetTest
+from FileStagingTest import FileStagingTest
+from H5HandlePoolTest import H5HandlePoolTest
+from LazyDataTest import LazyDataTest
+from MetadataIndexTest import MetadataIndexTest
+from OutputContainerTest import OutputContainerTest
+from ProcessSupervisorTest import ProcessSupervisorTest
+from ResourceSchedulerTest import ResourceSchedulerTest
+from SchemaValidatorTest import SchemaValidatorTest
+from VirtualDatasetIndexTest import VirtualDatasetIndexTest
+from WavefrontResamplingTest import WavefrontResamplingTest
+from WritePolicyTest import WritePolicyTest
 
 # Setup the suite.
 def suite():
     suites = (
              unittest.makeSuite(EntityChecksTest,    'test'),
+             unittest.makeSuite(FileSetTest,    'test'),
+             unittest.makeSuite(FileStagingTest,    'test'),
+             unittest.makeSuite(H5HandlePoolTest,    'test'),
+             unittest.makeSuite(LazyDataTest,    'test'),
+             unittest.makeSuite(MetadataIndexTest,    'test'),
+             unittest.makeSuite(OutputContainerTest,    'test'),
+             unittest.makeSuite(ProcessSupervisorTest,    'test'),
+             unittest.makeSuite(ResourceSchedulerTest,    'test'),
+             unittest.makeSuite(SchemaValidatorTest,    'test'),
+             unittest.makeSuite(VirtualDatasetIndexTest,    'test'),
+             unittest.makeSuite(WavefrontResamplingTest,    'test'),
+             unittest.makeSuite(WritePolicyTest,    'test'),
              )
 
     return unittest.TestSuite(suites)
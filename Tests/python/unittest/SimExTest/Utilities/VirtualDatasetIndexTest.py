@@ -0,0 +1,120 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the virtual dataset index utilities.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from SimEx.Utilities.VirtualDatasetIndex import INDEX_FILE_NAME, findVirtualDatasetIndex, readPatterns, writeVirtualDatasetIndex
+
+class VirtualDatasetIndexTest(unittest.TestCase):
+    """ Test class for the virtual dataset index utilities. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__files = []
+        for i in range(5):
+            path = os.path.join(self.__tmp_dir, 'diffr_out_%07d.h5' % (i+1))
+            with h5py.File(path, 'w') as h5:
+                h5['data/data'] = numpy.full((3, 4), i, dtype='float32')
+                h5['params/beam/photonEnergy'] = 4960. + i
+                h5['params/info'] = 'singfel'
+            self.__files.append(path)
+        self.__index_path = os.path.join(self.__tmp_dir, INDEX_FILE_NAME)
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testWriteIndex(self):
+        """ Test that the index stacks the data and tabulates scalar parameters. """
+        self.assertEqual(writeVirtualDatasetIndex(self.__files, self.__index_path), 5)
+
+        with h5py.File(self.__index_path, 'r') as h5:
+            self.assertTrue(h5['data/data'].is_virtual)
+            self.assertEqual(h5['data/data'].shape, (5, 3, 4))
+            self.assertEqual(list(h5['data/data'][:, 0, 0]), [0., 1., 2., 3., 4.])
+            self.assertEqual(list(h5['params/beam/photonEnergy'][()]), [4960., 4961., 4962., 4963., 4964.])
+            self.assertNotIn('params/info', h5)
+
+        # The index stays valid if the directory is moved.
+        moved_dir = self.__tmp_dir + '_moved'
+        shutil.move(self.__tmp_dir, moved_dir)
+        try:
+            with h5py.File(os.path.join(moved_dir, INDEX_FILE_NAME), 'r') as h5:
+                self.assertEqual(h5['data/data'][4, 2, 3], 4.)
+        finally:
+            shutil.move(moved_dir, self.__tmp_dir)
+
+    def testWriteIndexInconsistent(self):
+        """ Test that files with differing data are refused. """
+        with h5py.File(self.__files[2], 'w') as h5:
+            h5['data/data'] = numpy.zeros((2, 2), dtype='float32')
+
+        self.assertRaises(ValueError, writeVirtualDatasetIndex, self.__files, self.__index_path)
+        self.assertRaises(KeyError, writeVirtualDatasetIndex, self.__files, self.__index_path, dataset='/data/diffr')
+        self.assertRaises(ValueError, writeVirtualDatasetIndex, [], self.__index_path)
+        self.assertFalse(os.path.exists(self.__index_path))
+
+    def testFindIndex(self):
+        """ Test that an index is only used for the files it covers. """
+        self.assertIsNone(findVirtualDatasetIndex(self.__files))
+
+        writeVirtualDatasetIndex(self.__files, self.__index_path)
+        self.assertEqual(findVirtualDatasetIndex(self.__files), (self.__index_path, 0))
+        self.assertEqual(findVirtualDatasetIndex(self.__files[1:3]), (self.__index_path, 1))
+        self.assertIsNone(findVirtualDatasetIndex(self.__files[::2]))
+        self.assertIsNone(findVirtualDatasetIndex(self.__files, dataset='/data/diffr'))
+
+        # Changed files invalidate the index.
+        with h5py.File(self.__files[3], 'a') as h5:
+            h5['extra'] = numpy.zeros(1000)
+        self.assertIsNone(findVirtualDatasetIndex(self.__files))
+
+    def testReadPatterns(self):
+        """ Test reading through the index and file by file gives the same data. """
+        unindexed = list(readPatterns(self.__files))
+
+        writeVirtualDatasetIndex(self.__files, self.__index_path)
+        indexed = list(readPatterns(self.__files, batch_size=2))
+        self.assertEqual(len(indexed), 5)
+        for a, b in zip(unindexed, indexed):
+            numpy.testing.assert_array_equal(a, b)
+
+        self.assertEqual([p[0, 0] for p in readPatterns(self.__files[1:4], batch_size=2)], [1., 2., 3.])
+
+        # Unreadable files yield None.
+        self.assertEqual(list(readPatterns([os.path.join(self.__tmp_dir, 'missing.h5')])), [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
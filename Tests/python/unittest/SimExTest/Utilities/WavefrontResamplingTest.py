@@ -0,0 +1,111 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the WavefrontResampling utilities.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+import SimEx.Utilities.WavefrontResampling as WavefrontResampling
+from SimEx.Utilities.WavefrontResampling import rebinField, resampleWavefront
+from TestUtilities import TestUtilities
+
+def pulseEnergy(path, field='/data/arrEhor'):
+    """ Intensity of a wavefront integrated over its mesh. """
+    with h5py.File(path, 'r') as h5:
+        mesh = h5['params/Mesh']
+        cell = 1.0
+        for prefix, n in [('x', 'nx'), ('y', 'ny'), ('slice', 'nSlices')]:
+            cell *= (mesh[prefix + 'Max'][()] - mesh[prefix + 'Min'][()]) / (mesh[n][()] - 1)
+        E = h5[field][()].astype(numpy.float64)
+        return numpy.sum(E[..., 0]**2 + E[..., 1]**2) * cell
+
+class WavefrontResamplingTest(unittest.TestCase):
+    """ Test class for the WavefrontResampling utilities. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__input = TestUtilities.generateTestFilePath('FELsource_out.h5')
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        shutil.rmtree(self.__tmp_dir)
+
+    def testResample(self):
+        """ Test that the mesh is updated and the pulse energy is conserved. """
+        output = os.path.join(self.__tmp_dir, 'FELsource_out_0000001.h5')
+        self.assertEqual(resampleWavefront(self.__input, output, nx=7, ny=7, nSlices=55), {'nx' : 7, 'ny' : 7, 'nSlices' : 55})
+
+        with h5py.File(output, 'r') as h5:
+            self.assertEqual(h5['data/arrEhor'].shape, (7, 7, 55, 2))
+            self.assertEqual(h5['data/arrEver'].shape, (7, 7, 55, 2))
+            self.assertEqual([h5['params/Mesh/' + k][()] for k in ['nx', 'ny', 'nSlices']], [7, 7, 55])
+            self.assertAlmostEqual(h5['params/Mesh/xMax'][()] + h5['params/Mesh/xMin'][()], 0.0)
+            self.assertEqual(h5['params/photonEnergy'][()], 4960.)
+            self.assertIn('history/parent/misc/temporal_struct', h5)
+        self.assertAlmostEqual(pulseEnergy(output) / pulseEnergy(self.__input), 1.0, 5)
+
+        # Blocks of different sizes.
+        resampleWavefront(self.__input, output, nx=8, nSlices=100)
+        with h5py.File(output, 'r') as h5:
+            self.assertEqual(h5['data/arrEhor'].shape, (21, 8, 100, 2))
+        self.assertAlmostEqual(pulseEnergy(output) / pulseEnergy(self.__input), 1.0, 5)
+
+        self.assertRaises(IOError, resampleWavefront, output, output, nx=4)
+        self.assertEqual(sorted(os.listdir(self.__tmp_dir)), ['FELsource_out_0000001.h5'])
+
+    def testRebinField(self):
+        """ Test rebinning of a field, also slab by slab. """
+        field = numpy.random.RandomState(1).normal(size=(6, 4, 30, 2)).astype(numpy.float32)
+
+        # Keeping the mesh keeps the field.
+        self.assertTrue(numpy.allclose(rebinField(field, (6, 4, 30)), field, atol=1e-6))
+
+        # A uniform phase is kept, the intensity is averaged.
+        uniform = numpy.zeros((4, 4, 4, 2), dtype=numpy.float32)
+        uniform[..., 0] = 3.0
+        uniform[0, 0, 0, 0] = 5.0
+        rebinned = rebinField(uniform, (2, 2, 2))
+        self.assertTrue(numpy.allclose(rebinned[..., 1], 0.0))
+        self.assertAlmostEqual(rebinned[0, 0, 0, 0], numpy.sqrt((7*9. + 25.) / 8), 5)
+
+        # Slabs of five slices give the same result as a single slab.
+        expected = rebinField(field, (3, 2, 7))
+        slab_bytes = WavefrontResampling._SLAB_BYTES
+        try:
+            WavefrontResampling._SLAB_BYTES = 6*4*2*4*5
+            self.assertTrue(numpy.allclose(rebinField(field, (3, 2, 7)), expected))
+        finally:
+            WavefrontResampling._SLAB_BYTES = slab_bytes
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+##########################################################################
+#                                                                        #
+# Copyright (C) 2015 Carsten Fortmann-Grote                              #
+# Contact: Carsten Fortmann-Grote <carsten.grote@xfel.eu>                #
+#                                                                        #
+# This file is part of simex_platform.                                   #
+# simex_platform is free software: you can redistribute it and/or modify #
+# it under the terms of the GNU General Public License as published by   #
+# the Free Software Foundation, either version 3 of the License, or      #
+# (at your option) any later version.                                    #
+#                                                                        #
+# simex_platform is distributed in the hope that it will be useful,      #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+# GNU General Public License for more details.                           #
+#                                                                        #
+# You should have received a copy of the GNU General Public License      #
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+# Include needed directories in sys.path.                                #
+#                                                                        #
+##########################################################################
+
+""" Test module for the WritePolicy.
+    @author CFG
+    @institution XFEL
+    @creation 20161018
+"""
+import paths
+import h5py
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from SimEx.Utilities.WritePolicy import WritePolicy, chunkShape, setWritePolicy, writePolicy
+
+class WritePolicyTest(unittest.TestCase):
+    """ Test class for the WritePolicy class. """
+
+    def setUp(self):
+        """ Setting up a test. """
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__h5 = h5py.File(os.path.join(self.__tmp_dir, 'test.h5'), 'w')
+
+    def tearDown(self):
+        """ Tearing down a test. """
+        self.__h5.close()
+        shutil.rmtree(self.__tmp_dir)
+        setWritePolicy(None)
+        setWritePolicy(None, 'EMCOrientation')
+
+    def testDefaults(self):
+        """ Test the default policy. """
+        policy = WritePolicy()
+        self.assertEqual(policy.codec, 'gzip')
+        self.assertEqual(policy.level, 4)
+        self.assertTrue(policy.shuffle)
+        self.assertFalse(policy.downcast)
+
+        self.assertRaises(ValueError, WritePolicy, codec='bzip2')
+        self.assertRaises(ValueError, WritePolicy, level=10)
+        self.assertRaises(TypeError, WritePolicy, shuffle='yes')
+
+    def testCodecs(self):
+        """ Test that datasets are written with the requested filters. """
+        data = numpy.random.random((64, 64, 64))
+
+        dataset = WritePolicy(codec='gzip', level=1).createDataset(self.__h5, 'gzip', data)
+        self.assertEqual(dataset.compression, 'gzip')
+        self.assertEqual(dataset.compression_opts, 1)
+        self.assertTrue(dataset.shuffle)
+        self.assertEqual(dataset.chunks, (32, 64, 64))
+
+        dataset = WritePolicy(codec='lzf', shuffle=False).createDataset(self.__h5, 'lzf', data)
+        self.assertEqual(dataset.compression, 'lzf')
+        self.assertFalse(dataset.shuffle)
+
+        dataset = WritePolicy(codec='none').createDataset(self.__h5, 'none', data)
+        self.assertIsNone(dataset.compression)
+        self.assertIsNone(dataset.chunks)
+
+        for name in ['gzip', 'lzf', 'none']:
+            numpy.testing.assert_array_equal(self.__h5[name][()], data)
+
+    def testSmallData(self):
+        """ Test that scalars, strings and small arrays are written without filters. """
+        policy = WritePolicy()
+        for name, data in [('scalar', 1.0), ('string', 'version'), ('small', numpy.zeros(10))]:
+            dataset = policy.createDataset(self.__h5, name, data)
+            self.assertIsNone(dataset.compression)
+            self.assertIsNone(dataset.chunks)
+
+    def testDowncast(self):
+        """ Test that double precision data is down-cast only where allowed. """
+        data = numpy.random.random(4096)
+
+        policy = WritePolicy(downcast=True)
+        self.assertEqual(policy.createDataset(self.__h5, 'allowed', data, allow_downcast=True).dtype, numpy.float32)
+        self.assertEqual(policy.createDataset(self.__h5, 'not_allowed', data).dtype, numpy.float64)
+        self.assertEqual(WritePolicy().createDataset(self.__h5, 'disabled', data, allow_downcast=True).dtype, numpy.float64)
+        self.assertEqual(policy.createDataset(self.__h5, 'integer', numpy.arange(4096), allow_downcast=True).dtype, numpy.arange(1).dtype)
+
+    def testChunkShape(self):
+        """ Test the chunk shape heuristic. """
+        self.assertEqual(chunkShape((100,), 8, 1048576), (100,))
+        self.assertEqual(chunkShape((1024, 1024), 8, 1048576), (256, 512))
+        self.assertEqual(chunkShape((10, 0), 8, 1048576), (10, 1))
+
+    def testExtendableDataset(self):
+        """ Test creating datasets that grow row by row. """
+        policy = WritePolicy(codec='lzf')
+        dataset = policy.createExtendableDataset(self.__h5, 'patterns', (241, 241), numpy.float64, expected_rows=1000)
+        self.assertEqual(dataset.shape, (0, 241, 241))
+        self.assertEqual(dataset.maxshape, (None, 241, 241))
+        # Whole rows per chunk.
+        self.assertEqual(dataset.chunks, (2, 241, 241))
+        self.assertEqual(dataset.compression, 'lzf')
+        dataset.resize(1, axis=0)
+        dataset[0] = numpy.ones((241, 241))
+        self.assertEqual(dataset[0].sum(), 241*241)
+
+        # Rows larger than a chunk are split.
+        self.assertEqual(policy.createExtendableDataset(self.__h5, 'large', (1024, 1024), numpy.float64).chunks, (1, 256, 512))
+        # Small datasets are not compressed.
+        self.assertIsNone(policy.createExtendableDataset(self.__h5, 'small', (), numpy.float64).compression)
+
+    def testStagePolicies(self):
+        """ Test default and per-stage policies. """
+        default = writePolicy()
+        self.assertIs(writePolicy('EMCOrientation'), default)
+
+        emc_policy = WritePolicy(codec='lzf')
+        setWritePolicy(emc_policy, 'EMCOrientation')
+        self.assertIs(writePolicy('EMCOrientation'), emc_policy)
+        self.assertIs(writePolicy('DMPhasing'), default)
+
+        new_default = WritePolicy(codec='none')
+        setWritePolicy(new_default)
+        self.assertIs(writePolicy('DMPhasing'), new_default)
+
+        setWritePolicy(None, 'EMCOrientation')
+        self.assertIs(writePolicy('EMCOrientation'), new_default)
+        self.assertRaises(TypeError, setWritePolicy, 'lzf')
+
+
+if __name__ == '__main__':
+    unittest.main()